@@ -4,7 +4,10 @@ from .models import (Student, Meal, Activity, AwayPeriod, Announcement,
                      Room, RoomAssignment, RoomChangeRequest, Payment, 
                      Notification, LoginActivity, Visitor, HealthAppointment,
                      StaffProfile, LostItem, TutoringPost, Document,
-                     AdminSubscription, RegistrationPayment, EmergencyAlert, Message)
+                     AdminSubscription, RegistrationPayment, EmergencyAlert, Message,
+                     MpesaCallback, LedgerEntry, StudentBalance, RoommatePreference,
+                     MealDefault, MealForecast, MealArchive, MealServing, InboundMessage)
+from .booking import sync_room_occupancy
 
 class RoomAssignmentInline(admin.TabularInline):
     model = RoomAssignment
@@ -62,6 +65,34 @@ class RegistrationPaymentAdmin(admin.ModelAdmin):
     list_display = ('phone_number', 'amount', 'transaction_id', 'status', 'created_at')
     list_filter = ('status', 'created_at')
 
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ('checkout_request_id', 'status', 'received_at', 'processed_at')
+    list_filter = ('status', 'received_at')
+    search_fields = ('checkout_request_id',)
+    readonly_fields = ('payload', 'received_at', 'processed_at')
+
+@admin.register(InboundMessage)
+class InboundMessageAdmin(admin.ModelAdmin):
+    list_display = ('sender', 'text', 'student', 'status', 'received_at', 'processed_at')
+    list_filter = ('status', 'received_at')
+    search_fields = ('sender', 'provider_message_id', 'text')
+    raw_id_fields = ('student',)
+    readonly_fields = ('provider_message_id', 'received_at', 'processed_at')
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'entry_type', 'source', 'amount', 'posted_at')
+    list_filter = ('entry_type', 'source', 'posted_at')
+    search_fields = ('student__user__username', 'student__university_id', 'description')
+    raw_id_fields = ('student',)
+
+@admin.register(StudentBalance)
+class StudentBalanceAdmin(admin.ModelAdmin):
+    list_display = ('student', 'total_charged', 'total_paid', 'balance', 'oldest_unpaid_at')
+    search_fields = ('student__user__username', 'student__university_id')
+    readonly_fields = ('total_charged', 'total_paid', 'balance', 'oldest_unpaid_at', 'last_payment_at', 'updated_at')
+
 @admin.register(EmergencyAlert)
 class EmergencyAlertAdmin(admin.ModelAdmin):
     list_display = ('student', 'location', 'is_resolved', 'created_at')
@@ -97,6 +128,12 @@ class StudentAdmin(admin.ModelAdmin):
     def get_full_name(self, obj):
         return obj.user.get_full_name()
 
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is RoomAssignment:
+            rooms = {f.initial.get('room') for f in formset.forms} | {f.instance.room_id for f in formset.forms}
+            sync_room_occupancy(rooms - {None})
+
 @admin.register(Meal)
 class MealAdmin(admin.ModelAdmin):
     list_display = ('student', 'date', 'breakfast', 'early', 'supper', 'away')
@@ -113,6 +150,31 @@ class AwayPeriodAdmin(admin.ModelAdmin):
     list_display = ('student', 'start_date', 'end_date')
     list_filter = ('start_date', 'end_date')
 
+@admin.register(MealDefault)
+class MealDefaultAdmin(admin.ModelAdmin):
+    list_display = ('student', 'weekday', 'breakfast', 'early', 'supper')
+    list_filter = ('weekday', 'breakfast', 'early', 'supper')
+
+@admin.register(MealForecast)
+class MealForecastAdmin(admin.ModelAdmin):
+    list_display = ('date', 'meal', 'confirmed', 'forecast', 'actual', 'generated_at')
+    list_filter = ('meal',)
+    date_hierarchy = 'date'
+
+@admin.register(MealArchive)
+class MealArchiveAdmin(admin.ModelAdmin):
+    list_display = ('student', 'month')
+    list_filter = ('month',)
+    search_fields = ('student__user__username', 'student__university_id')
+    raw_id_fields = ('student',)
+
+@admin.register(MealServing)
+class MealServingAdmin(admin.ModelAdmin):
+    list_display = ('student', 'date', 'meal', 'line', 'served_at')
+    list_filter = ('meal', 'line')
+    date_hierarchy = 'date'
+    raw_id_fields = ('student', 'scanned_by')
+
 @admin.register(Announcement)
 class AnnouncementAdmin(admin.ModelAdmin):
     list_display = ('title', 'priority', 'is_active', 'created_by', 'created_at')
@@ -127,9 +189,16 @@ class MaintenanceRequestAdmin(admin.ModelAdmin):
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ('room_number', 'floor', 'block', 'room_type', 'capacity', 'is_available')
+    list_display = ('room_number', 'floor', 'block', 'room_type', 'capacity', 'occupied_beds', 'is_available')
     list_filter = ('floor', 'block', 'room_type', 'is_available')
     search_fields = ('room_number', 'block')
+    # Maintained by hms.booking
+    readonly_fields = ('occupied_beds',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Capacity may have changed
+        sync_room_occupancy([obj.pk])
 
 @admin.register(RoomAssignment)
 class RoomAssignmentAdmin(admin.ModelAdmin):
@@ -137,6 +206,17 @@ class RoomAssignmentAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'assigned_date')
     search_fields = ('student__user__username', 'room__room_number')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Recount the room it was in and the room it is in now
+        sync_room_occupancy({obj.room_id, form.initial.get('room')} - {None})
+
+@admin.register(RoommatePreference)
+class RoommatePreferenceAdmin(admin.ModelAdmin):
+    list_display = ('student', 'preferred_student', 'created_at')
+    search_fields = ('student__user__username', 'preferred_student__user__username')
+    raw_id_fields = ('student', 'preferred_student')
+
 @admin.register(RoomChangeRequest)
 class RoomChangeRequestAdmin(admin.ModelAdmin):
     list_display = ('student', 'current_room', 'requested_room', 'status', 'created_at')
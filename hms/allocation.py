@@ -0,0 +1,287 @@
+"""
+Batch room allocation for semester intake.
+
+Pending students (hostel residents without an active assignment) are grouped
+by roommate preference and packed into rooms best-fit-decreasing: the most
+constrained groups go first (accessibility needs, then larger groups) and
+each takes the fullest compatible room it fits in, so partly occupied rooms
+are topped up before empty ones are opened.
+
+Constraints:
+- a block houses one gender (taken from its current occupants, or given
+  explicitly), and so does every room;
+- a student with a hostel preference is only placed in that block;
+- students with mobility or visual impairments get the lowest floor of a
+  block, or a room whose amenities mention accessibility; those rooms are
+  handed to other students last.
+
+Nothing is written in dry-run mode. Otherwise all assignments are created
+with one bulk_create, student room numbers are set with one bulk_update
+and the semester charges are posted to the fee ledger.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from . import ledger
+from .booking import sync_room_occupancy
+from .models import Room, RoomAssignment, RoommatePreference, Student
+
+ACCESSIBILITY_NEEDS = ('physical', 'visual')
+ACCESSIBLE_AMENITY_KEYWORDS = ('accessible', 'wheelchair', 'ramp')
+
+
+class Placement:
+    def __init__(self, student, room, bed_number):
+        self.student = student
+        self.room = room
+        self.bed_number = bed_number
+
+
+class AllocationResult:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.placements = []
+        self.unplaced = []  # (student, reason)
+        self.assignments = []
+
+    @property
+    def placed_count(self):
+        return len(self.placements)
+
+    def rooms_used(self):
+        return len({p.room.pk for p in self.placements})
+
+
+class _RoomSlot:
+    """Mutable view of a room's remaining beds while planning"""
+
+    def __init__(self, room, occupied, free_beds, gender, accessible):
+        self.room = room
+        self.occupied = occupied
+        self.free_beds = free_beds
+        self.gender = gender
+        self.accessible = accessible
+
+    @property
+    def free(self):
+        return len(self.free_beds)
+
+
+def needs_accessible_room(student):
+    return student.disability in ACCESSIBILITY_NEEDS
+
+
+def pending_students():
+    return (Student.objects.filter(residence_type='hostel', is_on_attachment=False)
+            .exclude(room_assignments__is_active=True)
+            .select_related('user')
+            .order_by('created_at', 'pk'))
+
+
+def _group_students(students, max_size):
+    """Union students who asked to room together (same gender only), capped at max_size"""
+    by_id = {s.pk: s for s in students}
+    parent = {pk: pk for pk in by_id}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    preferences = (RoommatePreference.objects
+                   .filter(student_id__in=by_id, preferred_student_id__in=by_id)
+                   .values_list('student_id', 'preferred_student_id'))
+    for a, b in preferences:
+        if by_id[a].gender != by_id[b].gender:
+            continue
+        parent[find(a)] = find(b)
+
+    groups = defaultdict(list)
+    for pk in by_id:
+        groups[find(pk)].append(by_id[pk])
+
+    result = []
+    for members in groups.values():
+        members.sort(key=lambda s: (s.created_at, s.pk))
+        for start in range(0, len(members), max_size):
+            result.append(members[start:start + max_size])
+    return result
+
+
+def _load_rooms(rooms, block_genders):
+    rooms = rooms.annotate(
+        occupied=Count('assignments', filter=Q(assignments__is_active=True))
+    )
+    lowest_floor = dict(Room.objects.values('block').annotate(lowest=Min('floor')).values_list('block', 'lowest'))
+
+    taken_beds = defaultdict(set)
+    room_genders = defaultdict(set)
+    for room_id, bed, gender in (RoomAssignment.objects.filter(is_active=True)
+                                 .values_list('room_id', 'bed_number', 'student__gender')):
+        if bed:
+            taken_beds[room_id].add(bed)
+        room_genders[room_id].add(gender)
+
+    block_genders = dict(block_genders or {})
+    inferred = defaultdict(set)
+    slots = []
+    for room in rooms:
+        genders = room_genders.get(room.pk, set())
+        if len(genders) > 1:
+            # Legacy mixed room: leave it alone rather than make it worse
+            continue
+        gender = next(iter(genders)) if genders else None
+        inferred[room.block].update(genders)
+        # Beds without a number still count as occupied
+        unnumbered = max(room.occupied - len(taken_beds[room.pk]), 0)
+        free_beds = [n for n in range(1, room.capacity + 1) if n not in taken_beds[room.pk]][unnumbered:]
+        if not free_beds or not room.is_available:
+            continue
+        accessible = (room.floor == lowest_floor.get(room.block)
+                      or any(k in room.amenities.lower() for k in ACCESSIBLE_AMENITY_KEYWORDS))
+        slots.append(_RoomSlot(room, room.occupied, free_beds, gender, accessible))
+
+    for block, genders in inferred.items():
+        genders.discard(None)
+        if block not in block_genders and len(genders) == 1:
+            block_genders[block] = next(iter(genders))
+    return slots, block_genders
+
+
+class _RoomIndex:
+    """Rooms bucketed by (block, gender, accessible, free beds).
+
+    take() walks the buckets in preference order: accessible rooms only once
+    no other room fits, then the fewest free beds (best fit), then rooms
+    already of the group's gender before empty ones, then block order.
+    """
+
+    def __init__(self, slots):
+        self.buckets = defaultdict(list)
+        self.blocks = sorted({s.room.block for s in slots})
+        self.max_free = max((s.free for s in slots), default=0)
+        # Reverse so pop() hands out rooms in block/floor/number order
+        for slot in sorted(slots, key=lambda s: (s.room.block, s.room.floor, s.room.room_number), reverse=True):
+            self._add(slot)
+
+    def _add(self, slot):
+        self.buckets[(slot.room.block, slot.gender, slot.accessible, slot.free)].append(slot)
+
+    def take(self, size, gender, blocks, accessible_choices):
+        for accessible in accessible_choices:
+            for free in range(size, self.max_free + 1):
+                for room_gender in (gender, None):
+                    for block in blocks:
+                        bucket = self.buckets.get((block, room_gender, accessible, free))
+                        if bucket:
+                            return bucket.pop()
+        return None
+
+    def put_back(self, slot):
+        if slot.free:
+            self._add(slot)
+
+
+def plan_allocation(students=None, rooms=None, block_genders=None):
+    """Work out placements without touching the database"""
+    students = list(pending_students() if students is None else students)
+    rooms = Room.objects.all() if rooms is None else rooms
+    result = AllocationResult(dry_run=True)
+
+    slots, block_genders = _load_rooms(rooms, block_genders)
+    index = _RoomIndex(slots)
+    if not slots:
+        result.unplaced = [(s, 'No free beds') for s in students]
+        return result
+
+    placeable = []
+    for student in students:
+        if not student.gender:
+            result.unplaced.append((student, 'Gender not recorded'))
+        else:
+            placeable.append(student)
+
+    groups = _group_students(placeable, max(index.max_free, 1))
+    groups.sort(key=lambda g: (not any(needs_accessible_room(s) for s in g), -len(g), g[0].created_at, g[0].pk))
+
+    for group in groups:
+        gender = group[0].gender
+        hostels = {s.hostel.strip().lower() for s in group if s.hostel}
+        blocks = [b for b in index.blocks
+                  if block_genders.get(b) in (None, gender)
+                  and (not hostels or b.strip().lower() in hostels)]
+        accessible_choices = (True,) if any(needs_accessible_room(s) for s in group) else (False, True)
+
+        slot = index.take(len(group), gender, blocks, accessible_choices)
+        if slot is None and len(group) > 1:
+            # Keep what we can: fall back to placing members individually
+            for student in group:
+                _place([student], gender, blocks, index, block_genders, result)
+            continue
+        if slot is None:
+            result.unplaced.append((group[0], _unplaced_reason(group[0], blocks)))
+            continue
+        _assign(group, slot, gender, index, block_genders, result)
+    return result
+
+
+def _place(group, gender, blocks, index, block_genders, result):
+    accessible_choices = (True,) if needs_accessible_room(group[0]) else (False, True)
+    slot = index.take(1, gender, blocks, accessible_choices)
+    if slot is None:
+        result.unplaced.append((group[0], _unplaced_reason(group[0], blocks)))
+        return
+    _assign(group, slot, gender, index, block_genders, result)
+
+
+def _assign(group, slot, gender, index, block_genders, result):
+    for student in group:
+        result.placements.append(Placement(student, slot.room, slot.free_beds.pop(0)))
+    slot.gender = gender
+    block_genders.setdefault(slot.room.block, gender)
+    index.put_back(slot)
+
+
+def _unplaced_reason(student, blocks):
+    if not blocks:
+        return 'No block matches hostel/gender'
+    if needs_accessible_room(student):
+        return 'No accessible bed free'
+    return 'No compatible bed free'
+
+
+def allocate_rooms(students=None, rooms=None, block_genders=None, dry_run=False, assigned_date=None):
+    """Plan and (unless dry_run) write the allocation. Returns an AllocationResult."""
+    if dry_run:
+        return plan_allocation(students, rooms, block_genders)
+
+    assigned_date = assigned_date or timezone.now().date()
+    with transaction.atomic():
+        rooms = Room.objects.all() if rooms is None else rooms
+        # Serialise against other allocation runs; single bookings are
+        # guarded by the occupied_beds counter and the unique active bed
+        list(rooms.select_for_update().values_list('pk', flat=True))
+        result = plan_allocation(students, rooms, block_genders)
+        result.dry_run = False
+        if not result.placements:
+            return result
+
+        result.assignments = RoomAssignment.objects.bulk_create([
+            RoomAssignment(student=p.student, room=p.room, bed_number=p.bed_number,
+                           assigned_date=assigned_date, is_active=True,
+                           notes='Batch allocation')
+            for p in result.placements
+        ], batch_size=1000)
+
+        placed_students = []
+        for p in result.placements:
+            p.student.room_number = p.room.room_number
+            placed_students.append(p.student)
+        Student.objects.bulk_update(placed_students, ['room_number'])
+
+        sync_room_occupancy({p.room.pk for p in result.placements})
+
+        ledger.charge_room_assignments(result.assignments)
+    return result
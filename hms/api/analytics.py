@@ -4,14 +4,18 @@ from rest_framework import status
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
 from datetime import timedelta, datetime
-from hms.models import Student, Payment, MaintenanceRequest, Visitor, Meal, DefermentRequest
-import collections
+from hms.models import Student, Payment, MaintenanceRequest, Visitor, DefermentRequest
+from hms.meal_archive import daily_totals as meal_daily_totals
+from .throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
 
 class ActivityAnalyticsView(APIView):
     """
     API endpoint to provide activity data for the dashboard chart.
     Supports daily, weekly, and monthly ranges.
     """
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'activity_analytics'
+
     def get(self, request):
         time_range = request.query_params.get('range', 'weekly')
         end_date = timezone.now().date()
@@ -46,21 +50,10 @@ class ActivityAnalyticsView(APIView):
             mapping = {str(item['day']): item['count'] for item in counts}
             return [mapping.get(str(d), 0) for d in date_list]
 
-        # Specialized meal count logic
-        meal_records = Meal.objects.filter(date__in=data_points)
-        
-        breakfast_mapping = collections.defaultdict(int)
-        supper_mapping = collections.defaultdict(int)
-        
-        for m in meal_records:
-            date_str = str(m.date)
-            if m.breakfast:
-                breakfast_mapping[date_str] += 1
-            if m.supper:
-                supper_mapping[date_str] += 1
-                
-        weekly_breakfasts = [breakfast_mapping.get(str(d), 0) for d in data_points]
-        weekly_suppers = [supper_mapping.get(str(d), 0) for d in data_points]
+        # Meal counts come from live rows plus the monthly archive
+        meal_totals = meal_daily_totals(data_points[0], data_points[-1])
+        weekly_breakfasts = [meal_totals[d]['breakfast'] for d in data_points]
+        weekly_suppers = [meal_totals[d]['supper'] for d in data_points]
 
         # Fetch datasets
         weekly_registrations = get_daily_counts(Student.objects, 'user__date_joined', data_points)
@@ -83,8 +76,9 @@ class ActivityAnalyticsView(APIView):
             vis = Visitor.objects.filter(check_in_time__date__in=date_list).count()
             def_req = DefermentRequest.objects.filter(created_at__date__in=date_list).count()
             
-            breakfast_total = Meal.objects.filter(date__in=date_list, breakfast=True).count()
-            supper_total = Meal.objects.filter(date__in=date_list, supper=True).count()
+            meal_totals = meal_daily_totals(date_list[0], date_list[-1]).values()
+            breakfast_total = sum(day['breakfast'] for day in meal_totals)
+            supper_total = sum(day['supper'] for day in meal_totals)
             
             return reg + pay + main + vis + def_req + breakfast_total + supper_total
 
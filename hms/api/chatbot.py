@@ -2,17 +2,86 @@
 Chatbot API Endpoint
 
 Provides REST API for chatbot interactions in the Student Welfare Management System.
+
+Replies depend only on the role and the words of the message (plus the
+published content version), so they are cached under (knowledge version,
+role, normalised message): "How do I pay fees?" and "how do i pay fees"
+share one entry, and new content starts a fresh set of entries. The
+client-supplied history is bounded (at most CHATBOT_HISTORY_LIMIT items
+accepted, the last CHATBOT_MAX_HISTORY kept, each truncated) and requests
+are throttled per user and per IP (hms.api.throttling).
 """
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+import hashlib
 import json
 
-from hms.chatbot import ChatService
+from hms import knowledge
+from hms.autocomplete import fold
+from hms.chatbot import SPECIFIC_SCORE, get_engine
+from .throttling import IPTokenBucketThrottle, UserTokenBucketThrottle, record_usage
+
+MAX_MESSAGE_LENGTH = 1000
+
+
+def chat_role(user):
+    """Role label used to pick the chatbot's response table"""
+    staff_profile = getattr(user, 'staff_profile', None)
+    if staff_profile and staff_profile.role == 'warden':
+        return 'Warden'
+    if staff_profile or user.is_staff or user.is_superuser:
+        return 'Admin'
+    return 'Student'
+
+
+def clean_history(history):
+    """The last CHATBOT_MAX_HISTORY well-formed items, contents truncated; None when over the hard limit"""
+    if not isinstance(history, list):
+        return []
+    if len(history) > getattr(settings, 'CHATBOT_HISTORY_LIMIT', 100):
+        return None
+    cleaned = [
+        {'role': item['role'], 'content': item['content'][:MAX_MESSAGE_LENGTH]}
+        for item in history
+        if isinstance(item, dict) and item.get('role') in ('user', 'assistant') and isinstance(item.get('content'), str)
+    ]
+    return cleaned[-getattr(settings, 'CHATBOT_MAX_HISTORY', 20):]
+
+
+def reply_cache_key(user_role, message):
+    normalised = ' '.join(fold(message))
+    digest = hashlib.sha1(normalised.encode()).hexdigest()
+    return f'chatbot_reply:{knowledge.current_version()}:{user_role}:{digest}'
+
+
+def build_reply(message, user_role):
+    """{'response', 'quick_replies', 'role', 'sources'} for a message"""
+    # Shared engine: the intents are compiled once per process
+    engine = get_engine()
+    intent, score = engine.match(message)
+
+    # Questions the intents cannot place are answered from published content
+    sources = knowledge.search(message) if score < SPECIFIC_SCORE else []
+    if sources:
+        answer = knowledge.format_answer(sources)
+    else:
+        answer = engine.response(intent, user_role)
+
+    return {
+        'response': answer,
+        'quick_replies': engine.quick_replies(user_role),
+        'role': 'assistant',
+        'sources': [
+            {'title': s.title, 'snippet': s.snippet, 'url': s.url, 'kind': s.kind} for s in sources
+        ],
+    }
 
 
 class ChatbotAPIView(APIView):
@@ -21,67 +90,56 @@ class ChatbotAPIView(APIView):
     
     POST /api/chatbot/
     Body: {
-        "message": "User's message",
-        "history": [{"role": "user"|"assistant", "content": "..."}]  # Optional
+        "message": "User's message",  # At most 1000 characters
+        "history": [{"role": "user"|"assistant", "content": "..."}]  # Optional, bounded
     }
     
     Returns: {
         "response": "Assistant's response",
-        "quick_replies": ["suggestion1", "suggestion2", ...]
+        "quick_replies": ["suggestion1", "suggestion2", ...],
+        "sources": [{"title", "snippet", "url", "kind"}, ...]  # Content the answer quotes
     }
     """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'chatbot'
     
     def post(self, request):
         """Handle chat message and return AI response."""
         try:
             # Get message from request
-            message = request.data.get('message', '').strip()
+            message = request.data.get('message', '')
+            message = message.strip() if isinstance(message, str) else ''
             if not message:
                 return Response(
                     {'error': 'Message cannot be empty'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            if len(message) > MAX_MESSAGE_LENGTH:
+                return Response(
+                    {'error': f'Message cannot be longer than {MAX_MESSAGE_LENGTH} characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Get conversation history (default to empty list)
-            history = request.data.get('history', [])
-            if not isinstance(history, list):
-                history = []
-            
-            # Get user information
-            user = request.user
-            user_name = user.get_full_name() or user.username
-            
-            # Determine user role
-            user_role = 'Student'
-            if hasattr(user, 'admin_profile'):
-                user_role = 'Admin'
-            elif hasattr(user, 'warden_profile'):
-                user_role = 'Warden'
-            
-            # Initialize chat service
-            chat_service = ChatService()
-            
-            # Get AI response
-            response_message = chat_service.chat(
-                message=message,
-                conversation_history=history,
-                user_role=user_role,
-                user_name=user_name
-            )
+            # Bounded server-side; the rule-based engine does not read it
+            history = clean_history(request.data.get('history', []))
+            if history is None:
+                return Response(
+                    {'error': 'Conversation history is too long'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Get quick replies for this role
-            quick_replies = chat_service.get_quick_replies(user_role)
+            user_role = chat_role(request.user)
+            key = reply_cache_key(user_role, message)
+            reply = cache.get(key)
+            if reply is None:
+                reply = build_reply(message, user_role)
+                cache.set(key, reply, getattr(settings, 'CHATBOT_CACHE_SECONDS', 600))
+            else:
+                record_usage(self.throttle_scope, 'cache_hits')
             
-            return Response({
-                'response': response_message['content'],
-                'quick_replies': quick_replies,
-                'role': response_message['role']
-            })
+            return Response(reply)
             
-        except ValueError as e:
-            # API key not configured (not needed for rule-based, but keep for compatibility)
-            pass
         except Exception as e:
             # Generic error handling
             return Response(
@@ -0,0 +1,121 @@
+"""
+Meal Planning API Endpoints
+
+Lets a student read and submit a week of meals (plus recurring weekday
+defaults) in one request, and read their attendance totals and streaks
+over any range (archived months included).
+"""
+from datetime import datetime, timedelta
+from django.utils import timezone
+from django.db import transaction
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from hms.meal_archive import attendance, streaks
+from hms.meal_plans import (PlanValidationError, apply_plan, save_defaults, validate_plan,
+                            week_plan, MEAL_FIELDS)
+from hms.models import MealDefault, Student
+from .serializers import MealPlanSerializer
+
+
+class MealPlanAPIView(APIView):
+    """
+    GET  /api/meals/plan/?start=YYYY-MM-DD
+    Returns the effective plan for the week and the student's weekday defaults.
+
+    POST /api/meals/plan/
+    Body: {
+        "days": [{"date": "YYYY-MM-DD", "breakfast": true, "early": false, "supper": true}, ...],
+        "defaults": [{"weekday": 0, "breakfast": true, "early": false, "supper": false}, ...]  # Optional
+    }
+    The whole plan is validated before anything is saved; a rejected day
+    returns 400 with an error per date.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def _student(self, request):
+        try:
+            return request.user.student_profile
+        except Student.DoesNotExist:
+            return None
+
+    def _payload(self, student, start=None):
+        return {
+            'days': [dict(entry, date=entry['date'].isoformat()) for entry in week_plan(student, start)],
+            'defaults': list(MealDefault.objects.filter(student=student).values('weekday', *MEAL_FIELDS)),
+        }
+
+    def get(self, request):
+        student = self._student(request)
+        if student is None:
+            return Response({'error': 'Only students can plan meals.'}, status=status.HTTP_403_FORBIDDEN)
+        start = None
+        if request.query_params.get('start'):
+            try:
+                start = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+            except ValueError:
+                return Response({'error': 'start must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self._payload(student, start))
+
+    def post(self, request):
+        student = self._student(request)
+        if student is None:
+            return Response({'error': 'Only students can plan meals.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = MealPlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        days = serializer.validated_data['days']
+        try:
+            meals, warnings = validate_plan(student, days)
+        except PlanValidationError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            save_defaults(student, serializer.validated_data['defaults'])
+            if meals:
+                apply_plan(meals)
+
+        payload = self._payload(student)
+        payload.update(saved=len(meals), warnings=warnings)
+        return Response(payload)
+
+
+class MealHistoryAPIView(APIView):
+    """
+    GET /api/meals/history/?start=YYYY-MM-DD&end=YYYY-MM-DD&meal=supper
+    Returns the student's attendance totals for the range (default: the
+    last 30 days up to today) and the current/longest streak for `meal`
+    (any meal when omitted).
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 366
+
+    def get(self, request):
+        try:
+            student = request.user.student_profile
+        except Student.DoesNotExist:
+            return Response({'error': 'Only students have a meal history.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            end = (datetime.strptime(request.query_params['end'], '%Y-%m-%d').date()
+                   if request.query_params.get('end') else timezone.localdate())
+            start = (datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+                     if request.query_params.get('start') else end - timedelta(days=29))
+        except ValueError:
+            return Response({'error': 'start and end must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end or (end - start).days >= self.MAX_DAYS:
+            return Response({'error': f'The range must be 1 to {self.MAX_DAYS} days.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        meal = request.query_params.get('meal') or None
+        if meal not in (None, *MEAL_FIELDS):
+            return Response({'error': f'meal must be one of {", ".join(MEAL_FIELDS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'totals': attendance(student.pk, start, end),
+            'streaks': streaks(student.pk, start, end, meal),
+        })
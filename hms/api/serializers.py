@@ -35,3 +35,33 @@ class ResetPasswordSerializer(serializers.Serializer):
         user.set_password(self.validated_data['password'])
         user.save()
         return user
+
+
+class MealPlanDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    breakfast = serializers.BooleanField(default=False)
+    early = serializers.BooleanField(default=False)
+    supper = serializers.BooleanField(default=False)
+
+
+class MealDefaultSerializer(serializers.Serializer):
+    weekday = serializers.IntegerField(min_value=0, max_value=6)
+    breakfast = serializers.BooleanField(default=False)
+    early = serializers.BooleanField(default=False)
+    supper = serializers.BooleanField(default=False)
+
+
+class MealPlanSerializer(serializers.Serializer):
+    days = MealPlanDaySerializer(many=True, required=False, default=list)
+    defaults = MealDefaultSerializer(many=True, required=False, default=list)
+
+    def validate_days(self, value):
+        if len(value) > 14:
+            raise serializers.ValidationError("A plan can cover at most 14 days.")
+        return value
+
+    def validate_defaults(self, value):
+        weekdays = [item['weekday'] for item in value]
+        if len(weekdays) != len(set(weekdays)):
+            raise serializers.ValidationError("Each weekday can only appear once.")
+        return value
@@ -0,0 +1,140 @@
+"""
+Cache-backed token-bucket throttles and API usage counters.
+
+A view opts in with a throttle_scope and the two throttle classes:
+
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'chatbot'
+
+Each (scope, user) and (scope, client IP) pair has a bucket in the cache
+(plus (scope, email) for views that also use EmailTokenBucketThrottle):
+the number of tokens left and when it was last updated. A bucket holds up
+to N tokens for a rate of "N/period" and refills continuously, so a client
+may burst N requests and then continue at the sustained rate; a request
+with no token left gets 429 with a Retry-After of the time until the next
+token. Anonymous requests use their IP as the user key. The client IP is
+DRF's get_ident, which reads X-Forwarded-For only as far as
+REST_FRAMEWORK['NUM_PROXIES'] trusted proxies vouch for it.
+
+Rates are DRF-style strings ('30/min'), per scope and kind, from RATES
+merged with settings.API_THROTTLE_RATES. Like DRF's own throttles the
+read-modify-write on a bucket is not atomic, so concurrent requests can
+occasionally spend the same token; the limits are protective, not exact.
+
+Usage counters (requests, throttled_user, throttled_ip, throttled_email and any metric a
+view records, e.g. the chatbot's cache_hits) are kept per scope and day
+in the cache and reported by the api_usage endpoint.
+"""
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+RATES = {
+    'chatbot': {'user': '30/min', 'ip': '120/min'},
+    'forgot_password': {'user': '5/hour', 'ip': '20/hour', 'email': '3/hour'},
+    'activity_analytics': {'user': '60/min', 'ip': '240/min'},
+}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+USAGE_KEY = 'api_usage:{day}:{scope}:{metric}'
+USAGE_DAYS = 7
+METRICS = ('requests', 'throttled_user', 'throttled_ip', 'throttled_email', 'cache_hits')
+
+
+def parse_rate(rate):
+    """'30/min' -> (capacity 30, refill 0.5 tokens per second)"""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period[0]]
+
+
+def rate_for(scope, kind):
+    rates = {**RATES.get(scope, {}), **getattr(settings, 'API_THROTTLE_RATES', {}).get(scope, {})}
+    return rates.get(kind)
+
+
+def record_usage(scope, metric):
+    key = USAGE_KEY.format(day=timezone.localdate().isoformat(), scope=scope, metric=metric)
+    cache.add(key, 0, timeout=USAGE_DAYS * 86400)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def usage_for(day, scopes=None):
+    """{scope: {metric: count}} for a date"""
+    scopes = scopes or sorted(RATES)
+    keys = {(scope, metric): USAGE_KEY.format(day=day.isoformat(), scope=scope, metric=metric)
+            for scope in scopes for metric in METRICS}
+    counts = cache.get_many(keys.values())
+    return {scope: {metric: counts.get(keys[scope, metric], 0) for metric in METRICS} for scope in scopes}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    kind = None
+
+    def get_ident_key(self, request):
+        """The bucket owner, or None to let the request through unmetered"""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = rate_for(scope, self.kind) if scope else None
+        if rate is None:
+            return True
+
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        capacity, per_second = parse_rate(rate)
+        key = f'throttle_bucket:{scope}:{self.kind}:{ident}'
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * per_second)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / per_second
+            record_usage(scope, f'throttled_{self.kind}')
+            return False
+        # An untouched bucket is full again after capacity / rate seconds
+        cache.set(key, (tokens - 1, now), timeout=math.ceil(capacity / per_second))
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per user (per IP when anonymous). Also counts the scope's requests."""
+    kind = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'u{request.user.pk}'
+        return f'ip{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        if getattr(view, 'throttle_scope', None):
+            record_usage(view.throttle_scope, 'requests')
+        return super().allow_request(request, view)
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per client IP, across all users behind it"""
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    """Per email address in the request body, whichever IP or user sends it"""
+    kind = 'email'
+
+    def get_ident_key(self, request):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return email.strip().lower()[:254]
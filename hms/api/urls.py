@@ -2,10 +2,15 @@ from django.urls import path
 from .views import ForgotPasswordView, ResetPasswordView
 from .analytics import ActivityAnalyticsView
 from .chatbot import ChatbotAPIView
+from .meals import MealHistoryAPIView, MealPlanAPIView
+from .usage import ApiUsageView
 
 urlpatterns = [
     path('auth/forgot-password/', ForgotPasswordView.as_view(), name='api_forgot_password'),
     path('auth/reset-password/', ResetPasswordView.as_view(), name='api_reset_password'),
     path('analytics/activity/', ActivityAnalyticsView.as_view(), name='api_activity_analytics'),
     path('chatbot/', ChatbotAPIView.as_view(), name='api_chatbot'),
+    path('meals/plan/', MealPlanAPIView.as_view(), name='api_meal_plan'),
+    path('meals/history/', MealHistoryAPIView.as_view(), name='api_meal_history'),
+    path('usage/', ApiUsageView.as_view(), name='api_usage'),
 ]
@@ -0,0 +1,26 @@
+from datetime import date
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from django.utils import timezone
+from .throttling import USAGE_DAYS, usage_for
+
+
+class ApiUsageView(APIView):
+    """
+    Per-scope API usage counters for a day (staff only).
+
+    GET /api/usage/?date=YYYY-MM-DD  (default today; the last 7 days are kept)
+    Returns: {"date": "...", "scopes": {"chatbot": {"requests", "throttled_user", "throttled_ip", "cache_hits"}, ...}}
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        day = timezone.localdate()
+        if request.query_params.get('date'):
+            try:
+                day = date.fromisoformat(request.query_params['date'])
+            except ValueError:
+                return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'date': day.isoformat(), 'retention_days': USAGE_DAYS, 'scopes': usage_for(day)})
@@ -7,10 +7,14 @@ from django.utils.encoding import force_bytes
 from django.core.mail import send_mail
 from django.conf import settings
 from .serializers import ForgotPasswordSerializer, ResetPasswordSerializer
+from .throttling import EmailTokenBucketThrottle, IPTokenBucketThrottle, UserTokenBucketThrottle
 
 class ForgotPasswordView(generics.GenericAPIView):
     serializer_class = ForgotPasswordSerializer
     permission_classes = [] 
+    # Each request can send an email; anonymous callers are bucketed by IP, and each address has its own bucket
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'forgot_password'
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -0,0 +1,143 @@
+"""
+Typeahead lookup of students for staff pages.
+
+Every student has a handful of StudentLookupKey rows, each a normalised
+string a search may start with:
+
+* name tokens, lowercased and accent-folded ("Zoë" -> "zoe")
+* the university ID with separators removed ("SCT211-0001/2020" ->
+  "sct21100012020") and each of its parts ("sct211", "0001", "2020")
+* the phone in E.164 digits ("0712 345 678" -> "254712345678")
+
+A query is split the same way and every token must be the prefix of one of
+the student's keys, so "zo kam" finds "Zoë Kamau". Digit-only tokens are
+also tried as a phone number, so "0712" matches "254712...". Each token is
+matched as a key range (key >= "zo" and key < "zp") on the (key, student)
+index, which any database can answer from the index alone.
+
+Keys are rewritten by the Student and User post_save signals in
+hms.signals; rebuild_lookup_keys backfills them. Results are cached per
+normalised query for AUTOCOMPLETE_CACHE_SECONDS (default 30), so a burst of
+keystrokes from several staff costs one query per distinct prefix.
+"""
+import re
+import unicodedata
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from .models import Student, StudentLookupKey
+
+RESULT_LIMIT = 8
+MAX_LIMIT = 20
+MIN_QUERY_LENGTH = 2
+MAX_TOKENS = 4
+KEY_LENGTH = 64
+NON_KEY_RE = re.compile(r'[^a-z0-9]+')
+
+
+def fold(text):
+    """Lowercase, strip accents and split into [a-z0-9] tokens"""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode().lower()
+    return [token for token in NON_KEY_RE.split(text) if token]
+
+
+def lookup_keys(student):
+    """The set of keys a search for this student may start with"""
+    user = student.user
+    keys = set(fold(user.first_name)) | set(fold(user.last_name)) | set(fold(user.username))
+    id_parts = fold(student.university_id)
+    keys.update(id_parts)
+    if len(id_parts) > 1:
+        keys.add(''.join(id_parts))
+    if student.phone_e164:
+        keys.add(student.phone_e164.lstrip('+'))
+    return {key[:KEY_LENGTH] for key in keys}
+
+
+def index_student(student):
+    """Replace a student's lookup keys"""
+    keys = lookup_keys(student)
+    with transaction.atomic():
+        StudentLookupKey.objects.filter(student=student).exclude(key__in=keys).delete()
+        StudentLookupKey.objects.bulk_create(
+            [StudentLookupKey(student=student, key=key) for key in keys], ignore_conflicts=True)
+
+
+def rebuild_lookup_keys(batch_size=1000):
+    """Recreate the keys for every student; returns how many keys were written"""
+    written = 0
+    with transaction.atomic():
+        StudentLookupKey.objects.all().delete()
+        batch = []
+        for student in Student.objects.select_related('user').order_by('pk').iterator(chunk_size=batch_size):
+            batch.extend(StudentLookupKey(student=student, key=key) for key in lookup_keys(student))
+            if len(batch) >= batch_size:
+                written += len(StudentLookupKey.objects.bulk_create(batch))
+                batch = []
+        written += len(StudentLookupKey.objects.bulk_create(batch))
+    return written
+
+
+def _prefix(token):
+    """key >= token and key < the next string after every token-prefixed one"""
+    return Q(key__gte=token, key__lt=token[:-1] + chr(ord(token[-1]) + 1))
+
+
+def query_tokens(query):
+    """Folded tokens of a query; an ID typed with separators also counts as one compact token"""
+    raw = str(query or '')[:100]
+    tokens = []
+    for word in raw.split():
+        parts = fold(word)
+        if len(parts) > 1 and any(part.isdigit() for part in parts):
+            tokens.append(''.join(parts))
+        else:
+            tokens.extend(parts)
+    return [token[:KEY_LENGTH] for token in tokens[:MAX_TOKENS]]
+
+
+def _token_filter(token):
+    match = _prefix(token)
+    # A local number ("0712", "712") also matches the stored E.164 form
+    if token.isdigit() and len(token) > 1 and token[0] in '017':
+        match |= _prefix('254' + (token[1:] if token[0] == '0' else token))
+    return Exists(StudentLookupKey.objects.filter(match, student=OuterRef('pk')))
+
+
+def matching_students(query, students=None):
+    """Students (from `students`, default all) with a key starting with every token of `query`"""
+    students = Student.objects.all() if students is None else students
+    tokens = query_tokens(query)
+    if not tokens:
+        return students.none()
+    for token in tokens:
+        students = students.filter(_token_filter(token))
+    return students
+
+
+def suggest(query, limit=RESULT_LIMIT):
+    """Up to `limit` students whose keys start with every token of `query`, as dicts for JSON"""
+    tokens = query_tokens(query)
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    if not tokens or sum(len(token) for token in tokens) < MIN_QUERY_LENGTH:
+        return []
+
+    cache_key = f"autocomplete:{'+'.join(tokens)}:{limit}"
+    results = cache.get(cache_key)
+    if results is not None:
+        return results
+
+    rows = matching_students(query).order_by('user__first_name', 'user__last_name', 'pk').values(
+        'pk', 'user_id', 'user__first_name', 'user__last_name', 'user__username',
+        'university_id', 'phone', 'hostel', 'room_number')[:limit]
+    results = [{
+        'id': row['pk'],
+        'user_id': row['user_id'],
+        'name': f"{row['user__first_name']} {row['user__last_name']}".strip() or row['user__username'],
+        'university_id': row['university_id'] or '',
+        'phone': row['phone'],
+        'residence': ' '.join(part for part in (row['hostel'], row['room_number']) if part),
+    } for row in rows]
+    cache.set(cache_key, results, getattr(settings, 'AUTOCOMPLETE_CACHE_SECONDS', 30))
+    return results
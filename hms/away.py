@@ -0,0 +1,145 @@
+"""
+Away status served from an interval index.
+
+AwayPeriod rows are loaded once, merged per student (overlapping or
+back-to-back periods become one interval) and kept sorted, so "is this
+student away on D" is a binary search and "who is away on D" only looks at
+intervals that start on or before D.
+
+Being away is implicit: no Meal rows are written for away days. Meal rows
+that already exist inside a new away period are cleared with one UPDATE,
+and meal counts add the away students from the index instead of counting
+Meal.away flags.
+
+The index of current and future periods (plus a short history for the
+analytics charts) is cached and dropped whenever an AwayPeriod changes.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.db import transaction
+from .models import AwayPeriod, Meal
+
+AWAY_INDEX_CACHE_KEY = 'away_index'
+AWAY_INDEX_TTL = 60 * 60
+# How far back the cached index reaches; older days are loaded on demand
+AWAY_INDEX_HISTORY_DAYS = 31
+
+
+def merge_intervals(intervals):
+    """Merge overlapping or adjacent (start, end) date ranges"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+class AwayIndex:
+    """Merged away intervals per student, covering days from `since` onwards"""
+
+    def __init__(self, periods, since=None):
+        by_student = defaultdict(list)
+        for student_id, start, end in periods:
+            by_student[student_id].append((start, end))
+
+        self.since = since
+        self._starts = {}
+        self._ends = {}
+        intervals = []
+        for student_id, ranges in by_student.items():
+            merged = merge_intervals(ranges)
+            self._starts[student_id] = [start for start, _ in merged]
+            self._ends[student_id] = [end for _, end in merged]
+            intervals.extend((start, end, student_id) for start, end in merged)
+
+        # All intervals by start date, for "who is away on D"
+        intervals.sort()
+        self._all_starts = [start for start, _, _ in intervals]
+        self._all = intervals
+
+    def covers(self, day):
+        return self.since is None or day >= self.since
+
+    def is_away(self, student_id, day):
+        starts = self._starts.get(student_id)
+        if not starts:
+            return False
+        i = bisect_right(starts, day) - 1
+        return i >= 0 and self._ends[student_id][i] >= day
+
+    def away_on(self, day):
+        """Ids of students away on `day`"""
+        stop = bisect_right(self._all_starts, day)
+        return {student_id for _, end, student_id in self._all[:stop] if end >= day}
+
+    def periods_for(self, student_id):
+        return list(zip(self._starts.get(student_id, ()), self._ends.get(student_id, ())))
+
+
+def load_away_index(since=None, student_ids=None):
+    """Build an index from one query over the periods still running on or after `since`"""
+    periods = AwayPeriod.objects.all()
+    if since is not None:
+        periods = periods.filter(end_date__gte=since)
+    if student_ids is not None:
+        periods = periods.filter(student_id__in=student_ids)
+    return AwayIndex(periods.values_list('student_id', 'start_date', 'end_date'), since=since)
+
+
+def get_away_index(day=None):
+    """Cached index of recent, current and future away periods.
+
+    Pass the earliest day you are going to ask about; if the cached index
+    does not reach that far back an uncached one is built for it.
+    """
+    index = cache.get(AWAY_INDEX_CACHE_KEY)
+    if index is None:
+        index = load_away_index(since=date.today() - timedelta(days=AWAY_INDEX_HISTORY_DAYS))
+        cache.set(AWAY_INDEX_CACHE_KEY, index, AWAY_INDEX_TTL)
+    if day is not None and not index.covers(day):
+        return load_away_index(since=day)
+    return index
+
+
+def invalidate_away_index():
+    cache.delete(AWAY_INDEX_CACHE_KEY)
+
+
+def is_away(student, day):
+    return get_away_index(day).is_away(student.pk, day)
+
+
+def students_away_on(day):
+    return get_away_index(day).away_on(day)
+
+
+def away_counts(days):
+    """{day: number of students away} for each day, from the index"""
+    days = list(days)
+    if not days:
+        return {}
+    index = get_away_index(min(days))
+    return {day: len(index.away_on(day)) for day in days}
+
+
+def mark_away(student, start_date, end_date):
+    """Record an away period and clear meal choices already made inside it.
+
+    Only existing Meal rows are touched (one UPDATE); no rows are created for
+    the away days themselves.
+    """
+    from .meal_counters import refresh_counts
+
+    with transaction.atomic():
+        period = AwayPeriod.objects.create(student=student, start_date=start_date, end_date=end_date)
+        meals = Meal.objects.filter(student=student, date__range=(start_date, end_date))
+        dates = list(meals.values_list('date', flat=True))
+        if dates:
+            meals.update(away=True, breakfast=False, early=False, supper=False)
+            transaction.on_commit(lambda: refresh_counts(dates))
+    return period
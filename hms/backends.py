@@ -1,22 +1,37 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from . import login_throttle
 
 class EmailBackend(ModelBackend):
     """
     Custom authentication backend that allows users to log in using their email address.
+
+    Attempts are throttled per IP and per account (hms.login_throttle). A
+    throttled attempt raises PermissionDenied, which stops Django trying the
+    remaining backends, so no password is hashed for it.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(User.USERNAME_FIELD)
-        
+        if username is None or password is None:
+            return None
+
+        # Check if requested username is actually an email or a username
+        user = login_throttle.find_user(username)
+        if login_throttle.retry_after(request, username, user):
+            login_throttle.log_attempt(request, user, 'Throttled')
+            raise PermissionDenied
+
         try:
-            # Check if requested username is actually an email or a username
-            user = User.objects.get(Q(username__iexact=username) | Q(email__iexact=username))
-        except User.DoesNotExist:
-            # Run the default password hasher once to reduce the vulnerability to timing attacks
-            User().set_password(password)
-        else:
-            if user.check_password(password) and self.user_can_authenticate(user):
-                return user
+            with login_throttle.hashing_slot():
+                if user is None:
+                    # Run the default password hasher once to reduce the vulnerability to timing attacks
+                    User().set_password(password)
+                elif user.check_password(password) and self.user_can_authenticate(user):
+                    return user
+        except PermissionDenied:
+            login_throttle.log_attempt(request, user, 'Throttled')
+            raise
+        login_throttle.record_failure(request, username, user)
         return None
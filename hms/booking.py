@@ -0,0 +1,161 @@
+"""
+Contention-safe bed booking.
+
+A bed is claimed with a single conditional UPDATE on the room's
+occupied_beds counter (``... WHERE occupied_beds < capacity``), so when many
+students race for the same room exactly `capacity` of them win and the rest
+are turned away without waiting on a lock. The winner then takes the lowest
+free bed number; the partial unique constraint on active (room, bed_number)
+guarantees no two occupants ever share a bed.
+
+is_available is updated in the same statement: a room closes when its last
+bed is taken and reopens when a bed in a full room is released. A room an
+admin closed with beds still free stays closed.
+
+Assignments changed outside these functions are recounted with
+sync_room_occupancy: the Django admin does so after saving assignments,
+and deleting an active assignment (directly or by cascade) does so from a
+post_delete signal. Room.objects.with_occupancy() and occupancy_summary()
+both read the counter.
+
+The warden occupancy map is built from one annotated query and cached for
+a short TTL.
+"""
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Room, RoomAssignment
+
+
+class RoomFull(Exception):
+    """Raised when no bed could be reserved in the requested room"""
+
+
+def _claim_bed(room_id):
+    return Room.objects.filter(
+        pk=room_id, is_available=True, occupied_beds__lt=F('capacity')
+    ).update(
+        occupied_beds=F('occupied_beds') + 1,
+        is_available=Case(When(occupied_beds__lt=F('capacity') - 1, then=Value(True)), default=Value(False)),
+    )
+
+
+def _release_beds(room_ids):
+    for room_id in room_ids:
+        Room.objects.filter(pk=room_id, occupied_beds__gt=0).update(
+            occupied_beds=F('occupied_beds') - 1,
+            is_available=Case(When(occupied_beds__gte=F('capacity'), then=Value(True)), default=F('is_available')),
+        )
+
+
+def release_active_assignments(student, checkout_date=None):
+    """End the student's active assignments and free their beds"""
+    checkout_date = checkout_date or timezone.now().date()
+    with transaction.atomic():
+        room_ids = list(RoomAssignment.objects.select_for_update()
+                        .filter(student=student, is_active=True)
+                        .values_list('room_id', flat=True))
+        if room_ids:
+            RoomAssignment.objects.filter(student=student, is_active=True).update(
+                is_active=False, checkout_date=checkout_date)
+            _release_beds(room_ids)
+    return len(room_ids)
+
+
+def book_bed(student, room, bed_number=None, assigned_date=None, notes=''):
+    """Reserve a bed in `room` for `student`, moving them out of any current room.
+
+    Raises RoomFull straight away if the room has no free bed. Returns the new
+    RoomAssignment.
+    """
+    with transaction.atomic():
+        if not _claim_bed(room.pk):
+            raise RoomFull(f"Room {room.room_number} is full")
+
+        release_active_assignments(student)
+
+        capacity = Room.objects.values_list('capacity', flat=True).get(pk=room.pk)
+        taken = set(RoomAssignment.objects.filter(room_id=room.pk, is_active=True)
+                    .values_list('bed_number', flat=True))
+        candidates = [n for n in range(1, capacity + 1) if n not in taken]
+        if bed_number in candidates:
+            candidates.remove(bed_number)
+            candidates.insert(0, bed_number)
+
+        for bed in candidates:
+            try:
+                # Savepoint so a lost race on this bed lets us try the next one
+                with transaction.atomic():
+                    return RoomAssignment.objects.create(
+                        student=student, room=room, bed_number=bed, is_active=True,
+                        assigned_date=assigned_date or timezone.now().date(), notes=notes,
+                    )
+            except IntegrityError:
+                continue
+        # Counter and beds disagree (legacy data); undo the claim with the transaction
+        raise RoomFull(f"No free bed number in room {room.room_number}")
+
+
+def sync_room_occupancy(room_ids=None):
+    """Recount occupied_beds from active assignments.
+
+    Rooms that are now full close; rooms that were full and have a free bed
+    again reopen, as when a bed is released.
+    """
+    rooms = Room.objects.all()
+    if room_ids is not None:
+        rooms = rooms.filter(pk__in=room_ids)
+    was_full = list(rooms.filter(occupied_beds__gte=F('capacity')).values_list('pk', flat=True))
+    active = (RoomAssignment.objects.filter(room=OuterRef('pk'), is_active=True)
+              .values('room').annotate(n=Count('pk')).values('n'))
+    rooms.update(occupied_beds=Coalesce(Subquery(active), Value(0)))
+    rooms.filter(occupied_beds__gte=F('capacity')).update(is_available=False)
+    if was_full:
+        rooms.filter(pk__in=was_full, occupied_beds__lt=F('capacity')).update(is_available=True)
+
+
+OCCUPANCY_MAP_CACHE_KEY = 'room_occupancy_map'
+OCCUPANCY_MAP_TTL = 30
+
+
+def build_occupancy_map():
+    """Rooms grouped by block and floor with live occupancy, from a single query"""
+    rows = (Room.objects.with_occupancy()
+            .order_by('block', 'floor', 'room_number')
+            .values('pk', 'room_number', 'block', 'floor', 'room_type', 'capacity',
+                    'is_available', 'active_count', 'free_beds'))
+    blocks = []
+    totals = {'rooms': 0, 'capacity': 0, 'occupied': 0}
+    for row in rows:
+        block_name = row['block'] or 'Unassigned'
+        if not blocks or blocks[-1]['block'] != block_name:
+            blocks.append({'block': block_name, 'capacity': 0, 'occupied': 0, 'floors': []})
+        block = blocks[-1]
+        if not block['floors'] or block['floors'][-1]['floor'] != row['floor']:
+            block['floors'].append({'floor': row['floor'], 'rooms': []})
+        block['floors'][-1]['rooms'].append({
+            'id': row['pk'],
+            'number': row['room_number'],
+            'type': row['room_type'],
+            'capacity': row['capacity'],
+            'occupied': row['active_count'],
+            'free': row['free_beds'],
+            'available': row['is_available'],
+        })
+        block['capacity'] += row['capacity']
+        block['occupied'] += row['active_count']
+        totals['rooms'] += 1
+        totals['capacity'] += row['capacity']
+        totals['occupied'] += row['active_count']
+    return {'generated_at': timezone.now().isoformat(), 'totals': totals, 'blocks': blocks}
+
+
+def get_occupancy_map():
+    """Cached occupancy map; a few seconds of staleness is fine for the warden grid"""
+    data = cache.get(OCCUPANCY_MAP_CACHE_KEY)
+    if data is None:
+        data = build_occupancy_map()
+        cache.set(OCCUPANCY_MAP_CACHE_KEY, data, OCCUPANCY_MAP_TTL)
+    return data
@@ -1,134 +1,138 @@
 """
 Rule-Based Chatbot Service for Student Welfare Management System
 No API key required - uses pattern matching for responses
+
+Intents and their keywords live in chatbot_data/intents.json and the
+answers, per role, in chatbot_data/responses/<role>.json (a role without a
+file of its own uses its fallback, e.g. warden -> admin). Editing the
+wording never touches code.
+
+All keywords are compiled once per process into a single regex with one
+named group per intent, so a message is scanned once whatever the number of
+intents. Every keyword hit adds the intent's weight to its score, each
+keyword counted once, and the best-scoring intent wins; ties go to the
+intent listed first. Generic intents (greeting, help) carry a lower weight
+so "hi, how do I pay my fees?" is answered about payments. Messages with
+no hits get the role's fallback answer. The API answers those, and
+questions that matched only generic words (score below SPECIFIC_SCORE),
+from published content instead when hms.knowledge finds any.
+
+get_engine() returns the process-wide ChatbotEngine. The chatbot_benchmark
+command measures messages per second.
 """
+import json
 import re
-from typing import List, Dict
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+DATA_DIR = Path(__file__).resolve().parent / 'chatbot_data'
+FALLBACK_INTENT = 'fallback'
+# Roles without a response table of their own
+ROLE_FALLBACKS = {'warden': 'admin'}
+DEFAULT_ROLE = 'student'
+# Scores below this come from generic words only (greeting, help)
+SPECIFIC_SCORE = 1.0
+
+
+def role_key(user_role: str) -> str:
+    """Response table name for a role label such as 'Admin', 'Warden' or 'Student'"""
+    return (user_role or DEFAULT_ROLE).strip().lower()
+
+
+class ChatbotEngine:
+    """Intent matcher compiled once from the data files"""
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        with open(data_dir / 'intents.json', encoding='utf-8') as f:
+            intents = json.load(f)['intents']
+        self.intents = [intent['name'] for intent in intents]
+        self.weights = {intent['name']: float(intent.get('weight', 1.0)) for intent in intents}
+
+        groups = []
+        first_letters = set()
+        for index, intent in enumerate(intents):
+            # Longest first so a phrase wins over a keyword it starts with
+            keywords = sorted((k.lower() for k in intent['keywords']), key=len, reverse=True)
+            first_letters.update(k[0] for k in keywords)
+            alternatives = '|'.join(re.escape(k).replace(r'\ ', r'\s+') for k in keywords)
+            groups.append(f'(?P<i{index}>{alternatives})')
+        # Messages are lowercased before matching (cheaper than IGNORECASE); the
+        # lookahead skips words that cannot start any keyword without trying them all
+        letters = re.escape(''.join(sorted(first_letters)))
+        self.matcher = re.compile(rf'\b(?=[{letters}])(?:' + '|'.join(groups) + r')s?\b')
+        self.group_intents = {f'i{index}': name for index, name in enumerate(self.intents)}
+
+        self.tables = {}
+        for path in sorted((data_dir / 'responses').glob('*.json')):
+            with open(path, encoding='utf-8') as f:
+                self.tables[path.stem] = json.load(f)
+        missing = [name for table in self.tables.values()
+                   for name in self.intents + [FALLBACK_INTENT] if name not in table['responses']]
+        if missing:
+            raise ValueError(f"Chatbot responses missing for intents: {sorted(set(missing))}")
+
+    def table(self, user_role: str) -> Dict:
+        role = role_key(user_role)
+        role = role if role in self.tables else ROLE_FALLBACKS.get(role, DEFAULT_ROLE)
+        return self.tables[role]
+
+    def scores(self, message: str) -> Dict[str, float]:
+        """{intent: score} for every intent with at least one keyword in the message"""
+        seen = defaultdict(set)
+        for match in self.matcher.finditer(message.lower()):
+            name = match.lastgroup
+            seen[self.group_intents[name]].add(match.group(name))
+        return {intent: len(keywords) * self.weights[intent] for intent, keywords in seen.items()}
+
+    def match(self, message: str) -> Tuple[str, float]:
+        """(best intent, its score); (FALLBACK_INTENT, 0) when nothing matches"""
+        scores = self.scores(message)
+        if not scores:
+            return FALLBACK_INTENT, 0.0
+        # max() keeps the first of equal scores; break ties by intent order
+        intent = max(self.intents, key=lambda name: scores.get(name, -1))
+        return intent, scores[intent]
+
+    def classify(self, message: str) -> str:
+        return self.match(message)[0]
+
+    def response(self, intent: str, user_role: str) -> str:
+        return self.table(user_role)['responses'][intent]
+
+    def respond(self, message: str, user_role: str) -> str:
+        return self.response(self.classify(message), user_role)
+
+    def quick_replies(self, user_role: str) -> List[str]:
+        return list(self.table(user_role).get('quick_replies', []))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> ChatbotEngine:
+    """The process-wide engine, built on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ChatbotEngine()
+    return _engine
 
 
 class ChatService:
     """Service class for managing rule-based chatbot interactions."""
-    
+
     def __init__(self):
-        """Initialize the rule-based chatbot with response patterns."""
-        self.patterns = self._load_patterns()
-        
-    def _load_patterns(self) -> List[Dict]:
-        """Load question patterns and their responses."""
-        return [
-            # Greetings
-            {
-                'patterns': [r'\b(hi|hello|hey|greetings)\b'],
-                'responses': {
-                    'admin': "Hello Admin! 👋 I'm here to help you manage the system. You can ask me about:\n• Viewing meal confirmations\n• Managing students\n• Understanding dashboard stats\n• System features",
-                    'student': "Hello! 👋 I'm here to help you navigate the Campus Care System. You can ask me about:\n• Confirming meals\n• Viewing room details\n• Submitting requests\n• Hostel policies"
-                }
-            },
-            
-            # Meal Confirmation
-            {
-                'patterns': [r'\b(meal|confirm|breakfast|lunch|dinner|food)\b'],
-                'responses': {
-                    'admin': "📊 **Viewing Meal Confirmations:**\n1. Check the dashboard for today's confirmed meals\n2. Use the 'Confirmed Meals' table to see student lists\n3. Export data using the 'Export CSV' button\n4. Send notifications to students who haven't confirmed",
-                    'student': "🍽️ **Confirming Your Meals:**\n1. Go to 'Confirm Meals' in the menu\n2. Select which meals you'll attend (breakfast, lunch, dinner)\n3. Submit your choices\n4. You can change them before the deadline\n\n💡 Tip: Confirm early to help the kitchen prepare!"
-                }
-            },
-            
-            # Room/Accommodation
-            {
-                'patterns': [r'\b(room|accommodation|hostel|dormitory|bed)\b'],
-                'responses': {
-                    'admin': "🏠 **Room Management:**\n• Go to 'Rooms' in the sidebar\n• View available rooms and occupancy\n• Assign students to rooms\n• Track maintenance issues\n• Update room status (available/occupied/maintenance)",
-                    'student': "🏠 **Your Room Information:**\n• Check your profile to see your room assignment\n• View your roommates\n• See room facilities and rules\n• Report any maintenance issues through the 'Maintenance' section"
-                }
-            },
-            
-            # Maintenance Requests
-            {
-                'patterns': [r'\b(maintenance|repair|broken|fix|issue|problem)\b'],
-                'responses': {
-                    'admin': "🔧 **Managing Maintenance:**\n1. Navigate to 'Maintenance' in the sidebar\n2. View all pending requests\n3. Assign requests to maintenance staff\n4. Update request status (pending/in progress/completed)\n5. View maintenance history",
-                    'student': "🔧 **Submitting Maintenance Requests:**\n1. Go to 'Maintenance' in your menu\n2. Click 'Submit New Request'\n3. Describe the issue clearly\n4. Select the category (plumbing, electrical, etc.)\n5. Track your request status in the same section"
-                }
-            },
-            
-            # Dashboard/Statistics
-            {
-                'patterns': [r'\b(dashboard|statistics|stats|analytics|report)\b'],
-                'responses': {
-                    'admin': "📈 **Understanding Dashboard Stats:**\n• **Students in Session:** Total active students\n• **Away Students:** Students marked as away\n• **Pending Payments:** Outstanding fees\n• **Meal Confirmations:** Daily meal counts\n• **Charts:** Toggle between daily/weekly/monthly views\n\nUse filters to view specific date ranges!",
-                    'student': "📊 **Your Dashboard:**\n• View your meal confirmations for the week\n• Check payment status\n• See important announcements\n• Quick access to common tasks\n• View your profile information"
-                }
-            },
-            
-            # Payments/Fees
-            {
-                'patterns': [r'\b(payment|fee|money|pay|mpesa|cost)\b'],
-                'responses': {
-                    'admin': "💰 **Managing Payments:**\n1. Go to 'Payments' section\n2. View all student payment statuses\n3. Mark payments as received\n4. Generate payment reports\n5. Send payment reminders to students",
-                    'student': "💰 **Making Payments:**\n1. Check your payment status on the dashboard\n2. View amount due and deadline\n3. Pay via M-Pesa or other accepted methods\n4. Contact admin if you have payment issues\n5. Keep your payment receipt for records"
-                }
-            },
-            
-            # Students Management
-            {
-                'patterns': [r'\b(student|manage student|add student|edit student)\b'],
-                'responses': {
-                    'admin': "👥 **Student Management:**\n• **View Students:** Click 'Students' in sidebar\n• **Add New:** Use 'Add Student' button\n• **Edit:** Click on student name > Edit\n• **View Details:** See full profile and history\n• **Away List:** Track students who are away\n\nYou can search and filter students by various criteria!",
-                    'student': "👤 **Your Profile:**\n• View your profile from the top menu\n• Update contact information\n• Check your hostel details\n• View your meal and payment history"
-                }
-            },
-            
-            # Announcements/News
-            {
-                'patterns': [r'\b(announcement|news|alert|notice|update)\b'],
-                'responses': {
-                    'admin': "📢 **Managing Announcements:**\n1. Go to 'News Alerts' in the sidebar\n2. Click 'Create Announcement'\n3. Set priority (urgent/normal)\n4. Choose visibility (all students/specific groups)\n5. Publish immediately or schedule for later",
-                    'student': "📢 **Viewing Announcements:**\n• Check your dashboard for latest announcements\n• Urgent notices are highlighted in red\n• Click on any announcement to read full details\n• Enable notifications to stay updated"
-                }
-            },
-            
-            # Away Mode
-            {
-                'patterns': [r'\b(away|leave|vacation|home|absent)\b'],
-                'responses': {
-                    'admin': "✈️ **Away Mode Management:**\n• View 'Away List' to see students who are away\n• Track departure and return dates\n• Adjust meal planning accordingly\n• Send reminders to students to update their status",
-                    'student': "✈️ **Going Away:**\n1. Go to your profile\n2. Enable 'Away Mode'\n3. Set your departure and return dates\n4. Your meals will be automatically suspended\n5. Remember to disable it when you return!"
-                }
-            },
-            
-            # System Owner / Developer
-            {
-                'patterns': [r'\b(owner|creator|developer|made|who created|author|background)\b'],
-                'responses': {
-                    'admin': "This system was developed and is maintained by **Ali Mahirizi Abdalla** (Software Engineer & Ethical Hacker). 👨‍💻",
-                    'student': "This system is proudly created by **Ali Mahirizi Abdalla**, a skilled Software Engineer and Ethical Hacker. 👨‍💻"
-                }
-            },
-
-            # Help/General
-            {
-                'patterns': [r'\b(help|how|what|where|guide|tutorial)\b'],
-                'responses': {
-                    'admin': "ℹ️ **Getting Help:**\n\n**Most Common Tasks:**\n• View daily meals: Dashboard > Confirmed Meals\n• Manage students: Sidebar > Students\n• Handle payments: Sidebar > Payments\n• Create announcements: Sidebar > News Alerts\n\n**Need more help?** Ask me specific questions!",
-                    'student': "ℹ️ **Getting Help:**\n\n**Quick Start:**\n• Confirm meals: Menu > Confirm Meals\n• View room: Profile > Room Details\n• Report issues: Menu > Maintenance\n• Check payments: Dashboard\n\n**Questions?** Just ask me anything!"
-                }
-            },
-            
-            # Default fallback
-            {
-                'patterns': [r'.*'],
-                'responses': {
-                    'admin': "I'm not sure I understand that question. I can help you with:\n\n✅ Meal confirmations\n✅ Student management\n✅ Dashboard statistics\n✅ Payments\n✅ Maintenance requests\n✅ Announcements\n\nTry asking about any of these topics!",
-                    'student': "I'm not sure about that. I can help you with:\n\n✅ Confirming meals\n✅ Room information\n✅ Maintenance requests\n✅ Payments\n✅ Announcements\n✅ Away mode\n\nWhat would you like to know?"
-                }
-            }
-        ]
-    
+        """Use the shared engine; nothing is compiled per instance."""
+        self.engine = get_engine()
+
     def get_system_prompt(self, user_role: str, user_name: str = "") -> str:
         """Get role-specific system prompt (for compatibility)."""
         return f"Rule-based assistant for {user_role}"
-    
+
     def chat(
         self,
         message: str,
@@ -138,59 +142,27 @@ class ChatService:
     ) -> Dict[str, str]:
         """
         Process message and return rule-based response.
-        
+
         Args:
             message: User's message
             conversation_history: List of previous messages (not used in rule-based)
             user_role: User's role in the system
             user_name: User's name for personalization
-            
+
         Returns:
             Dict with 'role' and 'content' keys
         """
         try:
-            # Normalize the message
-            message_lower = message.lower().strip()
-            
-            # Determine role key
-            role_key = 'admin' if user_role in ['Admin', 'Warden'] else 'student'
-            
-            # Find matching pattern
-            for pattern_set in self.patterns:
-                for pattern in pattern_set['patterns']:
-                    if re.search(pattern, message_lower, re.IGNORECASE):
-                        response = pattern_set['responses'][role_key]
-                        return {
-                            "role": "assistant",
-                            "content": response
-                        }
-            
-            # If no pattern matched, return default
             return {
                 "role": "assistant",
-                "content": self.patterns[-1]['responses'][role_key]
+                "content": self.engine.respond(message.strip(), user_role)
             }
-            
         except Exception as e:
             return {
                 "role": "assistant",
                 "content": f"I encountered an error. Please try rephrasing your question. (Error: {str(e)[:50]})"
             }
-            
+
     def get_quick_replies(self, user_role: str) -> List[str]:
         """Get role-specific quick replies."""
-        if user_role in ['Admin', 'Warden']:
-            return [
-                "View pending maintenance",
-                "How to manage students?",
-                "Dashboard statistics",
-                "Who is the owner?"
-            ]
-        else:
-            return [
-                "How to apply for deferment?",
-                "Check my fee balance",
-                "Book health appointment",
-                "Who is the owner?"
-            ]
-    
\ No newline at end of file
+        return self.engine.quick_replies(user_role)
@@ -0,0 +1,157 @@
+"""
+Deferment review workbench: one list, status facets, bulk decisions.
+
+The list page shows one status at a time (or all), with a count for every
+status from a single grouped query. Pages use keyset pagination on
+(created_at, id), newest first, backed by the (status, -created_at, -id)
+and (-created_at, -id) indexes. The cursor is the last row's creation time
+in microseconds and its id, so the next page is one index range scan
+however deep the officer has paged.
+
+decide() approves or rejects many requests in one transaction. Only
+undecided requests (pending or under review) change. The rows are locked,
+written with one bulk_update that also records the reviewer, and approved
+students are marked away. Student summaries are invalidated, and
+notifications are queued with run_async once the transaction commits:
+
+* emails go out over one SMTP connection;
+* SMS go as one bulk call per distinct text, to students who opted in.
+
+The wording comes from notifications.deferment_status_message, the same
+builder the single-request review page uses.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .away import mark_away
+from .models import DefermentRequest
+from .notifications import NotificationService, deferment_status_message
+from .student_summary import invalidate_summaries
+from .tasks import run_async
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+EMAIL_BATCH_SIZE = 100
+SMS_BATCH_SIZE = 100
+# Tab order on the list page
+STATUSES = [
+    ('pending', '🟡 Pending Application'),
+    ('under_review', '👀 Sent for Review'),
+    ('approved', '✅ Approved'),
+    ('rejected', '❌ Rejected'),
+    ('resumed', '🎓 Resumed Studies'),
+]
+UNDECIDED = ('pending', 'under_review')
+DECISIONS = ('approved', 'rejected')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def status_counts():
+    """{'all': n, 'pending': n, ...} from one GROUP BY"""
+    counts = {status: 0 for status, _ in STATUSES}
+    rows = DefermentRequest.objects.order_by().values('status').annotate(count=Count('id'))
+    for row in rows:
+        counts[row['status']] = row['count']
+    counts['all'] = sum(counts.values())
+    return counts
+
+
+def encode_cursor(deferment):
+    micros = (deferment.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{deferment.pk}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id), or None for a missing or malformed cursor"""
+    try:
+        micros, pk = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return EPOCH + timedelta(microseconds=micros), pk
+
+
+def deferment_page(status=None, after=None, size=PAGE_SIZE):
+    """(requests, next cursor or None) for one page, newest first"""
+    deferments = DefermentRequest.objects.select_related('student__user', 'reviewed_by')
+    if status:
+        deferments = deferments.filter(status=status)
+    position = decode_cursor(after) if after else None
+    if position:
+        created_at, pk = position
+        deferments = deferments.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(deferments.order_by('-created_at', '-pk')[:size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def decide(ids, status, reviewer, response=''):
+    """Set `status` ('approved' or 'rejected') on the undecided requests among `ids`.
+
+    Returns the requests that changed.
+    """
+    if status not in DECISIONS:
+        raise ValueError(f"Unknown decision {status!r}")
+    now = timezone.now()
+    with transaction.atomic():
+        deferments = list(DefermentRequest.objects.select_for_update(of=('self',))
+                          .select_related('student__user')
+                          .filter(pk__in=ids, status__in=UNDECIDED)
+                          .order_by('pk'))
+        for deferment in deferments:
+            deferment.status = status
+            deferment.reviewed_by = reviewer
+            deferment.reviewed_at = now
+            deferment.updated_at = now
+            if response:
+                deferment.admin_response = response
+        DefermentRequest.objects.bulk_update(
+            deferments, ['status', 'admin_response', 'reviewed_by', 'reviewed_at', 'updated_at'], batch_size=500)
+
+        if status == 'approved':
+            for deferment in deferments:
+                mark_away(deferment.student, deferment.start_date, deferment.end_date)
+
+        changed = [deferment.pk for deferment in deferments]
+        student_ids = {deferment.student_id for deferment in deferments}
+        # bulk_update sends no post_save, so do what the signals would
+        transaction.on_commit(lambda: invalidate_summaries(student_ids))
+        if changed:
+            run_async(notify_decisions, changed)
+    logger.info(f"[DEFERMENT] {reviewer} set {len(deferments)} of {len(ids)} requests to {status}")
+    return deferments
+
+
+def notify_decisions(deferment_ids):
+    """Email every student and text those who opted in, in batches. Returns (emailed, texted)."""
+    deferments = list(DefermentRequest.objects
+                      .filter(pk__in=deferment_ids, status__in=DECISIONS)
+                      .select_related('student__user__notification_preferences'))
+
+    emailed = 0
+    messages = []
+    texts = {}
+    for deferment in deferments:
+        subject, body, sms_body = deferment_status_message(deferment)
+        if deferment.student.user.email:
+            messages.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [deferment.student.user.email]))
+        preferences = getattr(deferment.student.user, 'notification_preferences', None)
+        phone = deferment.student.phone_e164 or deferment.student.phone
+        if phone and preferences and preferences.sms_notifications:
+            texts.setdefault(sms_body, []).append(phone)
+    if messages:
+        connection = get_connection(fail_silently=True)
+        for i in range(0, len(messages), EMAIL_BATCH_SIZE):
+            emailed += connection.send_messages(messages[i:i + EMAIL_BATCH_SIZE]) or 0
+
+    texted = 0
+    # Approval texts carry the dates, so one bulk call per distinct text
+    for sms_body, phones in texts.items():
+        texted += NotificationService.send_bulk_sms(phones, sms_body, batch_size=SMS_BATCH_SIZE)
+    logger.info(f"[DEFERMENT] Decision notices: {emailed} emails, {texted} SMS for {len(deferments)} requests")
+    return emailed, texted
@@ -0,0 +1,169 @@
+"""
+Dining-hall check-in with rotating meal passes.
+
+A student's meal pass is a QR code of
+
+    <student id>:<window>:<signature>
+
+where window is the current DINING_TOKEN_SECONDS slot and the signature
+is an HMAC of the first two parts keyed from SECRET_KEY. The scanner can
+therefore check a pass without reading the database: the signature proves
+who it belongs to and the window that it is fresh (the previous slot is
+still accepted so a pass shown just before it rotates still works).
+
+A valid scan is deduplicated with cache.add on a per-student, per-meal,
+per-day key, which acts as a shared "already served" set across workers,
+so a repeat scan is refused without touching the database. The serving is
+then written straight away with one INSERT; the unique (student, date,
+meal) constraint catches a repeat whose key was evicted. If the write
+fails the key is released, so the student can be scanned again rather
+than being marked served with no record of it.
+
+Servings feed dining_report (served vs confirmed, walk-ins and no-shows)
+and the forecast actuals.
+"""
+import base64
+import io
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from .meal_archive import MEAL_FIELDS, daily_totals, diners_on
+from .models import MealServing
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'hms.dining.meal-pass'
+SIGNATURE_LENGTH = 20
+SERVED_TTL = 60 * 60 * 24
+
+
+class InvalidPass(Exception):
+    """A scanned pass that is malformed, forged or expired"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _token_seconds():
+    return getattr(settings, 'DINING_TOKEN_SECONDS', 60)
+
+
+def _sign(student_id, window):
+    return salted_hmac(TOKEN_SALT, f'{student_id}:{window}', algorithm='sha256').hexdigest()[:SIGNATURE_LENGTH]
+
+
+def make_token(student_id, now=None):
+    """The current meal pass token for a student and the seconds until it rotates"""
+    now = time.time() if now is None else now
+    period = _token_seconds()
+    window = int(now // period)
+    return f'{student_id}:{window}:{_sign(student_id, window)}', int(period - now % period)
+
+
+def check_token(token, now=None):
+    """Return the student id a token was issued to, or raise InvalidPass"""
+    try:
+        student_id, window, signature = token.strip().split(':')
+        student_id, window = int(student_id), int(window)
+    except (AttributeError, ValueError):
+        raise InvalidPass('malformed')
+    if not constant_time_compare(signature, _sign(student_id, window)):
+        raise InvalidPass('invalid')
+    now = time.time() if now is None else now
+    current = int(now // _token_seconds())
+    if window not in (current, current - 1):
+        raise InvalidPass('expired')
+    return student_id
+
+
+def qr_png_base64(data):
+    """A QR code for `data` as a base64 PNG, for embedding in an <img> tag"""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _served_key(student_id, day, meal):
+    return f'served:{day.isoformat()}:{meal}:{student_id}'
+
+
+def record_scan(token, meal, line='', scanned_by=None, now=None):
+    """Check a scanned pass and record the serving.
+
+    Returns the student id; raises InvalidPass for a bad pass or a student
+    already served this meal today ('duplicate').
+    """
+    if meal not in MEAL_FIELDS:
+        raise InvalidPass('unknown meal')
+    student_id = check_token(token)
+    now = now or timezone.now()
+    day = timezone.localdate(now)
+    key = _served_key(student_id, day, meal)
+    if not cache.add(key, 1, SERVED_TTL):
+        raise InvalidPass('duplicate')
+
+    try:
+        with transaction.atomic():
+            MealServing.objects.create(student_id=student_id, date=day, meal=meal, served_at=now,
+                                       line=line[:30], scanned_by=scanned_by)
+    except IntegrityError:
+        # Already served; the cache key had been evicted
+        raise InvalidPass('duplicate')
+    except DatabaseError:
+        cache.delete(key)
+        raise
+    return student_id
+
+
+def served_counts(dates):
+    """{day: {meal: served}} from the recorded servings"""
+    counts = defaultdict(lambda: dict.fromkeys(MEAL_FIELDS, 0))
+    rows = (MealServing.objects.filter(date__in=list(dates)).values('date', 'meal')
+            .annotate(served=Count('pk')).order_by())
+    for row in rows:
+        counts[row['date']][row['meal']] = row['served']
+    return counts
+
+
+def dining_report(start, end):
+    """Served vs confirmed for each day and meal in start..end.
+
+    Rows carry confirmed, served, walk_ins (served without confirming) and
+    no_shows (confirmed but never scanned); the last three are None for a
+    meal with no scans at all.
+    """
+    confirmed = daily_totals(start, end)
+    served = defaultdict(set)
+    rows = MealServing.objects.filter(date__range=(start, end)).values_list('date', 'meal', 'student_id')
+    for day, meal, student_id in rows.iterator(chunk_size=5000):
+        served[(day, meal)].add(student_id)
+
+    report = []
+    day = start
+    while day <= end:
+        for meal in MEAL_FIELDS:
+            row = {'date': day, 'meal': meal, 'confirmed': confirmed[day][meal],
+                   'served': None, 'walk_ins': None, 'no_shows': None}
+            served_ids = served.get((day, meal))
+            # Without any scans the pass was not in use, so there is nothing to compare
+            if served_ids:
+                walk_ins = len(served_ids - diners_on(day, meal))
+                row.update(served=len(served_ids), walk_ins=walk_ins,
+                           no_shows=row['confirmed'] - (len(served_ids) - walk_ins))
+            report.append(row)
+        day += timedelta(days=1)
+    return report
@@ -0,0 +1,215 @@
+"""
+Kitchen demand forecasting.
+
+For each of the next days the forecast for a meal is
+
+    confirmed so far (Meal rows plus weekly defaults)
+    + expected diners among students who have not confirmed yet
+
+The second term is the sum, over regular diners who have neither a row
+nor a default for that day and are not away, of their historical chance of
+taking that meal on that weekday.
+
+History is held as a compact student x day matrix: for every student and
+meal one Python int whose bit i is set when they had the meal on day i of
+the window, plus a mask of the days they were not away. Weekday and
+recency selections are masks too, so a student's weighted rate for a
+weekday is a handful of AND + bit_count operations over the whole window.
+The last four weeks count double, which follows the academic calendar
+(openings, exams, breaks) without needing one. Rates are smoothed towards
+the weekday average across all diners, and students on attachment are
+left out.
+
+Every forecast is stored in MealForecast. Once a day has passed its actual
+count is filled in (meals served at check-in, or the final confirmations
+when passes were not scanned), and the recent ratio of late confirmations to
+expected ones corrects the unconfirmed term. forecast_meals runs all of
+this nightly.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from .away import load_away_index
+from .dining import served_counts
+from .meal_archive import daily_totals, month_start, shift_bits
+from .models import Meal, MealArchive, MealDefault, MealForecast, Student
+
+MEALS = ('breakfast', 'early', 'supper')
+FORECAST_DAYS = 7
+HISTORY_WEEKS = 8
+RECENT_WEEKS = 4
+RECENT_WEIGHT = 2
+SMOOTHING = 2.0
+CALIBRATION_DAYS = 28
+
+
+def _range_mask(lo, hi):
+    """Bits lo..hi inclusive"""
+    return ((1 << (hi - lo + 1)) - 1) << lo
+
+
+class MealHistory:
+    """Per-student meal bitsets over a window of whole weeks ending the day before `end`"""
+
+    def __init__(self, end, weeks=HISTORY_WEEKS, recent_weeks=RECENT_WEEKS):
+        self.days = weeks * 7
+        self.start = end - timedelta(days=self.days)
+        self.full = (1 << self.days) - 1
+        self.recent = _range_mask(self.days - recent_weeks * 7, self.days - 1)
+        self.weekday = [0] * 7
+        for i in range(self.days):
+            self.weekday[(self.start + timedelta(days=i)).weekday()] |= 1 << i
+        self.meals = {meal: defaultdict(int) for meal in MEALS}
+        self.present = {}
+        self.diners = set()
+
+    @classmethod
+    def load(cls, end, **kwargs):
+        history = cls(end, **kwargs)
+        last = end - timedelta(days=1)
+        rows = (Meal.objects.filter(date__range=(history.start, last))
+                .values_list('student_id', 'date', *MEALS).order_by().iterator(chunk_size=5000))
+        for student_id, day, *flags in rows:
+            bit = 1 << (day - history.start).days
+            history.diners.add(student_id)
+            for meal, taken in zip(MEALS, flags):
+                if taken:
+                    history.meals[meal][student_id] |= bit
+        # Closed months have been compacted out of Meal
+        archives = MealArchive.objects.filter(month__range=(month_start(history.start), last), recorded__gt=0)
+        for student_id, month, recorded, *values in archives.values_list(
+                'student_id', 'month', 'recorded', *MEALS).iterator(chunk_size=5000):
+            if shift_bits(recorded, month, history.start, history.days):
+                history.diners.add(student_id)
+            for meal, value in zip(MEALS, values):
+                history.meals[meal][student_id] |= shift_bits(value, month, history.start, history.days)
+
+        history.diners -= set(Student.objects.filter(pk__in=history.diners, is_on_attachment=True)
+                              .values_list('pk', flat=True))
+        away = load_away_index(since=history.start, student_ids=history.diners)
+        for student_id in history.diners:
+            mask = history.full
+            for start, stop in away.periods_for(student_id):
+                lo, hi = max((start - history.start).days, 0), min((stop - history.start).days, history.days - 1)
+                if lo <= hi:
+                    mask &= ~_range_mask(lo, hi)
+            history.present[student_id] = mask
+        return history
+
+    def _weighted(self, mask, weekday):
+        selected = mask & self.weekday[weekday]
+        return (selected & self.recent).bit_count() * RECENT_WEIGHT + (selected & ~self.recent).bit_count()
+
+    def weekday_counts(self, student_id, meal, weekday):
+        """(weighted days taken, weighted days present) for one student"""
+        present = self.present[student_id]
+        return (self._weighted(self.meals[meal][student_id] & present, weekday),
+                self._weighted(present, weekday))
+
+    def baseline(self, meal, weekday):
+        """Weekday rate across all diners, used to smooth individual rates"""
+        taken = present = 0
+        for student_id in self.diners:
+            t, p = self.weekday_counts(student_id, meal, weekday)
+            taken += t
+            present += p
+        return taken / present if present else 0.0
+
+    def rate(self, student_id, meal, weekday, baseline):
+        taken, present = self.weekday_counts(student_id, meal, weekday)
+        return (taken + SMOOTHING * baseline) / (present + SMOOTHING)
+
+
+def record_actuals(today=None):
+    """Fill in actual counts for forecasts of days that have passed"""
+    today = today or timezone.localdate()
+    dates = list(MealForecast.objects.filter(date__lt=today, actual__isnull=True)
+                 .values_list('date', flat=True).distinct())
+    if not dates:
+        return 0
+    confirmed = daily_totals(min(dates), max(dates))
+    served = served_counts(dates)
+    forecasts = list(MealForecast.objects.filter(date__in=dates, actual__isnull=True))
+    for forecast in forecasts:
+        # Scanned servings when the meal pass was in use, else the final confirmations
+        forecast.actual = (served.get(forecast.date, {}).get(forecast.meal)
+                           or confirmed[forecast.date][forecast.meal])
+    MealForecast.objects.bulk_update(forecasts, ['actual'])
+    return len(forecasts)
+
+
+def calibration(today=None):
+    """{meal: factor} scaling the unconfirmed term by how late confirmations turned out recently"""
+    today = today or timezone.localdate()
+    rows = (MealForecast.objects.filter(actual__isnull=False, date__gte=today - timedelta(days=CALIBRATION_DAYS))
+            .values('meal').annotate(actual=Sum('actual'), confirmed=Sum('confirmed'),
+                                     expected=Sum('expected_unconfirmed')).order_by())
+    factors = dict.fromkeys(MEALS, 1.0)
+    for row in rows:
+        if row['expected']:
+            factors[row['meal']] = min(max((row['actual'] - row['confirmed']) / row['expected'], 0.0), 2.0)
+    return factors
+
+
+def forecast_days(start=None, days=FORECAST_DAYS, history=None):
+    """Compute (without saving) forecasts for `days` days from `start` (default tomorrow)"""
+    today = timezone.localdate()
+    start = start or today + timedelta(days=1)
+    dates = [start + timedelta(days=i) for i in range(days)]
+    history = history or MealHistory.load(today)
+    factors = calibration(today)
+    away = load_away_index(since=start, student_ids=history.diners)
+
+    rows_by_day = defaultdict(set)
+    confirmed = {day: dict.fromkeys(MEALS, 0) for day in dates}
+    for student_id, day, *flags in Meal.objects.filter(date__in=dates).values_list(
+            'student_id', 'date', *MEALS).order_by():
+        rows_by_day[day].add(student_id)
+        for meal, taken in zip(MEALS, flags):
+            confirmed[day][meal] += taken
+
+    defaults_by_weekday = defaultdict(dict)
+    for student_id, weekday, *flags in MealDefault.objects.values_list('student_id', 'weekday', *MEALS):
+        defaults_by_weekday[weekday][student_id] = flags
+
+    results = []
+    for day in dates:
+        weekday = day.weekday()
+        defaults = defaults_by_weekday[weekday]
+        for student_id, flags in defaults.items():
+            if student_id not in rows_by_day[day] and not away.is_away(student_id, day):
+                for meal, taken in zip(MEALS, flags):
+                    confirmed[day][meal] += taken
+
+        undecided = [s for s in history.diners
+                     if s not in rows_by_day[day] and s not in defaults and not away.is_away(s, day)]
+        for meal in MEALS:
+            baseline = history.baseline(meal, weekday)
+            expected = sum(history.rate(s, meal, weekday, baseline) for s in undecided)
+            results.append(MealForecast(
+                date=day, meal=meal, confirmed=confirmed[day][meal],
+                expected_unconfirmed=round(expected, 2),
+                forecast=round(confirmed[day][meal] + expected * factors[meal]),
+                generated_at=timezone.now(),
+            ))
+    return results
+
+
+def run_forecast(days=FORECAST_DAYS):
+    """Nightly job: record yesterday's actuals, then store forecasts for the coming days"""
+    record_actuals()
+    forecasts = forecast_days(days=days)
+    MealForecast.objects.bulk_create(
+        forecasts, update_conflicts=True, unique_fields=['date', 'meal'],
+        update_fields=['confirmed', 'expected_unconfirmed', 'forecast', 'generated_at'],
+    )
+    return forecasts
+
+
+def forecast_table(dates):
+    """{date: {meal: MealForecast}} for the dashboard"""
+    table = defaultdict(dict)
+    for forecast in MealForecast.objects.filter(date__in=list(dates)):
+        table[forecast.date][forecast.meal] = forecast
+    return table
@@ -13,7 +13,8 @@ class VisitorForm(forms.ModelForm):
         model = Visitor
         fields = ['student', 'name', 'category', 'phone', 'id_number', 'purpose']
         widgets = {
-            'student': forms.Select(attrs={'class': 'w-full p-2 border rounded'}),
+            # Picked with the student typeahead in the template
+            'student': forms.HiddenInput(),
             'name': forms.TextInput(attrs={'class': 'w-full p-2 border rounded'}),
             'category': forms.Select(attrs={'class': 'w-full p-2 border rounded'}),
             'phone': forms.TextInput(attrs={'class': 'w-full p-2 border rounded'}),
@@ -0,0 +1,243 @@
+"""
+Retrieval over published content for the chatbot.
+
+Announcements, visible Documents (title and description), active
+MentalHealthResources and LibraryNews are tokenised into an in-memory BM25
+inverted index: {term: {document key: term frequency}}, with title terms
+counted twice. A question is answered from that index in about a
+millisecond even with thousands of entries, and the chatbot replies with the top snippets and links
+instead of its generic menu.
+
+Each process builds its index lazily on the first question. A shared
+version number in the cache says which index is current:
+
+* The post_save/post_delete signals in hms.signals call index_object /
+  remove_object once the write commits. These bump the version, and if the
+  local index was exactly one version behind, the change is applied to it
+  in place.
+* A process whose index version differs from the cache (another worker
+  changed something, or the cache was cleared) rebuilds on its next
+  question. The corpus is small, so a rebuild is one query per source.
+"""
+import math
+import re
+import threading
+from collections import Counter, namedtuple
+from django.core.cache import cache
+from django.urls import reverse
+from library.models import LibraryNews
+from .autocomplete import fold
+from .models import Announcement, Document, MentalHealthResource
+
+VERSION_KEY = 'knowledge_index_version'
+RESULT_LIMIT = 3
+SNIPPET_LENGTH = 200
+TITLE_BOOST = 2
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+STOPWORDS = frozenset(
+    'a an and are as at be by can do does for from get have how i in is it me my of on or so the this '
+    'to was we what when where which who why will with you your'.split()
+)
+
+Entry = namedtuple('Entry', 'kind title text url length')
+Result = namedtuple('Result', 'kind title snippet url score')
+
+
+def terms(text):
+    """Index terms: folded tokens without stopwords, with a trailing plural 's' dropped"""
+    result = []
+    for token in fold(text):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        result.append(token)
+    return result
+
+
+def _announcement_entry(announcement):
+    if not announcement.is_active:
+        return None
+    return announcement.title, announcement.content, reverse('hms:announcements')
+
+
+def _document_entry(document):
+    if not document.is_visible:
+        return None
+    return document.title, document.description, document.file.url if document.file else ''
+
+
+def _resource_entry(resource):
+    if not resource.is_active:
+        return None
+    url = resource.external_link or reverse('hms:mental_health_dashboard')
+    return resource.title, resource.content, url
+
+
+def _library_news_entry(news):
+    if not news.is_active:
+        return None
+    return news.title, news.content, reverse('library:student_library')
+
+
+# kind: (model, entry builder returning (title, text, url) or None when hidden)
+SOURCES = {
+    'announcement': (Announcement, _announcement_entry),
+    'document': (Document, _document_entry),
+    'resource': (MentalHealthResource, _resource_entry),
+    'library_news': (LibraryNews, _library_news_entry),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _) in SOURCES.items()}
+
+
+class KnowledgeIndex:
+    """BM25 inverted index over (kind, pk) keys"""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.postings = {}
+        self.entries = {}
+        self.total_length = 0
+
+    def add(self, key, kind, title, text, url):
+        self.remove(key)
+        counts = Counter(terms(title) * TITLE_BOOST + terms(text))
+        length = sum(counts.values())
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[key] = count
+        self.entries[key] = Entry(kind, title, text or '', url, length)
+        self.total_length += length
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_length -= entry.length
+        for term in set(terms(entry.title) + terms(entry.text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query, limit=RESULT_LIMIT):
+        query_terms = set(terms(query))
+        if not query_terms or not self.entries:
+            return []
+        count = len(self.entries)
+        average_length = self.total_length / count
+        scores = Counter()
+        for term in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, frequency in posting.items():
+                norm = K1 * (1 - B + B * self.entries[key].length / average_length)
+                scores[key] += idf * frequency * (K1 + 1) / (frequency + norm)
+
+        results = []
+        for key, score in scores.most_common(limit):
+            entry = self.entries[key]
+            results.append(Result(entry.kind, entry.title, snippet(entry.text, query_terms), entry.url, score))
+        return results
+
+
+def snippet(text, query_terms, length=SNIPPET_LENGTH):
+    """About `length` characters of `text` starting near the first query term"""
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    start = 0
+    for match in re.finditer(r'\w+', text):
+        word = terms(match.group())
+        if word and word[0] in query_terms:
+            start = match.start()
+            break
+    # Back up to the start of the sentence when it is close
+    sentence = text.rfind('. ', 0, start)
+    start = sentence + 2 if sentence != -1 and start - sentence < length // 2 else start
+    start = max(0, min(start, len(text) - length))
+    cut = text[start:start + length].rsplit(' ', 1)[0]
+    return ('…' if start else '') + cut + '…'
+
+
+def build_index(version=0):
+    index = KnowledgeIndex(version)
+    for kind, (model, build) in SOURCES.items():
+        for instance in model.objects.order_by('pk').iterator():
+            entry = build(instance)
+            if entry is not None:
+                index.add((kind, instance.pk), kind, *entry)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def _bump_version():
+    cache.add(VERSION_KEY, 0, timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+def get_index():
+    """This process's index, rebuilt when another process has changed the content"""
+    global _index
+    version = current_version()
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = build_index(version)
+    return _index
+
+
+def _apply(change):
+    version = _bump_version()
+    with _index_lock:
+        if _index is not None and _index.version == version - 1:
+            change(_index)
+            _index.version = version
+
+
+def index_object(instance):
+    """Add, refresh or drop the entry for one record"""
+    kind = KIND_BY_MODEL[type(instance)]
+    entry = SOURCES[kind][1](instance)
+    key = (kind, instance.pk)
+    _apply(lambda index: index.add(key, kind, *entry) if entry is not None else index.remove(key))
+
+
+def remove_object(model, object_id):
+    key = (KIND_BY_MODEL[model], object_id)
+    _apply(lambda index: index.remove(key))
+
+
+def search(query, limit=RESULT_LIMIT):
+    """Top Results for `query`, best first"""
+    index = get_index()
+    # Signals may be updating the same index from another thread
+    with _index_lock:
+        return index.search(query, limit)
+
+
+def format_answer(results):
+    """A chat reply quoting the results"""
+    parts = ["Here is what I found:"]
+    for result in results:
+        part = f"**{result.title}**\n{result.snippet}" if result.snippet else f"**{result.title}**"
+        if result.url:
+            part += f"\n🔗 {result.url}"
+        parts.append(part)
+    return '\n\n'.join(parts)
@@ -0,0 +1,319 @@
+"""
+Student fee ledger.
+
+Every charge (room assignment, registration fee) and credit (M-Pesa payment)
+is written once to LedgerEntry, keyed by its source record so re-posting is a
+no-op. Each posting updates the student's StudentBalance row in the same
+transaction, so balance lookups and finance reports read one indexed row per
+student instead of summing payments.
+
+A room is billed once per stay. An assignment that starts the day another
+of the student's assignments ended (a move, a re-assignment or an approved
+room change) is a transfer and is not charged again.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import LedgerEntry, RoomAssignment, Student, StudentBalance
+from .student_summary import invalidate_summaries
+
+ZERO = Decimal('0.00')
+
+# (label, min days outstanding, max days outstanding)
+AGEING_BUCKETS = [
+    ('0-30 days', 0, 30),
+    ('31-60 days', 31, 60),
+    ('61-90 days', 61, 90),
+    ('90+ days', 91, None),
+]
+
+
+def _as_datetime(value):
+    if value is None:
+        return timezone.now()
+    if isinstance(value, datetime):
+        return value
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def _oldest_unpaid(charges, total_paid):
+    """Credits settle the oldest charges first; return when the first unsettled one was posted"""
+    remaining = total_paid
+    for amount, posted_at in charges:
+        if remaining < amount:
+            return posted_at
+        remaining -= amount
+    return None
+
+
+def post_entries(entries):
+    """Write ledger entries and update the affected balances atomically.
+
+    Entries whose source was already posted are skipped. Returns the entries
+    that were actually written.
+    """
+    entries = [e for e in entries if e.amount and e.amount > 0]
+    if not entries:
+        return []
+
+    student_ids = sorted({e.student_id for e in entries})
+    with transaction.atomic():
+        StudentBalance.objects.bulk_create(
+            [StudentBalance(student_id=pk) for pk in student_ids], ignore_conflicts=True
+        )
+        # Lock in primary key order so concurrent postings cannot deadlock
+        balances = {b.pk: b for b in StudentBalance.objects.select_for_update()
+                    .filter(pk__in=student_ids).order_by('pk')}
+
+        keyed = [e for e in entries if e.source_id is not None]
+        existing = set()
+        if keyed:
+            existing = set(LedgerEntry.objects.filter(
+                source__in={e.source for e in keyed},
+                source_id__in={e.source_id for e in keyed},
+            ).values_list('source', 'source_id', 'entry_type'))
+
+        new_entries = []
+        for entry in entries:
+            key = (entry.source, entry.source_id, entry.entry_type)
+            if entry.source_id is not None and key in existing:
+                continue
+            existing.add(key)
+            new_entries.append(entry)
+        if not new_entries:
+            return []
+        LedgerEntry.objects.bulk_create(new_entries, batch_size=500)
+
+        by_student = defaultdict(list)
+        for entry in new_entries:
+            by_student[entry.student_id].append(entry)
+
+        charges = defaultdict(list)
+        for student_id, amount, posted_at in (LedgerEntry.objects
+                                              .filter(student_id__in=by_student, entry_type='charge')
+                                              .order_by('posted_at', 'id')
+                                              .values_list('student_id', 'amount', 'posted_at')):
+            charges[student_id].append((amount, posted_at))
+
+        for student_id, posted in by_student.items():
+            balance = balances[student_id]
+            for entry in posted:
+                if entry.entry_type == 'charge':
+                    balance.total_charged += entry.amount
+                else:
+                    balance.total_paid += entry.amount
+                    if not balance.last_payment_at or entry.posted_at > balance.last_payment_at:
+                        balance.last_payment_at = entry.posted_at
+            balance.balance = balance.total_charged - balance.total_paid
+            balance.oldest_unpaid_at = _oldest_unpaid(charges[student_id], balance.total_paid)
+            balance.updated_at = timezone.now()
+
+        StudentBalance.objects.bulk_update(
+            [balances[pk] for pk in by_student],
+            ['total_charged', 'total_paid', 'balance', 'oldest_unpaid_at', 'last_payment_at', 'updated_at'],
+            batch_size=500,
+        )
+        transaction.on_commit(lambda: invalidate_summaries(list(by_student)))
+    return new_entries
+
+
+def room_charge_fields(assignment):
+    """LedgerEntry fields billing an assignment's room price for the semester"""
+    return dict(
+        student_id=assignment.student_id,
+        entry_type='charge',
+        source='room_assignment',
+        source_id=assignment.pk,
+        amount=assignment.room.price_per_semester,
+        description=f"Accommodation - Room {assignment.room.room_number}",
+        posted_at=_as_datetime(assignment.assigned_date),
+    )
+
+
+def ended_stays(assignments, student_ids=None):
+    """{(student_id, checkout date): assignment pks} for the checked-out rows of `assignments`"""
+    rows = assignments.filter(checkout_date__isnull=False)
+    if student_ids is not None:
+        rows = rows.filter(student_id__in=student_ids)
+    ended = defaultdict(set)
+    for student_id, checkout_date, pk in rows.values_list('student_id', 'checkout_date', 'pk'):
+        ended[(student_id, checkout_date)].add(pk)
+    return ended
+
+
+def is_transfer(assignment, ended):
+    """True when another of the student's assignments ended the day this one started"""
+    assigned = assignment.assigned_date
+    if isinstance(assigned, datetime):
+        assigned = timezone.localdate(assigned) if timezone.is_aware(assigned) else assigned.date()
+    return bool(ended.get((assignment.student_id, assigned), set()) - {assignment.pk})
+
+
+def charge_room_assignments(assignments):
+    """Bill each assignment's room price for the semester, skipping transfers"""
+    assignments = list(assignments)
+    ended = ended_stays(RoomAssignment.objects.all(), {assignment.student_id for assignment in assignments})
+    return post_entries([LedgerEntry(**room_charge_fields(assignment))
+                         for assignment in assignments if not is_transfer(assignment, ended)])
+
+
+def charge_room_assignment(assignment):
+    return charge_room_assignments([assignment])
+
+
+def payment_credit_fields(payment):
+    """LedgerEntry fields crediting a completed M-Pesa payment"""
+    return dict(
+        student_id=payment.student_id,
+        entry_type='credit',
+        source='payment',
+        source_id=payment.pk,
+        amount=Decimal(payment.amount),
+        description=f"M-Pesa payment {payment.transaction_id or ''}".strip(),
+        posted_at=payment.updated_at or timezone.now(),
+    )
+
+
+def credit_payments(payments):
+    """Credit completed M-Pesa payments"""
+    return post_entries([LedgerEntry(**payment_credit_fields(payment))
+                         for payment in payments if payment.status == 'Completed'])
+
+
+def credit_payment(payment):
+    return credit_payments([payment])
+
+
+def record_registration_fee(student, registration_payment):
+    """Post the registration fee and the M-Pesa payment that settled it"""
+    posted_at = registration_payment.updated_at or timezone.now()
+    amount = Decimal(registration_payment.amount)
+    return post_entries([
+        LedgerEntry(student=student, entry_type='charge', source='registration',
+                    source_id=registration_payment.pk, amount=amount,
+                    description="Registration fee", posted_at=posted_at),
+        LedgerEntry(student=student, entry_type='credit', source='registration',
+                    source_id=registration_payment.pk, amount=amount,
+                    description=f"M-Pesa payment {registration_payment.transaction_id or ''}".strip(),
+                    posted_at=posted_at),
+    ])
+
+
+def balance_fields(entries):
+    """StudentBalance fields for every student with entries in the `entries` queryset"""
+    totals = (entries.values('student_id').annotate(
+        charged=Coalesce(Sum('amount', filter=Q(entry_type='charge')), Value(ZERO)),
+        paid=Coalesce(Sum('amount', filter=Q(entry_type='credit')), Value(ZERO)),
+    ).order_by('student_id'))
+
+    charges = defaultdict(list)
+    last_payment = {}
+    for student_id, entry_type, amount, posted_at in (entries.order_by('posted_at', 'id')
+                                                       .values_list('student_id', 'entry_type', 'amount', 'posted_at')):
+        if entry_type == 'charge':
+            charges[student_id].append((amount, posted_at))
+        else:
+            last_payment[student_id] = posted_at
+
+    now = timezone.now()
+    return [
+        dict(
+            student_id=row['student_id'],
+            total_charged=row['charged'],
+            total_paid=row['paid'],
+            balance=row['charged'] - row['paid'],
+            oldest_unpaid_at=_oldest_unpaid(charges[row['student_id']], row['paid']),
+            last_payment_at=last_payment.get(row['student_id']),
+            updated_at=now,
+        )
+        for row in totals
+    ]
+
+
+BALANCE_FIELDS = ['total_charged', 'total_paid', 'balance', 'oldest_unpaid_at', 'last_payment_at', 'updated_at']
+
+
+def recompute_balances(student_ids=None):
+    """Rebuild balance rows from the ledger (repairs drift after manual edits)"""
+    entries = LedgerEntry.objects.all()
+    if student_ids is not None:
+        entries = entries.filter(student_id__in=student_ids)
+    rows = [StudentBalance(**fields) for fields in balance_fields(entries)]
+    with transaction.atomic():
+        StudentBalance.objects.bulk_create(
+            rows, batch_size=500, update_conflicts=True, unique_fields=['student'], update_fields=BALANCE_FIELDS,
+        )
+    return len(rows)
+
+
+def get_balance(student):
+    """Current balance row for a student (unsaved zero row if nothing was posted yet)"""
+    try:
+        return StudentBalance.objects.get(pk=student.pk)
+    except StudentBalance.DoesNotExist:
+        return StudentBalance(student=student)
+
+
+# ==================== Finance queries ====================
+
+def _outstanding_by(field):
+    rows = (StudentBalance.objects.filter(balance__gt=0)
+            .values(field)
+            .annotate(outstanding=Sum('balance'), students=Count('pk'))
+            .order_by('-outstanding'))
+    return [{'group': row[field] or 'Unassigned', 'outstanding': row['outstanding'], 'students': row['students']}
+            for row in rows]
+
+
+def outstanding_by_hostel():
+    return _outstanding_by('student__hostel')
+
+
+def outstanding_by_school():
+    labels = dict(Student._meta.get_field('academic_school').choices)
+    rows = _outstanding_by('student__academic_school')
+    for row in rows:
+        row['group'] = labels.get(row['group'], row['group'])
+    return rows
+
+
+def ageing_buckets(today=None):
+    """Outstanding balances grouped by the age of the oldest unpaid charge, in one query"""
+    now = _as_datetime(today) if today else timezone.now()
+    money = DecimalField(max_digits=14, decimal_places=2)
+    aggregates = {}
+    for index, (label, low, high) in enumerate(AGEING_BUCKETS):
+        condition = Q(oldest_unpaid_at__lte=now - timedelta(days=low))
+        if high is not None:
+            condition &= Q(oldest_unpaid_at__gt=now - timedelta(days=high + 1))
+        aggregates[f'bucket_{index}'] = Coalesce(
+            Sum(Case(When(condition, then='balance'), default=Value(ZERO), output_field=money)),
+            Value(ZERO), output_field=money,
+        )
+        aggregates[f'count_{index}'] = Count('pk', filter=condition)
+    totals = StudentBalance.objects.filter(balance__gt=0).aggregate(**aggregates)
+    return [{'label': label, 'outstanding': totals[f'bucket_{i}'], 'students': totals[f'count_{i}']}
+            for i, (label, _, _) in enumerate(AGEING_BUCKETS)]
+
+
+def finance_summary():
+    """Headline totals across all students.
+
+    `collected` is every credit, registration fees included; `revenue` is
+    the completed accommodation (M-Pesa) payments only, as reported before
+    the ledger existed.
+    """
+    money = DecimalField(max_digits=14, decimal_places=2)
+    totals = StudentBalance.objects.aggregate(
+        charged=Coalesce(Sum('total_charged'), Value(ZERO), output_field=money),
+        collected=Coalesce(Sum('total_paid'), Value(ZERO), output_field=money),
+        outstanding=Coalesce(Sum('balance', filter=Q(balance__gt=0)), Value(ZERO), output_field=money),
+        debtors=Count('pk', filter=Q(balance__gt=0)),
+    )
+    totals.update(LedgerEntry.objects.filter(entry_type='credit', source='payment').aggregate(
+        revenue=Coalesce(Sum('amount'), Value(ZERO), output_field=money)))
+    return totals
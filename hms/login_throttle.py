@@ -0,0 +1,161 @@
+"""
+Login throttling for credential-stuffing bursts.
+
+Every failed login is counted in two cache-backed sliding windows of
+LOGIN_FAILURE_WINDOW seconds (default 900): one for the client IP (taken
+from X-Forwarded-For only as far as NUM_PROXIES trusted proxies vouch for
+it, so a forged header cannot pick a fresh bucket per attempt) and one
+for the account (the user's pk, or the typed login when it matches no
+user). A window is approximated from two fixed buckets updated with
+cache.incr: the current bucket plus the previous one weighted by how much
+of it is still inside the window. That keeps the count atomic across
+workers without storing individual timestamps.
+
+Below the free allowance (LOGIN_ACCOUNT_FREE_FAILURES=5 per account,
+LOGIN_IP_FREE_FAILURES=20 per IP) nothing changes. After it, each attempt
+has to wait 1, 2, 4, ... seconds (at most LOGIN_MAX_DELAY=300) after the
+previous failure. Attempts that arrive sooner are refused before any
+password is hashed, so an attack spends cache lookups rather than PBKDF2.
+A successful login clears the account's window.
+
+Hashing is also bounded per process: at most LOGIN_MAX_CONCURRENT_HASHES
+(default 4) passwords are checked at once. An attempt that cannot get a
+slot within LOGIN_HASH_WAIT seconds is refused, so a burst from many IPs
+queues briefly and then sheds load instead of filling every worker.
+
+Failed and refused attempts are written to LoginActivity in the background.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.db.models.functions import Lower
+from .models import LoginActivity
+from .tasks import run_async
+from .utils.helpers import get_trusted_client_ip
+
+logger = logging.getLogger(__name__)
+
+KEY = 'login_failures:{scope}:{ident}'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalise_login(login):
+    return (login or '').strip().lower()[:150]
+
+
+def find_user(login):
+    """The user whose username or email is `login` (case-insensitive), using the lower() indexes"""
+    login = normalise_login(login)
+    if not login:
+        return None
+    users = list(User.objects.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+                 .filter(Q(username_lower=login) | Q(email_lower=login))[:2])
+    for user in users:
+        if user.username.lower() == login:
+            return user
+    # Two accounts sharing an email cannot be told apart; neither may log in with it
+    return users[0] if len(users) == 1 else None
+
+
+def _keys(request, login, user):
+    keys = []
+    ip = get_trusted_client_ip(request) if request is not None else None
+    if ip:
+        keys.append(('ip', KEY.format(scope='ip', ident=ip), _setting('LOGIN_IP_FREE_FAILURES', 20)))
+    ident = f'user{user.pk}' if user is not None else normalise_login(login)
+    keys.append(('account', KEY.format(scope='account', ident=ident), _setting('LOGIN_ACCOUNT_FREE_FAILURES', 5)))
+    return keys
+
+
+def _buckets(prefix, now):
+    window = _setting('LOGIN_FAILURE_WINDOW', 900)
+    current = int(now // window)
+    return f'{prefix}:{current}', f'{prefix}:{current - 1}', (now % window) / window
+
+
+def failure_count(prefix, now=None):
+    """Failures in the sliding window ending now"""
+    current, previous, elapsed = _buckets(prefix, now or time.time())
+    counts = cache.get_many([current, previous])
+    return counts.get(current, 0) + counts.get(previous, 0) * (1 - elapsed)
+
+
+def delay_for(failures, free):
+    """Seconds an attempt must wait after the last failure"""
+    if failures < free:
+        return 0
+    return min(2 ** int(failures - free), _setting('LOGIN_MAX_DELAY', 300))
+
+
+def retry_after(request, login, user=None):
+    """Seconds before this IP / account may try again (0 when allowed now)"""
+    now = time.time()
+    wait = 0
+    for _, prefix, free in _keys(request, login, user):
+        delay = delay_for(failure_count(prefix, now), free)
+        if delay:
+            last = cache.get(f'{prefix}:last', 0)
+            wait = max(wait, last + delay - now)
+    return max(0, int(wait + 0.999))
+
+
+def record_failure(request, login, user=None):
+    now = time.time()
+    window = _setting('LOGIN_FAILURE_WINDOW', 900)
+    for _, prefix, _ in _keys(request, login, user):
+        current, _, _ = _buckets(prefix, now)
+        cache.add(current, 0, timeout=2 * window)
+        try:
+            cache.incr(current)
+        except ValueError:
+            cache.set(current, 1, timeout=2 * window)
+        cache.set(f'{prefix}:last', now, timeout=2 * window)
+    log_attempt(request, user, 'Failed')
+
+
+def reset(user):
+    """Forget the account's failures after a successful login"""
+    prefix = KEY.format(scope='account', ident=f'user{user.pk}')
+    current, previous, _ = _buckets(prefix, time.time())
+    cache.delete_many([current, previous, f'{prefix}:last'])
+
+
+def _save_login_activity(user_id, ip, user_agent, status):
+    LoginActivity.objects.create(user_id=user_id, ip_address=ip, user_agent=user_agent, status=status)
+
+
+def log_attempt(request, user, status):
+    """Write a LoginActivity row in the background"""
+    ip = get_trusted_client_ip(request) if request is not None else None
+    user_agent = request.META.get('HTTP_USER_AGENT', '') if request is not None else ''
+    run_async(_save_login_activity, user.pk if user else None, ip, user_agent, status)
+
+
+_hash_slots = None
+_hash_slots_lock = threading.Lock()
+
+
+@contextmanager
+def hashing_slot():
+    """Hold one of the process's password-hashing slots; PermissionDenied when none frees up in time"""
+    global _hash_slots
+    if _hash_slots is None:
+        with _hash_slots_lock:
+            if _hash_slots is None:
+                _hash_slots = threading.BoundedSemaphore(_setting('LOGIN_MAX_CONCURRENT_HASHES', 4))
+    if not _hash_slots.acquire(timeout=_setting('LOGIN_HASH_WAIT', 2)):
+        logger.warning("[LOGIN] All password hashing slots busy; refusing attempt")
+        raise PermissionDenied
+    try:
+        yield
+    finally:
+        _hash_slots.release()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from hms.allocation import allocate_rooms, pending_students
+
+
+class Command(BaseCommand):
+    help = 'Place all pending hostel students into free beds in one batch (use --dry-run to preview)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Show the plan without writing anything')
+        parser.add_argument('--block-gender', action='append', default=[], metavar='BLOCK=GENDER',
+                            help='Reserve a block for one gender, e.g. --block-gender A=female (repeatable)')
+        parser.add_argument('--limit', type=int, default=None, help='Only allocate the first N pending students')
+        parser.add_argument('--show', type=int, default=50, help='Number of placements to print')
+
+    def handle(self, *args, **options):
+        block_genders = {}
+        for item in options['block_gender']:
+            block, sep, gender = item.partition('=')
+            if not sep or gender not in ('male', 'female', 'others'):
+                raise CommandError(f'Invalid --block-gender value: {item}')
+            block_genders[block] = gender
+
+        students = pending_students()
+        if options['limit']:
+            students = students[:options['limit']]
+
+        result = allocate_rooms(students=students, block_genders=block_genders, dry_run=options['dry_run'])
+
+        prefix = '[DRY RUN] ' if options['dry_run'] else ''
+        for placement in result.placements[:options['show']]:
+            self.stdout.write(
+                f"  {placement.student.university_id or placement.student.user.username:<16}"
+                f" -> Room {placement.room.room_number} bed {placement.bed_number}"
+            )
+        if result.placed_count > options['show']:
+            self.stdout.write(f'  ... and {result.placed_count - options["show"]} more')
+        for student, reason in result.unplaced[:options['show']]:
+            self.stdout.write(self.style.WARNING(
+                f"  Unplaced {student.university_id or student.user.username}: {reason}"
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Placed {result.placed_count} students in {result.rooms_used()} rooms; '
+            f'{len(result.unplaced)} could not be placed.'
+        ))
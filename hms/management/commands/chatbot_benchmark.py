@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from hms.chatbot import ChatbotEngine, get_engine
+
+SAMPLE_MESSAGES = [
+    'hi',
+    'How do I confirm my meals for tomorrow?',
+    'hello, how do I pay my fees with mpesa?',
+    'The tap in my room is broken, who can fix it?',
+    'Where can I see the latest announcements?',
+    'I am going home for the vacation next week',
+    'Who created this system?',
+    'show me the dashboard statistics',
+    'what is the meaning of life',
+    'add student to the hostel',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark the rule-based chatbot: engine build time and messages answered per second '
+        'on a fixed mix of messages. No database access.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100000)
+        parser.add_argument('--role', default='Student')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ChatbotEngine()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        engine = get_engine()
+        role = options['role']
+        total = options['messages']
+        started = time.perf_counter()
+        for i in range(total):
+            engine.respond(SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], role)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'Engine build: {build_ms:.1f} ms ({len(engine.intents)} intents)')
+        self.stdout.write(f'Messages: {total} as {role} in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Throughput: {total / elapsed:,.0f} messages/s'))
@@ -0,0 +1,34 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from hms.meal_archive import closed_months, compact_month
+
+
+class Command(BaseCommand):
+    help = 'Pack closed months of Meal rows into the MealArchive bitsets and delete them from Meal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Compact only this month (YYYY-MM); defaults to every closed month')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be compacted')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                months = [datetime.strptime(options['month'], '%Y-%m').date()]
+            except ValueError:
+                raise CommandError('--month must be YYYY-MM')
+        else:
+            months = closed_months()
+
+        if not months:
+            self.stdout.write('No closed months left in the Meal table.')
+            return
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f'  would compact {month:%Y-%m}')
+                continue
+            try:
+                archived, deleted = compact_month(month)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(
+                f'{month:%Y-%m}: {deleted} meal rows packed into {archived} archive rows.'))
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from hms.meal_plans import expand_defaults
+
+
+class Command(BaseCommand):
+    help = (
+        "Turn students' weekly meal defaults into Meal rows for the coming days. "
+        "Days a student already planned, or is away, are left alone. Run nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='First day to expand (YYYY-MM-DD, default tomorrow)')
+        parser.add_argument('--days', type=int, default=1, help='Number of days to expand')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                start = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
+        else:
+            start = timezone.localdate() + timedelta(days=1)
+
+        total = 0
+        for offset in range(options['days']):
+            day = start + timedelta(days=offset)
+            created = expand_defaults(day)
+            total += created
+            self.stdout.write(f'  {day}: {created} meals from defaults')
+        self.stdout.write(self.style.SUCCESS(f'Expanded {total} default meals over {options["days"]} days.'))
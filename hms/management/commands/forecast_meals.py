@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from hms.forecasting import FORECAST_DAYS, run_forecast
+
+
+class Command(BaseCommand):
+    help = 'Record actual meal counts for past forecasts and store forecasts for the coming days (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=FORECAST_DAYS, help='Number of days to forecast, starting tomorrow')
+
+    def handle(self, *args, **options):
+        forecasts = run_forecast(days=options['days'])
+        for forecast in forecasts:
+            self.stdout.write(f'  {forecast.date} {forecast.meal:<9} {forecast.forecast:>5} '
+                              f'(confirmed {forecast.confirmed}, expected {forecast.expected_unconfirmed:.1f} more)')
+        self.stdout.write(self.style.SUCCESS(f'Stored {len(forecasts)} meal forecasts.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from hms.room_swaps import approve_swap_cycles, find_swap_cycles
+
+
+class Command(BaseCommand):
+    help = 'Find pending room change requests that can be granted as swaps (use --approve to apply them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--approve', action='store_true', help='Approve every swap found in one transaction')
+        parser.add_argument('--show', type=int, default=50, help='Number of swaps to print')
+
+    def handle(self, *args, **options):
+        cycles = find_swap_cycles()
+        for cycle in cycles[:options['show']]:
+            route = ' -> '.join(f"{change.student.university_id or change.student.user.username}"
+                                f" ({current.room.room_number})" for change, current, _ in cycle.moves())
+            self.stdout.write(f'  {route}')
+        if len(cycles) > options['show']:
+            self.stdout.write(f'  ... and {len(cycles) - options["show"]} more')
+
+        matched = sum(len(cycle) for cycle in cycles)
+        if not options['approve']:
+            self.stdout.write(self.style.SUCCESS(f'Found {len(cycles)} swaps covering {matched} requests.'))
+            return
+
+        approved, skipped = approve_swap_cycles([[r.pk for r in cycle.requests] for cycle in cycles])
+        self.stdout.write(self.style.SUCCESS(
+            f'Approved {len(approved)} swaps ({sum(len(c) for c in approved)} students moved); '
+            f'{len(skipped)} skipped.'
+        ))
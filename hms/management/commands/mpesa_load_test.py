@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from hms.models import Student, Payment
+from hms.phones import to_e164
+
+USERNAME_PREFIX = 'loadtest_student_'
+PASSWORD = 'LoadTest!2024'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive pay_accommodation -> M-Pesa callback -> payment status polling for many concurrent '
+        'students against a running server (use together with the mpesa_simulator command). '
+        'The server, any process_mpesa_callbacks workers and this command must share the database '
+        'and, when more than one process serves requests, a shared cache (REDIS_URL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--amount', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for a final status')
+        parser.add_argument('--setup-only', action='store_true', help='Only create the load test students')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the load test students and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} load test records.'))
+            return
+
+        usernames = self.setup_students(options['students'])
+        if options['setup_only']:
+            return
+
+        self.timings = defaultdict(list)
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self._lock = threading.Lock()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for username in usernames:
+                executor.submit(self.run_student, username, options)
+        elapsed = time.monotonic() - started
+        self.report(len(usernames), elapsed)
+
+    def setup_students(self, count):
+        """Create (or reuse) load test students with one shared password hash"""
+        usernames = [f'{USERNAME_PREFIX}{i:06d}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        password_hash = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=name, password=password_hash, first_name='Load', last_name=name[-6:])
+            for name in usernames if name not in existing
+        ], batch_size=1000)
+
+        users = User.objects.filter(username__in=usernames, student_profile__isnull=True)
+        Student.objects.bulk_create([
+            Student(user=user, university_id=f'LT{user.username[-6:]}', phone=phone, phone_e164=to_e164(phone))
+            for user in users
+            for phone in [f'07{user.username[-6:]:0>8}']
+        ], batch_size=1000, ignore_conflicts=True)
+        self.stdout.write(f'{count} load test students ready (password: {PASSWORD}).')
+        return usernames
+
+    def record(self, step, started, ok=True):
+        with self._lock:
+            self.timings[step].append(time.monotonic() - started)
+            if not ok:
+                self.errors[step] += 1
+
+    def run_student(self, username, options):
+        base = options['base_url'].rstrip('/')
+        session = requests.Session()
+        try:
+            t = time.monotonic()
+            r = session.post(f'{base}/login/', data={'username': username, 'password': PASSWORD},
+                             allow_redirects=False, timeout=30)
+            self.record('login', t, r.status_code == 302)
+
+            session.get(f'{base}/student/pay-accommodation/', timeout=30)
+            t = time.monotonic()
+            r = session.post(
+                f'{base}/student/pay-accommodation/',
+                data={'phone': '0712345678', 'amount': options['amount']},
+                headers={'X-CSRFToken': session.cookies.get('csrftoken', ''), 'Referer': base},
+                allow_redirects=False, timeout=30,
+            )
+            self.record('stk_push', t, r.status_code == 302)
+            flow_started = t
+
+            close_old_connections()
+            payment = (Payment.objects.filter(student__user__username=username)
+                       .order_by('-id').values('id', 'checkout_request_id').first())
+            if not payment or not payment['checkout_request_id']:
+                with self._lock:
+                    self.outcomes['not_initiated'] += 1
+                return
+
+            status = 'Pending'
+            deadline = time.monotonic() + options['timeout']
+            while status == 'Pending' and time.monotonic() < deadline:
+                time.sleep(options['poll_interval'])
+                t = time.monotonic()
+                r = session.get(f"{base}/payment/status/{payment['checkout_request_id']}/", timeout=30)
+                self.record('status_poll', t, r.status_code == 200)
+                if r.status_code == 200:
+                    status = r.json().get('status', 'Pending')
+            self.record('payment_to_final', flow_started, status != 'Pending')
+
+            t = time.monotonic()
+            r = session.get(f"{base}/payment/check/{payment['id']}/", allow_redirects=False, timeout=30)
+            self.record('check_payment_status', t, r.status_code == 302)
+
+            with self._lock:
+                self.outcomes[status] += 1
+        except requests.RequestException as e:
+            with self._lock:
+                self.errors[type(e).__name__] += 1
+                self.outcomes['error'] += 1
+        finally:
+            close_old_connections()
+
+    def report(self, students, elapsed):
+        self.stdout.write('')
+        self.stdout.write(f'{students} students in {elapsed:.1f}s ({students / elapsed:.1f} payments/s)')
+        self.stdout.write(f"{'step':<22}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for step, values in self.timings.items():
+            ms = [v * 1000 for v in values]
+            self.stdout.write(
+                f"{step:<22}{len(ms):>8}{self.errors[step]:>8}"
+                f"{percentile(ms, 50):>10.0f}{percentile(ms, 95):>10.0f}"
+                f"{percentile(ms, 99):>10.0f}{max(ms):>10.0f}"
+            )
+        self.stdout.write('Outcomes: ' + ', '.join(f'{k}={v}' for k, v in sorted(self.outcomes.items())))
+        other_errors = {k: v for k, v in self.errors.items() if k not in self.timings}
+        if other_errors:
+            self.stdout.write(self.style.WARNING(f'Transport errors: {other_errors}'))
@@ -0,0 +1,231 @@
+import heapq
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand
+
+
+class DarajaSimulator:
+    """In-memory stand-in for the Safaricom Daraja STK Push API"""
+
+    def __init__(self, latency=0.05, callback_delay=3.0, failure_rate=0.1, duplicate_rate=0.05,
+                 error_rate=0.0, drop_rate=0.0, seed=None):
+        self.latency = latency
+        self.callback_delay = callback_delay
+        self.failure_rate = failure_rate
+        self.duplicate_rate = duplicate_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.checkouts = {}
+        self.stats = {'oauth': 0, 'stk_push': 0, 'stk_query': 0, 'callbacks_sent': 0,
+                      'callbacks_failed': 0, 'callbacks_dropped': 0, 'errors_injected': 0}
+        self._lock = threading.Lock()
+        self._queue = []
+        self._wakeup = threading.Condition(self._lock)
+        self._sender = ThreadPoolExecutor(max_workers=32, thread_name_prefix='daraja-callback')
+        self._http = requests.Session()
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def _sleep_latency(self):
+        if self.latency:
+            # Jitter around the configured latency so percentiles are meaningful
+            time.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+
+    def _inject_error(self):
+        with self._lock:
+            if self.random.random() < self.error_rate:
+                self.stats['errors_injected'] += 1
+                return True
+        return False
+
+    def oauth(self):
+        self._sleep_latency()
+        with self._lock:
+            self.stats['oauth'] += 1
+        return 200, {'access_token': uuid.uuid4().hex, 'expires_in': '3599'}
+
+    def stk_push(self, payload):
+        self._sleep_latency()
+        if self._inject_error():
+            return 503, {'errorCode': '503.001.01', 'errorMessage': 'Service temporarily unavailable'}
+
+        checkout_id = f"ws_CO_SIM_{uuid.uuid4().hex[:20]}"
+        with self._lock:
+            self.stats['stk_push'] += 1
+            failed = self.random.random() < self.failure_rate
+            due = time.monotonic() + self.random.uniform(0.5, 1.5) * self.callback_delay
+            self.checkouts[checkout_id] = {
+                'due': due,
+                'result_code': 1032 if failed else 0,
+                'amount': payload.get('Amount'),
+                'phone': payload.get('PhoneNumber'),
+                'receipt': f"SIM{uuid.uuid4().hex[:7].upper()}",
+            }
+            copies = 2 if self.random.random() < self.duplicate_rate else 1
+            if self.random.random() < self.drop_rate:
+                self.stats['callbacks_dropped'] += 1
+                copies = 0
+            for n in range(copies):
+                heapq.heappush(self._queue, (due + n * 0.5, checkout_id, payload.get('CallBackURL')))
+            self._wakeup.notify()
+
+        return 200, {
+            'MerchantRequestID': uuid.uuid4().hex[:16],
+            'CheckoutRequestID': checkout_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    def stk_query(self, payload):
+        self._sleep_latency()
+        if self._inject_error():
+            return 503, {'errorCode': '503.001.01', 'errorMessage': 'Service temporarily unavailable'}
+
+        checkout_id = payload.get('CheckoutRequestID')
+        with self._lock:
+            self.stats['stk_query'] += 1
+            checkout = self.checkouts.get(checkout_id)
+        if not checkout:
+            return 400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'}
+        if time.monotonic() < checkout['due']:
+            return 200, {'ResponseCode': '0', 'ResultCode': '4999',
+                         'ResultDesc': 'The transaction is still under processing',
+                         'CheckoutRequestID': checkout_id}
+        return 200, {
+            'ResponseCode': '0',
+            'ResultCode': str(checkout['result_code']),
+            'ResultDesc': self._result_desc(checkout['result_code']),
+            'CheckoutRequestID': checkout_id,
+        }
+
+    @staticmethod
+    def _result_desc(result_code):
+        if result_code == 0:
+            return 'The service request is processed successfully.'
+        return 'Request cancelled by user'
+
+    def _callback_body(self, checkout_id):
+        checkout = self.checkouts[checkout_id]
+        callback = {
+            'MerchantRequestID': uuid.uuid4().hex[:16],
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': checkout['result_code'],
+            'ResultDesc': self._result_desc(checkout['result_code']),
+        }
+        if checkout['result_code'] == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': checkout['amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': checkout['receipt']},
+                {'Name': 'PhoneNumber', 'Value': checkout['phone']},
+            ]}
+        return {'Body': {'stkCallback': callback}}
+
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._wakeup.wait(timeout)
+                _, checkout_id, url = heapq.heappop(self._queue)
+                body = self._callback_body(checkout_id)
+            self._sender.submit(self._send_callback, url, body)
+
+    def _send_callback(self, url, body):
+        try:
+            self._http.post(url, json=body, timeout=10)
+            key = 'callbacks_sent'
+        except requests.RequestException:
+            key = 'callbacks_failed'
+        with self._lock:
+            self.stats[key] += 1
+
+
+def make_handler(simulator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _payload(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return {}
+
+        def do_GET(self):
+            if self.path.startswith('/oauth/v1/generate'):
+                return self._reply(*simulator.oauth())
+            if self.path == '/stats':
+                with simulator._lock:
+                    stats = dict(simulator.stats)
+                return self._reply(200, stats)
+            self._reply(404, {'errorMessage': 'Not found'})
+
+        def do_POST(self):
+            if self.path == '/mpesa/stkpush/v1/processrequest':
+                return self._reply(*simulator.stk_push(self._payload()))
+            if self.path == '/mpesa/stkpushquery/v1/query':
+                return self._reply(*simulator.stk_query(self._payload()))
+            self._reply(404, {'errorMessage': 'Not found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local Daraja (M-Pesa) simulator for load testing. Point the app at it with '
+        'MPESA_BASE_URL=http://127.0.0.1:8090, any MPESA_CONSUMER_KEY/SECRET, and '
+        'MPESA_CALLBACK_URL=http://127.0.0.1:8000/payment/callback/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', type=float, default=50, help='Mean API response latency in ms')
+        parser.add_argument('--callback-delay', type=float, default=3.0,
+                            help='Mean seconds between STK push and the callback')
+        parser.add_argument('--failure-rate', type=float, default=0.1, help='Share of payments the customer cancels')
+        parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Share of callbacks sent twice')
+        parser.add_argument('--drop-rate', type=float, default=0.0, help='Share of callbacks never sent')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of API calls answered with HTTP 503')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        simulator = DarajaSimulator(
+            latency=options['latency'] / 1000,
+            callback_delay=options['callback_delay'],
+            failure_rate=options['failure_rate'],
+            duplicate_rate=options['duplicate_rate'],
+            error_rate=options['error_rate'],
+            drop_rate=options['drop_rate'],
+            seed=options['seed'],
+        )
+        server = ThreadingHTTPServer((options['host'], options['port']), make_handler(simulator))
+        server.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(
+            f"Daraja simulator listening on http://{options['host']}:{options['port']} (stats at /stats)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(json.dumps(simulator.stats, indent=2))
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from hms.whatsapp import process_pending_messages
+
+
+class Command(BaseCommand):
+    help = 'Answer stored WhatsApp messages that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the inbox')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            count = process_pending_messages(limit=options['batch_size'])
+            if count or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Processed {count} WhatsApp messages.'))
+            if not options['loop']:
+                return
+            if count < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from hms.ledger import charge_room_assignments, credit_payments, recompute_balances
+from hms.models import Payment, RoomAssignment
+
+
+class Command(BaseCommand):
+    help = 'Post any room assignments and completed payments missing from the fee ledger, then rebuild balances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--balances-only', action='store_true',
+                            help='Skip posting and only recompute balance rows from existing entries')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if not options['balances_only']:
+            charged = 0
+            assignments = RoomAssignment.objects.select_related('room').order_by('pk')
+            for start in range(0, assignments.count(), batch_size):
+                charged += len(charge_room_assignments(assignments[start:start + batch_size]))
+
+            credited = 0
+            payments = Payment.objects.filter(status='Completed').order_by('pk')
+            for start in range(0, payments.count(), batch_size):
+                credited += len(credit_payments(payments[start:start + batch_size]))
+            self.stdout.write(f'Posted {charged} room charges and {credited} payment credits.')
+
+        rebuilt = recompute_balances()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} student balances.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from hms.autocomplete import rebuild_lookup_keys
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the student typeahead keys (names, university IDs, phones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_lookup_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} student lookup keys.'))
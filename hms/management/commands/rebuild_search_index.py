@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from hms.search import SOURCES, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=list(SOURCES),
+                            help='Only rebuild this kind (repeatable); defaults to all')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = rebuild_index(options['kind'], batch_size=options['batch_size'])
+        for kind, count in counts.items():
+            self.stdout.write(f'  {kind}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Indexed {sum(counts.values())} search documents.'))
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from hms.meal_counters import reconcile_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached per-date meal counters from the database and correct any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=8, help='Number of days to check, starting today')
+        parser.add_argument('--loop', action='store_true', help='Keep running and reconcile periodically')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            today = timezone.localdate()
+            dates = [today + timedelta(days=i) for i in range(options['days'])]
+            drift = reconcile_counts(dates)
+            for day, fields in sorted(drift.items()):
+                changes = ', '.join(f'{field} {cached}->{actual}' for field, (cached, actual) in fields.items())
+                self.stdout.write(self.style.WARNING(f'  {day}: {changes}'))
+            self.stdout.write(self.style.SUCCESS(
+                f'Reconciled meal counters for {len(dates)} days; {len(drift)} had drifted.'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from hms.payments import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = 'Query M-Pesa for stale Pending payments (lost callbacks) and settle them in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=10,
+                            help='Only reconcile payments pending for at least this many minutes')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent STK query threads')
+        parser.add_argument('--rate', type=float, default=5,
+                            help='Maximum STK queries per second (Daraja rate limit)')
+        parser.add_argument('--limit', type=int, default=5000, help='Maximum payments to check per run')
+        parser.add_argument('--dry-run', action='store_true', help='Query M-Pesa but do not update records')
+
+    def handle(self, *args, **options):
+        summary = reconcile_pending_payments(
+            older_than=timedelta(minutes=options['older_than']),
+            workers=options['workers'],
+            rate=options['rate'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+        )
+
+        prefix = '[DRY RUN] ' if options['dry_run'] else ''
+        self.stdout.write(f"{prefix}Checked {summary['checked']} checkouts")
+        self.stdout.write(f"  Completed:     {summary['completed']}")
+        self.stdout.write(f"  Failed:        {summary['failed']}")
+        self.stdout.write(f"  Still pending: {summary['still_pending']}")
+        if summary['errors']:
+            self.stdout.write(self.style.WARNING(f"  Query errors:  {summary['errors']}"))
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Reconciliation finished.'))
@@ -0,0 +1,94 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+from django.db.models import Count, F, Q
+from hms.booking import book_bed, RoomFull
+from hms.models import Student, Room, RoomAssignment
+from .mpesa_load_test import percentile
+
+USERNAME_PREFIX = 'loadtest_booker_'
+ROOM_PREFIX = 'LT'
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate the room-selection rush: many students book a few popular rooms at once. '
+        'Reports throughput and latency and verifies that no room was overbooked. '
+        'Creates its own rooms/students (removed with --cleanup).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=20)
+        parser.add_argument('--capacity', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the load test data and exit')
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        if options['cleanup']:
+            self.stdout.write(self.style.SUCCESS('Load test data removed.'))
+            return
+
+        rooms = Room.objects.bulk_create([
+            Room(room_number=f'{ROOM_PREFIX}{i:04d}', block='LOADTEST', floor=1, capacity=options['capacity'])
+            for i in range(options['rooms'])
+        ])
+        User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{i:06d}') for i in range(options['students'])],
+                                 batch_size=1000)
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX, student_profile__isnull=True)
+        Student.objects.bulk_create([Student(user=user) for user in users], batch_size=1000)
+        students = list(Student.objects.filter(user__username__startswith=USERNAME_PREFIX).order_by('pk'))
+
+        outcomes = Counter()
+        latencies = []
+
+        def attempt(index):
+            student = students[index]
+            room = rooms[index % len(rooms)]
+            started = time.monotonic()
+            try:
+                while True:
+                    try:
+                        book_bed(student, room)
+                        return 'booked', time.monotonic() - started
+                    except RoomFull:
+                        return 'full', time.monotonic() - started
+                    except OperationalError:
+                        # SQLite write lock; real deployments run on Postgres
+                        outcomes['lock_retries'] += 1
+                        time.sleep(0.005)
+            finally:
+                close_old_connections()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for outcome, elapsed in executor.map(attempt, range(len(students))):
+                outcomes[outcome] += 1
+                latencies.append(elapsed * 1000)
+        elapsed = time.monotonic() - started
+
+        overbooked = (Room.objects.filter(block='LOADTEST')
+                      .annotate(active=Count('assignments', filter=Q(assignments__is_active=True)))
+                      .filter(Q(active__gt=F('capacity')) | ~Q(occupied_beds=F('active'))).count())
+        duplicate_beds = (RoomAssignment.objects.filter(room__block='LOADTEST', is_active=True)
+                          .values('room', 'bed_number').annotate(n=Count('pk')).filter(n__gt=1).count())
+
+        self.stdout.write(f"{len(students)} booking attempts in {elapsed:.2f}s "
+                          f"({len(students) / elapsed:.0f} attempts/s, {options['concurrency']} threads)")
+        self.stdout.write(f"Latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+                          f"p99={percentile(latencies, 99):.1f} max={max(latencies):.1f}")
+        self.stdout.write('Outcomes: ' + ', '.join(f'{k}={v}' for k, v in sorted(outcomes.items())))
+        if overbooked or duplicate_beds:
+            self.stdout.write(self.style.ERROR(
+                f'{overbooked} rooms with a wrong occupancy count, {duplicate_beds} shared beds'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No overbooking: every room holds at most its capacity.'))
+        self.cleanup()
+
+    def cleanup(self):
+        Room.objects.filter(block='LOADTEST', room_number__startswith=ROOM_PREFIX).delete()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
@@ -1,46 +1,43 @@
-from django.core.management.base import BaseCommand
+import time
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.contrib.auth.models import User
-# from hms.models import Notification
-import datetime
+from hms.meal_plans import MEAL_FIELDS
+from hms.meal_reminders import send_meal_reminders
+
 
 class Command(BaseCommand):
-    help = 'Send meal reminders to students based on current time'
+    help = 'Remind students who have not confirmed their meals (once per student, date and meal)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to remind about (YYYY-MM-DD); defaults to tomorrow')
+        parser.add_argument('--meal', choices=MEAL_FIELDS, default='breakfast',
+                            help='Meal the reminder is for; each meal is reminded separately')
+        parser.add_argument('--no-admin-summary', action='store_true', help='Do not email the admin summary')
+        parser.add_argument('--loop', action='store_true', help='Keep running and send reminders periodically')
+        parser.add_argument('--interval', type=float, default=3600.0, help='Seconds between runs with --loop')
 
-    def handle(self, *args, **kwargs):
-        now = timezone.localtime(timezone.now())
-        current_time = now.time()
-        
-        meal_type = None
-        
-        # Define ranges (adjust as per hostel rules)
-        # Breakfast: 6:00 AM - 9:00 AM
-        if datetime.time(6, 0) <= current_time <= datetime.time(9, 0):
-            meal_type = 'Breakfast'
-        # Lunch: 11:00 AM - 2:00 PM
-        elif datetime.time(11, 0) <= current_time <= datetime.time(14, 0):
-            meal_type = 'Lunch'
-        # Dinner: 5:00 PM - 8:00 PM
-        elif datetime.time(17, 0) <= current_time <= datetime.time(20, 0):
-            meal_type = 'Dinner'
-            
-        if not meal_type:
-            self.stdout.write(self.style.WARNING(f'No active meal time found at {current_time}.'))
-            return
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
 
-        # Get all students
-        users = User.objects.filter(student_profile__isnull=False)
-        count = 0
-        
-        for user in users:
-            # Prevent duplicate notifications for same meal on same day could be added here
-            # For now, we assume this command runs once per meal slot
-            # Notification.objects.create(
-            #     user=user,
-            #     title=f"🍽️ {meal_type} is Ready!",
-            #     message=f"Don't forget to have your {meal_type}. The mess hall is open.",
-            #     link="/student/dashboard/"
-            # )
-            count += 1
-            
-        self.stdout.write(self.style.SUCCESS(f'Successfully sent {count} {meal_type} reminders.'))
+        while True:
+            summary = send_meal_reminders(
+                day=day or timezone.localdate() + timedelta(days=1),
+                meal=options['meal'],
+                notify_admins=not options['no_admin_summary'],
+            )
+            if summary is None:
+                self.stdout.write(self.style.WARNING('Another reminder run for this date and meal is in progress.'))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{summary['meal']} on {summary['date']}: {summary['unconfirmed']} unconfirmed, "
+                    f"{summary['reminded']} reminded (email {summary['emailed']}, SMS {summary['texted']}), "
+                    f"{summary['already_reminded']} already reminded."))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
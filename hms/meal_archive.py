@@ -0,0 +1,218 @@
+"""
+Compact archive of past meals.
+
+Meal grows by one row per student per day. Once a month has closed, its
+rows are packed into one MealArchive row per student: an int per field
+whose bit d-1 is set when the student had that meal (or was away) on day d,
+so a month is five 32-bit columns. compact_meals moves every closed month
+out of Meal; the live table then only holds the current and next month.
+
+History queries read both. Archived months are shifted into one bitset per
+field over the requested range and live rows are OR-ed in, so attendance
+totals are bit counts and streaks are runs of set bits. Away days come from
+the stored flags plus AwayPeriod, since live away days have no rows.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from .models import AwayPeriod, Meal, MealArchive
+
+MEAL_FIELDS = ('breakfast', 'early', 'supper')
+ARCHIVE_FIELDS = ('recorded',) + MEAL_FIELDS + ('away',)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(month):
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def shift_bits(bits, month, start, length):
+    """Place a month's bitset on a range of `length` days beginning at `start`"""
+    offset = (month - start).days
+    bits = bits << offset if offset >= 0 else bits >> -offset
+    return bits & ((1 << length) - 1)
+
+
+def _set_days(bits, first, last, start, length):
+    """Set the bits for first..last (clipped to the range)"""
+    lo, hi = max((first - start).days, 0), min((last - start).days, length - 1)
+    if lo <= hi:
+        bits |= ((1 << (hi - lo + 1)) - 1) << lo
+    return bits
+
+
+def pack_month(month):
+    """{student_id: {field: bits}} for one month from its Meal rows and away periods"""
+    end = month_end(month)
+    packed = defaultdict(lambda: dict.fromkeys(ARCHIVE_FIELDS, 0))
+    rows = (Meal.objects.filter(date__range=(month, end))
+            .values_list('student_id', 'date', *MEAL_FIELDS, 'away').order_by().iterator(chunk_size=5000))
+    for student_id, day, *flags in rows:
+        bit = 1 << (day.day - 1)
+        bits = packed[student_id]
+        bits['recorded'] |= bit
+        for field, flag in zip(ARCHIVE_FIELDS[1:], flags):
+            if flag:
+                bits[field] |= bit
+
+    periods = AwayPeriod.objects.filter(start_date__lte=end, end_date__gte=month)
+    for student_id, first, last in periods.values_list('student_id', 'start_date', 'end_date'):
+        packed[student_id]['away'] = _set_days(packed[student_id]['away'], first, last, month, end.day)
+    return packed
+
+
+def closed_months(today=None):
+    """Months before the current one that still have live Meal rows"""
+    today = today or timezone.localdate()
+    return list(Meal.objects.filter(date__lt=month_start(today)).dates('date', 'month'))
+
+
+def compact_month(month, today=None):
+    """Pack a closed month into MealArchive and delete its Meal rows.
+
+    Safe to re-run: bits are OR-ed into any archive rows already there.
+    Returns (archive rows written, Meal rows deleted).
+    """
+    month = month_start(month)
+    if month >= month_start(today or timezone.localdate()):
+        raise ValueError(f"{month:%B %Y} has not closed yet")
+
+    with transaction.atomic():
+        packed = pack_month(month)
+        existing = {archive.student_id: archive
+                    for archive in MealArchive.objects.select_for_update().filter(month=month)}
+        archives = []
+        for student_id, bits in packed.items():
+            archive = existing.get(student_id) or MealArchive(student_id=student_id, month=month)
+            for field, value in bits.items():
+                setattr(archive, field, getattr(archive, field) | value)
+            archives.append(archive)
+        MealArchive.objects.bulk_create([a for a in archives if a.pk is None], batch_size=1000)
+        MealArchive.objects.bulk_update([a for a in archives if a.pk], ARCHIVE_FIELDS, batch_size=1000)
+        # A plain DELETE: going through delete() would fire the audit-log and
+        # counter signals once per row for a whole month of meals. Nothing
+        # references Meal, so there are no cascades to collect.
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {quote(Meal._meta.db_table)} "
+                           f"WHERE {quote(Meal._meta.get_field('date').column)} BETWEEN %s AND %s",
+                           [month, month_end(month)])
+            deleted = cursor.rowcount
+    return len(archives), deleted
+
+
+def history_bits(student_id, start, end):
+    """{field: bitset} over start..end (bit i is start + i days), from archive and live rows"""
+    length = (end - start).days + 1
+    bits = dict.fromkeys(ARCHIVE_FIELDS, 0)
+    archives = MealArchive.objects.filter(student_id=student_id, month__range=(month_start(start), end))
+    for month, *values in archives.values_list('month', *ARCHIVE_FIELDS):
+        for field, value in zip(ARCHIVE_FIELDS, values):
+            bits[field] |= shift_bits(value, month, start, length)
+
+    rows = Meal.objects.filter(student_id=student_id, date__range=(start, end))
+    for day, *flags in rows.values_list('date', *MEAL_FIELDS, 'away'):
+        bit = 1 << (day - start).days
+        bits['recorded'] |= bit
+        for field, flag in zip(ARCHIVE_FIELDS[1:], flags):
+            if flag:
+                bits[field] |= bit
+
+    periods = AwayPeriod.objects.filter(student_id=student_id, start_date__lte=end, end_date__gte=start)
+    for first, last in periods.values_list('start_date', 'end_date'):
+        bits['away'] = _set_days(bits['away'], first, last, start, length)
+    return bits
+
+
+def _meal_bits(bits, meal=None):
+    if meal:
+        return bits[meal]
+    return bits['breakfast'] | bits['early'] | bits['supper']
+
+
+def attendance(student_id, start, end):
+    """Number of days in start..end with each meal, with any meal ('meals') and away"""
+    bits = history_bits(student_id, start, end)
+    totals = {field: value.bit_count() for field, value in bits.items()}
+    totals['meals'] = _meal_bits(bits).bit_count()
+    return totals
+
+
+def _longest_run(bits):
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+
+def streaks(student_id, start, end, meal=None):
+    """{'current', 'longest'} runs of consecutive days with `meal` (any meal by default).
+
+    The current streak is the run ending on `end`.
+    """
+    length = (end - start).days + 1
+    bits = _meal_bits(history_bits(student_id, start, end), meal)
+    missed = ~bits & ((1 << length) - 1)
+    current = length - missed.bit_length()
+    return {'current': current, 'longest': _longest_run(bits)}
+
+
+def first_meal_date(student_id):
+    """The earliest day with a meal record, archived or live"""
+    archive = (MealArchive.objects.filter(student_id=student_id, recorded__gt=0)
+               .order_by('month').values_list('month', 'recorded').first())
+    if archive:
+        month, recorded = archive
+        return month + timedelta(days=(recorded & -recorded).bit_length() - 1)
+    return Meal.objects.filter(student_id=student_id).aggregate(first=Min('date'))['first']
+
+
+def diners_on(day, meal):
+    """Ids of students who had `meal` on `day`, archived or live"""
+    ids = set(Meal.objects.filter(date=day, **{meal: True}).values_list('student_id', flat=True))
+    archives = (MealArchive.objects.filter(month=month_start(day))
+                .annotate(hit=F(meal).bitand(1 << (day.day - 1))).filter(hit__gt=0))
+    ids.update(archives.values_list('student_id', flat=True))
+    return ids
+
+
+def daily_totals(start, end):
+    """{day: {'breakfast', 'early', 'supper'}} across all students for start..end"""
+    length = (end - start).days + 1
+    days = [start + timedelta(days=i) for i in range(length)]
+    totals = {day: dict.fromkeys(MEAL_FIELDS, 0) for day in days}
+
+    counts = {field: Count('pk', filter=Q(**{field: True})) for field in MEAL_FIELDS}
+    for row in Meal.objects.filter(date__range=(start, end)).values('date').annotate(**counts).order_by():
+        for field in MEAL_FIELDS:
+            totals[row['date']][field] += row[field]
+
+    archives = MealArchive.objects.filter(month__range=(month_start(start), end))
+    for month, *values in archives.values_list('month', *MEAL_FIELDS).iterator(chunk_size=5000):
+        for field, value in zip(MEAL_FIELDS, values):
+            bits = shift_bits(value, month, start, length)
+            while bits:
+                low = bits & -bits
+                totals[days[low.bit_length() - 1]][field] += 1
+                bits ^= low
+    return totals
+
+
+def meals_on(day):
+    """{student_id: {'breakfast', 'early', 'supper', 'away'}} for every student with a meal record on `day`"""
+    fields = MEAL_FIELDS + ('away',)
+    records = {student_id: dict(zip(fields, flags))
+               for student_id, *flags in Meal.objects.filter(date=day).values_list('student_id', *fields)}
+    bit = 1 << (day.day - 1)
+    archives = (MealArchive.objects.filter(month=month_start(day))
+                .annotate(hit=F('recorded').bitand(bit)).filter(hit__gt=0))
+    for student_id, *values in archives.values_list('student_id', *fields):
+        records.setdefault(student_id, {field: bool(value & bit) for field, value in zip(fields, values)})
+    return records
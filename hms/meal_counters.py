@@ -0,0 +1,145 @@
+"""
+Per-date meal counters kept in the cache.
+
+Each date has one counter per meal (breakfast, early, supper) plus the
+number of Meal rows ("confirmed"). A counter is seeded from a single
+aggregate the first time it is read and from then on moved by deltas:
+Meal post_save/post_delete signals compare the row with the values it was
+loaded with and increment/decrement the affected counters once the
+transaction commits. Reading a day's numbers is then one cache round trip.
+
+Writes that bypass signals (bulk upserts, queryset updates) call
+refresh_counts() for the dates they touched, which drops those counters
+so they are reseeded on the next read. reconcile_counts() recomputes a
+range of dates from the database and corrects any drift; run it
+periodically with the reconcile_meal_counters command.
+
+The away count is not a Meal counter: away days have no rows, so it is
+read from the away index.
+
+The kitchen board polls board_snapshot() as JSON every few seconds. Each
+poll is a short request that reads the counters (cache reads, not
+queries), so an open board never holds a worker.
+"""
+import logging
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .away import students_away_on
+from .models import Meal
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('breakfast', 'early', 'supper', 'confirmed')
+# Long enough to cover the meal planning horizon
+COUNTER_TTL = 60 * 60 * 24 * 16
+
+
+def _key(day, field):
+    return f'meal_count:{day.isoformat()}:{field}'
+
+
+def _db_counts(dates):
+    totals = {field: Count('pk', filter=Q(**{field: True})) for field in COUNTER_FIELDS if field != 'confirmed'}
+    counts = {day: dict.fromkeys(COUNTER_FIELDS, 0) for day in dates}
+    rows = Meal.objects.filter(date__in=dates).values('date').annotate(confirmed=Count('pk'), **totals)
+    for row in rows:
+        counts[row['date']] = {field: row[field] for field in COUNTER_FIELDS}
+    return counts
+
+
+def _seed(day):
+    """Load a day's counters from the database without overwriting live ones"""
+    counts = _db_counts([day])[day]
+    for field, value in counts.items():
+        cache.add(_key(day, field), value, COUNTER_TTL)
+    return counts
+
+
+def get_counts(day):
+    """{'breakfast', 'early', 'supper', 'confirmed', 'away'} for one date"""
+    keys = {field: _key(day, field) for field in COUNTER_FIELDS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        counts = {field: cached[key] for field, key in keys.items()}
+    else:
+        counts = _seed(day)
+    counts['away'] = len(students_away_on(day))
+    return counts
+
+
+def _apply(day, deltas):
+    try:
+        for field, delta in deltas.items():
+            if delta:
+                cache.incr(_key(day, field), delta)
+    except ValueError:
+        # Not cached (or expired part way through): reseed the day on its next read
+        refresh_counts([day])
+
+
+def _row_values(meal):
+    day = Meal._meta.get_field('date').to_python(meal.date)
+    return (day, meal.breakfast, meal.early, meal.supper)
+
+
+def remember_state(meal):
+    """Keep the values a Meal was loaded/saved with, to diff on the next save"""
+    meal._counted_state = _row_values(meal) if meal.pk else None
+
+
+def record_change(meal, deleted=False):
+    """Queue the counter deltas for a saved or deleted Meal"""
+    before = getattr(meal, '_counted_state', None)
+    after = None if deleted else _row_values(meal)
+    changes = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        day, breakfast, early, supper = state
+        deltas = changes.setdefault(day, dict.fromkeys(COUNTER_FIELDS, 0))
+        deltas['confirmed'] += sign
+        deltas['breakfast'] += sign * breakfast
+        deltas['early'] += sign * early
+        deltas['supper'] += sign * supper
+    meal._counted_state = after
+
+    changes = {day: deltas for day, deltas in changes.items() if any(deltas.values())}
+    if changes:
+        transaction.on_commit(lambda: [_apply(day, deltas) for day, deltas in changes.items()])
+
+
+def refresh_counts(dates):
+    """Drop counters for dates changed outside the signals; they reseed on next read"""
+    cache.delete_many([_key(day, field) for day in set(dates) for field in COUNTER_FIELDS])
+
+
+def reconcile_counts(dates):
+    """Recompute counters from the database; returns {date: {field: (cached, actual)}} for drifted ones"""
+    dates = list(dates)
+    actual = _db_counts(dates)
+    keys = [_key(day, field) for day in dates for field in COUNTER_FIELDS]
+    cached = cache.get_many(keys)
+    drift = {}
+    for day in dates:
+        for field in COUNTER_FIELDS:
+            key = _key(day, field)
+            if key in cached and cached[key] != actual[day][field]:
+                drift.setdefault(day, {})[field] = (cached[key], actual[day][field])
+    cache.set_many({_key(day, field): actual[day][field] for day in dates for field in COUNTER_FIELDS},
+                   COUNTER_TTL)
+    if drift:
+        logger.warning(f"[MEALS] Counter drift corrected for {len(drift)} dates: {drift}")
+    return drift
+
+
+def board_snapshot():
+    """Today's and tomorrow's counters for the kitchen board"""
+    today = timezone.localdate()
+    tomorrow = today + timedelta(days=1)
+    return {
+        'today': dict(get_counts(today), date=today.isoformat()),
+        'tomorrow': dict(get_counts(tomorrow), date=tomorrow.isoformat()),
+    }
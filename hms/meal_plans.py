@@ -0,0 +1,173 @@
+"""
+Week-ahead meal planning.
+
+A student submits a whole week (per-day breakfast/early/supper) in one
+request. The plan is validated in memory against the breakfast lock, the
+away index and the planning horizon, then written with a single
+bulk_create(update_conflicts=True) on Meal(student, date). Nothing is
+written if any day is invalid.
+
+Recurring defaults ("breakfast every weekday") live in MealDefault and are
+expanded lazily: a day without a Meal row falls back to the student's
+default for that weekday when the plan is shown or counted, and
+expand_meal_defaults turns the defaults for the coming day into real rows
+(explicit choices always win). The kitchen gets planned numbers for the
+whole week instead of waiting for the morning.
+"""
+from datetime import time, timedelta
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from .away import get_away_index, students_away_on
+from .meal_counters import refresh_counts
+from .models import Meal, MealDefault
+
+MEAL_FIELDS = ('breakfast', 'early', 'supper')
+BREAKFAST_LOCK_TIME = time(8, 0)
+WEEK_DAYS = 7
+PLAN_HORIZON_DAYS = 14
+
+
+class PlanValidationError(Exception):
+    """Raised with a {date: message} dict when any day of a plan is rejected"""
+
+    def __init__(self, errors):
+        super().__init__('Invalid meal plan')
+        self.errors = errors
+
+
+def breakfast_locked(day, now=None):
+    """Breakfast and early breakfast for today cannot change after 08:00 local time"""
+    now = timezone.localtime(now)
+    return day == now.date() and now.time() > BREAKFAST_LOCK_TIME
+
+
+def _defaults_by_weekday(student):
+    return {d.weekday: d for d in MealDefault.objects.filter(student=student)}
+
+
+def week_plan(student, start=None, days=WEEK_DAYS):
+    """The student's effective plan for `days` days from `start` (default today)"""
+    start = start or timezone.localdate()
+    dates = [start + timedelta(days=i) for i in range(days)]
+    meals = {m.date: m for m in Meal.objects.filter(student=student, date__in=dates)}
+    defaults = _defaults_by_weekday(student)
+    away_index = get_away_index(start)
+
+    plan = []
+    for day in dates:
+        entry = {'date': day, 'locked': breakfast_locked(day), 'away': away_index.is_away(student.pk, day)}
+        source = meals.get(day) or defaults.get(day.weekday())
+        if entry['away']:
+            entry.update({field: False for field in MEAL_FIELDS}, source='away')
+        elif source is not None:
+            entry.update({field: getattr(source, field) for field in MEAL_FIELDS},
+                         source='confirmed' if day in meals else 'default')
+        else:
+            entry.update({field: False for field in MEAL_FIELDS}, source='none')
+        plan.append(entry)
+    return plan
+
+
+def validate_plan(student, days, now=None):
+    """Check a plan in memory and return (unsaved Meal objects, warnings).
+
+    `days` is a list of dicts with a `date` and the three meal flags. Raises
+    PlanValidationError listing every rejected day.
+    """
+    today = timezone.localdate(now)
+    away_index = get_away_index(today)
+    errors, warnings, seen = {}, [], set()
+
+    for entry in days:
+        day = entry['date']
+        if day in seen:
+            errors[day.isoformat()] = 'Date appears more than once.'
+        elif day < today:
+            errors[day.isoformat()] = 'Date is in the past.'
+        elif day > today + timedelta(days=PLAN_HORIZON_DAYS):
+            errors[day.isoformat()] = f'Plans can only be made {PLAN_HORIZON_DAYS} days ahead.'
+        elif away_index.is_away(student.pk, day):
+            errors[day.isoformat()] = "You are marked as away for this date. Change your 'Away Mode' settings first."
+        seen.add(day)
+    if errors:
+        raise PlanValidationError(errors)
+
+    # Only today can be locked, so at most one row is read here
+    locked_days = [entry['date'] for entry in days if breakfast_locked(entry['date'], now)]
+    current = {}
+    if locked_days:
+        existing = {m.date: m for m in Meal.objects.filter(student=student, date__in=locked_days)}
+        defaults = _defaults_by_weekday(student)
+        for day in locked_days:
+            current[day] = existing.get(day) or defaults.get(day.weekday())
+
+    meals = []
+    for entry in days:
+        values = {field: bool(entry.get(field)) for field in MEAL_FIELDS}
+        if entry['date'] in current:
+            previous = current[entry['date']]
+            locked_values = {field: bool(previous and getattr(previous, field)) for field in ('breakfast', 'early')}
+            if any(values[f] != locked_values[f] for f in locked_values):
+                warnings.append(f"Breakfast options are locked for {entry['date']} after 08:00 AM.")
+            values.update(locked_values)
+        meals.append(Meal(student=student, date=entry['date'], away=False, **values))
+    return meals, warnings
+
+
+def apply_plan(meals):
+    """Write a validated plan with one upsert"""
+    saved = Meal.objects.bulk_create(
+        meals, update_conflicts=True, unique_fields=['student', 'date'],
+        update_fields=list(MEAL_FIELDS) + ['away', 'submitted_at'],
+    )
+    transaction.on_commit(lambda: refresh_counts([meal.date for meal in meals]))
+    return saved
+
+
+def save_defaults(student, defaults):
+    """Replace the given weekdays' defaults; a weekday with no meals is cleared"""
+    keep = [d for d in defaults if any(d.get(field) for field in MEAL_FIELDS)]
+    clear = [d['weekday'] for d in defaults if not any(d.get(field) for field in MEAL_FIELDS)]
+    with transaction.atomic():
+        if clear:
+            MealDefault.objects.filter(student=student, weekday__in=clear).delete()
+        if keep:
+            MealDefault.objects.bulk_create(
+                [MealDefault(student=student, weekday=d['weekday'],
+                             **{field: bool(d.get(field)) for field in MEAL_FIELDS}) for d in keep],
+                update_conflicts=True, unique_fields=['student', 'weekday'],
+                update_fields=list(MEAL_FIELDS) + ['updated_at'],
+            )
+
+
+def _pending_defaults(day):
+    """Defaults that apply on `day`: the student has no Meal row and is not away"""
+    has_meal = Meal.objects.filter(student=OuterRef('student'), date=day)
+    return (MealDefault.objects.filter(weekday=day.weekday())
+            .exclude(student_id__in=students_away_on(day))
+            .filter(~Exists(has_meal)))
+
+
+def expand_defaults(day):
+    """Materialise the defaults for `day` as Meal rows; explicit rows are left alone"""
+    rows = _pending_defaults(day).values_list('student_id', *MEAL_FIELDS)
+    meals = [Meal(student_id=student_id, date=day, breakfast=breakfast, early=early, supper=supper)
+             for student_id, breakfast, early, supper in rows]
+    Meal.objects.bulk_create(meals, ignore_conflicts=True, batch_size=1000)
+    transaction.on_commit(lambda: refresh_counts([day]))
+    return len(meals)
+
+
+def planned_counts(dates):
+    """{day: {'breakfast', 'early', 'supper'}} from confirmed meals plus unexpanded defaults"""
+    dates = list(dates)
+    totals = {field: Count('pk', filter=Q(**{field: True})) for field in MEAL_FIELDS}
+    counts = {day: dict.fromkeys(MEAL_FIELDS, 0) for day in dates}
+    for row in Meal.objects.filter(date__in=dates).values('date').annotate(**totals):
+        counts[row['date']] = {field: row[field] for field in MEAL_FIELDS}
+    for day in dates:
+        extra = _pending_defaults(day).aggregate(**totals)
+        for field in MEAL_FIELDS:
+            counts[day][field] += extra[field] or 0
+    return counts
@@ -0,0 +1,149 @@
+"""
+Reminders for students who have not confirmed their meals.
+
+The unconfirmed set for a day is one anti-join: students (not on
+attachment) with no Meal row, no weekly default for that weekday and no
+away period covering the day. Preferences and contact details come back in
+the same query.
+
+Each reminder is an in-app Notification whose dedupe_key is
+meal-reminder:<date>:<meal>:<student id>, so running the job again never
+reminds anyone twice. A run holds a cache lock for its date and meal, so
+overlapping runs (the --loop worker and the dashboard button) cannot both
+pick the same students before either has written their keys; the later
+run skips. New reminders are written with one bulk_create. Only those
+students are then contacted on the
+channels they opted into through NotificationPreference: emails go out in
+batches over one SMTP connection, and SMS in batches of recipients per
+gateway call. Admins get a short summary with counts, not the list.
+
+send_meal_reminders runs from the send_meal_reminders command (cron) or
+in the background from the admin dashboard button.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .meal_plans import MEAL_FIELDS
+from .models import AwayPeriod, Meal, MealDefault, Notification, Student
+from .notifications import NotificationService
+
+logger = logging.getLogger(__name__)
+
+EMAIL_BATCH_SIZE = 100
+SMS_BATCH_SIZE = 100
+MEAL_LABELS = {'breakfast': 'breakfast', 'early': 'early breakfast', 'supper': 'supper'}
+
+
+LOCK_TIMEOUT = 15 * 60
+
+
+def reminder_key(student_id, day, meal):
+    return f'meal-reminder:{day.isoformat()}:{meal}:{student_id}'
+
+
+def _lock_key(day, meal):
+    return f'meal-reminder-lock:{day.isoformat()}:{meal}'
+
+
+def unconfirmed_students(day):
+    """Students with no choice for `day`: no Meal row, no weekday default and not away"""
+    return (Student.objects
+            .filter(is_on_attachment=False)
+            .filter(~Exists(Meal.objects.filter(student=OuterRef('pk'), date=day)),
+                    ~Exists(MealDefault.objects.filter(student=OuterRef('pk'), weekday=day.weekday())),
+                    ~Exists(AwayPeriod.objects.filter(student=OuterRef('pk'), start_date__lte=day,
+                                                      end_date__gte=day))))
+
+
+def _send_emails(recipients, subject, body_for):
+    """One EmailMessage per recipient, sent in batches over a single connection"""
+    sent = 0
+    connection = get_connection(fail_silently=True)
+    for i in range(0, len(recipients), EMAIL_BATCH_SIZE):
+        batch = [EmailMessage(subject, body_for(first_name), settings.DEFAULT_FROM_EMAIL, [email],
+                              connection=connection)
+                 for first_name, email in recipients[i:i + EMAIL_BATCH_SIZE]]
+        sent += connection.send_messages(batch) or 0
+    return sent
+
+
+def send_meal_reminders(day=None, meal='breakfast', notify_admins=True):
+    """Remind every unconfirmed student once about `meal` on `day` (default tomorrow).
+
+    Returns a summary dict: unconfirmed, already_reminded, reminded, emailed,
+    texted; or None when another run for the same day and meal is in progress.
+    """
+    if meal not in MEAL_FIELDS:
+        raise ValueError(f"Unknown meal {meal!r}")
+    day = day or timezone.localdate() + timedelta(days=1)
+    lock = _lock_key(day, meal)
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        logger.info(f"[MEALS] Reminders for {meal} on {day} are already being sent; skipping")
+        return None
+    try:
+        return _send_meal_reminders(day, meal, notify_admins)
+    finally:
+        cache.delete(lock)
+
+
+def _send_meal_reminders(day, meal, notify_admins):
+    label = MEAL_LABELS[meal]
+
+    rows = list(unconfirmed_students(day).values_list(
+        'pk', 'user_id', 'user__first_name', 'user__email', 'phone_e164',
+        'user__notification_preferences__email_notifications',
+        'user__notification_preferences__sms_notifications'))
+    prefix = reminder_key('', day, meal)
+    reminded = {int(key[len(prefix):]) for key in
+                Notification.objects.filter(dedupe_key__startswith=prefix).values_list('dedupe_key', flat=True)}
+    new = [row for row in rows if row[0] not in reminded]
+
+    title = f"🍽️ Confirm your {label} for {day:%a %d %b}"
+    message = f"You have not chosen your meals for {day:%A, %B %d}. Please confirm your {label} before the deadline."
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, notification_type='meal', title=title, message=message,
+                     link='/student/dashboard/', dedupe_key=reminder_key(student_id, day, meal))
+        for student_id, user_id, *_ in new
+    ], ignore_conflicts=True, batch_size=1000)
+
+    emails = [(first_name, email) for _, _, first_name, email, _, wants_email, _ in new if wants_email and email]
+    phones = [phone for *_, phone, _, wants_sms in new if wants_sms and phone]
+    emailed = _send_emails(
+        emails, title,
+        lambda first_name: f"Dear {first_name or 'student'},\n\n{message}\n\n"
+                           f"Student Welfare Management System") if emails else 0
+    texted = NotificationService.send_bulk_sms(
+        phones, f"CampusCare: Please confirm your {label} for {day:%b %d}.", batch_size=SMS_BATCH_SIZE
+    ) if phones else 0
+
+    summary = {'date': day, 'meal': meal, 'unconfirmed': len(rows), 'already_reminded': len(rows) - len(new),
+               'reminded': len(new), 'emailed': emailed, 'texted': texted}
+    logger.info(f"[MEALS] Reminders for {meal} on {day}: {summary}")
+    if notify_admins and new:
+        _mail_admin_summary(summary)
+    return summary
+
+
+def _mail_admin_summary(summary):
+    admin_email = getattr(settings, 'ADMIN_EMAIL', None)
+    if not admin_email:
+        return
+    day = summary['date']
+    students = Student.objects.count()
+    send_mail(
+        subject=f"Meal confirmations for {day:%B %d}: {summary['unconfirmed']} unconfirmed",
+        message=(
+            f"Meal reminder run for {MEAL_LABELS[summary['meal']]} on {day:%A, %B %d, %Y}\n\n"
+            f"Unconfirmed students: {summary['unconfirmed']} of {students}\n"
+            f"Reminded now: {summary['reminded']} (email {summary['emailed']}, SMS {summary['texted']})\n"
+            f"Already reminded earlier: {summary['already_reminded']}\n\n"
+            f"The kitchen dashboard has the planned numbers for the week.\n"
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[admin_email],
+        fail_silently=True,
+    )
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0053_mpesacallback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee_balance', serialize=False, to='hms.student')),
+                ('total_charged', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, help_text='Charged minus paid; negative means credit', max_digits=12)),
+                ('oldest_unpaid_at', models.DateTimeField(blank=True, help_text='Date of the oldest charge not yet covered by credits', null=True)),
+                ('last_payment_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['balance'], name='hms_student_balance_ccedf6_idx'), models.Index(fields=['oldest_unpaid_at'], name='hms_student_oldest__065ef1_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('charge', 'Charge'), ('credit', 'Credit')], max_length=10)),
+                ('source', models.CharField(choices=[('room_assignment', 'Room Assignment'), ('registration', 'Registration Fee'), ('payment', 'Payment'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField(blank=True, help_text='Primary key of the originating record', null=True)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Always positive; entry_type gives the direction', max_digits=12)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('posted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='hms.student')),
+            ],
+            options={
+                'verbose_name_plural': 'Ledger Entries',
+                'ordering': ['posted_at', 'id'],
+                'indexes': [models.Index(fields=['student', 'posted_at'], name='hms_ledgere_student_311d15_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('source_id__isnull', False)), fields=('source', 'source_id', 'entry_type'), name='unique_ledger_entry_source')],
+            },
+        ),
+    ]
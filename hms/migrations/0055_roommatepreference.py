@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0054_studentbalance_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoommatePreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('preferred_student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferred_by', to='hms.student')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roommate_preferences', to='hms.student')),
+            ],
+            options={
+                'unique_together': {('student', 'preferred_student')},
+            },
+        ),
+    ]
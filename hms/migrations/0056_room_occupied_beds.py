@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:31
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_occupancy(apps, schema_editor):
+    """Give every active occupant a distinct bed and count occupied beds per room"""
+    Room = apps.get_model('hms', 'Room')
+    RoomAssignment = apps.get_model('hms', 'RoomAssignment')
+
+    by_room = defaultdict(list)
+    for assignment in RoomAssignment.objects.filter(is_active=True).order_by('assigned_date', 'pk'):
+        by_room[assignment.room_id].append(assignment)
+
+    renumbered = []
+    for assignments in by_room.values():
+        used = set()
+        pending = []
+        for assignment in assignments:
+            if assignment.bed_number and assignment.bed_number > 0 and assignment.bed_number not in used:
+                used.add(assignment.bed_number)
+            else:
+                pending.append(assignment)
+        bed = 1
+        for assignment in pending:
+            while bed in used:
+                bed += 1
+            assignment.bed_number = bed
+            used.add(bed)
+            renumbered.append(assignment)
+    RoomAssignment.objects.bulk_update(renumbered, ['bed_number'], batch_size=500)
+
+    rooms = list(Room.objects.all())
+    for room in rooms:
+        room.occupied_beds = len(by_room.get(room.pk, []))
+        if room.occupied_beds >= room.capacity:
+            room.is_available = False
+    Room.objects.bulk_update(rooms, ['occupied_beds', 'is_available'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0055_roommatepreference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='occupied_beds',
+            field=models.PositiveIntegerField(default=0, help_text='Active assignments; maintained by hms.booking'),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='roomassignment',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('room', 'bed_number'), name='unique_active_bed'),
+        ),
+    ]
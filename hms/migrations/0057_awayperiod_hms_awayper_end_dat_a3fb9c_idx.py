@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0056_room_occupied_beds'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='awayperiod',
+            index=models.Index(fields=['end_date'], name='hms_awayper_end_dat_a3fb9c_idx'),
+        ),
+    ]
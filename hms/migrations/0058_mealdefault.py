@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0057_awayperiod_hms_awayper_end_dat_a3fb9c_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealDefault',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('breakfast', models.BooleanField(default=False)),
+                ('early', models.BooleanField(default=False)),
+                ('supper', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_defaults', to='hms.student')),
+            ],
+            options={
+                'ordering': ['student', 'weekday'],
+                'indexes': [models.Index(fields=['weekday'], name='hms_mealdef_weekday_2f91c5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'weekday'), name='unique_meal_default_weekday')],
+            },
+        ),
+    ]
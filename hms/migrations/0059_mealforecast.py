@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0058_mealdefault'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal', models.CharField(choices=[('breakfast', 'Breakfast'), ('early', 'Early Breakfast'), ('supper', 'Supper')], max_length=10)),
+                ('confirmed', models.PositiveIntegerField(default=0, help_text='Confirmed (or defaulted) when the forecast was made')),
+                ('expected_unconfirmed', models.FloatField(default=0, help_text='Expected extra diners among students who had not confirmed')),
+                ('forecast', models.PositiveIntegerField(default=0)),
+                ('actual', models.PositiveIntegerField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['date', 'meal'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'meal'), name='unique_meal_forecast')],
+            },
+        ),
+    ]
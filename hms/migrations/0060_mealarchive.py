@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0059_mealforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('recorded', models.PositiveIntegerField(default=0, help_text='Days that had a meal record')),
+                ('breakfast', models.PositiveIntegerField(default=0)),
+                ('early', models.PositiveIntegerField(default=0)),
+                ('supper', models.PositiveIntegerField(default=0)),
+                ('away', models.PositiveIntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_archives', to='hms.student')),
+            ],
+            options={
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['month'], name='hms_mealarc_month_86fc7c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'month'), name='unique_meal_archive_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0060_mealarchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealServing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal', models.CharField(choices=[('breakfast', 'Breakfast'), ('early', 'Early Breakfast'), ('supper', 'Supper')], max_length=10)),
+                ('served_at', models.DateTimeField()),
+                ('line', models.CharField(blank=True, help_text='Serving line that scanned the pass', max_length=30)),
+                ('scanned_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_servings', to='hms.student')),
+            ],
+            options={
+                'ordering': ['-served_at'],
+                'indexes': [models.Index(fields=['date', 'meal'], name='hms_mealser_date_fc6b01_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'date', 'meal'), name='unique_meal_serving')],
+            },
+        ),
+    ]
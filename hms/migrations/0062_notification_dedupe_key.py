@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0061_mealserving'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='dedupe_key',
+            field=models.CharField(blank=True, help_text='Idempotency key for generated notifications (e.g. one meal reminder per student, date and meal)', max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Backend-specific full-text index over title (weighted higher) and body.
+# Kept in step with hms.search, which queries these structures.
+POSTGRES_FORWARD = [
+    """ALTER TABLE hms_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED""",
+    "CREATE INDEX hms_searchdocument_vector_gin ON hms_searchdocument USING GIN (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS hms_searchdocument_vector_gin",
+    "ALTER TABLE hms_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+# External-content FTS5 table kept in sync by triggers
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE hms_searchdocument_fts USING fts5(
+        title, body, content='hms_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER hms_searchdocument_ai AFTER INSERT ON hms_searchdocument BEGIN
+        INSERT INTO hms_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER hms_searchdocument_ad AFTER DELETE ON hms_searchdocument BEGIN
+        INSERT INTO hms_searchdocument_fts(hms_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER hms_searchdocument_au AFTER UPDATE ON hms_searchdocument BEGIN
+        INSERT INTO hms_searchdocument_fts(hms_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO hms_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS hms_searchdocument_au",
+    "DROP TRIGGER IF EXISTS hms_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS hms_searchdocument_ai",
+    "DROP TABLE IF EXISTS hms_searchdocument_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+create_fulltext = _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD})
+drop_fulltext = _run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0062_notification_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('student', 'Student'), ('announcement', 'Announcement'), ('maintenance', 'Maintenance Request'), ('deferment', 'Deferment Request')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('visibility', models.CharField(choices=[('public', 'Everyone signed in'), ('owner', 'Owner and staff'), ('staff', 'Staff only')], default='staff', max_length=10)),
+                ('source_date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='hms.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['visibility', 'kind'], name='hms_searchd_visibil_3d8ddc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0063_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentLookupKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lookup_keys', to='hms.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'student'], name='student_lookup_key_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'key'), name='unique_student_lookup_key')],
+            },
+        ),
+    ]
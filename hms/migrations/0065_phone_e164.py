@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:14
+
+from django.db import migrations, models
+
+from hms.phones import to_e164
+
+
+def backfill_phone_e164(apps, schema_editor):
+    """Fill phone_e164 from the phone as typed for existing students and staff"""
+    for model_name in ('Student', 'StaffProfile'):
+        model = apps.get_model('hms', model_name)
+        batch = []
+        for row in model.objects.exclude(phone='').only('pk', 'phone').iterator(chunk_size=1000):
+            row.phone_e164 = to_e164(row.phone)
+            if row.phone_e164:
+                batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ['phone_e164'])
+                batch = []
+        model.objects.bulk_update(batch, ['phone_e164'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0064_studentlookupkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staffprofile',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='phone in canonical E.164 form, kept in sync on save', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='phone in canonical E.164 form, kept in sync on save', max_length=16),
+        ),
+        migrations.RunPython(backfill_phone_e164, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Expression indexes for case-insensitive login lookups (hms.login_throttle.find_user).
+
+    auth_user belongs to django.contrib.auth, so these are plain SQL rather
+    than Meta.indexes. Both SQLite and PostgreSQL support them.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('hms', '0066_inboundmessage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS hms_user_username_lower_idx ON auth_user (lower(username))',
+            reverse_sql='DROP INDEX IF EXISTS hms_user_username_lower_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS hms_user_email_lower_idx ON auth_user (lower(email))',
+            reverse_sql='DROP INDEX IF EXISTS hms_user_email_lower_idx',
+        ),
+    ]
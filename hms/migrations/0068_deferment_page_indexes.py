@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0067_user_lower_login_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='defermentrequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='deferment_status_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='defermentrequest',
+            index=models.Index(fields=['-created_at', '-id'], name='deferment_page_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:02
+
+from django.db import migrations
+
+from hms.autocomplete import lookup_keys
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    """Write the typeahead keys for existing students, as rebuild_lookup_keys does.
+
+    Runs after 0065 so the keys include the E.164 phone numbers.
+    """
+    Student = apps.get_model('hms', 'Student')
+    StudentLookupKey = apps.get_model('hms', 'StudentLookupKey')
+    StudentLookupKey.objects.all().delete()
+    batch = []
+    for student in Student.objects.select_related('user').order_by('pk').iterator(chunk_size=1000):
+        batch.extend(StudentLookupKey(student=student, key=key) for key in lookup_keys(student))
+        if len(batch) >= 1000:
+            StudentLookupKey.objects.bulk_create(batch)
+            batch = []
+    StudentLookupKey.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0068_deferment_page_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:10
+
+from django.db import migrations
+
+from hms.search import SOURCES
+
+
+def backfill_search_documents(apps, schema_editor):
+    """Index the existing records, as rebuild_search_index does"""
+    SearchDocument = apps.get_model('hms', 'SearchDocument')
+    SearchDocument.objects.all().delete()
+    for kind, (model, build, related) in SOURCES.items():
+        model = apps.get_model('hms', model.__name__)
+        batch = []
+        for instance in model.objects.select_related(*related).order_by('pk').iterator(chunk_size=1000):
+            fields = build(instance)
+            if fields is None:
+                continue
+            batch.append(SearchDocument(kind=kind, object_id=instance.pk, **fields))
+            if len(batch) >= 1000:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0069_backfill_student_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:20
+
+from django.db import migrations
+
+from hms.ledger import (BALANCE_FIELDS, balance_fields, ended_stays, is_transfer, payment_credit_fields,
+                        room_charge_fields)
+
+
+def backfill_fee_ledger(apps, schema_editor):
+    """Post existing room assignments and completed payments, then rebuild balances, as rebuild_fee_ledger does.
+
+    Transfers (a stay that began the day the student's previous one ended)
+    are not charged, as in ledger.charge_room_assignments.
+    """
+    LedgerEntry = apps.get_model('hms', 'LedgerEntry')
+    StudentBalance = apps.get_model('hms', 'StudentBalance')
+    RoomAssignment = apps.get_model('hms', 'RoomAssignment')
+    Payment = apps.get_model('hms', 'Payment')
+
+    posted = set(LedgerEntry.objects.filter(source_id__isnull=False)
+                 .values_list('source', 'source_id', 'entry_type'))
+    ended = ended_stays(RoomAssignment.objects.all())
+    sources = [
+        (RoomAssignment.objects.select_related('room'), room_charge_fields),
+        (Payment.objects.filter(status='Completed'), payment_credit_fields),
+    ]
+    for rows, build in sources:
+        batch = []
+        for row in rows.order_by('pk').iterator(chunk_size=1000):
+            if build is room_charge_fields and is_transfer(row, ended):
+                continue
+            fields = build(row)
+            if not (fields['amount'] and fields['amount'] > 0):
+                continue
+            if (fields['source'], row.pk, fields['entry_type']) in posted:
+                continue
+            batch.append(LedgerEntry(**fields))
+            if len(batch) >= 1000:
+                LedgerEntry.objects.bulk_create(batch)
+                batch = []
+        LedgerEntry.objects.bulk_create(batch)
+
+    StudentBalance.objects.bulk_create(
+        [StudentBalance(**fields) for fields in balance_fields(LedgerEntry.objects.all())],
+        batch_size=500, update_conflicts=True, unique_fields=['student'], update_fields=BALANCE_FIELDS,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0070_backfill_search_documents'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fee_ledger, migrations.RunPython.noop),
+    ]
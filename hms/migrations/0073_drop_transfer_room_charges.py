@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:10
+
+from django.db import migrations
+
+from hms.ledger import balance_fields, ended_stays, is_transfer
+
+
+def drop_transfer_room_charges(apps, schema_editor):
+    """Remove room charges already posted for transfers, then rebuild the affected balances.
+
+    select_room, assign_room and the 0071 backfill used to bill every
+    assignment, so a student who moved room was charged twice.
+    """
+    LedgerEntry = apps.get_model('hms', 'LedgerEntry')
+    StudentBalance = apps.get_model('hms', 'StudentBalance')
+    RoomAssignment = apps.get_model('hms', 'RoomAssignment')
+
+    ended = ended_stays(RoomAssignment.objects.all())
+    charged = set(LedgerEntry.objects.filter(source='room_assignment', entry_type='charge')
+                  .values_list('source_id', flat=True))
+    transfers = [assignment for assignment in RoomAssignment.objects.filter(pk__in=charged)
+                 if is_transfer(assignment, ended)]
+    if not transfers:
+        return
+    LedgerEntry.objects.filter(source='room_assignment', entry_type='charge',
+                               source_id__in=[assignment.pk for assignment in transfers]).delete()
+
+    student_ids = {assignment.student_id for assignment in transfers}
+    StudentBalance.objects.filter(pk__in=student_ids).delete()
+    StudentBalance.objects.bulk_create(
+        [StudentBalance(**fields) for fields in balance_fields(LedgerEntry.objects.filter(student_id__in=student_ids))],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0072_deferment_reviewer'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_transfer_room_charges, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 from datetime import date, datetime
 import json
+from .phones import to_e164
 
 class AuditLog(models.Model):
     """
@@ -39,11 +41,21 @@ class AuditLog(models.Model):
     def __str__(self):
         return f"{self.user} - {self.action} - {self.timestamp}"
 
+def _sync_phone_e164(instance, save_kwargs):
+    """Derive phone_e164 from phone before a save (see hms.phones)"""
+    instance.phone_e164 = to_e164(instance.phone)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'phone' in update_fields:
+        save_kwargs['update_fields'] = {*update_fields, 'phone_e164'}
+
+
 class Student(models.Model):
     """Extended profile for students"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
     university_id = models.CharField(max_length=50, unique=True, null=True, blank=True)
     phone = models.CharField(max_length=15, blank=True)
+    phone_e164 = models.CharField(max_length=16, blank=True, db_index=True, editable=False,
+                                  help_text="phone in canonical E.164 form, kept in sync on save")
     profile_image = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
     timetable = models.FileField(upload_to='timetables/', blank=True, null=True)
     room_number = models.CharField(max_length=10, blank=True, null=True)
@@ -118,6 +130,10 @@ class Student(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        _sync_phone_e164(self, kwargs)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.university_id})"
 
@@ -145,6 +161,9 @@ class AwayPeriod(models.Model):
     end_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['end_date'])]
+
     def clean(self):
         from django.core.exceptions import ValidationError
         if self.start_date > self.end_date:
@@ -153,6 +172,92 @@ class AwayPeriod(models.Model):
     def __str__(self):
         return f"{self.student} Away: {self.start_date} to {self.end_date}"
 
+class MealDefault(models.Model):
+    """A student's standing meal choice for one weekday (e.g. breakfast every Monday)"""
+    WEEKDAYS = [(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+                (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='meal_defaults')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    breakfast = models.BooleanField(default=False)
+    early = models.BooleanField(default=False)
+    supper = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['student', 'weekday']
+        constraints = [models.UniqueConstraint(fields=['student', 'weekday'], name='unique_meal_default_weekday')]
+        indexes = [models.Index(fields=['weekday'])]
+
+    def __str__(self):
+        return f"{self.student} - {self.get_weekday_display()}"
+
+class MealForecast(models.Model):
+    """Nightly headcount forecast for one meal on one day, with the actual count filled in afterwards"""
+    MEAL_CHOICES = [('breakfast', 'Breakfast'), ('early', 'Early Breakfast'), ('supper', 'Supper')]
+
+    date = models.DateField()
+    meal = models.CharField(max_length=10, choices=MEAL_CHOICES)
+    confirmed = models.PositiveIntegerField(default=0, help_text="Confirmed (or defaulted) when the forecast was made")
+    expected_unconfirmed = models.FloatField(default=0, help_text="Expected extra diners among students who had not confirmed")
+    forecast = models.PositiveIntegerField(default=0)
+    actual = models.PositiveIntegerField(null=True, blank=True)
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['date', 'meal']
+        constraints = [models.UniqueConstraint(fields=['date', 'meal'], name='unique_meal_forecast')]
+
+    def __str__(self):
+        return f"{self.get_meal_display()} {self.date}: {self.forecast}"
+
+    @property
+    def error(self):
+        return None if self.actual is None else self.forecast - self.actual
+
+    @property
+    def error_percent(self):
+        if self.actual is None:
+            return None
+        return round(100 * (self.forecast - self.actual) / self.actual, 1) if self.actual else None
+
+class MealArchive(models.Model):
+    """One student's meals for a closed month, packed as bitsets (bit d-1 is day d of the month)"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='meal_archives')
+    month = models.DateField(help_text="First day of the month")
+    recorded = models.PositiveIntegerField(default=0, help_text="Days that had a meal record")
+    breakfast = models.PositiveIntegerField(default=0)
+    early = models.PositiveIntegerField(default=0)
+    supper = models.PositiveIntegerField(default=0)
+    away = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-month']
+        constraints = [models.UniqueConstraint(fields=['student', 'month'], name='unique_meal_archive_month')]
+        indexes = [models.Index(fields=['month'])]
+
+    def __str__(self):
+        return f"{self.student} - {self.month:%B %Y}"
+
+class MealServing(models.Model):
+    """A meal actually served, recorded when the student's meal pass is scanned in the dining hall"""
+    MEAL_CHOICES = MealForecast.MEAL_CHOICES
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='meal_servings')
+    date = models.DateField()
+    meal = models.CharField(max_length=10, choices=MEAL_CHOICES)
+    served_at = models.DateTimeField()
+    line = models.CharField(max_length=30, blank=True, help_text="Serving line that scanned the pass")
+    scanned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        ordering = ['-served_at']
+        constraints = [models.UniqueConstraint(fields=['student', 'date', 'meal'], name='unique_meal_serving')]
+        indexes = [models.Index(fields=['date', 'meal'])]
+
+    def __str__(self):
+        return f"{self.student} - {self.get_meal_display()} {self.date}"
+
 class Activity(models.Model):
     """Weekly activities"""
     display_name = models.CharField(max_length=100)
@@ -255,6 +360,8 @@ class StaffProfile(models.Model):
     role = models.CharField(max_length=50, choices=ROLE_CHOICES)
     national_id = models.CharField(max_length=20, unique=True, verbose_name="Role ID / National ID")
     phone = models.CharField(max_length=15)
+    phone_e164 = models.CharField(max_length=16, blank=True, db_index=True, editable=False,
+                                  help_text="phone in canonical E.164 form, kept in sync on save")
     is_approved = models.BooleanField(default=True)
     profile_image = models.ImageField(upload_to='staff_profiles/', null=True, blank=True)
 
@@ -288,6 +395,10 @@ class StaffProfile(models.Model):
         }
         return colors.get(self.role, {'name': 'Gray', 'hex': '#4B5563'})
 
+    def save(self, *args, **kwargs):
+        _sync_phone_e164(self, kwargs)
+        super().save(*args, **kwargs)
+
     def get_category(self):
         """Categorize roles for permission logic"""
         role = self.role
@@ -353,11 +464,18 @@ class DefermentRequest(models.Model):
     reason = models.TextField(help_text="Detailed explanation")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     admin_response = models.TextField(blank=True, help_text="Response from admin")
+    reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviewed_deferments')
+    reviewed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        # Keyset pages of the review workbench (hms.deferments)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='deferment_status_page_idx'),
+            models.Index(fields=['-created_at', '-id'], name='deferment_page_idx'),
+        ]
 
     @property
     def duration_days(self):
@@ -447,6 +565,28 @@ class Message(models.Model):
     def __str__(self):
         return f"From {self.sender} to {self.recipient}: {self.content[:20]}"
 
+class RoomQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        """Annotate active occupants (active_count) and free_beds from the occupied_beds counter"""
+        return self.annotate(
+            active_count=models.F('occupied_beds'),
+            free_beds=Greatest(models.F('capacity') - models.F('occupied_beds'), models.Value(0)),
+        )
+
+    def occupancy_summary(self):
+        """Room and bed totals in one aggregate query (uses the occupied_beds counter)"""
+        totals = self.aggregate(
+            total_rooms=models.Count('pk'),
+            available_rooms=models.Count('pk', filter=models.Q(is_available=True)),
+            full_rooms=models.Count('pk', filter=models.Q(occupied_beds__gte=models.F('capacity'))),
+            total_beds=Coalesce(models.Sum('capacity'), 0),
+            occupied_beds=Coalesce(models.Sum('occupied_beds'), 0),
+        )
+        totals['occupied_rooms'] = totals['total_rooms'] - totals['available_rooms']
+        totals['free_beds'] = max(totals['total_beds'] - totals['occupied_beds'], 0)
+        totals['occupancy_rate'] = round(totals['occupied_beds'] * 100 / totals['total_beds'], 1) if totals['total_beds'] else 0
+        return totals
+
 class Room(models.Model):
     """Rooms in hostels"""
     ROOM_TYPES = [
@@ -458,17 +598,27 @@ class Room(models.Model):
     room_type = models.CharField(max_length=20, choices=ROOM_TYPES, default='double')
     capacity = models.IntegerField(default=2)
     is_available = models.BooleanField(default=True)
+    occupied_beds = models.PositiveIntegerField(default=0, help_text="Active assignments; maintained by hms.booking")
     amenities = models.TextField(blank=True, help_text="List amenities (e.g., AC, attached bathroom)")
     price_per_semester = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RoomQuerySet.as_manager()
+
     class Meta:
         ordering = ['block', 'floor', 'room_number']
 
     def __str__(self):
         return f"{self.room_number} ({self.block})"
 
+    @property
+    def available_beds(self):
+        """Free beds, from the with_occupancy() annotation when present"""
+        if hasattr(self, 'free_beds'):
+            return self.free_beds
+        return max(self.capacity - self.occupied_beds, 0)
+
 class RoomAssignment(models.Model):
     """Assigning students to rooms"""
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='assignments')
@@ -483,6 +633,14 @@ class RoomAssignment(models.Model):
 
     class Meta:
         ordering = ['-assigned_date']
+        constraints = [
+            # Two active occupants can never hold the same bed
+            models.UniqueConstraint(
+                fields=['room', 'bed_number'],
+                condition=models.Q(is_active=True),
+                name='unique_active_bed',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.student} in {self.room}"
@@ -507,6 +665,18 @@ class RoomChangeRequest(models.Model):
     def __str__(self):
         return f"Change Request: {self.student}"
 
+class RoommatePreference(models.Model):
+    """A student's request to share a room with another student at allocation time"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='roommate_preferences')
+    preferred_student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='preferred_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['student', 'preferred_student']
+
+    def __str__(self):
+        return f"{self.student} -> {self.preferred_student}"
+
 class LoginActivity(models.Model):
     """Track user login activities"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_activities', null=True, blank=True)
@@ -534,7 +704,7 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=[
         ('Pending', 'Pending'), ('Completed', 'Completed'), ('Failed', 'Failed')
     ], default='Pending')
-    checkout_request_id = models.CharField(max_length=100, null=True, blank=True)
+    checkout_request_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     description = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -565,7 +735,7 @@ class AdminSubscription(models.Model):
     last_payment_date = models.DateTimeField(null=True, blank=True)
     expiry_date = models.DateTimeField(null=True, blank=True)
     transaction_id = models.CharField(max_length=50, unique=True, null=True, blank=True)
-    checkout_request_id = models.CharField(max_length=100, null=True, blank=True)
+    checkout_request_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     phone_number = models.CharField(max_length=15, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=3000.00)
     
@@ -613,6 +783,85 @@ class RegistrationPayment(models.Model):
     def __str__(self):
         return f"Reg Payment {self.status} - {self.phone_number}"
 
+class MpesaCallback(models.Model):
+    """Raw STK Push callbacks from Safaricom, stored before they are processed"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('duplicate', 'Duplicate'),
+        ('failed', 'Failed'),
+    ]
+    checkout_request_id = models.CharField(max_length=100, blank=True, db_index=True)
+    payload = models.TextField(help_text="Raw callback body as received")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [models.Index(fields=['status', 'received_at'])]
+
+    def __str__(self):
+        return f"Callback {self.checkout_request_id or '-'} ({self.status})"
+
+class LedgerEntry(models.Model):
+    """Immutable fee ledger line: a charge billed to a student or a credit received"""
+    ENTRY_TYPES = [
+        ('charge', 'Charge'),
+        ('credit', 'Credit'),
+    ]
+    SOURCE_CHOICES = [
+        ('room_assignment', 'Room Assignment'),
+        ('registration', 'Registration Fee'),
+        ('payment', 'Payment'),
+        ('adjustment', 'Adjustment'),
+    ]
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='ledger_entries')
+    entry_type = models.CharField(max_length=10, choices=ENTRY_TYPES)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="Primary key of the originating record")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, help_text="Always positive; entry_type gives the direction")
+    description = models.CharField(max_length=255, blank=True)
+    posted_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['posted_at', 'id']
+        verbose_name_plural = "Ledger Entries"
+        indexes = [models.Index(fields=['student', 'posted_at'])]
+        constraints = [
+            # A source record is posted at most once per direction
+            models.UniqueConstraint(
+                fields=['source', 'source_id', 'entry_type'],
+                condition=models.Q(source_id__isnull=False),
+                name='unique_ledger_entry_source',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entry_type_display()} KES {self.amount} - {self.student}"
+
+class StudentBalance(models.Model):
+    """Denormalised running balance per student, maintained with every ledger posting"""
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='fee_balance')
+    total_charged = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Charged minus paid; negative means credit")
+    oldest_unpaid_at = models.DateTimeField(null=True, blank=True, help_text="Date of the oldest charge not yet covered by credits")
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['balance']),
+            models.Index(fields=['oldest_unpaid_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - KES {self.balance}"
+
 class LostItem(models.Model):
     """Model for Lost and Found items"""
     STATUS_CHOICES = [
@@ -653,6 +902,8 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.CharField(max_length=255, blank=True, null=True, help_text="Optional URL to redirect when clicked")
+    dedupe_key = models.CharField(max_length=100, unique=True, null=True, blank=True,
+                                  help_text="Idempotency key for generated notifications (e.g. one meal reminder per student, date and meal)")
 
     class Meta:
         ordering = ['-created_at']
@@ -884,3 +1135,74 @@ class CrisisHelpline(models.Model):
     def __str__(self):
         return f"{self.name} - {self.phone}"
 
+
+
+class SearchDocument(models.Model):
+    """Denormalised, full-text indexed copy of a searchable record (see hms.search)"""
+    KIND_CHOICES = [
+        ('student', 'Student'),
+        ('announcement', 'Announcement'),
+        ('maintenance', 'Maintenance Request'),
+        ('deferment', 'Deferment Request'),
+    ]
+    VISIBILITY_CHOICES = [
+        ('public', 'Everyone signed in'),
+        ('owner', 'Owner and staff'),
+        ('staff', 'Staff only'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='staff')
+    owner = models.ForeignKey(Student, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    source_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document')]
+        indexes = [models.Index(fields=['visibility', 'kind'])]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.title}"
+
+
+class StudentLookupKey(models.Model):
+    """Normalised prefix of a student's name, university ID or phone (see hms.autocomplete)"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='lookup_keys')
+    key = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['student', 'key'], name='unique_student_lookup_key')]
+        indexes = [models.Index(fields=['key', 'student'], name='student_lookup_key_idx')]
+
+    def __str__(self):
+        return f"{self.key} -> {self.student_id}"
+
+
+class InboundMessage(models.Model):
+    """WhatsApp messages from Africa's Talking, stored before they are processed (see hms.whatsapp)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('replied', 'Replied'),
+        ('failed', 'Failed'),
+    ]
+    provider_message_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    sender = models.CharField(max_length=50)
+    text = models.TextField(blank=True)
+    student = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='inbound_messages')
+    reply = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [models.Index(fields=['status', 'received_at'])]
+
+    def __str__(self):
+        return f"{self.sender}: {self.text[:30]} ({self.status})"
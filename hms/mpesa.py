@@ -1,9 +1,79 @@
-
 import requests
 import json
 import base64
+import logging
+import threading
+import time
 from datetime import datetime
 from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .phones import msisdn
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_KEY = 'mpesa_access_token'
+# Refresh the token this many seconds before Safaricom expires it
+TOKEN_EXPIRY_MARGIN = 60
+
+
+def _build_session():
+    """Shared HTTP session so Daraja calls reuse pooled TCP/TLS connections"""
+    session = requests.Session()
+    # POSTs (STK push/query) are only retried on connection failures so a
+    # slow Daraja response never results in a second prompt on the phone.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+session = _build_session()
+
+
+class CallMetrics:
+    """Per-endpoint call counts and timings for the Daraja API (process-local)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, elapsed, ok):
+        with self._lock:
+            stat = self._stats.setdefault(name, {
+                'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0,
+            })
+            ms = elapsed * 1000
+            stat['calls'] += 1
+            stat['total_ms'] += ms
+            stat['last_ms'] = ms
+            stat['max_ms'] = max(stat['max_ms'], ms)
+            if not ok:
+                stat['errors'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for name, stat in self._stats.items():
+                avg = stat['total_ms'] / stat['calls'] if stat['calls'] else 0.0
+                result[name] = dict(stat, avg_ms=round(avg, 2))
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+metrics = CallMetrics()
+
 
 class MpesaClient:
     def __init__(self):
@@ -11,20 +81,67 @@ class MpesaClient:
         self.consumer_secret = settings.MPESA_CONSUMER_SECRET
         self.shortcode = settings.MPESA_SHORTCODE
         self.passkey = settings.MPESA_PASSKEY
-        self.base_url = "https://sandbox.safaricom.co.ke" if settings.DEBUG else "https://api.safaricom.co.ke"
+        self.base_url = getattr(settings, 'MPESA_BASE_URL', '') or (
+            "https://sandbox.safaricom.co.ke" if settings.DEBUG else "https://api.safaricom.co.ke"
+        )
+
+    def _request(self, name, method, url, **kwargs):
+        """Send a request through the pooled session, recording its timing"""
+        kwargs.setdefault('timeout', 10)
+        start = time.monotonic()
+        ok = False
+        try:
+            response = session.request(method, url, **kwargs)
+            ok = response.status_code < 400
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.record(name, elapsed, ok)
+            logger.debug(f"[MPESA] {name} took {elapsed * 1000:.1f}ms (ok={ok})")
 
     def get_token(self):
+        if not self.consumer_key or not self.consumer_secret:
+            # Demo mode without credentials: stk_push/stk_push_query simulate success.
+            # Use the mpesa_simulator command to exercise the real request/callback cycle.
+            return "dummy_token"
+
+        token = cache.get(TOKEN_CACHE_KEY)
+        if token:
+            return token
+
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         auth = (self.consumer_key, self.consumer_secret)
         try:
-            response = requests.get(url, auth=auth, timeout=10)
+            response = self._request('oauth', 'GET', url, auth=auth)
             response.raise_for_status()
-            return response.json()['access_token']
+            data = response.json()
+            token = data['access_token']
+            expires_in = int(data.get('expires_in', 3599))
+            cache.set(TOKEN_CACHE_KEY, token, max(expires_in - TOKEN_EXPIRY_MARGIN, 1))
+            return token
         except Exception as e:
-            # Fallback for demo/testing without credentials
-            # In production this should raise Error
-            print(f"Mpesa Token Error: {e}")
-            return "dummy_token" 
+            logger.error(f"[MPESA] Token error: {e}")
+            return None
+
+    def invalidate_token(self):
+        cache.delete(TOKEN_CACHE_KEY)
+
+    def _post(self, name, path, payload):
+        """POST to Daraja with the cached token, refreshing it once if it was revoked"""
+        url = f"{self.base_url}{path}"
+        for attempt in range(2):
+            token = self.get_token()
+            if not token:
+                return {"ResponseCode": "1", "ResponseDescription": "Could not authenticate with M-Pesa"}
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json'
+            }
+            response = self._request(name, 'POST', url, headers=headers, json=payload)
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            return response.json()
 
     def stk_push(self, phone_number, amount, reference, callback_url, description="Accommodation"):
         token = self.get_token()
@@ -39,24 +156,16 @@ class MpesaClient:
 
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = base64.b64encode(f"{self.shortcode}{self.passkey}{timestamp}".encode()).decode()
-        
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
+
         # M-Pesa expects phone in 2547XXXXXXXX format without +
-        if phone_number.startswith('+'):
-            phone_number = phone_number[1:]
-        if phone_number.startswith('0'):
-            phone_number = '254' + phone_number[1:]
-            
+        phone_number = msisdn(phone_number) or phone_number
+
         payload = {
             "BusinessShortCode": self.shortcode,
             "Password": password,
             "Timestamp": timestamp,
             "TransactionType": "CustomerPayBillOnline",
-            "Amount": int(amount), 
+            "Amount": int(amount),
             "PartyA": phone_number,
             "PartyB": self.shortcode,
             "PhoneNumber": phone_number,
@@ -64,11 +173,9 @@ class MpesaClient:
             "AccountReference": reference,
             "TransactionDesc": description
         }
-        
-        url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
+
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            return response.json()
+            return self._post('stk_push', '/mpesa/stkpush/v1/processrequest', payload)
         except Exception as e:
             return {"ResponseCode": "1", "ResponseDescription": str(e)}
 
@@ -79,22 +186,15 @@ class MpesaClient:
 
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = base64.b64encode(f"{self.shortcode}{self.passkey}{timestamp}".encode()).decode()
-        
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        
+
         payload = {
             "BusinessShortCode": self.shortcode,
             "Password": password,
             "Timestamp": timestamp,
             "CheckoutRequestID": checkout_request_id
         }
-        
-        url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
+
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            return response.json()
+            return self._post('stk_push_query', '/mpesa/stkpushquery/v1/query', payload)
         except Exception as e:
             return {"ResponseCode": "1", "ResponseDescription": str(e)}
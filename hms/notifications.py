@@ -7,6 +7,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
 import logging
+from .phones import to_e164
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +57,42 @@ class NotificationService:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
     
+    @staticmethod
+    def format_phone(phone_number):
+        """Format phone: 07XX -> +254XX (see hms.phones); None if it is not a phone number"""
+        return to_e164(phone_number) or None
+
+    @staticmethod
+    def send_bulk_sms(phone_numbers, message, batch_size=100):
+        """Send the same SMS to many numbers, batch_size recipients per Africa's Talking call.
+
+        Returns the number of recipients in batches that were accepted.
+        """
+        import os
+        username = os.environ.get('AFRICASTALKING_USERNAME', 'sandbox')
+        api_key = os.getenv('AFRICASTALKING_API_KEY')
+        if not api_key:
+            logger.warning("[SMS SKIPPED] AFRICASTALKING_API_KEY not configured.")
+            return 0
+        phones = sorted({p for p in map(NotificationService.format_phone, phone_numbers) if p})
+        if not phones:
+            return 0
+
+        import africastalking
+        africastalking.initialize(username, api_key)
+        sms = africastalking.SMS
+        sender_id = os.environ.get('AFRICASTALKING_SENDER_ID')
+        sent = 0
+        for i in range(0, len(phones), batch_size):
+            batch = phones[i:i + batch_size]
+            try:
+                response = sms.send(message, batch, sender_id) if sender_id else sms.send(message, batch)
+                logger.info(f"[SMS SENT] {len(batch)} recipients: {response}")
+                sent += len(batch)
+            except Exception as e:
+                logger.error(f"[SMS ERROR] batch of {len(batch)}: {str(e)}")
+        return sent
+
     @staticmethod
     def send_sms(phone_number, message):
         """Send SMS via Africa's Talking"""
@@ -67,14 +104,9 @@ class NotificationService:
                 logger.warning("[SMS SKIPPED] AFRICASTALKING_API_KEY not configured.")
                 return False
 
-            # Format phone: 07XX -> +254XX
-            phone = phone_number.strip().replace(' ', '').replace('-', '') if phone_number else None
+            phone = NotificationService.format_phone(phone_number)
             if not phone:
                 return False
-            if phone.startswith('0') and len(phone) == 10:
-                phone = '+254' + phone[1:]
-            elif phone.startswith('254') and not phone.startswith('+'):
-                phone = '+' + phone
 
             import africastalking
             africastalking.initialize(username, api_key)
@@ -116,11 +148,8 @@ Please review this request in the admin dashboard.
     return NotificationService.send_email(admin_email, subject, message)
 
 
-def notify_deferment_status(deferment_request):
-    """Notify student when their deferment request status changes"""
-    student_email = deferment_request.student.user.email
-    student_phone = deferment_request.student.phone
-    
+def deferment_status_message(deferment_request):
+    """(email subject, email body, SMS text) telling the student their request's current status"""
     status_display = deferment_request.get_status_display()
     
     if deferment_request.status == 'approved':
@@ -159,6 +188,15 @@ Admin Notes: {deferment_request.admin_response or 'None'}
 Best regards,
 Student Welfare Management System
     """
+    return subject, message, sms_body
+
+
+def notify_deferment_status(deferment_request):
+    """Notify student when their deferment request status changes"""
+    student_email = deferment_request.student.user.email
+    student_phone = deferment_request.student.phone
+    
+    subject, message, sms_body = deferment_status_message(deferment_request)
     
     # Send email
     email_sent = NotificationService.send_email(student_email, subject, message)
@@ -340,18 +378,10 @@ Student Welfare Management System
 
 def send_bulk_meal_reminders():
     """Send reminders to all students who haven't confirmed meals for tomorrow"""
-    from .models import Student, Meal
-    from datetime import date, timedelta
-    
-    tomorrow = date.today() + timedelta(days=1)
-    
-    # Get students who haven't confirmed meals
-    confirmed_ids = Meal.objects.filter(date=tomorrow).values_list('student_id', flat=True)
-    unconfirmed_students = Student.objects.exclude(id__in=confirmed_ids)
-    
-    success_count = 0
-    for student in unconfirmed_students:
-        if notify_meal_reminder(student, tomorrow):
-            success_count += 1
-    
-    return success_count, unconfirmed_students.count()
+    from .meal_reminders import send_meal_reminders
+
+    summary = send_meal_reminders()
+    if summary is None:
+        # Another run is sending them
+        return 0, 0
+    return summary['reminded'], summary['unconfirmed']
@@ -0,0 +1,318 @@
+"""
+M-Pesa payment state handling.
+
+Safaricom callbacks are stored raw in the MpesaCallback inbox and acknowledged
+straight away; processing happens afterwards and is idempotent per
+CheckoutRequestID, so duplicate and late callbacks are harmless. The outcome
+of every checkout is published to the cache so status polling never has to
+touch the database or Daraja.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+from django.utils import timezone
+from .ledger import credit_payment, credit_payments
+from .models import Payment, RegistrationPayment, AdminSubscription, MpesaCallback, Notification
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_KEY = 'payment_status_{}'
+STATUS_CACHE_TTL = 60 * 60 * 24
+
+# STK query result codes that mean the customer will never complete the prompt
+# (cancelled, timed out, insufficient balance...). Anything else is still in flight.
+FINAL_FAILURE_CODES = ['1', '1032', '1037', '2001']
+
+# Inbox rows stuck in 'processing' longer than this are retried
+STALE_PROCESSING_AFTER = timedelta(minutes=5)
+
+
+def publish_status(checkout_request_id, status, description='', receipt=None, user_id=None):
+    """Store the latest known state of a checkout for cheap polling"""
+    if not checkout_request_id:
+        return
+    cache.set(STATUS_CACHE_KEY.format(checkout_request_id), {
+        'status': status,
+        'description': description or '',
+        'receipt': receipt,
+        'user_id': user_id,
+    }, STATUS_CACHE_TTL)
+
+
+def get_cached_status(checkout_request_id):
+    return cache.get(STATUS_CACHE_KEY.format(checkout_request_id))
+
+
+def is_final_result(result_code):
+    result_code = str(result_code)
+    return result_code == '0' or result_code in FINAL_FAILURE_CODES
+
+
+def apply_result(checkout_request_id, result_code, result_desc='', receipt=None):
+    """Apply a Daraja result to every record waiting on this checkout.
+
+    Completed/Active are terminal: a duplicate success or a late failure after
+    success changes nothing. A late success still upgrades a Failed record.
+    Returns True if any record changed.
+    """
+    success = str(result_code) == '0'
+    published = []
+
+    with transaction.atomic():
+        payments = (Payment.objects.select_for_update()
+                    .select_related('student__user')
+                    .filter(checkout_request_id=checkout_request_id))
+        for payment in payments:
+            if payment.status == 'Completed':
+                continue
+            if success:
+                payment.status = 'Completed'
+                payment.description = 'Success'
+                if receipt:
+                    payment.transaction_id = receipt
+                payment.save()
+                credit_payment(payment)
+                Notification.objects.create(
+                    user=payment.student.user,
+                    notification_type='finance',
+                    title="Payment Received",
+                    message=f"We received your payment of KES {payment.amount}. Ref: {payment.transaction_id}",
+                    link="/student/payment-history/"
+                )
+            elif payment.status == 'Pending':
+                payment.status = 'Failed'
+                payment.description = result_desc
+                payment.save()
+            else:
+                continue
+            published.append((payment.status, payment.description, payment.transaction_id, payment.student.user_id))
+
+        reg_payments = RegistrationPayment.objects.select_for_update().filter(checkout_request_id=checkout_request_id)
+        for reg_payment in reg_payments:
+            if reg_payment.status == 'Completed':
+                continue
+            if success:
+                reg_payment.status = 'Completed'
+                reg_payment.transaction_id = receipt
+            elif reg_payment.status == 'Pending':
+                reg_payment.status = 'Failed'
+            else:
+                continue
+            reg_payment.save()
+            published.append((reg_payment.status, result_desc, reg_payment.transaction_id, None))
+
+        subscriptions = AdminSubscription.objects.select_for_update().filter(checkout_request_id=checkout_request_id)
+        for admin_sub in subscriptions:
+            if admin_sub.status == 'Active':
+                continue
+            if success:
+                admin_sub.status = 'Active'
+                admin_sub.transaction_id = receipt
+                admin_sub.last_payment_date = timezone.now()
+                expiry_days = 365 if admin_sub.billing_cycle == 'annual' else 30
+                admin_sub.expiry_date = timezone.now() + timedelta(days=expiry_days)
+                # Clear system lock cache
+                transaction.on_commit(lambda: cache.delete('system_subscription_active'))
+            elif admin_sub.status == 'Pending':
+                admin_sub.status = 'Failed'
+            else:
+                continue
+            admin_sub.save()
+            published.append((admin_sub.status, result_desc, admin_sub.transaction_id, None))
+
+    # Only publish once the new state is committed
+    for status, description, receipt_no, user_id in published:
+        publish_status(checkout_request_id, status, description, receipt_no, user_id)
+    return bool(published)
+
+
+def _parse_callback(payload):
+    data = json.loads(payload)
+    stk_callback = data.get('Body', {}).get('stkCallback', {})
+    receipt = None
+    for item in stk_callback.get('CallbackMetadata', {}).get('Item', []):
+        if item.get('Name') == 'MpesaReceiptNumber':
+            receipt = item.get('Value')
+    return stk_callback, receipt
+
+
+def record_callback(body):
+    """Persist a raw callback body to the inbox. Never raises on bad JSON."""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    checkout_request_id = ''
+    try:
+        stk_callback, _ = _parse_callback(body)
+        checkout_request_id = stk_callback.get('CheckoutRequestID') or ''
+    except (ValueError, AttributeError):
+        pass
+    return MpesaCallback.objects.create(checkout_request_id=checkout_request_id, payload=body)
+
+
+def process_callback(callback_id):
+    """Process one inbox row. Safe to call concurrently and repeatedly."""
+    # Claim the row with a conditional UPDATE so only one worker processes it
+    claimed = (MpesaCallback.objects.filter(pk=callback_id, status='pending')
+               .update(status='processing', processed_at=timezone.now()))
+    if not claimed:
+        return None
+
+    callback = MpesaCallback.objects.get(pk=callback_id)
+    try:
+        stk_callback, receipt = _parse_callback(callback.payload)
+        if not callback.checkout_request_id:
+            raise ValueError("No CheckoutRequestID")
+        changed = apply_result(
+            callback.checkout_request_id,
+            stk_callback.get('ResultCode'),
+            stk_callback.get('ResultDesc', ''),
+            receipt,
+        )
+        callback.status = 'processed' if changed else 'duplicate'
+    except OperationalError as e:
+        # Transient (lock timeout, dropped connection): leave it for the next drain.
+        # Other database errors (e.g. a duplicate receipt number) fail the same way every time.
+        logger.warning(f"[MPESA] Callback {callback_id} will be retried: {e}")
+        callback.status = 'pending'
+        callback.error = str(e)
+    except Exception as e:
+        logger.error(f"[MPESA] Callback {callback_id} failed: {e}")
+        callback.status = 'failed'
+        callback.error = str(e)
+    callback.processed_at = timezone.now()
+    callback.save(update_fields=['status', 'error', 'processed_at'])
+    return callback.status
+
+
+def process_pending_callbacks(limit=500):
+    """Drain the inbox. Returns the number of rows handled."""
+    stale_before = timezone.now() - STALE_PROCESSING_AFTER
+    MpesaCallback.objects.filter(status='processing', processed_at__lt=stale_before).update(status='pending')
+
+    ids = list(MpesaCallback.objects.filter(status='pending')
+               .order_by('received_at')
+               .values_list('id', flat=True)[:limit])
+    for callback_id in ids:
+        process_callback(callback_id)
+    return len(ids)
+
+
+# ==================== Reconciliation ====================
+
+class RateLimiter:
+    """Spaces out calls across threads to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _query_checkouts(checkout_ids, workers, rate):
+    """Query Daraja for each checkout through a bounded thread pool"""
+    from .mpesa import MpesaClient
+
+    client = MpesaClient()
+    limiter = RateLimiter(rate)
+
+    def query(checkout_request_id):
+        limiter.wait()
+        return checkout_request_id, client.stk_push_query(checkout_request_id)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for checkout_request_id, response in executor.map(query, checkout_ids):
+            results[checkout_request_id] = response
+    return results
+
+
+def reconcile_pending_payments(older_than=timedelta(minutes=10), workers=8, rate=5, limit=5000, dry_run=False):
+    """Resolve Pending Payment/RegistrationPayment rows whose callback never arrived.
+
+    Returns a summary dict of counts.
+    """
+    cutoff = timezone.now() - older_than
+    payment_ids = dict(Payment.objects.filter(
+        status='Pending', checkout_request_id__isnull=False, created_at__lt=cutoff
+    ).exclude(checkout_request_id='').values_list('checkout_request_id', 'id')[:limit])
+    reg_ids = dict(RegistrationPayment.objects.filter(
+        status='Pending', created_at__lt=cutoff
+    ).exclude(checkout_request_id='').values_list('checkout_request_id', 'id')[:limit])
+
+    summary = {'checked': 0, 'completed': 0, 'failed': 0, 'still_pending': 0, 'errors': 0}
+    checkout_ids = list(set(payment_ids) | set(reg_ids))
+    if not checkout_ids:
+        return summary
+
+    results = _query_checkouts(checkout_ids, workers, rate)
+    summary['checked'] = len(results)
+
+    outcomes = {}
+    for checkout_request_id, response in results.items():
+        if response.get('ResponseCode') != '0':
+            summary['errors'] += 1
+            continue
+        result_code = str(response.get('ResultCode'))
+        if not is_final_result(result_code):
+            summary['still_pending'] += 1
+            continue
+        outcomes[checkout_request_id] = (result_code == '0', response.get('ResultDesc', ''))
+
+    if dry_run:
+        summary['completed'] = sum(1 for ok, _ in outcomes.values() if ok)
+        summary['failed'] = len(outcomes) - summary['completed']
+        return summary
+
+    now = timezone.now()
+    published = []
+    with transaction.atomic():
+        # Re-read under lock: a callback may have landed while we were querying
+        payments = list(Payment.objects.select_for_update().select_related('student__user').filter(
+            checkout_request_id__in=outcomes.keys(), status='Pending'))
+        notifications = []
+        for payment in payments:
+            success, desc = outcomes[payment.checkout_request_id]
+            payment.status = 'Completed' if success else 'Failed'
+            payment.description = 'Verified by reconciliation' if success else desc
+            payment.updated_at = now
+            if success:
+                notifications.append(Notification(
+                    user=payment.student.user,
+                    notification_type='finance',
+                    title="Payment Received",
+                    message=f"We received your payment of KES {payment.amount}.",
+                    link="/student/payment-history/"
+                ))
+            published.append((payment.checkout_request_id, payment.status, payment.description, payment.student.user_id))
+        Payment.objects.bulk_update(payments, ['status', 'description', 'updated_at'], batch_size=500)
+        credit_payments(payments)
+        Notification.objects.bulk_create(notifications, batch_size=500)
+
+        reg_payments = list(RegistrationPayment.objects.select_for_update().filter(
+            checkout_request_id__in=outcomes.keys(), status='Pending'))
+        for reg_payment in reg_payments:
+            success, desc = outcomes[reg_payment.checkout_request_id]
+            reg_payment.status = 'Completed' if success else 'Failed'
+            reg_payment.updated_at = now
+            published.append((reg_payment.checkout_request_id, reg_payment.status, desc, None))
+        RegistrationPayment.objects.bulk_update(reg_payments, ['status', 'updated_at'], batch_size=500)
+
+    for checkout_request_id, status, description, user_id in published:
+        publish_status(checkout_request_id, status, description, user_id=user_id)
+        summary['completed' if status == 'Completed' else 'failed'] += 1
+    return summary
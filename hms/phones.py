@@ -0,0 +1,52 @@
+"""
+Canonical phone numbers.
+
+Phones are typed in many shapes ("0712 345 678", "+254712345678",
+"254-712-345678", "whatsapp:+254712345678"). to_e164 turns all of them
+into one E.164 string, "+254712345678", and is the only place that knows
+the formats. Student and StaffProfile keep it in an indexed phone_e164
+column next to the phone as typed, so inbound lookups (WhatsApp, SMS) are
+exact index matches instead of substring scans. Outgoing SMS use the E.164
+form and M-Pesa the same digits without the "+" (msisdn).
+
+Numbers without a country code are taken to be Kenyan (PHONE_COUNTRY_CODE,
+default 254), with or without the trunk 0.
+"""
+import re
+from django.conf import settings
+
+SCHEME_RE = re.compile(r'^\s*[a-z]+:', re.IGNORECASE)
+NON_DIGIT_RE = re.compile(r'\D')
+LOCAL_LENGTH = 9
+MIN_LENGTH, MAX_LENGTH = 8, 15
+
+
+def _country_code():
+    return getattr(settings, 'PHONE_COUNTRY_CODE', '254')
+
+
+def to_e164(phone):
+    """'+<country><number>' for a phone in any common format, or '' if it is not a phone number"""
+    if not phone:
+        return ''
+    raw = SCHEME_RE.sub('', str(phone)).strip()
+    digits = NON_DIGIT_RE.sub('', raw)
+    country = _country_code()
+    if raw.startswith('+'):
+        pass  # already carries its country code
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0') and len(digits) == LOCAL_LENGTH + 1:
+        digits = country + digits[1:]
+    elif len(digits) == LOCAL_LENGTH:
+        digits = country + digits
+    elif not (digits.startswith(country) and len(digits) == len(country) + LOCAL_LENGTH):
+        return ''
+    if not MIN_LENGTH <= len(digits) <= MAX_LENGTH:
+        return ''
+    return '+' + digits
+
+
+def msisdn(phone):
+    """The E.164 digits without '+', as M-Pesa expects (e.g. 254712345678), or ''"""
+    return to_e164(phone)[1:]
@@ -0,0 +1,215 @@
+"""
+Mutual room-swap matching for pending room change requests.
+
+Each pending request is an edge in a graph of rooms: the student's current
+room -> the room they asked for. A set of requests that forms a cycle
+(A wants B's room and B wants A's, or A -> B -> C -> A) can be approved
+together without needing a single free bed: every student takes the bed
+vacated by the next student in the cycle, so occupancy counts do not change.
+
+Mutual pairs are matched first through a (from, to) index; the remaining
+requests are then searched for the shortest cycle with a breadth-first
+search over rooms, oldest request first, so every request is used at most
+once and older requests are served before newer ones. Only students of the
+same gender are matched with each other, since a swap puts each student
+into the place of the next one.
+
+The student's current room is always taken from their active assignment,
+not the (possibly stale) current_room on the request.
+"""
+from collections import defaultdict, deque
+from django.db import transaction
+from django.utils import timezone
+from .models import Notification, RoomAssignment, RoomChangeRequest, Student
+
+MAX_CYCLE_LENGTH = 6
+
+
+class SwapCycle:
+    """Requests in cycle order: each student moves into the room of the next one"""
+
+    def __init__(self, requests, assignments):
+        self.requests = requests
+        self.assignments = assignments  # student_id -> active RoomAssignment
+
+    def __len__(self):
+        return len(self.requests)
+
+    @property
+    def key(self):
+        return ','.join(str(r.pk) for r in self.requests)
+
+    def moves(self):
+        """(request, from_assignment, bed vacated by the next student) for each member"""
+        count = len(self.requests)
+        for index, change in enumerate(self.requests):
+            successor = self.requests[(index + 1) % count]
+            yield (change, self.assignments[change.student_id], self.assignments[successor.student_id])
+
+
+def _candidate_requests(queryset=None):
+    """Oldest pending request per student, with the student's active assignment"""
+    queryset = queryset if queryset is not None else RoomChangeRequest.objects.filter(status='pending')
+    requests = (queryset.filter(requested_room__isnull=False)
+                .select_related('student__user', 'requested_room')
+                .order_by('created_at', 'pk'))
+    seen = set()
+    candidates = []
+    for change in requests:
+        if change.student_id not in seen:
+            seen.add(change.student_id)
+            candidates.append(change)
+
+    assignments = {
+        a.student_id: a for a in RoomAssignment.objects.filter(
+            student_id__in=seen, is_active=True).select_related('room')
+    }
+    candidates = [c for c in candidates
+                  if c.student_id in assignments
+                  and assignments[c.student_id].room_id != c.requested_room_id]
+    return candidates, assignments
+
+
+def _shortest_cycle(start, out_edges, used):
+    """Breadth-first search from start's target room back to its source room"""
+    source, target = start.from_room_id, start.requested_room_id
+    parents = {target: None}
+    queue = deque([(target, 1)])
+    while queue:
+        room_id, length = queue.popleft()
+        if length >= MAX_CYCLE_LENGTH:
+            continue
+        for edge in out_edges.get(room_id, ()):
+            if edge.pk in used or edge.pk == start.pk or edge.gender != start.gender:
+                continue
+            if edge.requested_room_id == source:
+                path = [edge]
+                while parents[room_id] is not None:
+                    previous = parents[room_id]
+                    path.append(previous)
+                    room_id = previous.from_room_id
+                return [start] + path[::-1]
+            if edge.requested_room_id not in parents:
+                parents[edge.requested_room_id] = edge
+                queue.append((edge.requested_room_id, length + 1))
+    return None
+
+
+def find_swap_cycles(queryset=None):
+    """Match pending room change requests into swap pairs and cycles.
+
+    Returns a list of SwapCycle, pairs first, each request in at most one.
+    """
+    candidates, assignments = _candidate_requests(queryset)
+    out_edges = defaultdict(list)
+    by_route = defaultdict(deque)
+    for change in candidates:
+        change.from_room_id = assignments[change.student_id].room_id
+        change.gender = change.student.gender
+        out_edges[change.from_room_id].append(change)
+        by_route[(change.from_room_id, change.requested_room_id, change.gender)].append(change)
+
+    used = set()
+    cycles = []
+
+    for change in candidates:
+        if change.pk in used:
+            continue
+        partners = by_route[(change.requested_room_id, change.from_room_id, change.gender)]
+        while partners and partners[0].pk in used:
+            partners.popleft()
+        if partners:
+            partner = partners.popleft()
+            used.update((change.pk, partner.pk))
+            cycles.append(SwapCycle([change, partner], assignments))
+
+    for change in candidates:
+        if change.pk in used:
+            continue
+        path = _shortest_cycle(change, out_edges, used)
+        if path:
+            used.update(r.pk for r in path)
+            cycles.append(SwapCycle(path, assignments))
+
+    return cycles
+
+
+def approve_swap_cycles(cycle_keys, reviewed_by=None, admin_notes=''):
+    """Approve the given cycles (lists of request ids) in one transaction.
+
+    Every cycle is re-checked under row locks: its requests must still be
+    pending and each student must still be in the room the previous student
+    asked for. Cycles that no longer hold are skipped and returned so the
+    warden can see why; everything else is moved with one bulk update and
+    one bulk insert. Returns (approved cycles, skipped cycle keys).
+    """
+    id_lists = [[int(pk) for pk in key] for key in cycle_keys if len(key) >= 2]
+    all_ids = {pk for ids in id_lists for pk in ids}
+    today = timezone.now().date()
+
+    with transaction.atomic():
+        list(RoomChangeRequest.objects.select_for_update()
+             .filter(pk__in=all_ids).values_list('pk', flat=True))
+        requests = {r.pk: r for r in RoomChangeRequest.objects.filter(pk__in=all_ids, status='pending')
+                    .select_related('student__user', 'requested_room')}
+        student_ids = [r.student_id for r in requests.values()]
+        list(RoomAssignment.objects.select_for_update()
+             .filter(student_id__in=student_ids, is_active=True).values_list('pk', flat=True))
+        assignments = {a.student_id: a for a in RoomAssignment.objects.filter(
+            student_id__in=student_ids, is_active=True).select_related('room')}
+
+        approved, skipped, claimed = [], [], set()
+        for ids in id_lists:
+            members = [requests.get(pk) for pk in ids]
+            valid = (
+                len(set(ids)) == len(ids)
+                and not claimed.intersection(ids)
+                and all(m is not None and m.student_id in assignments for m in members)
+                and len({m.student_id for m in members}) == len(members)
+                and all(members[i].requested_room_id
+                        == assignments[members[(i + 1) % len(members)].student_id].room_id
+                        for i in range(len(members)))
+            )
+            if not valid:
+                skipped.append(ids)
+                continue
+            claimed.update(ids)
+            approved.append(SwapCycle(members, assignments))
+
+        if not approved:
+            return approved, skipped
+
+        moves = [move for cycle in approved for move in cycle.moves()]
+        now = timezone.now()
+
+        # Free every old bed first so the active (room, bed) constraint holds
+        RoomAssignment.objects.filter(pk__in=[old.pk for _, old, _ in moves]).update(
+            is_active=False, checkout_date=today)
+        RoomAssignment.objects.bulk_create([
+            RoomAssignment(student_id=change.student_id, room_id=change.requested_room_id,
+                           bed_number=vacated.bed_number, assigned_date=today, is_active=True,
+                           notes=f'Room swap (request #{change.pk})')
+            for change, _, vacated in moves
+        ])
+
+        students = []
+        for change, _, _ in moves:
+            student = change.student
+            student.room_number = change.requested_room.room_number
+            students.append(student)
+        Student.objects.bulk_update(students, ['room_number'])
+
+        RoomChangeRequest.objects.filter(pk__in=claimed).update(
+            status='approved', reviewed_by=reviewed_by, admin_notes=admin_notes, updated_at=now)
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=change.student.user_id,
+                notification_type='system',
+                title='Room Change Approved',
+                message=f'Your room change has been approved. You are now in Room '
+                        f'{change.requested_room.room_number}, bed {vacated.bed_number}.',
+            )
+            for change, _, vacated in moves
+        ])
+
+    return approved, skipped
@@ -0,0 +1,207 @@
+"""
+Full-text search over students, announcements, maintenance and deferment
+requests.
+
+Every searchable record has one SearchDocument row: a title, a body of
+the text worth matching and who may see it (public, owner and staff, or
+staff only). Rows are kept current by the post_save/post_delete signals
+in hms.signals once the write commits. rebuild_search_index rebuilds them
+from scratch, for example after bulk updates that skip signals.
+
+The index itself depends on the database (created in migration 0063):
+
+* PostgreSQL: a generated tsvector column (title weighted above body)
+  with a GIN index, matched with to_tsquery and ranked by ts_rank_cd.
+* SQLite: an external-content FTS5 table kept in sync by triggers,
+  matched with MATCH and ranked by bm25.
+* Anything else: plain substring matching, newest first.
+
+Every query term is matched as a prefix, so "jo ot" finds "John Otieno".
+Visibility is applied in the same query: staff see everything, students
+see public documents and their own requests.
+
+Changing SearchDocument's table on SQLite (a table rebuild) drops the FTS
+triggers; recreate them in the same migration.
+"""
+import re
+from django.db import connection, transaction
+from django.db.models import Q, Value
+from .models import Announcement, DefermentRequest, MaintenanceRequest, SearchDocument, Student
+
+RESULT_LIMIT = 10
+MIN_QUERY_LENGTH = 2
+TERM_RE = re.compile(r'\w+')
+# Context keys the search results page expects for each kind
+RESULT_GROUPS = {
+    'student': 'students',
+    'announcement': 'announcements',
+    'maintenance': 'maintenance',
+    'deferment': 'deferments',
+}
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part)
+
+
+def _full_name(user):
+    # User.get_full_name(), spelled out so the builders also work on migration models
+    return _join(user.first_name.strip(), user.last_name.strip())
+
+
+def _student_document(student):
+    user = student.user
+    return {
+        'title': _full_name(user) or user.username,
+        'body': _join(user.username, user.email, student.university_id, student.phone, student.program_of_study,
+                      student.get_academic_school_display() if student.academic_school else '',
+                      student.hostel, student.room_number),
+        'visibility': 'staff',
+        'owner': student,
+        'source_date': user.date_joined,
+    }
+
+
+def _announcement_document(announcement):
+    if not announcement.is_active:
+        return None
+    return {
+        'title': announcement.title,
+        'body': announcement.content,
+        'visibility': 'public',
+        'owner': None,
+        'source_date': announcement.created_at,
+    }
+
+
+def _maintenance_document(request):
+    return {
+        'title': request.title,
+        'body': _join(request.description, request.location, _full_name(request.student.user)),
+        'visibility': 'owner',
+        'owner': request.student,
+        'source_date': request.created_at,
+    }
+
+
+def _deferment_document(deferment):
+    return {
+        'title': f"{deferment.get_deferment_type_display()} - {_full_name(deferment.student.user)}",
+        'body': _join(deferment.reason, deferment.student.university_id),
+        'visibility': 'owner',
+        'owner': deferment.student,
+        'source_date': deferment.created_at,
+    }
+
+
+# kind: (model, document builder, related objects the builder reads)
+SOURCES = {
+    'student': (Student, _student_document, ('user',)),
+    'announcement': (Announcement, _announcement_document, ()),
+    'maintenance': (MaintenanceRequest, _maintenance_document, ('student__user',)),
+    'deferment': (DefermentRequest, _deferment_document, ('student__user',)),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in SOURCES.items()}
+
+
+def index_object(instance):
+    """Create, refresh or drop the document for one record"""
+    kind = KIND_BY_MODEL[type(instance)]
+    fields = SOURCES[kind][1](instance)
+    if fields is None:
+        remove_document(type(instance), instance.pk)
+    else:
+        SearchDocument.objects.update_or_create(kind=kind, object_id=instance.pk, defaults=fields)
+
+
+def remove_document(model, object_id):
+    SearchDocument.objects.filter(kind=KIND_BY_MODEL[model], object_id=object_id).delete()
+
+
+def rebuild_index(kinds=None, batch_size=1000):
+    """Rebuild the documents for the given kinds (all by default); returns {kind: documents}"""
+    counts = {}
+    for kind in kinds or SOURCES:
+        model, build, related = SOURCES[kind]
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=kind).delete()
+            batch = []
+            counts[kind] = 0
+            for instance in model.objects.select_related(*related).order_by('pk').iterator(chunk_size=batch_size):
+                fields = build(instance)
+                if fields is None:
+                    continue
+                batch.append(SearchDocument(kind=kind, object_id=instance.pk, **fields))
+                if len(batch) >= batch_size:
+                    counts[kind] += len(SearchDocument.objects.bulk_create(batch))
+                    batch = []
+            counts[kind] += len(SearchDocument.objects.bulk_create(batch))
+    return counts
+
+
+def visible_documents(user):
+    """Documents the user may see"""
+    documents = SearchDocument.objects.all()
+    if user.is_staff or user.is_superuser:
+        return documents
+    visible = Q(visibility='public')
+    student = Student.objects.filter(user=user).values_list('pk', flat=True).first()
+    if student:
+        visible |= Q(visibility='owner', owner_id=student)
+    return documents.filter(visible)
+
+
+def _match(documents, terms):
+    """Filter to documents matching every term (as a prefix), annotated with a score and ranked"""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return documents.extra(
+            select={'score': "ts_rank_cd(hms_searchdocument.search_vector, to_tsquery('simple', %s))"},
+            select_params=[tsquery],
+            where=["hms_searchdocument.search_vector @@ to_tsquery('simple', %s)"],
+            params=[tsquery],
+            order_by=['-score'],
+        )
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25 is negative; the best match has the lowest score. Title hits weigh 10x body hits.
+        return documents.extra(
+            select={'score': 'bm25(hms_searchdocument_fts, 10.0, 1.0)'},
+            tables=['hms_searchdocument_fts'],
+            where=['hms_searchdocument_fts.rowid = hms_searchdocument.id', 'hms_searchdocument_fts MATCH %s'],
+            params=[match],
+            order_by=['score'],
+        )
+    for term in terms:
+        documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    return documents.annotate(score=Value(0.0)).order_by('-source_date')
+
+
+def search(user, query, kinds=None, limit=RESULT_LIMIT):
+    """Ranked SearchDocuments for `query` that `user` may see"""
+    terms = TERM_RE.findall(query.lower())
+    if not terms:
+        return []
+    documents = visible_documents(user)
+    if kinds:
+        documents = documents.filter(kind__in=kinds)
+    return list(_match(documents, terms)[:limit])
+
+
+def search_grouped(user, query, limit=RESULT_LIMIT):
+    """{'students': [...], 'announcements': [...], ...} of records in rank order, up to `limit` each"""
+    groups = {key: [] for key in RESULT_GROUPS.values()}
+    if len(query.strip()) < MIN_QUERY_LENGTH:
+        return groups
+
+    ids = {kind: [] for kind in SOURCES}
+    for document in search(user, query, limit=limit * len(SOURCES)):
+        if len(ids[document.kind]) < limit:
+            ids[document.kind].append(document.object_id)
+    for kind, object_ids in ids.items():
+        if object_ids:
+            model, _, related = SOURCES[kind]
+            objects = model.objects.select_related(*related).in_bulk(object_ids)
+            groups[RESULT_GROUPS[kind]] = [objects[pk] for pk in object_ids if pk in objects]
+    return groups
@@ -1,10 +1,20 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.forms.models import model_to_dict
-from .models import AuditLog, Student, Meal, Announcement, MaintenanceRequest
+from library.models import LibraryNews
+from .models import (AuditLog, Student, Meal, Announcement, MaintenanceRequest, AwayPeriod, DefermentRequest,
+                     CounsellingRequest, Document, MentalHealthResource, RoomAssignment)
+from .away import invalidate_away_index
+from .booking import sync_room_occupancy
+from .meal_counters import record_change, remember_state
 from .middleware import get_current_request
+from .search import index_object, remove_document
+from .autocomplete import index_student
+from . import knowledge, login_throttle
+from .student_summary import invalidate_summaries
 import json
 
 def get_client_ip(request):
@@ -27,6 +37,10 @@ def log_user_login(sender, request, user, **kwargs):
         user_agent=request.META.get('HTTP_USER_AGENT', '')
     )
 
+@receiver(user_logged_in)
+def reset_login_failures(sender, request, user, **kwargs):
+    login_throttle.reset(user)
+
 @receiver(user_logged_out)
 def log_user_logout(sender, request, user, **kwargs):
     if user:
@@ -96,3 +110,105 @@ def log_delete(sender, instance, **kwargs):
         ip_address=get_client_ip(request) if request else None,
         user_agent=request.META.get('HTTP_USER_AGENT', '') if request else None
     )
+
+@receiver(post_save, sender=AwayPeriod)
+@receiver(post_delete, sender=AwayPeriod)
+def refresh_away_index(sender, **kwargs):
+    """Drop the cached away index once the change is committed"""
+    transaction.on_commit(invalidate_away_index)
+
+@receiver(post_delete, sender=RoomAssignment)
+def release_deleted_assignment_bed(sender, instance, **kwargs):
+    """Recount the room once an active assignment is deleted (admin, or cascade from a student)"""
+    if instance.is_active:
+        room_id = instance.room_id
+        transaction.on_commit(lambda: sync_room_occupancy([room_id]))
+
+@receiver(post_init, sender=Meal)
+def remember_meal_state(sender, instance, **kwargs):
+    remember_state(instance)
+
+@receiver(post_save, sender=Meal)
+def count_meal_save(sender, instance, **kwargs):
+    """Move the cached per-date meal counters by this row's change"""
+    record_change(instance)
+
+@receiver(post_delete, sender=Meal)
+def count_meal_delete(sender, instance, **kwargs):
+    record_change(instance, deleted=True)
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Announcement)
+@receiver(post_save, sender=MaintenanceRequest)
+@receiver(post_save, sender=DefermentRequest)
+def update_search_document(sender, instance, **kwargs):
+    """Refresh the record's search document once the change is committed"""
+    transaction.on_commit(lambda: index_object(instance))
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Announcement)
+@receiver(post_delete, sender=MaintenanceRequest)
+@receiver(post_delete, sender=DefermentRequest)
+def delete_search_document(sender, instance, **kwargs):
+    # The instance loses its pk once deleted, so capture it now
+    object_id = instance.pk
+    transaction.on_commit(lambda: remove_document(sender, object_id))
+
+@receiver(post_save, sender=Student)
+def update_student_lookup_keys(sender, instance, **kwargs):
+    """Refresh the typeahead keys for the student's name, ID and phone"""
+    transaction.on_commit(lambda: index_student(instance))
+
+SEARCH_USER_FIELDS = ('first_name', 'last_name', 'username', 'email')
+
+def _search_state(user):
+    # __dict__ so a deferred field is not loaded just to be remembered
+    return tuple(user.__dict__.get(field) for field in SEARCH_USER_FIELDS)
+
+@receiver(post_init, sender=User)
+def remember_user_search_state(sender, instance, **kwargs):
+    instance._search_state = _search_state(instance)
+
+@receiver(post_save, sender=User)
+def update_student_search_document(sender, instance, created, update_fields=None, **kwargs):
+    """Names and emails live on User; re-index the student when they change.
+
+    Saves that touch none of them (last_login on every login) cost nothing.
+    """
+    if update_fields is not None and not set(update_fields) & set(SEARCH_USER_FIELDS):
+        return
+    state = _search_state(instance)
+    changed = state != getattr(instance, '_search_state', None)
+    instance._search_state = state
+    if created or not changed:
+        return
+    student = Student.objects.filter(user=instance).select_related('user').first()
+    if student:
+        transaction.on_commit(lambda: index_object(student))
+        transaction.on_commit(lambda: index_student(student))
+
+@receiver(post_save, sender=DefermentRequest)
+@receiver(post_delete, sender=DefermentRequest)
+@receiver(post_save, sender=CounsellingRequest)
+@receiver(post_delete, sender=CounsellingRequest)
+def invalidate_student_summary(sender, instance, **kwargs):
+    """Drop the cached WhatsApp summary once a request the student can ask about changes"""
+    if instance.student_id:
+        student_id = instance.student_id
+        transaction.on_commit(lambda: invalidate_summaries([student_id]))
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_save, sender=Document)
+@receiver(post_save, sender=MentalHealthResource)
+@receiver(post_save, sender=LibraryNews)
+def update_knowledge_entry(sender, instance, **kwargs):
+    """Refresh the chatbot's retrieval index once the change is committed"""
+    transaction.on_commit(lambda: knowledge.index_object(instance))
+
+@receiver(post_delete, sender=Announcement)
+@receiver(post_delete, sender=Document)
+@receiver(post_delete, sender=MentalHealthResource)
+@receiver(post_delete, sender=LibraryNews)
+def delete_knowledge_entry(sender, instance, **kwargs):
+    object_id = instance.pk
+    transaction.on_commit(lambda: knowledge.remove_object(sender, object_id))
@@ -0,0 +1,146 @@
+/**
+ * Student typeahead for staff pages.
+ *
+ * <input data-autocomplete="/search/students/" ...> gets a dropdown of
+ * matching students. Requests are debounced, a newer keystroke aborts the
+ * request in flight, and answers are remembered per query for the page.
+ *
+ * What picking a student does is set on the input:
+ *   data-autocomplete-link="chat_url"     go to that URL of the result
+ *   data-autocomplete-target="id_student" put the student id in that field
+ *   data-autocomplete-fill="university_id" put that value in the input
+ *   data-autocomplete-submit              then submit the input's form
+ */
+(function () {
+    const DEBOUNCE_MS = 200;
+    const MIN_LENGTH = 2;
+
+    function attach(input) {
+        const url = input.dataset.autocomplete;
+        const answers = new Map();
+        let timer = null;
+        let inFlight = null;
+        let items = [];
+        let active = -1;
+
+        const list = document.createElement('ul');
+        list.className = 'absolute z-50 mt-1 w-full bg-white dark:bg-slate-800 border border-slate-200 dark:border-slate-700 rounded-xl shadow-lg overflow-hidden hidden';
+        list.setAttribute('role', 'listbox');
+        input.parentElement.classList.add('relative');
+        input.parentElement.appendChild(list);
+        input.setAttribute('autocomplete', 'off');
+
+        function close() {
+            list.classList.add('hidden');
+            active = -1;
+        }
+
+        function highlight(index) {
+            active = index;
+            Array.from(list.children).forEach((li, i) => {
+                li.classList.toggle('bg-indigo-50', i === index);
+                li.classList.toggle('dark:bg-indigo-500/20', i === index);
+            });
+        }
+
+        function pick(result) {
+            close();
+            if (input.dataset.autocompleteLink) {
+                window.location.href = result[input.dataset.autocompleteLink];
+                return;
+            }
+            if (input.dataset.autocompleteTarget) {
+                const target = document.getElementById(input.dataset.autocompleteTarget);
+                if (target) target.value = result.id;
+            }
+            input.value = (input.dataset.autocompleteFill && result[input.dataset.autocompleteFill]) || result.name;
+            if (input.dataset.autocompleteSubmit !== undefined && input.form) input.form.submit();
+        }
+
+        function render(results) {
+            items = results;
+            list.replaceChildren();
+            if (!results.length) {
+                close();
+                return;
+            }
+            results.forEach((result, i) => {
+                const li = document.createElement('li');
+                li.className = 'px-4 py-2 cursor-pointer text-sm hover:bg-slate-100 dark:hover:bg-white/10';
+                li.setAttribute('role', 'option');
+                const name = document.createElement('span');
+                name.className = 'font-medium text-slate-800 dark:text-white';
+                name.textContent = result.name;
+                const meta = document.createElement('span');
+                meta.className = 'ml-2 text-xs text-slate-500';
+                meta.textContent = [result.university_id, result.phone, result.residence].filter(Boolean).join(' · ');
+                li.append(name, meta);
+                li.addEventListener('mousedown', (e) => {
+                    e.preventDefault();
+                    pick(result);
+                });
+                li.addEventListener('mouseenter', () => highlight(i));
+                list.appendChild(li);
+            });
+            list.classList.remove('hidden');
+            highlight(-1);
+        }
+
+        function lookup(query) {
+            if (answers.has(query)) {
+                render(answers.get(query));
+                return;
+            }
+            if (inFlight) inFlight.abort();
+            inFlight = new AbortController();
+            fetch(`${url}?q=${encodeURIComponent(query)}`, {
+                signal: inFlight.signal,
+                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            })
+                .then((response) => (response.ok ? response.json() : { results: [] }))
+                .then((data) => {
+                    answers.set(query, data.results);
+                    if (input.value.trim() === query) render(data.results);
+                })
+                .catch((error) => {
+                    if (error.name !== 'AbortError') close();
+                });
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (input.dataset.autocompleteTarget) {
+                const target = document.getElementById(input.dataset.autocompleteTarget);
+                if (target) target.value = '';
+            }
+            if (query.length < MIN_LENGTH) {
+                close();
+                return;
+            }
+            timer = setTimeout(() => lookup(query), DEBOUNCE_MS);
+        });
+
+        input.addEventListener('keydown', (e) => {
+            if (list.classList.contains('hidden')) return;
+            if (e.key === 'ArrowDown') {
+                e.preventDefault();
+                highlight(Math.min(active + 1, items.length - 1));
+            } else if (e.key === 'ArrowUp') {
+                e.preventDefault();
+                highlight(Math.max(active - 1, 0));
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                pick(items[active]);
+            } else if (e.key === 'Escape') {
+                close();
+            }
+        });
+
+        input.addEventListener('blur', close);
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('input[data-autocomplete]').forEach(attach);
+    });
+})();
@@ -0,0 +1,47 @@
+"""
+Cached per-student status summary.
+
+The WhatsApp bot answers BALANCE, DEFERMENT and STATUS from one small dict
+per student: fee balance and the status of the latest deferment and
+counselling requests. It is built with three indexed lookups on first use
+and cached for STUDENT_SUMMARY_SECONDS (default 300), so a burst of
+messages from the same student (results day) costs the database nothing.
+
+The entry is dropped whenever one of its sources changes: ledger postings
+(hms.ledger.post_entries) and deferment or counselling saves (signals in
+hms.signals). The TTL bounds staleness for anything that bypasses those,
+such as recompute_balances.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .models import CounsellingRequest, DefermentRequest, StudentBalance
+
+CACHE_KEY = 'student_summary_{}'
+
+
+def _latest_status(model, student_id):
+    latest = model.objects.filter(student_id=student_id).order_by('-created_at').first()
+    return latest.get_status_display() if latest else None
+
+
+def build_summary(student_id):
+    balance = StudentBalance.objects.filter(pk=student_id).values_list('balance', flat=True).first()
+    return {
+        'balance': balance if balance is not None else 0,
+        'deferment': _latest_status(DefermentRequest, student_id),
+        'counselling': _latest_status(CounsellingRequest, student_id),
+    }
+
+
+def get_summary(student_id):
+    """{'balance', 'deferment', 'counselling'} for a student, from the cache when possible"""
+    key = CACHE_KEY.format(student_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(student_id)
+        cache.set(key, summary, getattr(settings, 'STUDENT_SUMMARY_SECONDS', 300))
+    return summary
+
+
+def invalidate_summaries(student_ids):
+    cache.delete_many([CACHE_KEY.format(pk) for pk in student_ids])
@@ -0,0 +1,41 @@
+"""
+Lightweight background task runner for SWMS.
+
+There is no external queue (Celery/RQ) in this deployment, so work that must
+not hold up a request is handed to a small process-wide thread pool once the
+surrounding transaction commits. Anything that has to survive a restart is
+also written to an inbox table first and drained by a management command.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'BACKGROUND_TASK_WORKERS', 4),
+    thread_name_prefix='swms-task',
+)
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        close_old_connections()
+
+
+def run_async(func, *args, **kwargs):
+    """Run func in the background after the current transaction commits.
+
+    With BACKGROUND_TASKS_EAGER enabled (tests, management commands) the
+    function runs inline instead.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: func(*args, **kwargs))
+        return
+    transaction.on_commit(lambda: _executor.submit(_run, func, args, kwargs))
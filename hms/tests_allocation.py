@@ -0,0 +1,111 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from hms.allocation import allocate_rooms
+from hms.models import Student, Room, RoomAssignment, RoommatePreference, LedgerEntry
+
+
+class BatchAllocationTest(TestCase):
+    def make_student(self, username, gender='male', **fields):
+        user = User.objects.create_user(username=username, password='password123')
+        student = Student.objects.get(user=user)
+        student.gender = gender
+        for name, value in fields.items():
+            setattr(student, name, value)
+        student.save()
+        return student
+
+    def make_room(self, number, block='A', floor=1, capacity=2, **fields):
+        return Room.objects.create(room_number=number, block=block, floor=floor, capacity=capacity, **fields)
+
+    def test_dry_run_writes_nothing(self):
+        self.make_room('A101')
+        self.make_student('s1')
+        result = allocate_rooms(dry_run=True)
+        self.assertEqual(result.placed_count, 1)
+        self.assertFalse(RoomAssignment.objects.exists())
+
+    def test_bulk_writes_assignments_room_numbers_and_charges(self):
+        self.make_room('A101', capacity=2, price_per_semester=9000)
+        self.make_room('A102', capacity=2, price_per_semester=9000)
+        students = [self.make_student(f's{i}') for i in range(4)]
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = allocate_rooms()
+        self.assertEqual(result.placed_count, 4)
+        self.assertLess(len(ctx.captured_queries), 25)
+
+        self.assertEqual(RoomAssignment.objects.filter(is_active=True).count(), 4)
+        self.assertEqual(set(RoomAssignment.objects.values_list('room__room_number', 'bed_number')),
+                         {('A101', 1), ('A101', 2), ('A102', 1), ('A102', 2)})
+        for student in students:
+            student.refresh_from_db()
+            self.assertIn(student.room_number, ('A101', 'A102'))
+        self.assertFalse(Room.objects.filter(is_available=True).exists())
+        self.assertEqual(LedgerEntry.objects.filter(source='room_assignment').count(), 4)
+
+    def test_rooms_and_blocks_are_single_gender(self):
+        self.make_room('A101', block='A')
+        self.make_room('B101', block='B')
+        existing = self.make_student('existing', gender='female')
+        RoomAssignment.objects.create(student=existing, room=Room.objects.get(room_number='A101'), bed_number=1)
+        self.make_student('m1', gender='male')
+        self.make_student('f1', gender='female')
+
+        result = allocate_rooms(dry_run=True)
+        placed = {p.student.user.username: p.room.room_number for p in result.placements}
+        self.assertEqual(placed, {'f1': 'A101', 'm1': 'B101'})
+
+    def test_hostel_preference_and_block_gender_override(self):
+        self.make_room('A101', block='A')
+        self.make_room('B101', block='B')
+        self.make_student('m1', gender='male', hostel='a')
+        self.make_student('f1', gender='female')
+
+        result = allocate_rooms(dry_run=True, block_genders={'A': 'male'})
+        placed = {p.student.user.username: p.room.block for p in result.placements}
+        self.assertEqual(placed, {'m1': 'A', 'f1': 'B'})
+
+    def test_accessibility_needs_get_ground_floor(self):
+        self.make_room('A101', floor=0, capacity=1)
+        self.make_room('A201', floor=2, capacity=1)
+        self.make_student('walker')
+        self.make_student('wheelchair', disability='physical')
+
+        result = allocate_rooms(dry_run=True)
+        placed = {p.student.user.username: p.room.room_number for p in result.placements}
+        self.assertEqual(placed, {'wheelchair': 'A101', 'walker': 'A201'})
+
+    def test_accessible_rooms_are_used_last(self):
+        # The ground-floor room is the tighter fit, but the walker gets the upstairs one
+        self.make_room('A101', floor=0, capacity=1)
+        self.make_room('A201', floor=2, capacity=2)
+        self.make_student('walker')
+
+        result = allocate_rooms(dry_run=True)
+        self.assertEqual([p.room.room_number for p in result.placements], ['A201'])
+
+    def test_roommate_preferences_share_a_room(self):
+        for number in ('A101', 'A102', 'A103'):
+            self.make_room(number, capacity=2)
+        a = self.make_student('a')
+        self.make_student('b')
+        c = self.make_student('c')
+        RoommatePreference.objects.create(student=a, preferred_student=c)
+
+        result = allocate_rooms(dry_run=True)
+        rooms = {p.student.user.username: p.room.room_number for p in result.placements}
+        self.assertEqual(rooms['a'], rooms['c'])
+        self.assertNotEqual(rooms['a'], rooms['b'])
+
+    def test_unplaced_students_are_reported(self):
+        self.make_room('A101', capacity=1)
+        self.make_student('s1')
+        self.make_student('s2')
+        self.make_student('nogender', gender=None)
+
+        result = allocate_rooms(dry_run=True)
+        self.assertEqual(result.placed_count, 1)
+        reasons = sorted(reason for _, reason in result.unplaced)
+        self.assertEqual(reasons, ['Gender not recorded', 'No compatible bed free'])
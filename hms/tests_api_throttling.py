@@ -0,0 +1,104 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from hms.api import chatbot as chatbot_api
+from hms.api.throttling import usage_for
+
+
+class ChatbotProtectionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('hms:api_chatbot')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='amina'))
+
+    def chat(self, message, **extra):
+        return self.client.post(self.url, {'message': message, **extra}, format='json')
+
+    def test_replies_are_cached_by_role_and_normalised_text(self):
+        with mock.patch.object(chatbot_api, 'build_reply', wraps=chatbot_api.build_reply) as build:
+            first = self.chat('How do I pay my fees?').json()
+            second = self.chat('  how do i PAY my fees ').json()
+        self.assertEqual(first, second)
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(usage_for(timezone.localdate())['chatbot']['cache_hits'], 1)
+
+    def test_history_is_bounded(self):
+        self.assertEqual(self.chat('hi', history=[{'role': 'user', 'content': 'x'}] * 101).status_code, 400)
+        self.assertEqual(self.chat('hi', history=[{'role': 'user', 'content': 'x' * 5000}] * 100).status_code, 200)
+        self.assertEqual(self.chat('x' * 1001).status_code, 400)
+
+    @override_settings(API_THROTTLE_RATES={'chatbot': {'user': '3/min'}})
+    def test_token_bucket_throttles_per_user(self):
+        codes = [self.chat(f'question {i}').status_code for i in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        response = self.chat('again')
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # Another user on the same IP has a bucket of their own
+        self.client.force_authenticate(User.objects.create_user(username='brian'))
+        self.assertEqual(self.chat('hello').status_code, 200)
+
+        usage = usage_for(timezone.localdate())['chatbot']
+        self.assertEqual((usage['requests'], usage['throttled_user']), (6, 2))
+
+    @override_settings(API_THROTTLE_RATES={'chatbot': {'user': '100/min', 'ip': '2/min'}})
+    def test_token_bucket_throttles_per_ip(self):
+        self.assertEqual(self.chat('one').status_code, 200)
+        self.client.force_authenticate(User.objects.create_user(username='brian'))
+        self.assertEqual(self.chat('two').status_code, 200)
+        self.assertEqual(self.chat('three').status_code, 429)
+        self.assertEqual(self.client.post(self.url, {'message': 'four'}, format='json',
+                                          REMOTE_ADDR='10.0.0.9').status_code, 200)
+
+    def test_bucket_refills_over_time(self):
+        with override_settings(API_THROTTLE_RATES={'chatbot': {'user': '1/min'}}), \
+                mock.patch('hms.api.throttling.time.time', return_value=1000.0) as now:
+            self.assertEqual(self.chat('one').status_code, 200)
+            self.assertEqual(self.chat('two').status_code, 429)
+            now.return_value = 1061.0
+            self.assertEqual(self.chat('three').status_code, 200)
+
+
+class ThrottledEndpointsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DEFAULT_FROM_EMAIL='noreply@example.com', CSRF_TRUSTED_ORIGINS=['https://example.com'])
+    def test_forgot_password_is_throttled_per_ip(self):
+        client = APIClient()
+        url = reverse('hms:api_forgot_password')
+        codes = [client.post(url, {'email': f'nobody{i}@example.com'}, format='json').status_code for i in range(6)]
+        self.assertEqual(codes, [200] * 5 + [429])
+
+    @override_settings(DEFAULT_FROM_EMAIL='noreply@example.com', CSRF_TRUSTED_ORIGINS=['https://example.com'])
+    def test_forgot_password_is_throttled_per_email(self):
+        client = APIClient()
+        url = reverse('hms:api_forgot_password')
+        codes = [client.post(url, {'email': ' Victim@Example.com'}, format='json',
+                             REMOTE_ADDR=f'10.0.0.{i}').status_code for i in range(4)]
+        self.assertEqual(codes, [200] * 3 + [429])
+        self.assertEqual(usage_for(timezone.localdate())['forgot_password']['throttled_email'], 1)
+
+    @override_settings(REST_FRAMEWORK={'NUM_PROXIES': 1},
+                       API_THROTTLE_RATES={'activity_analytics': {'user': '100/min', 'ip': '1/min'}})
+    def test_ip_bucket_ignores_forged_forwarded_for(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        url = reverse('hms:api_activity_analytics')
+        codes = [client.get(url, HTTP_X_FORWARDED_FOR=f'198.51.100.{i}, 203.0.113.7').status_code for i in range(2)]
+        self.assertEqual(codes, [200, 429])
+
+    def test_usage_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='amina'))
+        self.assertEqual(client.get(reverse('hms:api_usage')).status_code, 403)
+        client.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        client.get(reverse('hms:api_activity_analytics'))
+        data = client.get(reverse('hms:api_usage')).json()
+        self.assertEqual(data['scopes']['activity_analytics']['requests'], 1)
+        self.assertEqual(client.get(reverse('hms:api_usage'), {'date': 'nope'}).status_code, 400)
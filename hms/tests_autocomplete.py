@@ -0,0 +1,83 @@
+from io import StringIO
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from hms.autocomplete import lookup_keys, query_tokens, suggest
+from hms.models import StudentLookupKey
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class StudentAutocompleteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zoe = User.objects.create_user(username='zk', first_name='Zoë', last_name='Kamau')
+            self.zack = User.objects.create_user(username='zo', first_name='Zack', last_name='Otieno')
+            self.staff = User.objects.create_user(username='warden', password='pw', is_staff=True)
+            student = self.zoe.student_profile
+            student.university_id = 'SCT211-0001/2020'
+            student.phone = '0712 345 678'
+            student.save()
+
+    def names(self, query):
+        return [result['name'] for result in suggest(query)]
+
+    def test_keys_are_folded_ids_and_e164_phones(self):
+        keys = lookup_keys(self.zoe.student_profile)
+        self.assertTrue({'zoe', 'kamau', 'sct211', '0001', '2020', 'sct21100012020', '254712345678'} <= keys)
+        self.assertEqual(query_tokens('  Zoë  SCT211-0001 '), ['zoe', 'sct2110001'])
+
+    def test_every_token_must_prefix_a_key(self):
+        self.assertEqual(self.names('zo'), ['Zack Otieno', 'Zoë Kamau'])
+        self.assertEqual(self.names('zo kam'), ['Zoë Kamau'])
+        self.assertEqual(self.names('sct211-00'), ['Zoë Kamau'])
+        self.assertEqual(self.names('x'), [])
+
+    def test_local_phone_numbers_match_the_e164_key(self):
+        self.assertEqual(self.names('0712'), ['Zoë Kamau'])
+        self.assertEqual(self.names('71234'), ['Zoë Kamau'])
+        self.assertEqual(self.names('+254 712'), ['Zoë Kamau'])
+
+    def test_renames_rekey_and_rebuild_backfills(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zack.last_name = 'Mwangi'
+            self.zack.save()
+        self.assertEqual(self.names('mwa'), ['Zack Mwangi'])
+        self.assertEqual(self.names('otie'), [])
+
+        StudentLookupKey.objects.all().delete()
+        call_command('rebuild_lookup_keys', stdout=StringIO())
+        cache.clear()
+        self.assertEqual(self.names('kama'), ['Zoë Kamau'])
+
+    def test_results_are_cached_per_prefix(self):
+        suggest('kam')
+        with self.assertNumQueries(0):
+            self.assertEqual([r['name'] for r in suggest('kam')], ['Zoë Kamau'])
+
+    def test_endpoint_is_staff_only(self):
+        client = Client()
+        client.force_login(self.zoe)
+        self.assertEqual(client.get(reverse('hms:student_autocomplete'), {'q': 'zo'}).status_code, 403)
+
+        client.force_login(self.staff)
+        data = client.get(reverse('hms:student_autocomplete'), {'q': 'zoe'}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['university_id'], 'SCT211-0001/2020')
+        self.assertEqual(data['results'][0]['chat_url'], reverse('hms:chat_with', args=[self.zoe.pk]))
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_staff_pages_use_the_key_index(self):
+        admin = User.objects.create_superuser(username='root', password='pw', email='root@example.com')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(reverse('hms:manage_students'), {'search': 'zoe kam'})
+        self.assertEqual([s.pk for s in response.context['page_obj']], [self.zoe.student_profile.pk])
+        response = client.get(reverse('hms:visitor_management'))
+        self.assertContains(response, 'data-autocomplete="%s"' % reverse('hms:student_autocomplete'))
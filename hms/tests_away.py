@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from hms.away import AwayIndex, merge_intervals, get_away_index, away_counts
+from hms.models import Student, Meal, AwayPeriod, AuditLog
+
+
+class AwayIndexTest(TestCase):
+    def test_overlapping_and_adjacent_periods_are_merged(self):
+        d = date(2025, 3, 1)
+        merged = merge_intervals([(d, d + timedelta(days=4)), (d + timedelta(days=2), d + timedelta(days=6)),
+                                  (d + timedelta(days=7), d + timedelta(days=8)), (d + timedelta(days=20), d + timedelta(days=21))])
+        self.assertEqual(merged, [(d, d + timedelta(days=8)), (d + timedelta(days=20), d + timedelta(days=21))])
+
+    def test_lookups(self):
+        d = date(2025, 3, 1)
+        index = AwayIndex([(1, d, d + timedelta(days=3)), (1, d + timedelta(days=10), d + timedelta(days=12)),
+                           (2, d + timedelta(days=2), d + timedelta(days=11))])
+        self.assertTrue(index.is_away(1, d + timedelta(days=3)))
+        self.assertFalse(index.is_away(1, d + timedelta(days=5)))
+        self.assertFalse(index.is_away(3, d))
+        self.assertEqual(index.away_on(d + timedelta(days=2)), {1, 2})
+        self.assertEqual(index.away_on(d + timedelta(days=11)), {1, 2})
+        self.assertEqual(index.away_on(d + timedelta(days=13)), set())
+
+
+class AwayModeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='traveller', password='password123')
+        self.student = Student.objects.get(user=self.user)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.today = date.today()
+
+    def test_toggle_away_writes_no_meal_rows(self):
+        Meal.objects.create(student=self.student, date=self.today + timedelta(days=2), breakfast=True, supper=True)
+        meal_audits = AuditLog.objects.filter(model_name='Meal').count()
+        self.client.post(reverse('hms:toggle_away'), {
+            'start_date': self.today.isoformat(),
+            'end_date': (self.today + timedelta(days=89)).isoformat(),
+        })
+
+        self.assertEqual(AwayPeriod.objects.filter(student=self.student).count(), 1)
+        self.assertEqual(Meal.objects.filter(student=self.student).count(), 1)
+        meal = Meal.objects.get(student=self.student)
+        self.assertEqual((meal.away, meal.breakfast, meal.supper), (True, False, False))
+        self.assertEqual(AuditLog.objects.filter(model_name='Meal').count(), meal_audits)
+
+    def test_index_is_refreshed_when_periods_change(self):
+        tomorrow = self.today + timedelta(days=1)
+        self.assertFalse(get_away_index().is_away(self.student.pk, tomorrow))
+        with self.captureOnCommitCallbacks(execute=True):
+            AwayPeriod.objects.create(student=self.student, start_date=tomorrow, end_date=tomorrow)
+        self.assertTrue(get_away_index().is_away(self.student.pk, tomorrow))
+        self.assertEqual(away_counts([self.today, tomorrow]), {self.today: 0, tomorrow: 1})
+
+    def test_confirm_meals_is_refused_while_away(self):
+        tomorrow = self.today + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            AwayPeriod.objects.create(student=self.student, start_date=tomorrow, end_date=tomorrow)
+        self.client.post(reverse('hms:confirm_meals'), {'date': tomorrow.isoformat(), 'supper': 'on'})
+        self.assertFalse(Meal.objects.filter(student=self.student, date=tomorrow).exists())
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.db import connection, OperationalError
+from hms.booking import book_bed, release_active_assignments, RoomFull
+from hms.models import Student, Room, RoomAssignment
+
+
+def make_students(count, prefix='booker'):
+    User.objects.bulk_create([User(username=f'{prefix}{i}') for i in range(count)])
+    users = User.objects.filter(username__startswith=prefix, student_profile__isnull=True)
+    Student.objects.bulk_create([Student(user=user) for user in users])
+    return list(Student.objects.filter(user__username__startswith=prefix).order_by('pk'))
+
+
+class BookBedTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(room_number='C101', floor=1, capacity=2)
+        self.other = Room.objects.create(room_number='C102', floor=1, capacity=1)
+        self.students = make_students(3)
+
+    def test_beds_are_numbered_and_room_closes_when_full(self):
+        first = book_bed(self.students[0], self.room)
+        second = book_bed(self.students[1], self.room)
+        self.assertEqual({first.bed_number, second.bed_number}, {1, 2})
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.occupied_beds, 2)
+        self.assertFalse(self.room.is_available)
+        with self.assertRaises(RoomFull):
+            book_bed(self.students[2], self.room)
+
+    def test_moving_frees_the_old_bed_and_reopens_the_room(self):
+        book_bed(self.students[0], self.other)
+        self.other.refresh_from_db()
+        self.assertFalse(self.other.is_available)
+
+        book_bed(self.students[0], self.room)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.occupied_beds, 0)
+        self.assertTrue(self.other.is_available)
+        self.assertEqual(RoomAssignment.objects.filter(student=self.students[0], is_active=True).count(), 1)
+
+    def test_released_bed_number_is_reused(self):
+        book_bed(self.students[0], self.room)
+        book_bed(self.students[1], self.room)
+        release_active_assignments(self.students[0])
+        assignment = book_bed(self.students[2], self.room)
+        self.assertEqual(assignment.bed_number, 1)
+
+    def test_manually_closed_room_is_not_booked(self):
+        Room.objects.filter(pk=self.room.pk).update(is_available=False)
+        with self.assertRaises(RoomFull):
+            book_bed(self.students[0], self.room)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    """Fire parallel bookings at a few rooms and check nothing is overbooked"""
+
+    ROOMS = 5
+    CAPACITY = 4
+    STUDENTS = 60
+    THREADS = 16
+
+    def setUp(self):
+        self.rooms = [Room.objects.create(room_number=f'R{i}', floor=1, capacity=self.CAPACITY)
+                      for i in range(self.ROOMS)]
+        self.students = make_students(self.STUDENTS, prefix='rush')
+
+    def _book(self, index):
+        student = self.students[index]
+        room = self.rooms[index % self.ROOMS]
+        try:
+            for _ in range(50):
+                try:
+                    book_bed(student, room)
+                    return 'booked'
+                except RoomFull:
+                    return 'full'
+                except OperationalError:
+                    # SQLite serialises writers ("database table is locked"); retry
+                    time.sleep(0.01)
+            return 'gave_up'
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_never_overbook(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            outcomes = list(executor.map(self._book, range(self.STUDENTS)))
+
+        self.assertNotIn('gave_up', outcomes)
+        self.assertEqual(outcomes.count('booked'), self.ROOMS * self.CAPACITY)
+        self.assertEqual(outcomes.count('full'), self.STUDENTS - self.ROOMS * self.CAPACITY)
+        for room in self.rooms:
+            room.refresh_from_db()
+            beds = list(RoomAssignment.objects.filter(room=room, is_active=True)
+                        .values_list('bed_number', flat=True))
+            self.assertEqual(sorted(beds), list(range(1, self.CAPACITY + 1)))
+            self.assertEqual(room.occupied_beds, self.CAPACITY)
+            self.assertFalse(room.is_available)
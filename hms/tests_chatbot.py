@@ -0,0 +1,55 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from hms.chatbot import ChatService, FALLBACK_INTENT, get_engine
+from hms.models import StaffProfile
+
+
+class ChatbotEngineTest(TestCase):
+    def setUp(self):
+        self.engine = get_engine()
+
+    def test_engine_is_shared(self):
+        self.assertIs(ChatService().engine, self.engine)
+        self.assertIs(ChatService().engine, get_engine())
+
+    def test_best_overlap_wins_over_first_match(self):
+        # First-match-wins used to answer every greeting-prefixed question with the greeting
+        self.assertEqual(self.engine.classify('Hello, how do I pay my fees with M-Pesa?'), 'payments')
+        self.assertEqual(self.engine.classify('Hi'), 'greeting')
+        self.assertEqual(self.engine.classify('My room heater is broken, please fix and repair it'), 'maintenance')
+        self.assertEqual(self.engine.classify('Confirm   my BREAKFAST and lunch meals'), 'meals')
+        self.assertEqual(self.engine.classify('Who created this?'), 'owner')
+        self.assertEqual(self.engine.classify('lorem ipsum'), FALLBACK_INTENT)
+        # Whole words only: "this" does not contain "hi"
+        self.assertEqual(self.engine.classify('this'), FALLBACK_INTENT)
+
+    def test_responses_depend_on_role(self):
+        student = self.engine.respond('dashboard', 'Student')
+        admin = self.engine.respond('dashboard', 'Admin')
+        self.assertNotEqual(student, admin)
+        self.assertEqual(self.engine.respond('dashboard', 'Warden'), admin)
+        self.assertEqual(self.engine.respond('dashboard', 'Guest'), student)
+        self.assertIn('How to apply for deferment?', ChatService().get_quick_replies('Student'))
+
+
+class ChatbotAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_staff_get_admin_answers(self):
+        url = reverse('hms:api_chatbot')
+        client = APIClient()
+        user = User.objects.create_user(username='warden1', is_staff=True)
+        StaffProfile.objects.create(user=user, role='warden', national_id='12345678')
+        client.force_authenticate(user)
+        response = client.post(url, {'message': 'dashboard'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], get_engine().respond('dashboard', 'Admin'))
+
+        client.force_authenticate(User.objects.create_user(username='amina'))
+        response = client.post(url, {'message': 'dashboard'}, format='json')
+        self.assertEqual(response.json()['response'], get_engine().respond('dashboard', 'Student'))
+        self.assertEqual(client.post(url, {'message': ' '}, format='json').status_code, 400)
@@ -0,0 +1,109 @@
+from datetime import date
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.urls import reverse
+from django.utils import timezone
+from hms.deferments import decide, deferment_page, notify_decisions, status_counts
+from hms.models import AwayPeriod, DefermentRequest, NotificationPreference
+from hms.notifications import deferment_status_message
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def make_deferments(count, status='pending'):
+    deferments = []
+    for i in range(count):
+        student = User.objects.create_user(username=f'{status}{i}', first_name=f'S{i}',
+                                           email=f'{status}{i}@example.com').student_profile
+        deferments.append(DefermentRequest.objects.create(
+            student=student, start_date=date(2026, 11, 1), end_date=date(2026, 12, 1),
+            deferment_type='fee_challenges', reason='HELB delay', status=status))
+    return deferments
+
+
+class DefermentWorkbenchTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='officer', password='x', email='officer@example.com')
+
+    def test_facets_come_from_one_query(self):
+        make_deferments(3)
+        make_deferments(2, 'approved')
+        with self.assertNumQueries(1):
+            counts = status_counts()
+        self.assertEqual((counts['all'], counts['pending'], counts['approved'], counts['resumed']), (5, 3, 2, 0))
+
+    def test_keyset_pages_cover_every_row_once(self):
+        deferments = make_deferments(5)
+        # Equal timestamps are ordered by id
+        DefermentRequest.objects.filter(pk__in=[d.pk for d in deferments[:3]]).update(created_at=timezone.now())
+        seen, cursor = [], None
+        while True:
+            page, cursor = deferment_page('pending', cursor, size=2)
+            seen.extend(d.pk for d in page)
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(d.pk for d in deferments))
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(deferment_page('pending', 'garbage', size=10)[0][0].pk, seen[0])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_bulk_decision_is_one_transaction_with_batched_notices(self):
+        pending = make_deferments(3)
+        decided = make_deferments(1, 'rejected')[0]
+        NotificationPreference.objects.create(user=pending[0].student.user, sms_notifications=True)
+        pending[0].student.phone = '0712345678'
+        pending[0].student.save()
+
+        with mock.patch('hms.deferments.NotificationService.send_bulk_sms', return_value=1) as sms, \
+                self.captureOnCommitCallbacks(execute=True):
+            changed = decide([d.pk for d in pending] + [decided.pk], 'approved', self.admin, 'Enjoy the break')
+
+        self.assertEqual(len(changed), 3)
+        self.assertEqual(DefermentRequest.objects.filter(status='approved', admin_response='Enjoy the break').count(), 3)
+        self.assertEqual(DefermentRequest.objects.filter(reviewed_by=self.admin, reviewed_at__isnull=False).count(), 3)
+        self.assertIsNone(DefermentRequest.objects.get(pk=decided.pk).reviewed_by)
+        self.assertEqual(DefermentRequest.objects.get(pk=decided.pk).status, 'rejected')
+        self.assertEqual(AwayPeriod.objects.count(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        # Same wording as the single-request review page sends
+        subject, body, sms_body = deferment_status_message(DefermentRequest.objects.get(pk=pending[0].pk))
+        self.assertIn((subject, body), [(message.subject, message.body) for message in mail.outbox])
+        sms.assert_called_once()
+        self.assertEqual(sms.call_args.args[:2], (['+254712345678'], sms_body))
+
+    def test_failed_decision_rolls_back(self):
+        pending = make_deferments(2)
+        with mock.patch('hms.deferments.mark_away', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            decide([d.pk for d in pending], 'approved', self.admin)
+        self.assertEqual(DefermentRequest.objects.filter(status='pending').count(), 2)
+
+    def test_notices_skip_requests_no_longer_decided(self):
+        deferment = make_deferments(1)[0]
+        self.assertEqual(notify_decisions([deferment.pk]), (0, 0))
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE, BACKGROUND_TASKS_EAGER=True)
+    def test_workbench_page_and_bulk_form(self):
+        pending = make_deferments(3)
+        make_deferments(1, 'approved')
+        client = Client()
+        client.force_login(self.admin)
+
+        response = client.get(reverse('hms:admin_deferment_pending'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d.pk for d in response.context['deferments']], [d.pk for d in reversed(pending)])
+        self.assertIn(('pending', '🟡 Pending Application', 3), response.context['tabs'])
+        self.assertEqual(client.get(reverse('hms:admin_deferments'), {'status': 'approved'}).context['total_count'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('hms:admin_deferments') + '?status=pending',
+                                   {'ids': [pending[0].pk, pending[1].pk], 'decision': 'rejected'})
+        self.assertRedirects(response, reverse('hms:admin_deferments') + '?status=pending', fetch_redirect_response=False)
+        self.assertEqual(DefermentRequest.objects.filter(status='rejected').count(), 2)
+        self.assertEqual(client.post(reverse('hms:admin_deferments'), {'decision': 'rejected'}).status_code, 302)
+        self.assertEqual(DefermentRequest.objects.filter(status='pending').count(), 1)
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hms.dining import InvalidPass, check_token, dining_report, make_token, record_scan
+from hms.forecasting import record_actuals
+from hms.models import Student, Meal, MealForecast, MealServing
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class DiningCheckInTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.students = [Student.objects.get(user=User.objects.create_user(username=f'eater{i}', password='password123'))
+                         for i in range(3)]
+        self.chef = User.objects.create_superuser(username='chef', password='password123')
+
+    def test_tokens_rotate_and_cannot_be_forged(self):
+        token, expires_in = make_token(self.students[0].pk, now=1_000_000)
+        self.assertTrue(0 < expires_in <= 60)
+        self.assertEqual(check_token(token, now=1_000_000), self.students[0].pk)
+        self.assertEqual(check_token(token, now=1_000_060), self.students[0].pk)
+        for bad, now, reason in ((token, 1_000_200, 'expired'),
+                                 (token.replace(f'{self.students[0].pk}:', f'{self.students[1].pk}:', 1), 1_000_000, 'invalid'),
+                                 ('not a pass', 1_000_000, 'malformed')):
+            with self.assertRaises(InvalidPass) as ctx:
+                check_token(bad, now=now)
+            self.assertEqual(ctx.exception.reason, reason)
+
+    def test_scans_are_deduplicated_and_written_at_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            for student in self.students:
+                record_scan(make_token(student.pk)[0], 'supper')
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]), 3)
+        self.assertEqual(MealServing.objects.filter(date=self.today, meal='supper').count(), 3)
+
+        with CaptureQueriesContext(connection) as ctx, self.assertRaises(InvalidPass) as dup:
+            record_scan(make_token(self.students[0].pk)[0], 'supper')
+        self.assertEqual(dup.exception.reason, 'duplicate')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        record_scan(make_token(self.students[0].pk)[0], 'breakfast')
+        self.assertEqual(MealServing.objects.filter(date=self.today).count(), 4)
+
+    def test_evicted_key_is_still_a_duplicate(self):
+        token = make_token(self.students[0].pk)[0]
+        record_scan(token, 'early')
+        cache.clear()
+        with self.assertRaises(InvalidPass) as dup:
+            record_scan(token, 'early')
+        self.assertEqual(dup.exception.reason, 'duplicate')
+        self.assertEqual(MealServing.objects.count(), 1)
+
+    def test_failed_write_releases_the_key(self):
+        token = make_token(self.students[0].pk)[0]
+        with mock.patch.object(MealServing.objects, 'create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                record_scan(token, 'supper')
+        record_scan(token, 'supper')
+        self.assertEqual(MealServing.objects.count(), 1)
+
+    def test_scan_endpoint(self):
+        client = Client()
+        client.force_login(self.students[1].user)
+        token = make_token(self.students[0].pk)[0]
+        self.assertNotEqual(client.post(reverse('hms:dining_scan'), {'token': token, 'meal': 'supper'}).status_code, 200)
+
+        client.force_login(self.chef)
+        response = client.post(reverse('hms:dining_scan'), {'token': token, 'meal': 'supper', 'line': 'Line 1'})
+        self.assertEqual(response.json(), {'ok': True, 'student': self.students[0].pk})
+        self.assertEqual(client.post(reverse('hms:dining_scan'), {'token': token, 'meal': 'supper'}).status_code, 409)
+        self.assertEqual(client.post(reverse('hms:dining_scan'), {'token': 'x', 'meal': 'supper'}).status_code, 400)
+
+    def test_report_and_forecast_actuals_use_servings(self):
+        yesterday = self.today - timedelta(days=1)
+        Meal.objects.create(student=self.students[0], date=yesterday, supper=True)
+        Meal.objects.create(student=self.students[1], date=yesterday, supper=True)
+        MealServing.objects.bulk_create([
+            MealServing(student=self.students[0], date=yesterday, meal='supper', served_at=timezone.now()),
+            MealServing(student=self.students[2], date=yesterday, meal='supper', served_at=timezone.now()),
+        ])
+
+        supper = [row for row in dining_report(yesterday, yesterday) if row['meal'] == 'supper'][0]
+        self.assertEqual((supper['confirmed'], supper['served'], supper['walk_ins'], supper['no_shows']), (2, 2, 1, 1))
+        breakfast = [row for row in dining_report(yesterday, yesterday) if row['meal'] == 'breakfast'][0]
+        self.assertIsNone(breakfast['served'])
+
+        MealForecast.objects.create(date=yesterday, meal='supper', forecast=3, generated_at=timezone.now())
+        record_actuals(self.today)
+        self.assertEqual(MealForecast.objects.get(date=yesterday).actual, 2)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_pages_render(self):
+        client = Client()
+        client.force_login(self.students[0].user)
+        self.assertEqual(client.get(reverse('hms:meal_pass')).status_code, 200)
+        qr = client.get(reverse('hms:meal_pass_token')).json()
+        self.assertTrue(qr['qr'])
+
+        client.force_login(self.chef)
+        self.assertContains(client.get(reverse('hms:dining_scanner')), 'scanToken')
+        self.assertContains(client.get(reverse('hms:dining_report')), 'Served vs Confirmed')
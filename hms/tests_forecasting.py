@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from hms.forecasting import MealHistory, calibration, forecast_days, record_actuals, run_forecast
+from hms.models import Student, Meal, AwayPeriod, MealDefault, MealForecast
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class MealForecastTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.tomorrow = self.today + timedelta(days=1)
+        self.students = [Student.objects.get(user=User.objects.create_user(username=f'diner{i}'))
+                         for i in range(4)]
+
+    def eat(self, student, days=56, supper=True):
+        Meal.objects.bulk_create([Meal(student=student, date=self.today - timedelta(days=i), supper=supper)
+                                  for i in range(1, days + 1)])
+
+    def test_rates_come_from_weekday_history(self):
+        regular, never = self.students[:2]
+        self.eat(regular)
+        self.eat(never, supper=False)
+
+        history = MealHistory.load(self.today)
+        weekday = self.tomorrow.weekday()
+        self.assertEqual(history.weekday_counts(regular.pk, 'supper', weekday), (12, 12))
+        baseline = history.baseline('supper', weekday)
+        self.assertEqual(baseline, 0.5)
+        self.assertAlmostEqual(history.rate(regular.pk, 'supper', weekday, baseline), 13 / 14)
+        self.assertAlmostEqual(history.rate(never.pk, 'supper', weekday, baseline), 1 / 14)
+
+    def test_forecast_adds_expected_unconfirmed_diners(self):
+        regular, never, confirmed, defaulted = self.students
+        self.eat(regular)
+        self.eat(never, supper=False)
+        Meal.objects.create(student=confirmed, date=self.tomorrow, supper=True)
+        MealDefault.objects.create(student=defaulted, weekday=self.tomorrow.weekday(), supper=True)
+
+        supper = {f.meal: f for f in forecast_days(days=1)}['supper']
+        self.assertEqual(supper.confirmed, 2)
+        self.assertAlmostEqual(supper.expected_unconfirmed, 1.0)
+        self.assertEqual(supper.forecast, 3)
+
+    def test_away_and_attachment_students_are_left_out(self):
+        away, attached = self.students[:2]
+        self.eat(away)
+        self.eat(attached)
+        attached.is_on_attachment = True
+        attached.save()
+        AwayPeriod.objects.create(student=away, start_date=self.tomorrow, end_date=self.tomorrow + timedelta(days=2))
+
+        forecasts = forecast_days(days=4)
+        self.assertEqual([f.forecast for f in forecasts if f.meal == 'supper'], [0, 0, 0, 1])
+
+    def test_actuals_are_recorded_and_calibrate_the_forecast(self):
+        yesterday = self.today - timedelta(days=1)
+        MealForecast.objects.create(date=yesterday, meal='supper', confirmed=2, expected_unconfirmed=4,
+                                    forecast=6, generated_at=timezone.now())
+        Meal.objects.bulk_create([Meal(student=s, date=yesterday, supper=True) for s in self.students])
+
+        self.assertEqual(record_actuals(self.today), 1)
+        self.assertEqual(MealForecast.objects.get(date=yesterday, meal='supper').actual, 4)
+        self.assertEqual(calibration(self.today)['supper'], 0.5)
+        self.assertEqual(calibration(self.today)['breakfast'], 1.0)
+
+    def test_nightly_run_upserts(self):
+        self.eat(self.students[0])
+        run_forecast(days=3)
+        Meal.objects.create(student=self.students[1], date=self.tomorrow, supper=True)
+        run_forecast(days=3)
+        self.assertEqual(MealForecast.objects.count(), 9)
+        self.assertEqual(MealForecast.objects.get(date=self.tomorrow, meal='supper').confirmed, 1)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_dashboard_shows_forecast_and_accuracy(self):
+        MealForecast.objects.create(date=self.tomorrow, meal='supper', forecast=42, generated_at=timezone.now())
+        MealForecast.objects.create(date=self.today - timedelta(days=2), meal='breakfast', forecast=11,
+                                    actual=10, generated_at=timezone.now())
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='chef', password='password123'))
+        response = client.get(reverse('hms:kitchen_manager_dashboard'))
+        self.assertContains(response, '/ 42')
+        self.assertContains(response, '(10.0%)')
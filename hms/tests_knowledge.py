@@ -0,0 +1,85 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from library.models import LibraryNews
+from hms import knowledge
+from hms.models import Announcement, Document, MentalHealthResource
+
+
+class KnowledgeIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        knowledge._index = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.exam = Announcement.objects.create(
+                title='Exam timetable released',
+                content='The end of semester exam timetable is on the notice board. Special exams are in week 14.')
+            MentalHealthResource.objects.create(
+                title='Coping with exam stress', content='Breathing exercises and sleep tips for exam periods.',
+                external_link='https://example.com/stress')
+            LibraryNews.objects.create(title='Extended opening hours',
+                                       content='The library opens until midnight during exams.')
+            Document.objects.create(title='Hostel rules', description='Quiet hours start at 10pm.',
+                                    file='documents/rules.pdf')
+
+    def tearDown(self):
+        knowledge._index = None
+
+    def test_bm25_ranks_the_closest_document_first(self):
+        results = knowledge.search('When are the special exams?')
+        self.assertEqual(results[0].title, 'Exam timetable released')
+        self.assertEqual(results[0].url, reverse('hms:announcements'))
+        self.assertIn('Special exams are in week 14', results[0].snippet)
+        self.assertEqual(knowledge.search('library opening hours')[0].kind, 'library_news')
+        self.assertEqual(knowledge.search('dealing with stress')[0].url, 'https://example.com/stress')
+        self.assertEqual(knowledge.search('the and of'), [])
+
+    def test_signals_update_the_loaded_index_in_place(self):
+        index = knowledge.get_index()
+        with self.assertNumQueries(0):
+            knowledge.search('exam')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.exam.is_active = False
+            self.exam.save()
+            Announcement.objects.create(title='Water outage', content='No water in Block B on Friday.')
+        self.assertIs(knowledge.get_index(), index)
+        self.assertEqual(index.version, knowledge.current_version())
+        with self.assertNumQueries(0):
+            titles = [result.title for result in knowledge.search('exam water')]
+        self.assertNotIn('Exam timetable released', titles)
+        self.assertIn('Water outage', titles)
+
+    def test_other_process_changes_trigger_a_rebuild(self):
+        index = knowledge.get_index()
+        # A write elsewhere bumps the shared version without touching this index
+        cache.incr(knowledge.VERSION_KEY)
+        Announcement.objects.filter(pk=self.exam.pk).update(title='Exam dates moved')
+        self.assertIsNot(knowledge.get_index(), index)
+        self.assertEqual(knowledge.search('exam dates')[0].title, 'Exam dates moved')
+
+
+class ChatbotRetrievalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        knowledge._index = None
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Graduation gowns', content='Collect gowns from the registry.')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='amina'))
+        self.url = reverse('hms:api_chatbot')
+
+    def tearDown(self):
+        knowledge._index = None
+
+    def test_unmatched_questions_are_answered_from_content(self):
+        data = self.client.post(self.url, {'message': 'Where do I collect my graduation gown?'}, format='json').json()
+        self.assertIn('Collect gowns from the registry.', data['response'])
+        self.assertEqual(data['sources'][0]['title'], 'Graduation gowns')
+
+        # Specific intents keep their canned answers
+        data = self.client.post(self.url, {'message': 'How do I confirm my meals?'}, format='json').json()
+        self.assertEqual(data['sources'], [])
+        self.assertIn('Confirming Your Meals', data['response'])
@@ -0,0 +1,141 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from hms.ledger import (ageing_buckets, charge_room_assignment, credit_payment, finance_summary,
+                        get_balance, outstanding_by_hostel, recompute_balances, record_registration_fee)
+from hms.models import Student, Room, RoomAssignment, Payment, LedgerEntry, StudentBalance, RegistrationPayment
+
+
+class FeeLedgerTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(room_number='A101', floor=1, block='A', price_per_semester=12000)
+        self.student = self.make_student('ledger1', hostel='Block A')
+
+    def make_student(self, username, hostel=None):
+        user = User.objects.create_user(username=username, password='password123')
+        student = Student.objects.get(user=user)
+        student.hostel = hostel
+        student.save()
+        return student
+
+    def assign(self, student, days_ago=0):
+        assignment = RoomAssignment.objects.create(
+            student=student, room=self.room, assigned_date=timezone.now().date() - timedelta(days=days_ago)
+        )
+        charge_room_assignment(assignment)
+        return assignment
+
+    def pay(self, student, amount):
+        payment = Payment.objects.create(student=student, amount=amount, phone_number='0712345678',
+                                         status='Completed', transaction_id=f'RCPT{Payment.objects.count()}')
+        credit_payment(payment)
+        return payment
+
+    def test_charges_and_credits_update_balance(self):
+        self.assign(self.student)
+        self.pay(self.student, 5000)
+
+        balance = get_balance(self.student)
+        self.assertEqual(balance.total_charged, Decimal('12000'))
+        self.assertEqual(balance.total_paid, Decimal('5000'))
+        self.assertEqual(balance.balance, Decimal('7000'))
+        self.assertIsNotNone(balance.oldest_unpaid_at)
+
+    def test_reposting_a_source_is_a_no_op(self):
+        assignment = self.assign(self.student)
+        payment = self.pay(self.student, 5000)
+        charge_room_assignment(assignment)
+        credit_payment(payment)
+
+        self.assertEqual(LedgerEntry.objects.filter(student=self.student).count(), 2)
+        self.assertEqual(get_balance(self.student).balance, Decimal('7000'))
+
+    def test_settled_balance_has_no_ageing_date(self):
+        self.assign(self.student)
+        self.pay(self.student, 12000)
+        balance = get_balance(self.student)
+        self.assertEqual(balance.balance, Decimal('0'))
+        self.assertIsNone(balance.oldest_unpaid_at)
+
+    def test_moving_room_does_not_bill_again(self):
+        second = Room.objects.create(room_number='A102', floor=1, block='A', price_per_semester=15000)
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='warden', password='x', email='w@example.com'))
+        for room in (self.room, second):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(reverse('hms:assign_room'), {'room': room.pk, 'student': self.student.pk})
+            self.assertRedirects(response, reverse('hms:room_assignments'), fetch_redirect_response=False)
+
+        self.assertEqual(RoomAssignment.objects.filter(student=self.student).count(), 2)
+        self.assertEqual(get_balance(self.student).total_charged, Decimal('12000'))
+
+    def test_returning_after_checkout_is_billed(self):
+        first = self.assign(self.student, days_ago=120)
+        first.is_active = False
+        first.checkout_date = timezone.now().date() - timedelta(days=30)
+        first.save()
+        self.assign(self.student)
+        self.assertEqual(get_balance(self.student).total_charged, Decimal('24000'))
+
+    def test_finance_queries(self):
+        other = self.make_student('ledger2', hostel='Block B')
+        self.assign(self.student, days_ago=10)
+        self.assign(other, days_ago=75)
+        self.pay(other, 2000)
+        record_registration_fee(other, RegistrationPayment.objects.create(
+            phone_number='0712345678', amount=30, checkout_request_id='ws_CO_1', status='Completed'))
+
+        by_hostel = {row['group']: row['outstanding'] for row in outstanding_by_hostel()}
+        self.assertEqual(by_hostel, {'Block A': Decimal('12000'), 'Block B': Decimal('10000')})
+
+        buckets = {row['label']: row['outstanding'] for row in ageing_buckets()}
+        self.assertEqual(buckets['0-30 days'], Decimal('12000'))
+        self.assertEqual(buckets['61-90 days'], Decimal('10000'))
+        self.assertEqual(buckets['90+ days'], Decimal('0'))
+
+        summary = finance_summary()
+        self.assertEqual(summary['outstanding'], Decimal('22000'))
+        self.assertEqual(summary['collected'], Decimal('2030'))
+        # Registration fees are collected but are not accommodation revenue
+        self.assertEqual(summary['revenue'], Decimal('2000'))
+        self.assertEqual(summary['debtors'], 2)
+
+    def test_recompute_balances_repairs_drift(self):
+        self.assign(self.student)
+        self.pay(self.student, 3000)
+        StudentBalance.objects.filter(pk=self.student.pk).update(balance=0, total_paid=0)
+
+        recompute_balances()
+        balance = get_balance(self.student)
+        self.assertEqual(balance.total_paid, Decimal('3000'))
+        self.assertEqual(balance.balance, Decimal('9000'))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class LedgerPaymentIntegrationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='payer', password='password123')
+        self.student = Student.objects.get(user=user)
+        room = Room.objects.create(room_number='B201', floor=2, price_per_semester=8000)
+        charge_room_assignment(RoomAssignment.objects.create(student=self.student, room=room))
+        Payment.objects.create(student=self.student, amount=3000, phone_number='0712345678',
+                               checkout_request_id='ws_CO_LEDGER_1')
+
+    def test_mpesa_callback_credits_ledger_once(self):
+        body = json.dumps({'Body': {'stkCallback': {
+            'CheckoutRequestID': 'ws_CO_LEDGER_1', 'ResultCode': 0, 'ResultDesc': 'Success',
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'LEDG1'}]},
+        }}})
+        client = Client()
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(reverse('hms:mpesa_callback'), body, content_type='application/json')
+
+        self.assertEqual(LedgerEntry.objects.filter(student=self.student, entry_type='credit').count(), 1)
+        self.assertEqual(get_balance(self.student).balance, Decimal('5000'))
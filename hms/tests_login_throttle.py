@@ -0,0 +1,97 @@
+from unittest import mock
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from hms import login_throttle
+from hms.models import LoginActivity
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class LoginThrottleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Amina', email='Amina@Example.com', password='Password123!')
+        self.factory = RequestFactory()
+
+    def attempt(self, login, password='wrong', ip='10.0.0.1', **headers):
+        request = self.factory.post('/login/', REMOTE_ADDR=ip, **headers)
+        return authenticate(request, username=login, password=password)
+
+    def test_lookup_is_case_insensitive(self):
+        self.assertEqual(login_throttle.find_user(' amina '), self.user)
+        self.assertEqual(login_throttle.find_user('AMINA@example.COM'), self.user)
+        self.assertIsNone(login_throttle.find_user('nobody'))
+        User.objects.create_user(username='twin', email='amina@example.com')
+        # The username match wins; a shared email alone is ambiguous
+        self.assertEqual(login_throttle.find_user('amina'), self.user)
+        self.assertIsNone(login_throttle.find_user('amina@example.com'))
+
+    def test_account_delays_grow_and_skip_hashing(self):
+        with mock.patch('hms.login_throttle.time.time', return_value=10000.0) as now:
+            for _ in range(5):
+                self.assertIsNone(self.attempt('amina'))
+            with mock.patch.object(User, 'check_password') as check:
+                # The right password from another IP is refused without hashing
+                self.assertIsNone(self.attempt('amina@example.com', 'Password123!', ip='10.0.0.2'))
+            check.assert_not_called()
+            self.assertEqual(login_throttle.retry_after(None, 'amina', self.user), 1)
+
+            now.return_value = 10001.0
+            self.assertIsNone(self.attempt('amina'))
+            self.assertEqual(login_throttle.retry_after(None, 'amina', self.user), 2)
+
+            now.return_value = 10003.0
+            self.assertEqual(self.attempt('amina', 'Password123!'), self.user)
+
+    def test_ip_window_covers_many_accounts(self):
+        with override_settings(LOGIN_IP_FREE_FAILURES=3):
+            for name in ['a', 'b', 'c']:
+                self.attempt(name)
+            self.assertIsNone(self.attempt('amina', 'Password123!'))
+            self.assertEqual(self.attempt('amina', 'Password123!', ip='10.0.0.9'), self.user)
+
+    @override_settings(LOGIN_IP_FREE_FAILURES=3, NUM_PROXIES=1)
+    def test_forged_forwarded_for_does_not_change_the_ip(self):
+        # The proxy (REMOTE_ADDR) appends the real client; the left entries are client-supplied
+        for i, name in enumerate(['a', 'b', 'c']):
+            self.attempt(name, ip='10.1.1.1', HTTP_X_FORWARDED_FOR=f'198.51.100.{i}, 203.0.113.7')
+        self.assertIsNone(self.attempt('amina', 'Password123!', ip='10.1.1.1',
+                                       HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.7'))
+        self.assertEqual(self.attempt('amina', 'Password123!', ip='10.1.1.1',
+                                      HTTP_X_FORWARDED_FOR='203.0.113.8'), self.user)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_failures_are_logged_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.attempt('amina')
+            self.attempt('ghost')
+        self.assertFalse(LoginActivity.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertCountEqual(LoginActivity.objects.values_list('user__username', 'status', 'ip_address'),
+                              [('Amina', 'Failed', '10.0.0.1'), (None, 'Failed', '10.0.0.1')])
+
+    def test_busy_hashing_slots_refuse_the_attempt(self):
+        slots = mock.Mock()
+        slots.acquire.return_value = False
+        with mock.patch.object(login_throttle, '_hash_slots', slots), \
+                mock.patch.object(User, 'check_password') as check:
+            self.assertIsNone(self.attempt('amina', 'Password123!'))
+        check.assert_not_called()
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE, LOGIN_ACCOUNT_FREE_FAILURES=1)
+    def test_login_page_reports_the_wait(self):
+        client = Client()
+        client.post(reverse('hms:login'), {'username': 'amina', 'password': 'wrong'})
+        response = client.post(reverse('hms:login'), {'username': 'amina', 'password': 'Password123!'}, follow=True)
+        self.assertContains(response, 'Too many failed login attempts')
+
+        login_throttle.reset(self.user)
+        response = client.post(reverse('hms:login'), {'username': 'amina', 'password': 'Password123!'})
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from hms.meal_archive import (attendance, closed_months, compact_month, daily_totals, first_meal_date,
+                              history_bits, meals_on, streaks)
+from hms.models import Student, Meal, MealArchive, AwayPeriod, AuditLog
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class MealArchiveTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = Student.objects.get(user=User.objects.create_user(username='archived', password='password123'))
+        self.other = Student.objects.get(user=User.objects.create_user(username='other'))
+        self.march = date(2024, 3, 1)
+        Meal.objects.bulk_create(
+            [Meal(student=self.student, date=self.march + timedelta(days=i), supper=True, breakfast=i % 2 == 0)
+             for i in range(10)]
+            + [Meal(student=self.other, date=date(2024, 3, 31), early=True),
+               Meal(student=self.student, date=date(2024, 4, 1), supper=True)])
+        AwayPeriod.objects.create(student=self.student, start_date=date(2024, 3, 20), end_date=date(2024, 3, 22))
+
+    def test_compaction_packs_month_and_keeps_answers(self):
+        before = attendance(self.student.pk, date(2024, 3, 1), date(2024, 4, 1))
+        audit_rows = AuditLog.objects.count()
+
+        self.assertEqual(closed_months(today=date(2024, 4, 15)), [self.march])
+        self.assertEqual(compact_month(self.march, today=date(2024, 4, 15)), (2, 11))
+        self.assertEqual(Meal.objects.count(), 1)
+        self.assertEqual(AuditLog.objects.count(), audit_rows)
+
+        archive = MealArchive.objects.get(student=self.student)
+        self.assertEqual(archive.supper, (1 << 10) - 1)
+        self.assertEqual(archive.away, 0b111 << 19)
+        self.assertEqual(attendance(self.student.pk, date(2024, 3, 1), date(2024, 4, 1)), before)
+        self.assertEqual(before['supper'], 11)
+        self.assertEqual(before['breakfast'], 5)
+        self.assertEqual(before['away'], 3)
+
+    def test_compaction_refuses_open_month_and_merges_reruns(self):
+        with self.assertRaises(ValueError):
+            compact_month(date(2024, 4, 1), today=date(2024, 4, 15))
+        compact_month(self.march, today=date(2024, 4, 15))
+        Meal.objects.create(student=self.student, date=date(2024, 3, 15), early=True)
+        compact_month(self.march, today=date(2024, 4, 15))
+        archive = MealArchive.objects.get(student=self.student)
+        self.assertEqual((archive.supper.bit_count(), archive.early), (10, 1 << 14))
+
+    def test_streaks_and_first_meal_span_archive_and_live(self):
+        compact_month(self.march, today=date(2024, 4, 15))
+        self.assertEqual(streaks(self.student.pk, date(2024, 3, 1), date(2024, 3, 10)),
+                         {'current': 10, 'longest': 10})
+        self.assertEqual(streaks(self.student.pk, date(2024, 3, 1), date(2024, 4, 1), meal='breakfast'),
+                         {'current': 0, 'longest': 1})
+        self.assertEqual(streaks(self.student.pk, date(2024, 3, 25), date(2024, 4, 1))['current'], 1)
+        self.assertEqual(first_meal_date(self.student.pk), self.march)
+        self.assertEqual(first_meal_date(self.other.pk), date(2024, 3, 31))
+        self.assertEqual(history_bits(self.other.pk, date(2024, 3, 30), date(2024, 4, 1))['early'], 0b010)
+
+    def test_daily_totals_combine_archive_and_live(self):
+        compact_month(self.march, today=date(2024, 4, 15))
+        totals = daily_totals(date(2024, 3, 30), date(2024, 4, 1))
+        self.assertEqual(totals[date(2024, 3, 31)], {'breakfast': 0, 'early': 1, 'supper': 0})
+        self.assertEqual(totals[date(2024, 4, 1)]['supper'], 1)
+
+    def test_meal_export_reads_compacted_days(self):
+        compact_month(self.march, today=date(2024, 4, 15))
+        self.assertEqual(meals_on(date(2024, 3, 2)),
+                         {self.student.pk: {'breakfast': False, 'early': False, 'supper': True, 'away': False}})
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='boss', password='x', email='boss@example.com'))
+        response = client.get(reverse('hms:export_meals_csv'), {'date': '2024-03-31'})
+        rows = response.content.decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('Yes', rows[1].split(',')[3])
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_admin_dashboard_lists_compacted_days(self):
+        compact_month(self.march, today=date(2024, 4, 15))
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='boss', password='x', email='boss@example.com'))
+        response = client.get(reverse('hms:admin_dashboard'), {'date': '2024-03-03', 'filter': 'breakfast'})
+        self.assertEqual([meal.student for meal in response.context['meals_list']], [self.student])
+        response = client.get(reverse('hms:admin_dashboard'), {'date': '2024-03-02', 'filter': 'breakfast'})
+        self.assertEqual(response.context['meals_list'], [])
+
+    def test_history_api(self):
+        client = Client()
+        client.force_login(self.student.user)
+        today = timezone.localdate()
+        Meal.objects.create(student=self.student, date=today, supper=True)
+        response = client.get(reverse('hms:api_meal_history'), {'meal': 'supper'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['streaks']['current'], 1)
+        self.assertEqual(client.get(reverse('hms:api_meal_history'), {'meal': 'lunch'}).status_code, 400)
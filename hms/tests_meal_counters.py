@@ -0,0 +1,76 @@
+from datetime import timedelta
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hms.meal_counters import get_counts, reconcile_counts, board_snapshot
+from hms.meal_plans import apply_plan
+from hms.models import Student, Meal
+
+
+class MealCounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.students = [Student.objects.get(user=User.objects.create_user(username=f'eater{i}'))
+                         for i in range(3)]
+
+    def save(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Meal.objects.create(**kwargs)
+
+    def test_counters_follow_saves_and_deletes_without_queries(self):
+        self.save(student=self.students[0], date=self.today, breakfast=True, supper=True)
+        self.assertEqual(get_counts(self.today)['breakfast'], 1)
+
+        self.save(student=self.students[1], date=self.today, breakfast=True)
+        meal = Meal.objects.get(student=self.students[0])
+        meal.breakfast = False
+        meal.early = True
+        with self.captureOnCommitCallbacks(execute=True):
+            meal.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Meal.objects.filter(student=self.students[1]).delete()
+
+        with CaptureQueriesContext(connection) as ctx:
+            counts = get_counts(self.today)
+        self.assertFalse([q for q in ctx.captured_queries if 'hms_meal' in q['sql']])
+        self.assertEqual(counts, {'breakfast': 0, 'early': 1, 'supper': 1, 'confirmed': 1, 'away': 0})
+
+    def test_bulk_writes_reseed_and_reconcile_fixes_drift(self):
+        get_counts(self.today)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_plan([Meal(student=s, date=self.today, supper=True) for s in self.students])
+        self.assertEqual(get_counts(self.today)['supper'], 3)
+
+        cache.set(f'meal_count:{self.today.isoformat()}:supper', 10)
+        drift = reconcile_counts([self.today, self.today + timedelta(days=1)])
+        self.assertEqual(drift, {self.today: {'supper': (10, 3)}})
+        self.assertEqual(get_counts(self.today)['supper'], 3)
+
+    def test_rolled_back_save_does_not_count(self):
+        get_counts(self.today)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Meal.objects.create(student=self.students[0], date=self.today, supper=True)
+        # Callbacks never run when the transaction rolls back
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_counts(self.today)['supper'], 0)
+
+    def test_board_snapshot(self):
+        self.save(student=self.students[0], date=self.today, breakfast=True)
+        snapshot = board_snapshot()
+        self.assertEqual(snapshot['today']['breakfast'], 1)
+        self.assertEqual(snapshot['today']['date'], self.today.isoformat())
+
+    def test_board_data_view_requires_kitchen_role(self):
+        client = Client()
+        client.force_login(self.students[0].user)
+        self.assertNotEqual(client.get(reverse('hms:kitchen_board_data')).status_code, 200)
+
+        client.force_login(User.objects.create_superuser(username='chef', password='password123'))
+        response = client.get(reverse('hms:kitchen_board_data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'today', 'tomorrow'})
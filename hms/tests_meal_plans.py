@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, time, timedelta
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hms.meal_plans import validate_plan, save_defaults, week_plan, planned_counts, expand_defaults
+from hms.models import Student, Meal, AwayPeriod, MealDefault
+
+
+class MealPlanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='planner', password='password123')
+        self.student = Student.objects.get(user=self.user)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def post_plan(self, payload):
+        return self.client.post(reverse('hms:api_meal_plan'), data=json.dumps(payload),
+                                content_type='application/json')
+
+    def test_week_is_saved_with_one_insert(self):
+        days = [{'date': (self.tomorrow + timedelta(days=i)).isoformat(), 'breakfast': True, 'supper': i % 2 == 0}
+                for i in range(7)]
+        Meal.objects.create(student=self.student, date=self.tomorrow, supper=False)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_plan({'days': days})
+        self.assertEqual(response.status_code, 200)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "hms_meal"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Meal.objects.filter(student=self.student, breakfast=True).count(), 7)
+        self.assertTrue(Meal.objects.get(student=self.student, date=self.tomorrow).supper)
+
+    def test_away_day_rejects_whole_plan(self):
+        AwayPeriod.objects.create(student=self.student, start_date=self.tomorrow + timedelta(days=2),
+                                  end_date=self.tomorrow + timedelta(days=3))
+        cache.clear()
+        days = [{'date': (self.tomorrow + timedelta(days=i)).isoformat(), 'supper': True} for i in range(5)]
+        response = self.post_plan({'days': days})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertFalse(Meal.objects.exists())
+
+    def test_breakfast_is_locked_after_eight(self):
+        day = self.tomorrow
+        Meal.objects.create(student=self.student, date=day, breakfast=False, supper=False)
+        now = timezone.make_aware(datetime.combine(day, time(10, 0)))
+        meals, warnings = validate_plan(self.student, [{'date': day, 'breakfast': True, 'supper': True}], now=now)
+        self.assertEqual((meals[0].breakfast, meals[0].supper), (False, True))
+        self.assertEqual(len(warnings), 1)
+
+    def test_defaults_are_expanded_lazily(self):
+        other = Student.objects.get(user=User.objects.create_user(username='other', password='password123'))
+        save_defaults(self.student, [{'weekday': self.tomorrow.weekday(), 'breakfast': True}])
+        save_defaults(other, [{'weekday': self.tomorrow.weekday(), 'supper': True}])
+        Meal.objects.create(student=other, date=self.tomorrow, breakfast=True, supper=False)
+
+        plan = week_plan(self.student, self.tomorrow, days=1)
+        self.assertEqual((plan[0]['source'], plan[0]['breakfast']), ('default', True))
+        self.assertFalse(Meal.objects.filter(student=self.student).exists())
+        self.assertEqual(planned_counts([self.tomorrow])[self.tomorrow],
+                         {'breakfast': 2, 'early': 0, 'supper': 0})
+
+        self.assertEqual(expand_defaults(self.tomorrow), 1)
+        self.assertTrue(Meal.objects.get(student=self.student, date=self.tomorrow).breakfast)
+        self.assertFalse(Meal.objects.get(student=other, date=self.tomorrow).supper)
+
+    def test_clearing_a_default(self):
+        weekday = self.tomorrow.weekday()
+        self.post_plan({'defaults': [{'weekday': weekday, 'supper': True}]})
+        self.assertTrue(MealDefault.objects.filter(student=self.student, weekday=weekday).exists())
+        self.post_plan({'defaults': [{'weekday': weekday}]})
+        self.assertFalse(MealDefault.objects.filter(student=self.student).exists())
@@ -0,0 +1,85 @@
+from datetime import timedelta
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from hms.meal_reminders import send_meal_reminders, unconfirmed_students
+from hms.models import Student, Meal, MealDefault, AwayPeriod, Notification, NotificationPreference
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ADMIN_EMAIL='admin@example.com')
+class MealReminderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.students = [Student.objects.get(user=User.objects.create_user(
+            username=f'student{i}', email=f'student{i}@example.com', first_name=f'S{i}')) for i in range(6)]
+        confirmed, defaulted, away, attached = self.students[2:]
+        Meal.objects.create(student=confirmed, date=self.tomorrow, supper=True)
+        MealDefault.objects.create(student=defaulted, weekday=self.tomorrow.weekday(), breakfast=True)
+        AwayPeriod.objects.create(student=away, start_date=self.tomorrow, end_date=self.tomorrow)
+        attached.is_on_attachment = True
+        attached.save()
+        NotificationPreference.objects.create(user=self.students[0].user, email_notifications=True)
+        NotificationPreference.objects.create(user=self.students[1].user, email_notifications=False)
+
+    def test_unconfirmed_set_is_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            ids = set(unconfirmed_students(self.tomorrow).values_list('pk', flat=True))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(ids, {self.students[0].pk, self.students[1].pk})
+
+    def test_reminders_are_idempotent_and_respect_preferences(self):
+        summary = send_meal_reminders(self.tomorrow, 'breakfast')
+        self.assertEqual((summary['unconfirmed'], summary['reminded'], summary['emailed']), (2, 2, 1))
+        self.assertEqual(Notification.objects.filter(notification_type='meal').count(), 2)
+        self.assertEqual([m.to for m in mail.outbox], [['student0@example.com'], ['admin@example.com']])
+        self.assertNotIn('student1@example.com', mail.outbox[1].body)
+
+        again = send_meal_reminders(self.tomorrow, 'breakfast')
+        self.assertEqual((again['reminded'], again['already_reminded']), (0, 2))
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+        send_meal_reminders(self.tomorrow, 'supper', notify_admins=False)
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_overlapping_run_is_skipped(self):
+        # Another run holds the lock for this date and meal
+        cache.add(f'meal-reminder-lock:{self.tomorrow.isoformat()}:breakfast', 1)
+        self.assertIsNone(send_meal_reminders(self.tomorrow, 'breakfast'))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(send_meal_reminders(self.tomorrow, 'supper')['reminded'], 2)
+
+        cache.clear()
+        self.assertEqual(send_meal_reminders(self.tomorrow, 'breakfast')['reminded'], 2)
+        # The lock is released when the run finishes
+        self.assertEqual(send_meal_reminders(self.tomorrow, 'breakfast')['already_reminded'], 2)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_admin_button_queues_the_job(self):
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='boss', password='password123'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.get(reverse('hms:send_notifications'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Notification.objects.filter(user=self.students[0].user).count(), 1)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_dashboard_counts_only_unconfirmed_students(self):
+        client = Client()
+        boss = User.objects.create_superuser(username='boss', password='password123')
+        client.force_login(boss)
+        response = client.get(reverse('hms:admin_dashboard'))
+        # Students 0 and 1, plus the profile created for the new user; not the away or defaulted ones
+        expected = {self.students[0].pk, self.students[1].pk, *Student.objects.filter(user=boss).values_list('pk', flat=True)}
+        self.assertEqual(response.context['unconfirmed_count'], len(expected))
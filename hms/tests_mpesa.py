@@ -0,0 +1,59 @@
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from unittest.mock import patch, MagicMock
+from hms import mpesa
+from hms.mpesa import MpesaClient, TOKEN_CACHE_KEY
+
+
+def _response(status_code=200, payload=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = payload or {}
+    response.raise_for_status.return_value = None
+    return response
+
+
+@override_settings(MPESA_CONSUMER_KEY='key', MPESA_CONSUMER_SECRET='secret')
+class MpesaClientTokenTest(TestCase):
+    def setUp(self):
+        cache.delete(TOKEN_CACHE_KEY)
+        mpesa.metrics.reset()
+
+    def test_token_is_cached_between_calls(self):
+        """Only one OAuth round-trip is made for several STK queries"""
+        token_resp = _response(payload={'access_token': 'abc', 'expires_in': '3599'})
+        query_resp = _response(payload={'ResponseCode': '0', 'ResultCode': '0'})
+
+        with patch.object(mpesa.session, 'request', side_effect=[token_resp, query_resp, query_resp]) as mock_request:
+            client = MpesaClient()
+            client.stk_push_query('ws_CO_1')
+            MpesaClient().stk_push_query('ws_CO_2')
+
+        methods = [call.args[0] for call in mock_request.call_args_list]
+        self.assertEqual(methods, ['GET', 'POST', 'POST'])
+        self.assertEqual(cache.get(TOKEN_CACHE_KEY), 'abc')
+
+    def test_revoked_token_is_refreshed_once(self):
+        """A 401 from Daraja drops the cached token and retries with a new one"""
+        cache.set(TOKEN_CACHE_KEY, 'stale', 60)
+        unauthorized = _response(status_code=401)
+        token_resp = _response(payload={'access_token': 'fresh', 'expires_in': 3599})
+        query_resp = _response(payload={'ResponseCode': '0', 'ResultCode': '0'})
+
+        with patch.object(mpesa.session, 'request', side_effect=[unauthorized, token_resp, query_resp]):
+            result = MpesaClient().stk_push_query('ws_CO_1')
+
+        self.assertEqual(result['ResultCode'], '0')
+        self.assertEqual(cache.get(TOKEN_CACHE_KEY), 'fresh')
+
+    def test_metrics_recorded_per_call(self):
+        token_resp = _response(payload={'access_token': 'abc', 'expires_in': 3599})
+        query_resp = _response(payload={'ResponseCode': '0'})
+
+        with patch.object(mpesa.session, 'request', side_effect=[token_resp, query_resp]):
+            MpesaClient().stk_push_query('ws_CO_1')
+
+        snapshot = mpesa.metrics.snapshot()
+        self.assertEqual(snapshot['oauth']['calls'], 1)
+        self.assertEqual(snapshot['stk_push_query']['calls'], 1)
+        self.assertEqual(snapshot['stk_push_query']['errors'], 0)
@@ -0,0 +1,144 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from hms.models import Student, Payment, MpesaCallback, Notification
+from hms.payments import get_cached_status, process_pending_callbacks, reconcile_pending_payments
+
+
+def _callback_body(checkout_id, result_code=0, receipt='QWE123RTY'):
+    callback = {
+        'MerchantRequestID': '29412-2993-99933',
+        'CheckoutRequestID': checkout_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user',
+    }
+    if result_code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': 1500},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+        ]}
+    return json.dumps({'Body': {'stkCallback': callback}})
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class MpesaCallbackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='payer', password='password123')
+        self.student = Student.objects.get(user=self.user)
+        self.payment = Payment.objects.create(
+            student=self.student, amount=1500, phone_number='0712345678',
+            checkout_request_id='ws_CO_TEST_1'
+        )
+        self.client = Client()
+
+    def post_callback(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('hms:mpesa_callback'), body, content_type='application/json')
+
+    def test_callback_is_acknowledged_and_applied(self):
+        response = self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ResultCode'], 0)
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+        self.assertEqual(self.payment.transaction_id, 'QWE123RTY')
+        self.assertEqual(get_cached_status('ws_CO_TEST_1')['status'], 'Completed')
+
+    def test_duplicate_and_late_callbacks_are_idempotent(self):
+        self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.post_callback(_callback_body('ws_CO_TEST_1', result_code=1032))
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(MpesaCallback.objects.filter(status='duplicate').count(), 2)
+
+    def test_late_success_upgrades_failed_payment(self):
+        self.post_callback(_callback_body('ws_CO_TEST_1', result_code=1032))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Failed')
+
+        self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+
+    def test_malformed_callback_is_stored_and_marked_failed(self):
+        response = self.post_callback('not json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MpesaCallback.objects.get().status, 'failed')
+
+    def test_only_transient_database_errors_are_retried(self):
+        # The receipt number is unique, so this callback can never be applied
+        Payment.objects.create(student=self.student, amount=10, phone_number='0712345678',
+                               status='Completed', transaction_id='QWE123RTY')
+        self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.assertEqual(MpesaCallback.objects.get().status, 'failed')
+        self.assertEqual(process_pending_callbacks(), 0)
+
+        MpesaCallback.objects.all().delete()
+        with patch('hms.payments.apply_result', side_effect=OperationalError('database is locked')):
+            self.post_callback(_callback_body('ws_CO_TEST_1', receipt='NEW123'))
+        self.assertEqual(MpesaCallback.objects.get().status, 'pending')
+        self.assertEqual(process_pending_callbacks(), 1)
+        self.assertEqual(MpesaCallback.objects.get().status, 'processed')
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_inbox_is_drained_by_worker(self):
+        self.client.post(reverse('hms:mpesa_callback'), _callback_body('ws_CO_TEST_1'), content_type='application/json')
+        self.assertEqual(process_pending_callbacks(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+
+    def test_status_poll_reads_cache(self):
+        self.post_callback(_callback_body('ws_CO_TEST_1'))
+        self.client.login(username='payer', password='password123')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('hms:payment_status_api', args=['ws_CO_TEST_1']))
+        self.assertEqual(response.json()['status'], 'Completed')
+        self.assertFalse([q for q in ctx.captured_queries if 'hms_payment' in q['sql']])
+
+
+class ReconcilePaymentsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='payer', password='password123')
+        student = Student.objects.get(user=user)
+        old = timezone.now() - timedelta(hours=1)
+        self.paid = Payment.objects.create(student=student, amount=100, phone_number='0712345678', checkout_request_id='ws_CO_PAID')
+        self.cancelled = Payment.objects.create(student=student, amount=100, phone_number='0712345678', checkout_request_id='ws_CO_CANCEL')
+        self.in_flight = Payment.objects.create(student=student, amount=100, phone_number='0712345678', checkout_request_id='ws_CO_WAIT')
+        Payment.objects.filter(pk__in=[self.paid.pk, self.cancelled.pk, self.in_flight.pk]).update(created_at=old)
+        self.fresh = Payment.objects.create(student=student, amount=100, phone_number='0712345678', checkout_request_id='ws_CO_FRESH')
+
+    def fake_query(self, checkout_request_id):
+        codes = {'ws_CO_PAID': '0', 'ws_CO_CANCEL': '1032', 'ws_CO_WAIT': '4999'}
+        return {'ResponseCode': '0', 'ResultCode': codes[checkout_request_id], 'ResultDesc': 'desc'}
+
+    def test_stale_payments_are_settled_in_bulk(self):
+        with patch('hms.mpesa.MpesaClient.stk_push_query', side_effect=self.fake_query):
+            call_command('reconcile_payments', '--rate', '0', stdout=StringIO())
+
+        statuses = dict(Payment.objects.values_list('checkout_request_id', 'status'))
+        self.assertEqual(statuses, {
+            'ws_CO_PAID': 'Completed', 'ws_CO_CANCEL': 'Failed',
+            'ws_CO_WAIT': 'Pending', 'ws_CO_FRESH': 'Pending',
+        })
+        self.assertEqual(get_cached_status('ws_CO_PAID')['status'], 'Completed')
+
+    def test_dry_run_changes_nothing(self):
+        with patch('hms.mpesa.MpesaClient.stk_push_query', side_effect=self.fake_query):
+            summary = reconcile_pending_payments(rate=0, dry_run=True)
+        self.assertEqual((summary['completed'], summary['failed'], summary['still_pending']), (1, 1, 1))
+        self.assertEqual(Payment.objects.filter(status='Pending').count(), 4)
@@ -0,0 +1,64 @@
+from unittest import mock
+from django.test import TestCase
+from django.contrib.auth.models import User
+from hms.models import InboundMessage, Student, StaffProfile
+from hms.mpesa import MpesaClient
+from hms.notifications import NotificationService
+from hms.phones import msisdn, to_e164
+from hms.utils.helpers import format_phone_number
+from hms.utils.notifications import format_phone
+from hms.whatsapp import process_message
+
+
+class PhoneNormaliserTest(TestCase):
+    def test_common_formats_share_one_e164_form(self):
+        for raw in ['0712 345 678', '0712-345-678', '712345678', '254712345678', '+254 712 345 678',
+                    '00254712345678', 'whatsapp:+254712345678']:
+            self.assertEqual(to_e164(raw), '+254712345678', raw)
+        self.assertEqual(to_e164('+44 20 7946 0958'), '+442079460958')
+        for raw in ['', None, '12345', 'not a phone', '07123']:
+            self.assertEqual(to_e164(raw), '', raw)
+        self.assertEqual(msisdn('0712345678'), '254712345678')
+
+    def test_legacy_formatters_agree(self):
+        self.assertEqual(format_phone('0712 345 678'), '+254712345678')
+        self.assertEqual(NotificationService.format_phone('254712345678'), '+254712345678')
+        self.assertIsNone(format_phone(''))
+        self.assertEqual(format_phone_number('+254 712 345 678'), '254712345678')
+
+    def test_stk_push_sends_msisdn(self):
+        client = MpesaClient()
+        with mock.patch.object(client, 'get_token', return_value='token'), \
+                mock.patch.object(client, '_post', return_value={'ResponseCode': '0'}) as post:
+            client.stk_push('0712 345 678', 100, 'ref', 'https://example.com/cb')
+        payload = post.call_args.args[2]
+        self.assertEqual((payload['PartyA'], payload['PhoneNumber']), ('254712345678', '254712345678'))
+
+
+class PhoneColumnTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='amina', first_name='Amina')
+        self.student = self.user.student_profile
+
+    def test_save_keeps_phone_e164_in_sync(self):
+        self.student.phone = '0712 345 678'
+        self.student.save(update_fields=['phone'])
+        self.assertEqual(Student.objects.get(pk=self.student.pk).phone_e164, '+254712345678')
+
+        staff = StaffProfile.objects.create(user=User.objects.create_user(username='guard'), role='warden',
+                                            national_id='12345678', phone='254798765432')
+        self.assertEqual(staff.phone_e164, '+254798765432')
+
+    def test_whatsapp_sender_is_found_by_exact_phone(self):
+        self.student.phone = '0712345678'
+        self.student.save()
+        other = User.objects.create_user(username='other').student_profile
+        other.phone = '+255712345678'  # same last nine digits; the old substring lookup could pick it
+        other.save()
+
+        for sender, expected in [('whatsapp:+254712345678', self.student), ('whatsapp:+254700000000', None)]:
+            message = InboundMessage.objects.create(sender=sender, text='help')
+            with mock.patch('hms.whatsapp.get_reply_client'):
+                process_message(message.pk)
+            message.refresh_from_db()
+            self.assertEqual(message.student, expected)
@@ -0,0 +1,100 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from hms.booking import book_bed
+from hms.models import Student, Room, RoomAssignment, RoomChangeRequest, Notification
+from hms.room_swaps import approve_swap_cycles, find_swap_cycles
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class RoomSwapTest(TestCase):
+    def setUp(self):
+        self.rooms = {n: Room.objects.create(room_number=n, floor=1, capacity=2) for n in ('A', 'B', 'C', 'D')}
+        self.students = {}
+
+    def place(self, name, room, gender='female'):
+        user = User.objects.create_user(username=name, password='password123')
+        student = Student.objects.get(user=user)
+        student.gender = gender
+        student.save()
+        book_bed(student, self.rooms[room])
+        self.students[name] = student
+        return student
+
+    def ask(self, name, room):
+        student = self.students[name]
+        return RoomChangeRequest.objects.create(student=student, requested_room=self.rooms[room], reason='swap')
+
+    def keys(self, cycles):
+        return sorted(sorted(r.student.user.username for r in c.requests) for c in cycles)
+
+    def test_finds_pairs_and_three_way_cycles(self):
+        for name, room in [('ann', 'A'), ('bea', 'B'), ('cat', 'C'), ('dee', 'D'), ('eve', 'A')]:
+            self.place(name, room)
+        self.ask('ann', 'B')
+        self.ask('bea', 'A')
+        self.ask('cat', 'D')
+        self.ask('dee', 'A')
+        self.ask('eve', 'C')
+        cycles = find_swap_cycles()
+        self.assertEqual(self.keys(cycles), [['ann', 'bea'], ['cat', 'dee', 'eve']])
+        self.assertEqual([len(c) for c in cycles], [2, 3])
+
+    def test_unmatched_and_cross_gender_requests_are_left_alone(self):
+        self.place('ann', 'A')
+        self.place('bob', 'B', gender='male')
+        self.place('cat', 'C')
+        self.ask('ann', 'B')
+        self.ask('bob', 'A')
+        self.ask('cat', 'D')
+        self.assertEqual(find_swap_cycles(), [])
+
+    def test_approval_swaps_beds_in_one_go(self):
+        ann, bea = self.place('ann', 'A'), self.place('bea', 'B')
+        bea_bed = RoomAssignment.objects.get(student=bea, is_active=True).bed_number
+        first, second = self.ask('ann', 'B'), self.ask('bea', 'A')
+        reviewer = User.objects.create_superuser(username='warden', password='password123')
+
+        approved, skipped = approve_swap_cycles([[first.pk, second.pk]], reviewed_by=reviewer)
+
+        self.assertEqual((len(approved), skipped), (1, []))
+        active = RoomAssignment.objects.get(student=ann, is_active=True)
+        self.assertEqual((active.room, active.bed_number), (self.rooms['B'], bea_bed))
+        self.assertEqual(RoomAssignment.objects.get(student=bea, is_active=True).room, self.rooms['A'])
+        ann.refresh_from_db()
+        self.assertEqual(ann.room_number, 'B')
+        self.assertEqual(set(RoomChangeRequest.objects.values_list('status', flat=True)), {'approved'})
+        self.assertEqual(Notification.objects.filter(title='Room Change Approved').count(), 2)
+        for room in (self.rooms['A'], self.rooms['B']):
+            room.refresh_from_db()
+            self.assertEqual(room.occupied_beds, 1)
+
+    def test_stale_cycle_is_skipped(self):
+        self.place('ann', 'A')
+        self.place('bea', 'B')
+        first, second = self.ask('ann', 'B'), self.ask('bea', 'A')
+        book_bed(self.students['bea'], self.rooms['C'])
+
+        approved, skipped = approve_swap_cycles([[first.pk, second.pk]])
+        self.assertEqual((approved, skipped), ([], [[first.pk, second.pk]]))
+        self.assertEqual(RoomChangeRequest.objects.filter(status='pending').count(), 2)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_bulk_approval_view(self):
+        self.place('ann', 'A')
+        self.place('bea', 'B')
+        first, second = self.ask('ann', 'B'), self.ask('bea', 'A')
+        client = Client()
+        client.force_login(User.objects.create_superuser(username='warden', password='password123'))
+
+        response = client.get(reverse('hms:room_change_requests'))
+        self.assertContains(response, reverse('hms:room_swap_matches'))
+        response = client.get(reverse('hms:room_swap_matches'))
+        self.assertContains(response, f'value="{first.pk},{second.pk}"')
+
+        client.post(reverse('hms:room_swap_matches'), {'cycle': [f'{first.pk},{second.pk}']})
+        self.assertFalse(RoomChangeRequest.objects.filter(status='pending').exists())
@@ -0,0 +1,96 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from hms.booking import book_bed
+from hms.models import Student, Room, RoomAssignment
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class RoomOccupancyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='warden', password='password123')
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.rooms = [
+            Room.objects.create(room_number='A101', block='A', floor=1, capacity=2),
+            Room.objects.create(room_number='A201', block='A', floor=2, capacity=1),
+            Room.objects.create(room_number='B101', block='B', floor=1, capacity=3),
+        ]
+        for i in range(3):
+            user = User.objects.create_user(username=f'occupant{i}', password='password123')
+            book_bed(Student.objects.get(user=user), self.rooms[0] if i < 2 else self.rooms[2])
+
+    def test_with_occupancy_annotates_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            rooms = {r.room_number: r for r in Room.objects.with_occupancy()}
+        self.assertEqual((rooms['A101'].active_count, rooms['A101'].free_beds), (2, 0))
+        self.assertEqual((rooms['A201'].active_count, rooms['A201'].available_beds), (0, 1))
+        self.assertEqual((rooms['B101'].active_count, rooms['B101'].free_beds), (1, 2))
+
+    def test_occupancy_summary(self):
+        summary = Room.objects.occupancy_summary()
+        self.assertEqual(summary['total_rooms'], 3)
+        self.assertEqual(summary['occupied_rooms'], 1)
+        self.assertEqual(summary['total_beds'], 6)
+        self.assertEqual(summary['occupied_beds'], 3)
+        self.assertEqual(summary['occupancy_rate'], 50.0)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_room_list_queries_do_not_grow_with_rooms(self):
+        self.client.get(reverse('hms:room_list'))  # warm per-request caches (feature flags)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('hms:room_list'))
+        Room.objects.bulk_create([Room(room_number=f'C{i}', block='C', floor=1) for i in range(30)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('hms:room_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_occupancy_map_groups_by_block_and_floor_and_is_cached(self):
+        response = self.client.get(reverse('hms:room_occupancy_map'))
+        data = response.json()
+        self.assertEqual(data['totals'], {'rooms': 3, 'capacity': 6, 'occupied': 3})
+        block_a = data['blocks'][0]
+        self.assertEqual(block_a['block'], 'A')
+        self.assertEqual([f['floor'] for f in block_a['floors']], [1, 2])
+        self.assertEqual(block_a['floors'][0]['rooms'][0]['occupied'], 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('hms:room_occupancy_map'))
+        self.assertFalse([q for q in ctx.captured_queries if 'hms_room' in q['sql']])
+
+    def test_occupancy_map_requires_warden_role(self):
+        User.objects.create_user(username='student', password='password123')
+        client = Client()
+        client.login(username='student', password='password123')
+        response = client.get(reverse('hms:room_occupancy_map'))
+        self.assertNotEqual(response.status_code, 200)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_admin_edits_keep_the_counter_in_step(self):
+        assignment = RoomAssignment.objects.get(student__user__username='occupant0')
+        url = reverse('admin:hms_roomassignment_change', args=[assignment.pk])
+        response = self.client.post(url, {
+            'room': self.rooms[1].pk, 'student': assignment.student_id, 'bed_number': 1,
+            'assigned_date': assignment.assigned_date.isoformat(), 'is_active': 'on', 'notes': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        occupied = dict(Room.objects.values_list('room_number', 'occupied_beds'))
+        self.assertEqual(occupied, {'A101': 1, 'A201': 1, 'B101': 1})
+        # A101 was full and has a free bed again; A201 is now full
+        self.assertEqual(dict(Room.objects.values_list('room_number', 'is_available')),
+                         {'A101': True, 'A201': False, 'B101': True})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.get(user__username='occupant2').user.delete()
+        summary = Room.objects.occupancy_summary()
+        rooms = {r.room_number: r.active_count for r in Room.objects.with_occupancy()}
+        self.assertEqual((summary['occupied_beds'], sum(rooms.values())), (2, 2))
@@ -0,0 +1,94 @@
+from datetime import date
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User, update_last_login
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from hms.models import Announcement, MaintenanceRequest, DefermentRequest, SearchDocument
+from hms.search import search, search_grouped
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice = User.objects.create_user(username='alice', first_name='Alice', last_name='Wanjiru',
+                                                  email='alice@example.com')
+            self.bob = User.objects.create_user(username='bob', first_name='Bob', last_name='Otieno')
+            self.staff = User.objects.create_user(username='warden', is_staff=True)
+            self.leak = MaintenanceRequest.objects.create(student=self.alice.student_profile, title='Water leak',
+                                                          description='Bathroom tap is leaking', location='Block A')
+            MaintenanceRequest.objects.create(student=self.bob.student_profile, title='Broken window',
+                                              description='Water comes in when it rains')
+            self.notice = Announcement.objects.create(title='Water outage', content='No water on Friday')
+            DefermentRequest.objects.create(student=self.bob.student_profile, start_date=date(2026, 1, 1),
+                                            end_date=date(2026, 2, 1), deferment_type='fee_challenges',
+                                            reason='Waiting for HELB')
+
+    def kinds(self, user, query):
+        return [(d.kind, d.title) for d in search(user, query)]
+
+    def test_ranked_with_title_hits_first(self):
+        results = self.kinds(self.staff, 'water')
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[-1], ('maintenance', 'Broken window'))
+
+    def test_prefix_and_accent_folding(self):
+        self.assertEqual(self.kinds(self.staff, 'ali wanj')[0], ('student', 'Alice Wanjiru'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.first_name = 'Alicé'
+            self.alice.save()
+        self.assertEqual(self.kinds(self.staff, 'alice')[0], ('student', 'Alicé Wanjiru'))
+
+    def test_students_only_see_public_and_their_own(self):
+        self.assertEqual(sorted(self.kinds(self.alice, 'water')),
+                         [('announcement', 'Water outage'), ('maintenance', 'Water leak')])
+        self.assertEqual(self.kinds(self.alice, 'otieno'), [])
+        self.assertEqual(self.kinds(self.bob, 'helb'), [('deferment', 'Fee Challenges - Bob Otieno')])
+
+    def test_signals_keep_documents_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notice.is_active = False
+            self.notice.save()
+            self.leak.delete()
+        self.assertEqual(self.kinds(self.alice, 'water'), [])
+
+    def test_only_name_and_email_changes_reindex_students(self):
+        with mock.patch('hms.signals.index_student') as index_student, \
+                self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, self.alice)
+            self.alice.save()
+        index_student.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.last_name = 'Kamau'
+            self.alice.save()
+        self.assertIn(('student', 'Alice Kamau'), self.kinds(self.staff, 'kamau'))
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        Announcement.objects.filter(pk=self.notice.pk).update(title='Power outage')
+        call_command('rebuild_search_index', stdout=open('/dev/null', 'w'))
+        self.assertEqual(SearchDocument.objects.filter(kind='announcement').get().title, 'Power outage')
+        self.assertEqual(SearchDocument.objects.count(), 3 + 3 + 1)
+
+    def test_grouped_results_take_few_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            groups = search_grouped(self.staff, 'water')
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+        self.assertEqual([m.title for m in groups['maintenance']], ['Water leak', 'Broken window'])
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGE)
+    def test_search_page(self):
+        client = Client()
+        client.force_login(self.alice)
+        response = client.get(reverse('hms:global_search'), {'q': 'water'})
+        self.assertContains(response, 'Water outage')
+        self.assertContains(response, 'Bathroom tap')
+        self.assertNotContains(response, 'Water comes in')
@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError
+from django.urls import reverse
+from django.utils import timezone
+from hms import whatsapp
+from hms.models import DefermentRequest, InboundMessage, LedgerEntry
+from hms.ledger import post_entries
+from hms.student_summary import get_summary
+from hms.whatsapp import process_pending_messages
+
+
+@override_settings(AFRICASTALKING_API_KEY='key', AFRICASTALKING_USERNAME='campus')
+class WhatsAppWebhookTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        whatsapp._client = None
+        self.student = User.objects.create_user(username='amina').student_profile
+        self.student.phone = '0712345678'
+        self.student.save()
+        self.url = reverse('hms:whatsapp_webhook')
+
+    def tearDown(self):
+        whatsapp._client = None
+
+    def post(self, text, message_id='ATXid_1'):
+        return Client().post(self.url, {'from': 'whatsapp:+254712345678', 'text': text, 'id': message_id})
+
+    def test_webhook_only_stores_the_message(self):
+        # get_or_create on the message id: a SELECT and an INSERT in a savepoint, nothing else
+        with mock.patch('hms.whatsapp.ReplyClient.send') as send, self.assertNumQueries(4):
+            response = self.post('balance')
+        self.assertEqual(response.status_code, 200)
+        send.assert_not_called()
+        message = InboundMessage.objects.get()
+        self.assertEqual((message.status, message.provider_message_id), ('pending', 'ATXid_1'))
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_message_is_answered_once_per_provider_id(self):
+        with mock.patch('hms.whatsapp.ReplyClient.send') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post('balance')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post('balance')  # provider retry
+        send.assert_called_once_with('+254712345678', 'You have no outstanding fee balance.')
+        message = InboundMessage.objects.get()
+        self.assertEqual((message.status, message.student), ('replied', self.student))
+
+    def test_replies_reuse_one_pooled_client(self):
+        self.post('help', 'a')
+        self.post('status', 'b')
+        with mock.patch('requests.Session.post') as session_post:
+            self.assertEqual(process_pending_messages(), 2)
+        self.assertEqual(session_post.call_count, 2)
+        self.assertEqual(session_post.call_args.args[0], 'https://api.africastalking.com/version1/messaging')
+        self.assertEqual(set(InboundMessage.objects.values_list('status', flat=True)), {'replied'})
+
+    def test_send_failures_are_recorded(self):
+        self.post('help')
+        with mock.patch('requests.Session.post', side_effect=ConnectionError('down')):
+            process_pending_messages()
+        message = InboundMessage.objects.get()
+        self.assertEqual((message.status, message.error), ('failed', 'down'))
+
+    def test_only_transient_errors_are_retried_and_replies_are_not_resent(self):
+        self.post('balance')
+        with mock.patch('hms.whatsapp.get_summary', side_effect=OperationalError('database is locked')):
+            process_pending_messages()
+        self.assertEqual(InboundMessage.objects.get().status, 'pending')
+        with mock.patch('hms.whatsapp.get_summary', side_effect=IntegrityError('bad row')):
+            process_pending_messages()
+        self.assertEqual(InboundMessage.objects.get().status, 'failed')
+
+        # The reply went out but the worker died before finishing: a later drain must not send it again
+        self.post('help', 'ATXid_2')
+        with mock.patch('hms.whatsapp.ReplyClient.send', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                process_pending_messages()
+        InboundMessage.objects.filter(provider_message_id='ATXid_2').update(processed_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('hms.whatsapp.ReplyClient.send') as send:
+            process_pending_messages()
+        send.assert_not_called()
+        self.assertEqual(InboundMessage.objects.get(provider_message_id='ATXid_2').status, 'replied')
+
+    def test_summaries_are_cached_and_dropped_on_change(self):
+        self.assertEqual(get_summary(self.student.pk)['balance'], 0)
+        with self.assertNumQueries(0):
+            get_summary(self.student.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post_entries([LedgerEntry(student=self.student, entry_type='charge', source='adjustment',
+                                      amount=Decimal('1500.00'))])
+            DefermentRequest.objects.create(student=self.student, start_date=date(2026, 1, 1),
+                                            end_date=date(2026, 2, 1), deferment_type='fee_challenges',
+                                            reason='HELB')
+        summary = get_summary(self.student.pk)
+        self.assertEqual((summary['balance'], summary['deferment']), (Decimal('1500.00'), 'Pending'))
+        self.assertIn('KES 1,500.00', whatsapp.reply_for(self.student, 'BALANCE'))
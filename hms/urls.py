@@ -15,11 +15,15 @@ urlpatterns = [
     
     # Global Search
     path('search/', views.global_search, name='global_search'),
+    path('search/students/', views.student_autocomplete, name='student_autocomplete'),
     
     # Student
     path('student/dashboard/', views.student_dashboard, name='student_dashboard'),
     path('student/profile/', views.student_profile, name='student_profile'),
     path('student/confirm-meals/', views.confirm_meals, name='confirm_meals'),
+    path('student/meal-plan/', views.meal_plan, name='meal_plan'),
+    path('student/meal-pass/', views.meal_pass, name='meal_pass'),
+    path('student/meal-pass/token/', views.meal_pass_token, name='meal_pass_token'),
     path('student/toggle-away/', views.toggle_away_mode, name='toggle_away'),
     path('student/early-breakfast/', views.toggle_early_breakfast, name='toggle_early_breakfast'),
     path('student/update-status/', views.update_student_status, name='update_student_status'),
@@ -38,6 +42,7 @@ urlpatterns = [
     path('staff-dashboard/deferment-officer/', views.deferment_officer_dashboard, name='deferment_officer_dashboard'),
     path('staff-dashboard/dept-mcs/', views.dept_mcs_dashboard, name='dept_mcs_dashboard'),
     path('staff-dashboard/health-manager/', views.health_manager_dashboard, name='health_manager_dashboard'),
+    path('staff-dashboard/kitchen-manager/', views.kitchen_manager_dashboard, name='kitchen_manager_dashboard'),
     path('staff-dashboard/maintenance-supervisor/', views.maintenance_supervisor_dashboard, name='maintenance_supervisor_dashboard'),
     path('staff-dashboard/finance-officer/', views.finance_officer_dashboard, name='finance_officer_dashboard'),
     path('staff-dashboard/news-editor/', views.news_editor_dashboard, name='news_editor_dashboard'),
@@ -48,6 +53,11 @@ urlpatterns = [
     
     # Admin Dashboard (Legacy/Generic)
     path('manage/dashboard/', views.dashboard_admin, name='admin_dashboard'),
+    path('manage/kitchen-board/', views.kitchen_board, name='kitchen_board'),
+    path('manage/kitchen-board/data/', views.kitchen_board_data, name='kitchen_board_data'),
+    path('manage/dining/scan/', views.dining_scanner, name='dining_scanner'),
+    path('manage/dining/scan/submit/', views.dining_scan, name='dining_scan'),
+    path('manage/dining/report/', views.dining_report_view, name='dining_report'),
     path('manage/super-admin/', views.super_admin_dashboard, name='super_admin_dashboard'),
     path('manage/feature-flags/', views.feature_flags_control_panel, name='feature_flags'),
     path('manage/feature-flags/update/', views.update_feature_flags_api, name='update_feature_flags_api'),
@@ -118,16 +128,18 @@ urlpatterns = [
     path('student/deferment/delete/<int:pk>/', views.delete_leave_request, name='delete_leave_request'),  # Keep old name
     
     # Admin Deferment Management with Status Filters
-    path('manage/deferment/all/', views.admin_deferment_all, name='admin_deferment_all'),
-    path('manage/deferment/pending/', views.admin_deferment_pending, name='admin_deferment_pending'),
-    path('manage/deferment/under-review/', views.admin_deferment_under_review, name='admin_deferment_under_review'),
-    path('manage/deferment/approved/', views.admin_deferment_approved, name='admin_deferment_approved'),
-    path('manage/deferment/rejected/', views.admin_deferment_rejected, name='admin_deferment_rejected'),
-    path('manage/deferment/resumed/', views.admin_deferment_resumed, name='admin_deferment_resumed'),
+    path('manage/deferment/', views.admin_deferments, name='admin_deferments'),
+    # Status shortcuts for the same workbench (older links and the sidebar)
+    path('manage/deferment/all/', views.admin_deferments, name='admin_deferment_all'),
+    path('manage/deferment/pending/', views.admin_deferments, {'status': 'pending'}, name='admin_deferment_pending'),
+    path('manage/deferment/under-review/', views.admin_deferments, {'status': 'under_review'}, name='admin_deferment_under_review'),
+    path('manage/deferment/approved/', views.admin_deferments, {'status': 'approved'}, name='admin_deferment_approved'),
+    path('manage/deferment/rejected/', views.admin_deferments, {'status': 'rejected'}, name='admin_deferment_rejected'),
+    path('manage/deferment/resumed/', views.admin_deferments, {'status': 'resumed'}, name='admin_deferment_resumed'),
     path('manage/deferment/review/<int:pk>/', views.review_deferment, name='review_deferment'),
     
     # Legacy URLs (redirect to new deferment URLs)
-    path('manage/leave/', views.admin_deferment_all, name='manage_leave_requests'),
+    path('manage/leave/', views.admin_deferments, name='manage_leave_requests'),
     path('manage/leave/approve/<int:pk>/', views.review_deferment, name='approve_leave_request'),
 
 
@@ -138,8 +150,12 @@ urlpatterns = [
     path('manage/rooms/delete/<int:pk>/', views.delete_room, name='delete_room'),
     path('manage/rooms/assignments/', views.room_assignments, name='room_assignments'),
     path('manage/rooms/assign/', views.assign_room, name='assign_room'),
+    path('manage/rooms/allocate/', views.batch_allocate_rooms, name='batch_allocate_rooms'),
+    path('manage/rooms/occupancy/', views.room_occupancy, name='room_occupancy'),
+    path('manage/rooms/occupancy/map/', views.room_occupancy_map, name='room_occupancy_map'),
     path('manage/rooms/change-requests/', views.room_change_requests, name='room_change_requests'),
     path('manage/rooms/change-requests/approve/<int:pk>/', views.approve_room_change, name='approve_room_change'),
+    path('manage/rooms/change-requests/swaps/', views.room_swap_matches, name='room_swap_matches'),
     path('student/room-change/', views.student_request_room_change, name='student_request_room_change'),
 
     # Analytics Dashboard
@@ -215,6 +231,7 @@ urlpatterns = [
     path('student/payment-history/', views.payment_history, name='payment_history'),
     path('payment/callback/', views.mpesa_callback, name='mpesa_callback'),
     path('payment/check/<int:payment_id>/', views.check_payment_status, name='check_payment_status'),
+    path('payment/status/<str:checkout_id>/', views.payment_status_api, name='payment_status_api'),
     
     # Registration & Subscription Flow
     path('registration/check-status/<str:checkout_id>/', views.check_registration_status, name='check_registration_status'),
@@ -2,10 +2,11 @@
 Helper utility functions for Student Welfare Management System (SWMS)
 Provides common reusable functions used across the application
 """
+from django.conf import settings
 from django.contrib import messages
 from django.utils import timezone
 from datetime import datetime, timedelta
-import re
+from hms.phones import msisdn
 
 
 def get_user_role(user):
@@ -47,22 +48,7 @@ def format_phone_number(phone):
     Returns:
         str: Formatted phone number or original if invalid
     """
-    # Remove any spaces, dashes, or parentheses
-    phone = re.sub(r'[\s\-\(\)]', '', str(phone))
-    
-    # Handle different formats
-    if phone.startswith('0'):
-        phone = '254' + phone[1:]
-    elif phone.startswith('+254'):
-        phone = phone[1:]
-    elif phone.startswith('254'):
-        pass  # Already in correct format
-    
-    # Validate length (should be 12 digits: 254XXXXXXXXX)
-    if len(phone) == 12 and phone.startswith('254'):
-        return phone
-    
-    return phone  # Return as-is if we can't format
+    return msisdn(phone) or str(phone)
 
 
 def get_client_ip(request):
@@ -83,6 +69,30 @@ def get_client_ip(request):
     return ip
 
 
+def get_trusted_client_ip(request):
+    """
+    Get the client's IP address as recorded by our own proxies
+
+    Each of the settings.NUM_PROXIES proxies in front of the app appends the
+    address it received the request from to X-Forwarded-For, so the client
+    is that many entries from the right; anything further left was sent by
+    the client and cannot be trusted. With no proxies REMOTE_ADDR is used.
+    Use this wherever the address is a security key (throttling).
+
+    Args:
+        request: Django request object
+
+    Returns:
+        str: IP address
+    """
+    num_proxies = getattr(settings, 'NUM_PROXIES', 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if num_proxies and x_forwarded_for:
+        addresses = [address.strip() for address in x_forwarded_for.split(',')]
+        return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR')
+
+
 def is_within_timeframe(start_time, end_time, check_time=None):
     """
     Check if current time (or provided time) is within a timeframe
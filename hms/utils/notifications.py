@@ -1,6 +1,7 @@
 import os
 import africastalking
 from django.conf import settings
+from hms.phones import to_e164
 
 
 def get_at_client():
@@ -14,15 +15,8 @@ def get_at_client():
 
 
 def format_phone(phone):
-    """Convert phone number to international format (+254...)"""
-    if not phone:
-        return None
-    phone = phone.strip().replace(' ', '').replace('-', '')
-    if phone.startswith('0') and len(phone) == 10:
-        return '+254' + phone[1:]
-    if phone.startswith('254') and not phone.startswith('+'):
-        return '+' + phone
-    return phone
+    """Convert phone number to international format (+254...), or None if it is not one"""
+    return to_e164(phone) or None
 
 
 def send_sms(phone_number, message):
@@ -120,7 +114,7 @@ def notify_emergency(phone_numbers, message):
     if not at:
         print(f"[EMERGENCY SMS SKIPPED] Not configured.")
         return False
-    phones = [format_phone(p) for p in phone_numbers if p]
+    phones = [phone for phone in map(format_phone, phone_numbers) if phone]
     if not phones:
         return False
     sms = at.SMS
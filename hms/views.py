@@ -9,11 +9,11 @@ from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Q
-from .models import (Student, Meal, Activity, AwayPeriod, Announcement, Document, MaintenanceRequest,
+from .models import (Student, Meal, Activity, Announcement, Document, MaintenanceRequest,
                      Message, AuditLog,
                      LeaveRequest, DefermentRequest, Visitor, EmergencyAlert,
                      Room, RoomAssignment, RoomChangeRequest, Payment, Notification, LoginActivity, LostItem, StaffProfile, StaffInvitation, StudentInvitation,
-                     AdminSubscription, RegistrationPayment, TutoringPost, HealthAppointment)
+                     AdminSubscription, RegistrationPayment, TutoringPost, HealthAppointment, MealServing)
 from .decorators import (
     role_required, permission_required, staff_only, admin_only,
     super_admin_required, welfare_officer_required,
@@ -29,7 +29,7 @@ from .forms import (
     LeaveRequestForm, DefermentRequestForm, LeaveApprovalForm, VisitorForm, AnnouncementForm, LostItemForm,
     HealthAppointmentForm, HealthStaffUpdateForm
 )
-from datetime import date, datetime, time, timedelta
+from datetime import date, datetime, timedelta
 from django.db import transaction, models
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
@@ -38,6 +38,25 @@ from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse
 import json
 from .mpesa import MpesaClient
+from .payments import (record_callback, process_callback, apply_result, publish_status,
+                       get_cached_status, is_final_result)
+from .tasks import run_async
+from . import ledger, login_throttle
+from .booking import book_bed, RoomFull, sync_room_occupancy, get_occupancy_map
+from .away import away_counts, get_away_index, is_away, mark_away, students_away_on
+from .meal_plans import breakfast_locked, planned_counts
+from .meal_counters import board_snapshot, get_counts as get_meal_counts
+from .forecasting import MEALS, forecast_table
+from .meal_reminders import send_meal_reminders, unconfirmed_students
+from .search import search_grouped
+from .autocomplete import matching_students, suggest as suggest_students
+from .phones import msisdn
+from .whatsapp import process_message as process_whatsapp_message, record_message
+from .dining import InvalidPass, dining_report, make_token, qr_png_base64, record_scan
+from .meal_archive import (attendance as meal_attendance, daily_totals as daily_meal_totals, first_meal_date,
+                           meals_on)
+from .deferments import (DECISIONS as DEFERMENT_DECISIONS, STATUSES as DEFERMENT_STATUSES, decide as decide_deferments,
+                         deferment_page, status_counts as deferment_status_counts)
 
 # ==================== Authentication ====================
 ROLE_BANNERS = {
@@ -194,7 +213,7 @@ def register_student(request):
                     messages.success(request, f"Student {student.user.get_full_name()} registered successfully!")
                     return redirect('hms:dashboard_redirect')
                 else:
-                    login(request, student.user, backend='django.contrib.auth.backends.ModelBackend')
+                    login(request, student.user, backend='hms.backends.EmailBackend')
                     messages.success(request, "Registration successful! Welcome to Campus Care.")
                     try:
                         from .notifications import notify_welcome
@@ -219,6 +238,9 @@ def register_student(request):
 
 def check_registration_status(request, checkout_id):
     """AJAX view to poll registration payment status"""
+    state = get_cached_status(checkout_id)
+    if state and state['status'] == 'Pending':
+        return JsonResponse({'status': 'Pending'})
     payment = get_object_or_404(RegistrationPayment, checkout_request_id=checkout_id)
     if payment.status == 'Completed':
         # Create the user here once payment is confirmed
@@ -232,7 +254,8 @@ def check_registration_status(request, checkout_id):
                         student = form.save()
                         payment.temp_user_data = None # Clear data after use
                         payment.save()
-                    login(request, student.user, backend='django.contrib.auth.backends.ModelBackend')
+                        ledger.record_registration_fee(student, payment)
+                    login(request, student.user, backend='hms.backends.EmailBackend')
                     return JsonResponse({'status': 'Success', 'redirect_url': reverse('hms:student_dashboard')})
                 except Exception as e:
                     return JsonResponse({'status': 'Error', 'message': str(e)})
@@ -246,58 +269,6 @@ def check_registration_status(request, checkout_id):
     
     return JsonResponse({'status': 'Pending'})
 
-@csrf_exempt
-def mpesa_callback(request):
-    """Handle STK Push callbacks from Safaricom"""
-    try:
-        data = json.loads(request.body)
-        stk_callback = data.get('Body', {}).get('stkCallback', {})
-        result_code = stk_callback.get('ResultCode')
-        checkout_id = stk_callback.get('CheckoutRequestID')
-        
-        if result_code == 0:
-            # Payment Success
-            # Use metadata to get the transaction ID
-            metadata = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-            transaction_id = next((item['Value'] for item in metadata if item['Name'] == 'MpesaReceiptNumber'), None)
-            
-            # Update RegistrationPayment
-            reg_payment = RegistrationPayment.objects.filter(checkout_request_id=checkout_id).first()
-            if reg_payment:
-                reg_payment.status = 'Completed'
-                reg_payment.transaction_id = transaction_id
-                reg_payment.save()
-            
-            # Update AdminSubscription
-            admin_sub = AdminSubscription.objects.filter(checkout_request_id=checkout_id).first()
-            if admin_sub:
-                admin_sub.status = 'Active'
-                admin_sub.transaction_id = transaction_id
-                admin_sub.last_payment_date = timezone.now()
-                expiry_days = 365 if admin_sub.billing_cycle == 'annual' else 30
-                admin_sub.expiry_date = timezone.now() + timedelta(days=expiry_days)
-                admin_sub.save()
-                # Clear system lock cache if implemented
-                from django.core.cache import cache
-                cache.delete('system_subscription_active')
-        else:
-            # Payment Failed
-            reg_payment = RegistrationPayment.objects.filter(checkout_request_id=checkout_id).first()
-            if reg_payment:
-                reg_payment.status = 'Failed'
-                reg_payment.save()
-                
-            admin_sub = AdminSubscription.objects.filter(checkout_request_id=checkout_id).first()
-            if admin_sub:
-                admin_sub.status = 'Failed'
-                admin_sub.save()
-                
-    except Exception as e:
-        print(f"Callback processing error: {e}")
-        
-    return HttpResponse("OK")
-
-
 def register_staff(request):
     """
     Handle staff registration logic.
@@ -399,7 +370,12 @@ def user_login(request):
             else:
                 return redirect('hms:dashboard_redirect')
         else:
-            messages.error(request, 'Invalid email or password.')
+            login_name = request.POST.get('username', '')
+            wait = login_throttle.retry_after(request, login_name, login_throttle.find_user(login_name))
+            if wait:
+                messages.error(request, f'Too many failed login attempts. Please try again in {wait} seconds.')
+            else:
+                messages.error(request, 'Invalid email or password.')
     else:
         form = AuthenticationForm()
     
@@ -416,63 +392,6 @@ def terms_and_conditions(request):
     """Terms and Conditions page"""
     return render(request, 'hms/terms.html')
 
-@login_required
-def global_search(request):
-    """Global search across students, announcements, and maintenance requests"""
-    query = request.GET.get('q', '').strip()
-    
-    context = {
-        'query': query,
-        'students': [],
-        'announcements': [],
-        'maintenance': [],
-        'total_count': 0,
-    }
-    
-    if query:
-        # Search students (admin only)
-        if request.user.is_staff:
-            students = Student.objects.filter(
-                Q(user__first_name__icontains=query) |
-                Q(user__last_name__icontains=query) |
-                Q(university_id__icontains=query) |
-                Q(phone__icontains=query)
-            ).select_related('user')[:10]
-            context['students'] = students
-        
-        # Search announcements
-        announcements = Announcement.objects.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query),
-            is_active=True
-        ).order_by('-created_at')[:10]
-        context['announcements'] = announcements
-        
-        # Search maintenance requests (own requests for students, all for admin)
-        if request.user.is_staff:
-            maintenance = MaintenanceRequest.objects.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(location__icontains=query)
-            ).select_related('student__user').order_by('-created_at')[:10]
-        else:
-            try:
-                student = request.user.student_profile
-                maintenance = MaintenanceRequest.objects.filter(
-                    student=student
-                ).filter(
-                    Q(title__icontains=query) |
-                    Q(description__icontains=query) |
-                    Q(location__icontains=query)
-                ).order_by('-created_at')[:10]
-            except Student.DoesNotExist:
-                maintenance = []
-        
-        context['maintenance'] = maintenance
-        context['total_count'] = len(context['students']) + len(context['announcements']) + len(context['maintenance'])
-    
-    return render(request, 'hms/search_results.html', context)
-
 @login_required
 def dashboard_redirect(request):
     """Unified redirect for staff dashboards based on role"""
@@ -599,31 +518,22 @@ def student_dashboard(request):
     tomorrow = today + timedelta(days=1)
     
     # Check if currently away
-    is_away_today = AwayPeriod.objects.filter(student=student, start_date__lte=today, end_date__gte=today).exists()
-    is_away_tomorrow = AwayPeriod.objects.filter(student=student, start_date__lte=tomorrow, end_date__gte=tomorrow).exists()
-
-    # Get meal status for today and tomorrow
-    meal_today, _ = Meal.objects.get_or_create(student=student, date=today)
-    if is_away_today and not meal_today.away:
-         # Auto-correct to away if valid period exists
-         meal_today.away = True
-         meal_today.breakfast = False
-         meal_today.early = False
-         meal_today.supper = False
-         meal_today.save()
-
-    meal_tomorrow, _ = Meal.objects.get_or_create(student=student, date=tomorrow)
-    if is_away_tomorrow and not meal_tomorrow.away:
-         meal_tomorrow.away = True
-         meal_tomorrow.breakfast = False
-         meal_tomorrow.early = False
-         meal_tomorrow.supper = False
-         meal_tomorrow.save()
+    away_index = get_away_index()
+    is_away_today = away_index.is_away(student.pk, today)
+    is_away_tomorrow = away_index.is_away(student.pk, tomorrow)
+
+    # Get meal status for today and tomorrow; days without a row are shown unsaved
+    meals = {meal.date: meal for meal in Meal.objects.filter(student=student, date__in=[today, tomorrow])}
+    meal_today = meals.get(today) or Meal(student=student, date=today)
+    meal_tomorrow = meals.get(tomorrow) or Meal(student=student, date=tomorrow)
+    for meal, away in ((meal_today, is_away_today), (meal_tomorrow, is_away_tomorrow)):
+        if away:
+            # Away is implicit; show no meals whatever an older row says
+            meal.away = True
+            meal.breakfast = meal.early = meal.supper = False
     
     # Check lock time for UI display
-    now = timezone.now()
-    lock_time = time(8, 0)
-    is_locked = (now.time() > lock_time)
+    is_locked = breakfast_locked(today)
 
     # Away Mode Form
     away_form = AwayModeForm()
@@ -631,18 +541,12 @@ def student_dashboard(request):
     # === QUICK STATS CALCULATIONS ===
     # 1. Meals This Week
     week_ago = today - timedelta(days=7)
-    meals_this_week = Meal.objects.filter(
-        student=student,
-        date__gte=week_ago,
-        date__lte=today
-    ).aggregate(
-        total=models.Count('id', filter=models.Q(breakfast=True) | models.Q(early=True) | models.Q(supper=True))
-    )['total'] or 0
+    meals_this_week = meal_attendance(student.pk, week_ago, today)['meals']
     
     # 2. Days in Hostel (from first meal date or profile creation)
-    first_meal = Meal.objects.filter(student=student).order_by('date').first()
+    first_meal = first_meal_date(student.pk)
     if first_meal:
-        days_in_hostel = (today - first_meal.date).days
+        days_in_hostel = (today - first_meal).days
     else:
         days_in_hostel = 0
     
@@ -739,22 +643,7 @@ def student_profile(request):
     meal_history = student.meals.filter(date__gte=date.today()).order_by('date')[:10]
     
     # Generate QR code for student ID
-    import qrcode
-    import io
-    import base64
-    
-    qr_code_data = None
-    if student.university_id:
-        qr = qrcode.QRCode(version=1, box_size=10, border=2)
-        qr.add_data(student.university_id)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64 for embedding in template
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        qr_code_data = base64.b64encode(buffer.getvalue()).decode()
+    qr_code_data = qr_png_base64(student.university_id) if student.university_id else None
     
     # Payment summary (mock data - no Payment model exists yet)
     payment_summary = {
@@ -792,21 +681,16 @@ def confirm_meals(request):
         meal_date = datetime.strptime(meal_date_str, '%Y-%m-%d').date()
 
         # Check away status first
-        if AwayPeriod.objects.filter(student=student, start_date__lte=meal_date, end_date__gte=meal_date).exists():
+        if is_away(student, meal_date):
             messages.error(request, "You are marked as away for this date. Change your 'Away Mode' settings first.")
             return redirect('hms:student_dashboard')
         
-        # Enforce 8:00 AM Lock for breakfast/early
-        now = timezone.now()
-        current_time = now.time()
-        lock_time = time(8, 0)
-        is_today = (meal_date == date.today())
-        
         breakfast = request.POST.get('breakfast') == 'on'
         early = request.POST.get('early') == 'on'
         supper = request.POST.get('supper') == 'on'
         
-        if is_today and current_time > lock_time:
+        # Enforce 8:00 AM Lock for breakfast/early
+        if breakfast_locked(meal_date):
             # Cannot change breakfast/early settings after lock time
             existing, _ = Meal.objects.get_or_create(student=student, date=meal_date)
             breakfast = existing.breakfast
@@ -830,6 +714,30 @@ def confirm_meals(request):
         
     return redirect('hms:student_dashboard')
 
+@login_required
+def meal_plan(request):
+    """Week-ahead meal planner; the page talks to the meal plan API"""
+    if not hasattr(request.user, 'student_profile'):
+        return redirect('hms:dashboard_redirect')
+    return render(request, 'hms/student/meal_plan.html')
+
+@login_required
+def meal_pass(request):
+    """The student's rotating QR meal pass, scanned at the dining hall"""
+    if not hasattr(request.user, 'student_profile'):
+        return redirect('hms:dashboard_redirect')
+    return render(request, 'hms/student/meal_pass.html')
+
+@login_required
+def meal_pass_token(request):
+    """Current meal pass QR (the page polls this as the token rotates)"""
+    if not hasattr(request.user, 'student_profile'):
+        return JsonResponse({'error': 'Only students have a meal pass.'}, status=403)
+    token, expires_in = make_token(request.user.student_profile.pk)
+    response = JsonResponse({'qr': qr_png_base64(token), 'expires_in': expires_in})
+    response['Cache-Control'] = 'no-store'
+    return response
+
 @login_required
 def toggle_away_mode(request):
     if request.method == 'POST':
@@ -837,20 +745,9 @@ def toggle_away_mode(request):
         if form.is_valid():
             try:
                 student = request.user.student_profile
-                away_period = form.save(commit=False)
-                away_period.student = student
-                away_period.save()
-                
-                # Auto-update meals in this range to Away=True, Others=False
-                cur_date = away_period.start_date
-                while cur_date <= away_period.end_date:
-                    Meal.objects.update_or_create(
-                        student=student,
-                        date=cur_date,
-                        defaults={'away': True, 'breakfast': False, 'early': False, 'supper': False}
-                    )
-                    cur_date += timedelta(days=1)
-                    
+                # Away days need no Meal rows; meals already chosen in the range are cleared
+                away_period = mark_away(student, form.cleaned_data['start_date'], form.cleaned_data['end_date'])
+
                 messages.success(request, f"Away mode set from {away_period.start_date} to {away_period.end_date}")
             except Exception as e:
                  messages.error(request, f"Error setting away mode: {str(e)}")
@@ -882,23 +779,12 @@ def dashboard_admin(request):
     # Auto-redirect for student attempting to access admin url handled by decorator (or 403)
 
     
-    today = date.today()
+    today = timezone.localdate()
     tomorrow = today + timedelta(days=1)
     
-    # Counts for Today
-    today_stats = {
-        'breakfast': Meal.objects.filter(date=today, breakfast=True).count(),
-        'early': Meal.objects.filter(date=today, early=True).count(),
-        'supper': Meal.objects.filter(date=today, supper=True).count(),
-        'away': Meal.objects.filter(date=today, away=True).count(),
-    }
-    
-    # Counts for Tomorrow
-    tomorrow_stats = {
-        'breakfast': Meal.objects.filter(date=tomorrow, breakfast=True).count(),
-        'early': Meal.objects.filter(date=tomorrow, early=True).count(),
-        'supper': Meal.objects.filter(date=tomorrow, supper=True).count(),
-    }
+    # Counts for Today and Tomorrow (cached counters, no COUNT queries)
+    today_stats = get_meal_counts(today)
+    tomorrow_stats = get_meal_counts(tomorrow)
     
     total_students = Student.objects.count()
     
@@ -910,9 +796,10 @@ def dashboard_admin(request):
     in_hostel_count = Student.objects.filter(residence_type='hostel').count()
     
     # Bed capacity and room statistics
-    total_rooms = Room.objects.count()
-    occupied_rooms = Room.objects.filter(is_available=False).count()
-    total_bed_capacity = Room.objects.aggregate(total=models.Sum('capacity'))['total'] or 0
+    room_summary = Room.objects.occupancy_summary()
+    total_rooms = room_summary['total_rooms']
+    occupied_rooms = room_summary['occupied_rooms']
+    total_bed_capacity = room_summary['total_beds']
     
     # Meal plan status (students who have submitted meal choices for today)
     student_on_meals = Meal.objects.filter(date=today).values('student').distinct().count()
@@ -1040,21 +927,13 @@ def dashboard_admin(request):
     meals_query = Meal.objects.filter(date=filter_date).select_related('student__user')
     
     if search_query:
-        meals_query = meals_query.filter(
-            models.Q(student__user__first_name__icontains=search_query) | 
-            models.Q(student__user__last_name__icontains=search_query) |
-            models.Q(student__university_id__icontains=search_query)
-        )
+        meals_query = meals_query.filter(student__in=matching_students(search_query))
 
-    # 1b. Global Student Search (for "Full Info")
+    # 1b. Global Student Search (for "Full Info"), from the typeahead key index
     searched_students = []
     if search_query:
-        searched_students = Student.objects.filter(
-            models.Q(user__first_name__icontains=search_query) | 
-            models.Q(user__last_name__icontains=search_query) |
-            models.Q(university_id__icontains=search_query) |
-            models.Q(phone__icontains=search_query)
-        ).select_related('user').prefetch_related('room_assignments__room')[:5]
+        searched_students = matching_students(search_query).select_related('user').prefetch_related(
+            'room_assignments__room').order_by('user__first_name', 'user__last_name')[:5]
 
     # 2. Daily Lists
     present_list = meals_query.filter(away=False)
@@ -1068,15 +947,25 @@ def dashboard_admin(request):
     elif filter_type == 'early':
         present_list = present_list.filter(early=True)
 
-    # Students who have explicitly set 'away' to True for this date
-    away_list_consult = meals_query.filter(away=True)
-    
-    # 3. Notifications / "Unconfirmed" 
-    # Logic: Students who have a profile but NO meal record for tomorrow
-    # This might differ based on business logic, here assuming "No Record" = Unconfirmed
-    all_student_ids = Student.objects.values_list('id', flat=True)
-    confirmed_student_ids_tomorrow = Meal.objects.filter(date=tomorrow).values_list('student_id', flat=True)
-    unconfirmed_count = len(all_student_ids) - len(confirmed_student_ids_tomorrow)
+    if filter_date < today.replace(day=1):
+        # Closed month: compact_meals may have moved its rows into MealArchive
+        records = meals_on(filter_date)
+        diners = Student.objects.filter(pk__in=records).select_related('user').order_by('pk')
+        if search_query:
+            diners = diners.filter(pk__in=matching_students(search_query))
+        present_list = []
+        for student in diners:
+            meal = Meal(student=student, date=filter_date, **records[student.pk])
+            if meal.away or (filter_type in ('breakfast', 'supper', 'early') and not getattr(meal, filter_type)):
+                continue
+            present_list.append(meal)
+
+    # Students away on this date (from their away periods; no Meal rows are kept for them)
+    away_list_consult = Student.objects.filter(pk__in=students_away_on(filter_date)).select_related('user')
+    
+    # 3. Notifications / "Unconfirmed"
+    # Students with no choice for tomorrow: no Meal row, no weekday default and not away
+    unconfirmed_count = unconfirmed_students(tomorrow).count()
 
     # 4. Chart Data: Weekly Trends (Last 7 Days)
     week_start = today - timedelta(days=6)
@@ -1086,6 +975,8 @@ def dashboard_admin(request):
     weekly_maintenance = []
     weekly_visitors = []
     weekly_meals = []
+    # Archive-aware, so days already packed by compact_meals still count
+    week_meal_totals = daily_meal_totals(week_start, today)
     
     for i in range(7):
         d = week_start + timedelta(days=i)
@@ -1107,9 +998,8 @@ def dashboard_admin(request):
         visit_count = Visitor.objects.filter(check_in_time__date=d).count()
         weekly_visitors.append(visit_count)
         
-        # Total meals Activity (Breakfast OR Supper)
-        meal_activity = Meal.objects.filter(date=d).filter(models.Q(breakfast=True) | models.Q(supper=True)).count()
-        weekly_meals.append(meal_activity)
+        # Meals activity (breakfast and supper)
+        weekly_meals.append(week_meal_totals[d]['breakfast'] + week_meal_totals[d]['supper'])
 
     import json
     chart_data = {
@@ -1292,13 +1182,14 @@ def news_auditor_dashboard(request):
 def deferment_officer_dashboard(request):
     if not hasattr(request.user, 'staff_profile') or request.user.staff_profile.role != 'deferment_officer':
         return redirect('hms:dashboard_redirect')
+    counts = deferment_status_counts()
     context = {
         'dashboard_title': 'Deferment Officer Dashboard',
         'dashboard_description': 'Process student deferment requests.',
         'pending_deferments': DefermentRequest.objects.filter(status='pending').select_related('student__user').order_by('-created_at'),
-        'under_review_count': DefermentRequest.objects.filter(status='under_review').count(),
-        'approved_count': DefermentRequest.objects.filter(status='approved').count(),
-        'rejected_count': DefermentRequest.objects.filter(status='rejected').count(),
+        'under_review_count': counts['under_review'],
+        'approved_count': counts['approved'],
+        'rejected_count': counts['rejected'],
     }
     return render(request, 'hms/rbac/dashboards/deferment_officer_dashboard.html', context)
 
@@ -1431,17 +1322,20 @@ def export_meals_csv(request):
     writer = csv.writer(response)
     writer.writerow(['Name', 'University ID', 'Breakfast', 'Early', 'Supper', 'Away', 'Phone'])
     
-    meals = Meal.objects.filter(date=query_date).select_related('student__user')
+    # Live rows, or the archive once compact_meals has packed the month
+    records = meals_on(query_date)
+    students = Student.objects.filter(pk__in=records).select_related('user').order_by('pk')
     
-    for meal in meals:
+    for student in students:
+        meal = records[student.pk]
         writer.writerow([
-            meal.student.user.get_full_name(),
-            meal.student.university_id,
-            'Yes' if meal.breakfast else 'No',
-            'Yes' if meal.early else 'No',
-            'Yes' if meal.supper else 'No',
-            'Yes' if meal.away else 'No',
-            meal.student.phone
+            student.user.get_full_name(),
+            student.university_id,
+            'Yes' if meal['breakfast'] else 'No',
+            'Yes' if meal['early'] else 'No',
+            'Yes' if meal['supper'] else 'No',
+            'Yes' if meal['away'] else 'No',
+            student.phone
         ])
         
     return response
@@ -1573,76 +1467,18 @@ def manage_payments(request):
 @login_required
 @role_required(allowed_roles=['super_admin', 'dean_of_students', 'register_admin', 'Super Admin', 'Welfare Officer'])
 def send_meal_notifications(request):
-    """Send email notifications about unconfirmed students"""
-    
-    from django.core.mail import send_mail
-    from django.conf import settings
-    
-    tomorrow = date.today() + timedelta(days=1)
-    
-    # Get all students
-    all_students = Student.objects.all()
-    
-    # Get students who have confirmed meals for tomorrow
-    confirmed_student_ids = Meal.objects.filter(
-        date=tomorrow
-    ).values_list('student_id', flat=True)
-    
-    # Find unconfirmed students
-    unconfirmed_students = all_students.exclude(id__in=confirmed_student_ids)
-    
-    if not unconfirmed_students.exists():
-        messages.success(request, 'âœ… All students have confirmed their meals for tomorrow!')
-        return redirect('hms:admin_dashboard')
-    
-    # Prepare email content
-    unconfirmed_count = unconfirmed_students.count()
-    student_list = '\n'.join([
-        f"  â€¢ {student.user.get_full_name()} ({student.university_id}) - {student.user.email}"
-        for student in unconfirmed_students
-    ])
-    
-    subject = f'âš ï¸ Meal Confirmation Alert - {unconfirmed_count} Students Unconfirmed for {tomorrow.strftime("%B %d, %Y")}'
-    
-    message = f"""
-Hello Admin,
-
-This is an automated notification from the Student Welfare Management System.
-
-ðŸ“… Date: {tomorrow.strftime("%A, %B %d, %Y")}
-âš ï¸ Unconfirmed Students: {unconfirmed_count} out of {all_students.count()}
-
-The following students have NOT confirmed their meals for tomorrow:
-
-{student_list}
+    """Queue reminders for students who have not confirmed tomorrow's meals.
 
-Please remind these students to confirm their meal preferences before the deadline.
-
----
-ðŸ”— Access the admin dashboard: {request.build_absolute_uri('/kitchen/dashboard/')}
-
-This is an automated message from Student Welfare Management System.
-Do not reply to this email.
+    The reminders (in-app, plus email/SMS for students who opted in) and the
+    admin summary are sent in the background; see hms.meal_reminders.
     """
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[settings.ADMIN_EMAIL],
-            fail_silently=False,
-        )
-        
-        messages.success(
-            request, 
-            f'âœ… Email notification sent successfully to {settings.ADMIN_EMAIL}! '
-            f'{unconfirmed_count} unconfirmed students for {tomorrow.strftime("%B %d")}'
-        )
-        
-    except Exception as e:
-        messages.error(request, f'âŒ Failed to send email: {str(e)}')
-    
+    tomorrow = date.today() + timedelta(days=1)
+    run_async(send_meal_reminders, tomorrow)
+    messages.success(
+        request,
+        f'Meal reminders for {tomorrow.strftime("%B %d")} are being sent. '
+        f'A summary will be emailed to {settings.ADMIN_EMAIL}.'
+    )
     return redirect('hms:admin_dashboard')
 
 @login_required
@@ -1657,21 +1493,17 @@ def manage_students(request):
     students = Student.objects.all().select_related('user').order_by('user__first_name')
     
     if search_query:
-        students = students.filter(
-            models.Q(user__first_name__icontains=search_query) |
-            models.Q(user__last_name__icontains=search_query) |
-            models.Q(university_id__icontains=search_query)
-        )
+        students = matching_students(search_query, students)
     
     if residence_filter:
         students = students.filter(residence_type=residence_filter)
         
     if status_filter == 'active':
         today = timezone.now().date()
-        students = students.exclude(away_periods__start_date__lte=today, away_periods__end_date__gte=today)
+        students = students.exclude(pk__in=students_away_on(today))
     elif status_filter == 'away':
         today = timezone.now().date()
-        students = students.filter(away_periods__start_date__lte=today, away_periods__end_date__gte=today).distinct()
+        students = students.filter(pk__in=students_away_on(today))
     
     paginator = Paginator(students, 10)
     page_number = request.GET.get('page')
@@ -1782,9 +1614,9 @@ def away_list(request):
     """View list of students currently away (admin only)"""
         
     today = date.today()
-    away_periods = AwayPeriod.objects.filter(start_date__lte=today, end_date__gte=today).select_related('student__user')
+    students = Student.objects.filter(pk__in=students_away_on(today)).select_related('user')
     
-    return render(request, 'hms/admin/students.html', {'students': [ap.student for ap in away_periods]})
+    return render(request, 'hms/admin/students.html', {'students': students})
 
 # ==================== Announcements ====================
 
@@ -2029,28 +1861,19 @@ def select_room(request):
                     messages.info(request, f"You are already in Room {room_number}.")
                     return redirect('hms:student_profile')
 
-                # Check availability (double check)
-                if not room.is_available:
-                     messages.error(request, f"Room {room_number} is not available.")
-                     return redirect('hms:student_profile')
-                     
-                # Create Room Assignment
-                # First, end any active assignments
-                RoomAssignment.objects.filter(student=student, is_active=True).update(is_active=False, checkout_date=timezone.now())
+                # Reserve a bed atomically; many students race for the same rooms
+                with transaction.atomic():
+                    assignment = book_bed(student, room)
+                    ledger.charge_room_assignment(assignment)
+                    
+                    # Update student profile for display
+                    student.room_number = room_number
+                    student.save()
                 
-                # Create new assignment
-                RoomAssignment.objects.create(
-                    student=student,
-                    room=room,
-                    bed_number=1, # Defaulting to 1 for now, logic can be enhanced
-                    is_active=True
-                )
+                messages.success(request, f"Successfully assigned to Room {room_number}, bed {assignment.bed_number}.")
                 
-                # Update student profile for display
-                student.room_number = room_number
-                student.save()
-                
-                messages.success(request, f"Successfully assigned to Room {room_number}.")
+            except RoomFull:
+                messages.error(request, f"Room {room_number} is not available.")
                 
             except Room.DoesNotExist:
                 messages.error(request, "Selected room does not exist.")
@@ -2279,7 +2102,7 @@ def update_maintenance_status(request, pk):
 def room_list(request):
     """View all rooms (admin only)"""
     
-    rooms = Room.objects.all().order_by('block', 'floor', 'room_number')
+    rooms = Room.objects.with_occupancy().order_by('block', 'floor', 'room_number')
     
     # Filter by block if provided
     block_filter = request.GET.get('block')
@@ -2293,16 +2116,31 @@ def room_list(request):
     elif availability == 'occupied':
         rooms = rooms.filter(is_available=False)
     
+    summary = Room.objects.occupancy_summary()
     context = {
         'rooms': rooms,
-        'total_rooms': Room.objects.count(),
-        'available_rooms': Room.objects.filter(is_available=True).count(),
-        'occupied_rooms': Room.objects.filter(is_available=False).count(),
+        'total_rooms': summary['total_rooms'],
+        'available_rooms': summary['available_rooms'],
+        'occupied_rooms': summary['occupied_rooms'],
     }
     
     return render(request, 'hms/admin/room_list.html', context)
 
 
+@login_required
+@role_required(allowed_roles=['super_admin', 'warden', 'Super Admin', 'Hostel Manager'])
+def room_occupancy(request):
+    """Block/floor grid of room occupancy for wardens"""
+    return render(request, 'hms/admin/room_occupancy.html')
+
+
+@login_required
+@role_required(allowed_roles=['super_admin', 'warden', 'Super Admin', 'Hostel Manager'])
+def room_occupancy_map(request):
+    """JSON occupancy map grouped by block and floor (cached briefly)"""
+    return JsonResponse(get_occupancy_map())
+
+
 @login_required
 @role_required(['super_admin', 'register_admin', 'Admin'])
 def create_room(request):
@@ -2333,6 +2171,8 @@ def edit_room(request, pk):
         form = RoomForm(request.POST, instance=room)
         if form.is_valid():
             form.save()
+            # Capacity may have changed; a full room can't be reopened by hand
+            sync_room_occupancy([room.pk])
             messages.success(request, 'Room updated successfully!')
             return redirect('hms:room_list')
     else:
@@ -2378,21 +2218,21 @@ def assign_room(request):
     if request.method == 'POST':
         form = RoomAssignmentForm(request.POST)
         if form.is_valid():
-            assignment = form.save(commit=False)
-            
-            # Check if room has available beds
-            room = assignment.room
-            if room.available_beds <= 0:
+            room = form.cleaned_data['room']
+            student = form.cleaned_data['student']
+            try:
+                with transaction.atomic():
+                    assignment = book_bed(student, room, bed_number=form.cleaned_data.get('bed_number'),
+                                          notes=form.cleaned_data.get('notes', ''))
+                    ledger.charge_room_assignment(assignment)
+                    
+                    # Update student's room_number field
+                    student.room_number = room.room_number
+                    student.save()
+            except RoomFull:
                 messages.error(request, f'Room {room.room_number} is full!')
                 return render(request, 'hms/admin/room_assignment_form.html', {'form': form})
             
-            assignment.save()
-            
-            # Update student's room_number field
-            student = assignment.student
-            student.room_number = room.room_number
-            student.save()
-            
             messages.success(request, f'{student.user.get_full_name()} assigned to Room {room.room_number}!')
             return redirect('hms:room_assignments')
     else:
@@ -2401,6 +2241,29 @@ def assign_room(request):
     return render(request, 'hms/admin/room_assignment_form.html', {'form': form})
 
 
+@login_required
+@permission_required('view_accommodation')
+def batch_allocate_rooms(request):
+    """Preview and run the batch room allocation for pending students (admin only)"""
+    from .allocation import allocate_rooms
+
+    if request.method == 'POST':
+        result = allocate_rooms()
+        messages.success(request, f'{result.placed_count} students allocated to {result.rooms_used()} rooms.')
+        if result.unplaced:
+            messages.warning(request, f'{len(result.unplaced)} students could not be placed.')
+        return redirect('hms:room_assignments')
+
+    result = allocate_rooms(dry_run=True)
+    context = {
+        'placements': result.placements[:500],
+        'unplaced': result.unplaced,
+        'placed_count': result.placed_count,
+        'rooms_used': result.rooms_used(),
+    }
+    return render(request, 'hms/admin/batch_allocation.html', context)
+
+
 @login_required
 @permission_required('view_accommodation')
 def room_change_requests(request):
@@ -2416,6 +2279,37 @@ def room_change_requests(request):
     return render(request, 'hms/admin/room_change_requests.html', context)
 
 
+@login_required
+@permission_required('view_accommodation')
+def room_swap_matches(request):
+    """Match pending room change requests into swaps and approve them in bulk (admin only)"""
+    from .room_swaps import approve_swap_cycles, find_swap_cycles
+
+    if request.method == 'POST':
+        cycle_keys = []
+        for key in request.POST.getlist('cycle'):
+            try:
+                cycle_keys.append([int(pk) for pk in key.split(',')])
+            except ValueError:
+                continue
+        approved, skipped = approve_swap_cycles(cycle_keys, reviewed_by=request.user,
+                                                admin_notes=request.POST.get('admin_notes', ''))
+        moved = sum(len(cycle) for cycle in approved)
+        if approved:
+            messages.success(request, f'{len(approved)} swaps approved; {moved} students moved.')
+        if skipped:
+            messages.warning(request, f'{len(skipped)} swaps changed since they were matched and were skipped.')
+        return redirect('hms:room_swap_matches')
+
+    cycles = find_swap_cycles()
+    context = {
+        'cycles': cycles,
+        'students_matched': sum(len(cycle) for cycle in cycles),
+        'pending_count': RoomChangeRequest.objects.filter(status='pending').count(),
+    }
+    return render(request, 'hms/admin/room_swap_matches.html', context)
+
+
 @login_required
 @permission_required('view_accommodation')
 def approve_room_change(request, pk):
@@ -2428,27 +2322,23 @@ def approve_room_change(request, pk):
         admin_notes = request.POST.get('admin_notes', '')
         
         if action == 'approve':
-            room_change.status = 'approved'
-            room_change.admin_notes = admin_notes
-            room_change.reviewed_by = request.user
-            room_change.save()
-            
-            # Create new assignment if there's a requested room
-            if room_change.requested_room:
-                # Deactivate old assignment
-                RoomAssignment.objects.filter(student=room_change.student, is_active=True).update(is_active=False, checkout_date=timezone.now().date())
-                
-                # Create new assignment
-                RoomAssignment.objects.create(
-                    student=room_change.student,
-                    room=room_change.requested_room,
-                    assigned_date=timezone.now().date(),
-                    is_active=True
-                )
-                
-                # Update student's room_number
-                room_change.student.room_number = room_change.requested_room.room_number
-                room_change.student.save()
+            try:
+                with transaction.atomic():
+                    room_change.status = 'approved'
+                    room_change.admin_notes = admin_notes
+                    room_change.reviewed_by = request.user
+                    room_change.save()
+                    
+                    # Move the student if there's a requested room
+                    if room_change.requested_room:
+                        book_bed(room_change.student, room_change.requested_room)
+                        
+                        # Update student's room_number
+                        room_change.student.room_number = room_change.requested_room.room_number
+                        room_change.student.save()
+            except RoomFull:
+                messages.error(request, f'Room {room_change.requested_room.room_number} is full. The request is still pending.')
+                return redirect('hms:room_change_requests')
             
             messages.success(request, f'Room change request approved for {room_change.student.user.get_full_name()}!')
         
@@ -2575,85 +2465,36 @@ def delete_leave_request(request, pk):
 
 @login_required
 @permission_required('view_reports')
-def admin_deferment_all(request):
-    """Admin views all deferment requests"""
-    
-    deferments = DefermentRequest.objects.all().select_related('student__user').order_by('-created_at')
-    
-    context = {
-        'deferments': deferments,
-        'title': 'All Deferment Requests',
-        'active_tab': 'all'
-    }
-    return render(request, 'hms/admin/deferment_list.html', context)
-
-@login_required
-@permission_required('view_reports')
-def admin_deferment_pending(request):
-    """Admin views pending deferment requests"""
-    
-    deferments = DefermentRequest.objects.filter(status='pending').select_related('student__user').order_by('-created_at')
-    
-    context = {
-        'deferments': deferments,
-        'title': 'Pending Applications',
-        'active_tab': 'pending'
-    }
-    return render(request, 'hms/admin/deferment_list.html', context)
-
-@login_required
-@permission_required('view_reports')
-def admin_deferment_under_review(request):
-    """Admin views deferment requests under review"""
-    
-    deferments = DefermentRequest.objects.filter(status='under_review').select_related('student__user').order_by('-created_at')
-    
-    context = {
-        'deferments': deferments,
-        'title': 'Applications Under Review',
-        'active_tab': 'under_review'
-    }
-    return render(request, 'hms/admin/deferment_list.html', context)
-
-@login_required
-@permission_required('view_reports')
-def admin_deferment_approved(request):
-    """Admin views approved deferment requests"""
-    
-    deferments = DefermentRequest.objects.filter(status='approved').select_related('student__user').order_by('-created_at')
-    
-    context = {
-        'deferments': deferments,
-        'title': 'Approved Deferments',
-        'active_tab': 'approved'
-    }
-    return render(request, 'hms/admin/deferment_list.html', context)
-
-@login_required
-@permission_required('view_reports')
-def admin_deferment_rejected(request):
-    """Admin views rejected deferment requests"""
+def admin_deferments(request, status=None):
+    """Deferment review workbench: one status (or all) per page, with bulk approve/reject"""
     
-    deferments = DefermentRequest.objects.filter(status='rejected').select_related('student__user').order_by('-created_at')
+    status = request.GET.get('status', status)
+    if status not in dict(DEFERMENT_STATUSES):
+        status = None
     
-    context = {
-        'deferments': deferments,
-        'title': 'Rejected Applications',
-        'active_tab': 'rejected'
-    }
-    return render(request, 'hms/admin/deferment_list.html', context)
-
-@login_required
-@permission_required('view_reports')
-def admin_deferment_resumed(request):
-    """Admin views resumed studies deferment requests"""
+    if request.method == 'POST':
+        decision = request.POST.get('decision')
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        if decision not in DEFERMENT_DECISIONS or not ids:
+            messages.error(request, 'Select at least one request and a decision.')
+        else:
+            changed = decide_deferments(ids, decision, request.user, request.POST.get('admin_response', '').strip())
+            skipped = len(ids) - len(changed)
+            messages.success(request, f'{len(changed)} deferment request(s) {decision}.'
+                             + (f' {skipped} already decided were left unchanged.' if skipped else ''))
+        return redirect(request.get_full_path())
     
-    deferments = DefermentRequest.objects.filter(status='resumed').select_related('student__user').order_by('-created_at')
+    deferments, next_cursor = deferment_page(status, request.GET.get('after'))
+    counts = deferment_status_counts()
     
     context = {
         'deferments': deferments,
-        'title': 'Resumed Studies',
-        'active_tab': 'resumed'
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
+        'total_count': counts['all'],
+        'tabs': [(value, label, counts[value]) for value, label in DEFERMENT_STATUSES],
+        'title': dict(DEFERMENT_STATUSES).get(status, 'All Deferment Requests'),
+        'active_tab': status or 'all',
     }
     return render(request, 'hms/admin/deferment_list.html', context)
 
@@ -2676,11 +2517,7 @@ def review_deferment(request, pk):
             
             # If approved, create AwayPeriod automatically
             if defer_req.status == 'approved':
-                AwayPeriod.objects.create(
-                    student=defer_req.student,
-                    start_date=defer_req.start_date,
-                    end_date=defer_req.end_date
-                )
+                mark_away(defer_req.student, defer_req.start_date, defer_req.end_date)
                 messages.success(request, f'Deferment approved for {defer_req.student.user.get_full_name()}. Away period created.')
             else:
                 messages.info(request, f'Deferment status updated to {defer_req.get_status_display()}.')
@@ -2710,7 +2547,7 @@ def review_deferment(request, pk):
 
 
 # Maintain alias for compatibility with old URLs if needed
-manage_leave_requests = admin_deferment_all
+manage_leave_requests = admin_deferments
 approve_leave_request = review_deferment
 
 
@@ -2737,11 +2574,11 @@ def analytics_dashboard(request):
     available_rooms = Room.objects.filter(is_available=True).count()
     
     # Today's meal stats
-    today_meals = Meal.objects.filter(date=today)
-    today_breakfast = today_meals.filter(breakfast=True).count()
-    today_supper = today_meals.filter(supper=True).count()
-    today_away = today_meals.filter(away=True).count()
-    today_confirmed = today_meals.count()
+    today_counts = get_meal_counts(today)
+    today_breakfast = today_counts['breakfast']
+    today_supper = today_counts['supper']
+    today_away = today_counts['away']
+    today_confirmed = today_counts['confirmed']
     
     # Active leave requests
     active_leaves = LeaveRequest.objects.filter(
@@ -2777,15 +2614,11 @@ def analytics_dashboard(request):
     weekly_deferments = get_counts_for_dates(DefermentRequest.objects, 'created_at', weekly_dates)
     
     # Weekly Meals (Special handled)
-    meal_stats = Meal.objects.filter(date__in=weekly_dates)
-    weekly_breakfast = []
-    weekly_supper = []
-    weekly_away = []
-    for d in weekly_dates:
-        day_meals = meal_stats.filter(date=d)
-        weekly_breakfast.append(day_meals.filter(breakfast=True).count())
-        weekly_supper.append(day_meals.filter(supper=True).count())
-        weekly_away.append(day_meals.filter(away=True).count())
+    weekly_meals = daily_meal_totals(weekly_dates[0], weekly_dates[-1])
+    weekly_breakfast = [weekly_meals[d]['breakfast'] for d in weekly_dates]
+    weekly_supper = [weekly_meals[d]['supper'] for d in weekly_dates]
+    weekly_away_counts = away_counts(weekly_dates)
+    weekly_away = [weekly_away_counts[d] for d in weekly_dates]
 
     # Monthly Trends
     monthly_labels = [d.strftime('%b %d') for d in monthly_dates]
@@ -2796,15 +2629,11 @@ def analytics_dashboard(request):
     monthly_deferments = get_counts_for_dates(DefermentRequest.objects, 'created_at', monthly_dates)
     
     # Monthly Meals
-    monthly_meal_stats = Meal.objects.filter(date__in=monthly_dates)
-    monthly_breakfast = []
-    monthly_supper = []
-    monthly_away = []
-    for d in monthly_dates:
-        day_meals = monthly_meal_stats.filter(date=d)
-        monthly_breakfast.append(day_meals.filter(breakfast=True).count())
-        monthly_supper.append(day_meals.filter(supper=True).count())
-        monthly_away.append(day_meals.filter(away=True).count())
+    monthly_meals = daily_meal_totals(monthly_dates[0], monthly_dates[-1])
+    monthly_breakfast = [monthly_meals[d]['breakfast'] for d in monthly_dates]
+    monthly_supper = [monthly_meals[d]['supper'] for d in monthly_dates]
+    monthly_away_counts = away_counts(monthly_dates)
+    monthly_away = [monthly_away_counts[d] for d in monthly_dates]
     
     # ==================== MAINTENANCE STATS ====================
     maintenance_by_status = {
@@ -2991,8 +2820,8 @@ def pay_accommodation(request):
 
     # Get active room assignment to find the fee
     room_assignment = RoomAssignment.objects.filter(student=student, is_active=True).first()
-    default_amount = 0
-    if room_assignment:
+    default_amount = max(ledger.get_balance(student).balance, 0)
+    if not default_amount and room_assignment:
         default_amount = room_assignment.room.price_per_semester
 
     if request.method == 'POST':
@@ -3004,6 +2833,7 @@ def pay_accommodation(request):
             messages.error(request, "Please provide phone number and amount")
             return redirect('hms:pay_accommodation')
 
+        phone = msisdn(phone) or phone
         payment = Payment.objects.create(
             student=student,
             amount=amount,
@@ -3019,6 +2849,7 @@ def pay_accommodation(request):
         if response.get('ResponseCode') == '0':
             payment.checkout_request_id = response.get('CheckoutRequestID')
             payment.save()
+            publish_status(payment.checkout_request_id, 'Pending', user_id=request.user.id)
             messages.success(request, f"STK Push initiated to {phone}. Check your phone to complete payment.")
         else:
             payment.status = 'Failed'
@@ -3044,52 +2875,30 @@ def payment_history(request):
 
 @csrf_exempt
 def mpesa_callback(request):
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            # Log raw data for debugging if needed
-            # print(data)
-            
-            stk_callback = data.get('Body', {}).get('stkCallback', {})
-            result_code = stk_callback.get('ResultCode')
-            checkout_request_id = stk_callback.get('CheckoutRequestID')
-            result_desc = stk_callback.get('ResultDesc')
-            
-            if not checkout_request_id:
-                return JsonResponse({'status': 'error', 'message': 'No CheckoutRequestID'}, status=400)
+    """Handle STK Push callbacks from Safaricom.
 
-            try:
-                payment = Payment.objects.get(checkout_request_id=checkout_request_id)
-            except Payment.DoesNotExist:
-                return JsonResponse({'status': 'error', 'message': 'Payment not found'}, status=404)
-
-            if result_code == 0:
-                payment.status = 'Completed'
-                payment.description = 'Success'
-                # Extract receipt no
-                meta = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-                for item in meta:
-                    if item.get('Name') == 'MpesaReceiptNumber':
-                        payment.transaction_id = item.get('Value')
-                
-                # Send Notification
-                Notification.objects.create(
-                    user=payment.student.user,
-                    title="Payment Received",
-                    message=f"We received your payment of KES {payment.amount}. Ref: {payment.transaction_id}",
-                    link="/student/payment-history/"
-                )
-            else:
-                payment.status = 'Failed'
-                payment.description = result_desc
-
-            payment.save()
-        except Exception as e:
-            print(f"Callback Error: {e}")
-            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
-            
-        return JsonResponse({'status': 'ok'})
-    return JsonResponse({'error': 'only post'}, status=400)
+    The raw body is stored in the callback inbox and acknowledged immediately;
+    payment records are updated by hms.payments.process_callback in the
+    background (and by the process_mpesa_callbacks command as a fallback).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'only post'}, status=400)
+
+    callback = record_callback(request.body)
+    run_async(process_callback, callback.id)
+    return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
+
+@login_required
+def payment_status_api(request, checkout_id):
+    """AJAX view to poll a payment's status from the cache (no DB or Daraja calls)"""
+    state = get_cached_status(checkout_id)
+    if not state or state.get('user_id') != request.user.id:
+        return JsonResponse({'status': 'Unknown'}, status=404)
+    return JsonResponse({
+        'status': state['status'],
+        'description': state['description'],
+        'receipt': state['receipt'],
+    })
 
 @login_required
 def check_payment_status(request, payment_id):
@@ -3103,29 +2912,31 @@ def check_payment_status(request, payment_id):
         messages.error(request, "Cannot verify this payment (No CheckoutRequestID).")
         return redirect('hms:payment_history')
 
+    # The callback worker publishes the outcome; only ask Daraja if it hasn't
+    state = get_cached_status(payment.checkout_request_id)
+    if state and state['status'] == 'Completed':
+        messages.success(request, "Payment verified successfully!")
+        return redirect('hms:payment_history')
+    if state and state['status'] == 'Failed':
+        messages.warning(request, f"Payment status: {state['description']}")
+        return redirect('hms:payment_history')
+
+    # Throttle manual checks so repeated clicks don't each hit Daraja
+    from django.core.cache import cache
+    if not cache.add(f'payment_query_lock_{payment.id}', True, 30):
+        messages.info(request, "Still waiting for M-Pesa confirmation. Please try again shortly.")
+        return redirect('hms:payment_history')
+
     mpesa = MpesaClient()
     response = mpesa.stk_push_query(payment.checkout_request_id)
     
     if response.get('ResponseCode') == '0':
         result_code = response.get('ResultCode')
-        if result_code == '0':
-            payment.status = 'Completed'
-            payment.description = response.get('ResultDesc', 'Verified Manually')
-            payment.save()
-            
-            Notification.objects.create(
-                user=request.user, 
-                title="Payment Verified",
-                message=f"Manual verification successful for KES {payment.amount}.",
-                link="/student/payment-history/"
-            )
-            
+        if is_final_result(result_code):
+            apply_result(payment.checkout_request_id, result_code, response.get('ResultDesc', ''))
+        if str(result_code) == '0':
             messages.success(request, "Payment verified successfully!")
         else:
-            if result_code in ['1032', '1037', '1']:
-                payment.status = 'Failed'
-                payment.description = response.get('ResultDesc')
-                payment.save()
             messages.warning(request, f"Payment status: {response.get('ResultDesc')}")
     else:
         messages.error(request, f"Query failed: {response.get('ResponseDescription', response.get('errorMessage'))}")
@@ -3137,91 +2948,32 @@ def check_payment_status(request, payment_id):
 
 @login_required
 def global_search(request):
-    """
-    Global search across all modules:
-    - Students (name, email, university_id)
-    - Announcements (title, content)
-    - Maintenance Requests (description, location)
-    - Deferment Requests (reason)
-    """
+    """Ranked full-text search across students, announcements, maintenance
+    and deferment requests, limited to what the user may see (see hms.search)"""
     query = request.GET.get('q', '').strip()
-    
-    results = {
-        'students': [],
-        'announcements': [],
-        'maintenance': [],
-        'deferments': [],
-        'query': query,
-        'total_count': 0
-    }
-    
-    if query and len(query) >= 2:
-        # Search Students (admin only)
-        if request.user.is_staff:
-            students = Student.objects.filter(
-                Q(user__first_name__icontains=query) |
-                Q(user__last_name__icontains=query) |
-                Q(user__email__icontains=query) |
-                Q(university_id__icontains=query) |
-                Q(phone__icontains=query)
-            ).select_related('user')[:10]
-            results['students'] = students
-        
-        # Search Announcements
-        announcements = Announcement.objects.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query),
-            is_active=True
-        ).order_by('-created_at')[:10]
-        results['announcements'] = announcements
-        
-        # Search Maintenance Requests
-        if request.user.is_staff:
-            maintenance = MaintenanceRequest.objects.filter(
-                Q(description__icontains=query) |
-                Q(location__icontains=query)
-            ).select_related('student__user').order_by('-created_at')[:10]
-        else:
-            # Students can only see their own requests
-            try:
-                student = request.user.student_profile
-                maintenance = MaintenanceRequest.objects.filter(
-                    Q(description__icontains=query) |
-                    Q(location__icontains=query),
-                    student=student
-                ).order_by('-created_at')[:10]
-            except:
-                maintenance = []
-        results['maintenance'] = maintenance
-        
-        # Search Deferment Requests
-        if request.user.is_staff:
-            deferments = DefermentRequest.objects.filter(
-                Q(reason__icontains=query) |
-                Q(student__user__first_name__icontains=query) |
-                Q(student__user__last_name__icontains=query)
-            ).select_related('student__user').order_by('-created_at')[:10]
-        else:
-            try:
-                student = request.user.student_profile
-                deferments = DefermentRequest.objects.filter(
-                    Q(reason__icontains=query),
-                    student=student
-                ).order_by('-created_at')[:10]
-            except:
-                deferments = []
-        results['deferments'] = deferments
-        
-        # Calculate total
-        results['total_count'] = (
-            len(results['students']) + 
-            len(results['announcements']) + 
-            len(results['maintenance']) + 
-            len(results['deferments'])
-        )
-    
+    results = search_grouped(request.user, query)
+    results['total_count'] = sum(len(group) for group in results.values())
+    results['query'] = query
     return render(request, 'hms/search_results.html', results)
 
+
+@login_required
+def student_autocomplete(request):
+    """Typeahead JSON for staff student lookups (see hms.autocomplete)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'error': 'Staff only.'}, status=403)
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+    results = suggest_students(request.GET.get('q', ''), limit=limit)
+    for result in results:
+        result['details_url'] = reverse('hms:student_details', args=[result['user_id']])
+        result['chat_url'] = reverse('hms:chat_with', args=[result['user_id']])
+    response = JsonResponse({'results': results})
+    response['Cache-Control'] = 'private, max-age=30'
+    return response
+
 # ==================== Audit Logs ====================
 
 @login_required
@@ -3498,7 +3250,7 @@ def admin_subscription_pay(request):
             return redirect('hms:dashboard_redirect')
             
         else: # mpesa
-            phone = request.POST.get('phone')
+            phone = msisdn(request.POST.get('phone')) or request.POST.get('phone')
             if not phone:
                 if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                     return JsonResponse({'status': 'Error', 'message': 'Phone number is required.'})
@@ -3525,6 +3277,7 @@ def admin_subscription_pay(request):
                             checkout_request_id=response.get('CheckoutRequestID'),
                             status='Pending'
                         )
+                        publish_status(response.get('CheckoutRequestID'), 'Pending', user_id=request.user.id)
                         msg = "STK Push sent! Please check your phone to complete payment."
                         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                             return JsonResponse({'status': 'Success', 'message': msg})
@@ -3711,32 +3464,107 @@ def welfare_officer_dashboard(request):
 @hostel_manager_required
 def hostel_manager_dashboard(request):
     """Hostel and Room management dashboard"""
+    summary = Room.objects.occupancy_summary()
     context = {
-        'total_rooms': Room.objects.count(),
-        'available_rooms': Room.objects.filter(is_available=True).count(),
-        'occupied_rooms': Room.objects.filter(is_available=False).count(),
+        'total_rooms': summary['total_rooms'],
+        'available_rooms': summary['available_rooms'],
+        'occupied_rooms': summary['occupied_rooms'],
+        'occupancy_rate': summary['occupancy_rate'],
         'pending_room_changes': RoomChangeRequest.objects.filter(status='pending').count(),
         'recent_assignments': RoomAssignment.objects.select_related('student__user', 'room').order_by('-assigned_date')[:10],
         'pending_maintenance': MaintenanceRequest.objects.filter(status='pending').select_related('student__user').order_by('-created_at')[:5],
-        'total_assigned': RoomAssignment.objects.filter(is_current=True).count(),
+        'total_assigned': summary['occupied_beds'],
     }
     return render(request, 'hms/rbac/hostel_manager_dashboard.html', context)
 
 
+KITCHEN_BOARD_ROLES = ['super_admin', 'health_manager', 'warden', 'Kitchen Manager', 'Super Admin']
+
+
+@login_required
+@role_required(allowed_roles=KITCHEN_BOARD_ROLES)
+def kitchen_board(request):
+    """Full-screen live meal numbers for the kitchen"""
+    return render(request, 'hms/admin/kitchen_board.html', {
+        'snapshot': board_snapshot(),
+        'poll_seconds': getattr(settings, 'KITCHEN_BOARD_POLL_SECONDS', 5),
+    })
+
+
+@login_required
+@role_required(allowed_roles=KITCHEN_BOARD_ROLES)
+def kitchen_board_data(request):
+    """Current board numbers as JSON; the board polls this"""
+    return JsonResponse(board_snapshot())
+
+
+@login_required
+@role_required(allowed_roles=KITCHEN_BOARD_ROLES)
+def dining_scanner(request):
+    """Serving-line page that submits scanned meal passes"""
+    return render(request, 'hms/admin/dining_scanner.html', {'meals': MealServing.MEAL_CHOICES})
+
+
+@login_required
+@role_required(allowed_roles=KITCHEN_BOARD_ROLES)
+@require_POST
+def dining_scan(request):
+    """Record one scanned meal pass; checked without touching the database"""
+    try:
+        student_id = record_scan(request.POST.get('token', ''), request.POST.get('meal', ''),
+                                 line=request.POST.get('line', ''), scanned_by=request.user)
+    except InvalidPass as exc:
+        status = 409 if exc.reason == 'duplicate' else 400
+        return JsonResponse({'ok': False, 'error': exc.reason}, status=status)
+    return JsonResponse({'ok': True, 'student': student_id})
+
+
+@login_required
+@role_required(allowed_roles=KITCHEN_BOARD_ROLES)
+def dining_report_view(request):
+    """Meals served at check-in against meals confirmed, per day"""
+    today = timezone.localdate()
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 31)
+    except ValueError:
+        days = 7
+    rows = dining_report(today - timedelta(days=days - 1), today)
+    rows.reverse()
+    return render(request, 'hms/admin/dining_report.html', {'rows': rows, 'days': days})
+
+
 @login_required
 @kitchen_manager_required
 def kitchen_manager_dashboard(request):
     """Kitchen and Meal management dashboard"""
     today = date.today()
     tomorrow = today + timedelta(days=1)
+    week_dates = [today + timedelta(days=i) for i in range(7)]
+    planned = planned_counts(week_dates)
+    past_dates = [today - timedelta(days=i) for i in range(7, 0, -1)]
+    forecasts = forecast_table(week_dates + past_dates)
+    today_counts = get_meal_counts(today)
+    week_ahead = []
+    for d in week_dates:
+        row = dict(planned[d], date=d)
+        for meal in MEALS:
+            forecast = forecasts.get(d, {}).get(meal)
+            row[f'{meal}_forecast'] = forecast.forecast if forecast else None
+        week_ahead.append(row)
+    forecast_history = [
+        forecasts[d][meal] for d in past_dates for meal in MEALS
+        if meal in forecasts.get(d, {}) and forecasts[d][meal].actual is not None
+    ]
     context = {
         'today': today,
-        'breakfast_count': Meal.objects.filter(date=today, breakfast=True).count(),
-        'supper_count': Meal.objects.filter(date=today, supper=True).count(),
-        'early_count': Meal.objects.filter(date=today, early=True).count(),
-        'away_count': Meal.objects.filter(date=today, away=True).count(),
-        'tomorrow_breakfast': Meal.objects.filter(date=tomorrow, breakfast=True).count(),
-        'tomorrow_supper': Meal.objects.filter(date=tomorrow, supper=True).count(),
+        'breakfast_count': today_counts['breakfast'],
+        'supper_count': today_counts['supper'],
+        'early_count': today_counts['early'],
+        'away_count': today_counts['away'],
+        'tomorrow_breakfast': planned[tomorrow]['breakfast'],
+        'tomorrow_supper': planned[tomorrow]['supper'],
+        'week_ahead': week_ahead,
+        'forecast_history': forecast_history,
         'today_menu': Activity.objects.filter(active=True, weekday=today.weekday()).first(),
         'activities': Activity.objects.filter(active=True),
         'total_students': Student.objects.count(),
@@ -4449,69 +4277,19 @@ def update_feature_flags_api(request):
 # NEW FEATURES: ANALYTICS, MENTAL HEALTH, WHATSAPP
 # ============================================
 from .models import CounsellingRequest, MentalHealthResource, CrisisHelpline
-import africastalking
 from django.conf import settings
 from django.http import HttpResponse
 
 # --- WhatsApp Bot ---
-try:
-    africastalking.initialize(settings.AFRICASTALKING_USERNAME, settings.AFRICASTALKING_API_KEY)
-    sms = africastalking.SMS
-except Exception as e:
-    print("Africa's Talking Init Error:", e)
-
 @csrf_exempt
 def whatsapp_webhook(request):
-    if request.method == 'POST':
-        # AT webhook sends form-encoded data
-        sender = request.POST.get('from', '')
-        text = request.POST.get('text', '').strip().upper()
-        
-        # Phone number from WhatsApp format: "whatsapp:+2547XXXXXXXX"
-        clean_phone = sender.replace('whatsapp:', '').strip()
-        if clean_phone.startswith('+'):
-            clean_phone = clean_phone[1:] # e.g. 2547...
-            
-        # Try to find student by phone
-        student = Student.objects.filter(phone__icontains=clean_phone[-9:]).first()
-        
-        response_text = ""
-        
-        if not student:
-            response_text = "Sorry, we could not find a student registered with this phone number. Please update your profile."
-        else:
-            if "BALANCE" in text:
-                room_assignment = RoomAssignment.objects.filter(student=student, is_active=True).first()
-                if room_assignment:
-                    amount = room_assignment.room.price_per_semester
-                    response_text = f"Your accommodation fee balance is KES {amount}. Pay via M-Pesa to Paybill {settings.MPESA_SHORTCODE}."
-                else:
-                    response_text = "You do not have any active room assignments or fee balances."
-            elif "DEFERMENT" in text:
-                latest_deferment = DefermentRequest.objects.filter(student=student).order_by('-created_at').first()
-                if latest_deferment:
-                    response_text = f"Your latest deferment application status is: {latest_deferment.get_status_display().upper()}"
-                else:
-                    response_text = "You have no pending deferment applications. Please apply via the portal."
-            elif "STATUS" in text:
-                latest_req = CounsellingRequest.objects.filter(student=student).order_by('-created_at').first()
-                if latest_req:
-                    response_text = f"Your latest counselling request status is: {latest_req.get_status_display().upper()}"
-                else:
-                    response_text = "No recent requests found."
-            elif "HELP" in text:
-                response_text = "Available commands:\n1. BALANCE - Check fee balance\n2. DEFERMENT - Check deferment status\n3. STATUS - Check general request status\n4. HELP - Show this menu"
-            else:
-                response_text = "Welcome to Campus Care Bot! Send 'HELP' to see available commands."
-                
-        # Send reply back via WhatsApp
-        try:
-            sms.send(response_text, [sender])
-        except Exception as e:
-            print("AT Send Error:", e)
-            
-        return HttpResponse("OK", status=200)
-    return HttpResponse("Method not allowed", status=405)
+    """Store the inbound message and acknowledge at once; hms.whatsapp replies in the background"""
+    if request.method != 'POST':
+        return HttpResponse("Method not allowed", status=405)
+    message, created = record_message(request.POST)
+    if created:
+        run_async(process_whatsapp_message, message.id)
+    return HttpResponse("OK", status=200)
 
 def whatsapp_demo(request):
     return render(request, 'hms/whatsapp_demo.html')
@@ -4525,9 +4303,9 @@ def new_analytics_dashboard(request):
     
     total_students = Student.objects.count()
     
-    # Calculate revenue (Completed payments)
-    completed_payments = Payment.objects.filter(status='Completed')
-    total_revenue = sum(p.amount for p in completed_payments)
+    # Revenue (accommodation payments, not registration fees) and arrears come from the ledger
+    finance = ledger.finance_summary()
+    total_revenue = finance['revenue']
     
     # Deferment approval rate
     total_def = DefermentRequest.objects.count()
@@ -4544,7 +4322,7 @@ def new_analytics_dashboard(request):
     dept_data = [d['count'] for d in depts]
     
     # Pie chart: Payment methods
-    payment_methods = {'M-Pesa': completed_payments.count(), 'Bank': 0, 'Cash': 0} # M-Pesa only currently
+    payment_methods = {'M-Pesa': Payment.objects.filter(status='Completed').count(), 'Bank': 0, 'Cash': 0} # M-Pesa only currently
     
     chart_data = {
         'line_labels': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'],
@@ -4560,6 +4338,10 @@ def new_analytics_dashboard(request):
         'total_revenue': total_revenue,
         'def_rate': def_rate,
         'avg_response': avg_response,
+        'finance': finance,
+        'outstanding_by_hostel': ledger.outstanding_by_hostel()[:10],
+        'outstanding_by_school': ledger.outstanding_by_school(),
+        'ageing_buckets': ledger.ageing_buckets(),
         'chart_data': json.dumps(chart_data)
     }
     return render(request, 'hms/admin/analytics.html', context)
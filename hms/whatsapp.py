@@ -0,0 +1,182 @@
+"""
+WhatsApp bot (BALANCE, DEFERMENT, STATUS, HELP) over Africa's Talking.
+
+The webhook only stores the inbound message in the InboundMessage inbox
+and returns 200, so Africa's Talking is acknowledged within one INSERT
+and never retries because a reply was slow. The provider's message id is
+unique in the inbox: a retried delivery finds the existing row and is not
+processed again.
+
+process_message then runs in the background (hms.tasks.run_async), with
+the process_whatsapp_messages command as a fallback drain for rows left
+behind by a restart. It claims the row with a conditional UPDATE, finds
+the sender by the indexed phone_e164 column, answers from the cached
+student summary (hms.student_summary) and sends the reply. The row is
+marked replied before the send, so a reply goes out at most once; only
+transient database errors (OperationalError) before that point put the row
+back to pending.
+
+Replies go through one ReplyClient per process. It keeps a pooled HTTP
+session to the Africa's Talking messaging API, so a burst of replies
+reuses warm TLS connections instead of opening one per message as the SDK
+does.
+"""
+import logging
+import threading
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db import OperationalError
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from .models import InboundMessage, Student
+from .phones import to_e164
+from .student_summary import get_summary
+
+logger = logging.getLogger(__name__)
+
+# Inbox rows stuck in 'processing' longer than this are retried
+STALE_PROCESSING_AFTER = timedelta(minutes=5)
+REPLY_TIMEOUT = (3.05, 9.05)
+
+HELP_TEXT = ("Available commands:\n1. BALANCE - Check fee balance\n2. DEFERMENT - Check deferment status\n"
+             "3. STATUS - Check general request status\n4. HELP - Show this menu")
+UNKNOWN_SENDER_TEXT = ("Sorry, we could not find a student registered with this phone number. "
+                       "Please update your profile.")
+WELCOME_TEXT = "Welcome to Campus Care Bot! Send 'HELP' to see available commands."
+
+
+class ReplyClient:
+    """Sends messages through the Africa's Talking messaging API over a pooled session"""
+
+    def __init__(self, username, api_key, sender_id=''):
+        self.username = username
+        self.sender_id = sender_id
+        domain = 'sandbox.africastalking.com' if username == 'sandbox' else 'africastalking.com'
+        self.url = f'https://api.{domain}/version1/messaging'
+        self.session = requests.Session()
+        self.session.headers.update({'Accept': 'application/json', 'apiKey': api_key})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(settings, 'BACKGROUND_TASK_WORKERS', 4))
+        self.session.mount('https://', adapter)
+
+    def send(self, phone, message):
+        data = {'username': self.username, 'to': phone, 'message': message}
+        if self.sender_id:
+            data['from'] = self.sender_id
+        response = self.session.post(self.url, data=data, timeout=REPLY_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_reply_client():
+    """The process-wide ReplyClient, or None when Africa's Talking is not configured"""
+    global _client
+    if _client is None:
+        api_key = getattr(settings, 'AFRICASTALKING_API_KEY', '')
+        if not api_key:
+            return None
+        with _client_lock:
+            if _client is None:
+                _client = ReplyClient(getattr(settings, 'AFRICASTALKING_USERNAME', 'sandbox'), api_key,
+                                      getattr(settings, 'AFRICASTALKING_SENDER_ID', ''))
+    return _client
+
+
+def record_message(data):
+    """Store an inbound webhook payload; returns (message, created).
+
+    created is False for a redelivery of a message id already in the inbox.
+    """
+    fields = {'sender': data.get('from', '')[:50], 'text': data.get('text', '')}
+    provider_id = (data.get('id') or data.get('messageId') or '').strip()[:100]
+    if not provider_id:
+        return InboundMessage.objects.create(**fields), True
+    return InboundMessage.objects.get_or_create(provider_message_id=provider_id, defaults=fields)
+
+
+def reply_for(student, text):
+    """The bot's answer to `text`; `student` is None when the sender is not registered"""
+    if student is None:
+        return UNKNOWN_SENDER_TEXT
+    command = text.strip().upper()
+    if 'HELP' in command:
+        return HELP_TEXT
+    if not any(word in command for word in ('BALANCE', 'DEFERMENT', 'STATUS')):
+        return WELCOME_TEXT
+
+    summary = get_summary(student.pk)
+    if 'BALANCE' in command:
+        balance = summary['balance']
+        if balance > 0:
+            return f"Your fee balance is KES {balance:,.2f}. Pay via M-Pesa to Paybill {settings.MPESA_SHORTCODE}."
+        if balance < 0:
+            return f"You have no outstanding fees and a credit of KES {-balance:,.2f}."
+        return "You have no outstanding fee balance."
+    if 'DEFERMENT' in command:
+        if summary['deferment']:
+            return f"Your latest deferment application status is: {summary['deferment'].upper()}"
+        return "You have no pending deferment applications. Please apply via the portal."
+    if summary['counselling']:
+        return f"Your latest counselling request status is: {summary['counselling'].upper()}"
+    return "No recent requests found."
+
+
+def process_message(message_id):
+    """Answer one inbox row. Safe to call concurrently and repeatedly."""
+    claimed = (InboundMessage.objects.filter(pk=message_id, status='pending')
+               .update(status='processing', processed_at=timezone.now()))
+    if not claimed:
+        return None
+
+    message = InboundMessage.objects.get(pk=message_id)
+    fields = ['student', 'reply', 'status', 'error', 'processed_at']
+    try:
+        phone = to_e164(message.sender)
+        student = Student.objects.filter(phone_e164=phone).first() if phone else None
+        message.student = student
+        message.reply = reply_for(student, message.text)
+        client = get_reply_client()
+        if client is None:
+            raise RuntimeError("Africa's Talking is not configured")
+    except OperationalError as e:
+        # Transient (lock timeout, dropped connection): leave it for the next drain
+        logger.warning(f"[WHATSAPP] Message {message_id} will be retried: {e}")
+        message.status = 'pending'
+        message.error = str(e)
+    except Exception as e:
+        logger.error(f"[WHATSAPP] Message {message_id} failed: {e}")
+        message.status = 'failed'
+        message.error = str(e)
+    else:
+        # Mark it replied before sending: if the process dies or the save fails
+        # after the send, the row must not go back to pending and be sent twice
+        message.status = 'replied'
+        message.processed_at = timezone.now()
+        message.save(update_fields=fields)
+        try:
+            client.send(phone or message.sender, message.reply)
+            return message.status
+        except Exception as e:
+            logger.error(f"[WHATSAPP] Reply to message {message_id} failed: {e}")
+            message.status = 'failed'
+            message.error = str(e)
+    message.processed_at = timezone.now()
+    message.save(update_fields=fields)
+    return message.status
+
+
+def process_pending_messages(limit=500):
+    """Drain the inbox. Returns the number of rows handled."""
+    stale_before = timezone.now() - STALE_PROCESSING_AFTER
+    InboundMessage.objects.filter(status='processing', processed_at__lt=stale_before).update(status='pending')
+
+    ids = list(InboundMessage.objects.filter(status='pending')
+               .order_by('received_at')
+               .values_list('id', flat=True)[:limit])
+    for message_id in ids:
+        process_message(message_id)
+    return len(ids)
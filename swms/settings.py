@@ -96,6 +96,12 @@ if not DEBUG:
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True
 SESSION_COOKIE_SAMESITE = 'Lax'
+# Proxies that append to X-Forwarded-For in front of the app (Render's edge proxy).
+# Client IPs used for throttling are read this many entries from the right; 0 means REMOTE_ADDR.
+NUM_PROXIES = int(os.getenv('NUM_PROXIES', '0' if DEBUG else '1'))
+REST_FRAMEWORK = {
+    'NUM_PROXIES': NUM_PROXIES,
+}
 
 # ============================================
 # INSTALLED APPS
@@ -300,8 +306,8 @@ LOGIN_REDIRECT_URL = 'hms:student_dashboard'
 LOGOUT_REDIRECT_URL = 'landing'
 
 AUTHENTICATION_BACKENDS = [
+    # Covers usernames too (ModelBackend would only repeat the password hash)
     'hms.backends.EmailBackend',
-    'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
 
@@ -384,6 +390,16 @@ MPESA_CONSUMER_SECRET = os.getenv('MPESA_CONSUMER_SECRET', '')
 MPESA_SHORTCODE = os.getenv('MPESA_SHORTCODE', '174379') # Sandbox Paybill
 MPESA_PASSKEY = os.getenv('MPESA_PASSKEY', '') # Sandbox Passkey
 MPESA_CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'https://campus-care.co.ke/payment/callback/')
+# Override the Daraja host, e.g. http://127.0.0.1:8090 for the local mpesa_simulator
+MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', '')
+
+
+# ============================================
+# BACKGROUND TASKS (hms.tasks)
+# ============================================
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', 4))
+# Run background tasks inline (useful for tests and local debugging)
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', 'False') == 'True'
 
 
 # ============================================